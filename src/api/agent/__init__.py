@@ -1,28 +1,149 @@
 """Routing to single agent or multi-agent according to config"""
 
+import asyncio
+import os
+from contextlib import nullcontext
+from typing import Awaitable, Callable, Optional
+
+from api import metrics
+from api.cassette import use_cassette
+from api.config_loader import load_default_config
 from api.agent.single_agent import run_single_agent
 from api.agent.multi_agents.planner_agent import run_planner_agent
+from api.agent.run_store import (
+    CANCELLED,
+    COMPLETED,
+    FAILED,
+    RUNNING,
+    RunInProgressError,
+    get_run_store,
+)
+
+_cassettes_config = load_default_config().get("cassettes", {})
 
 
-async def run_agent(prompt: str, config: dict) -> str:
+async def run_agent(
+    prompt: str,
+    config: dict,
+    on_event: Optional[Callable[[dict], Awaitable[None]]] = None,
+    run_id: Optional[str] = None,
+) -> str:
     """
     Run the agent based on the provided configuration.
 
     Args:
         prompt (str): The input prompt for the agent.
         config (dict): Configuration dictionary to determine which agent to run.
+        on_event (Optional[Callable[[dict], Awaitable[None]]]): Async
+            callback receiving progress events while the agent runs.
+        run_id (Optional[str]): Persist the run under this ID. If the
+            run already exists, its stored prompt and config are used:
+            a completed run returns its answer, any other run resumes
+            from its last checkpoint (planner runs start over).
+
+    A "cassette" entry in config ({"name", "mode", "strict"}) records
+    the run's model and tool calls or replays them, see api.cassette.
+    The name is a file name in cassettes.dir of default_config.yaml.
 
     Returns:
         str: The response from the agent.
+
+    Raises:
+        RunInProgressError: If the run is executing in this process.
     """
+    if run_id is None:
+        return await _run(prompt, config, on_event, None)
+
+    store = get_run_store()
+    if run_id in store.active:
+        raise RunInProgressError(run_id)
+    store.active.add(run_id)
+    try:
+        run = await store.get(run_id)
+        if run is None:
+            await store.create(run_id, prompt, config)
+        elif run["status"] == COMPLETED:
+            return run["answer"]
+        else:
+            prompt, config = run["prompt"], run["config"]
+            await store.finish(run_id, RUNNING)
+        try:
+            answer = await _run(prompt, config, on_event, run_id)
+        except asyncio.CancelledError:
+            await store.finish(run_id, CANCELLED)
+            raise
+        except Exception as e:
+            await store.finish(
+                run_id, FAILED, error=f"{type(e).__name__}: {e}"
+            )
+            raise
+        await store.finish(run_id, COMPLETED, answer=answer)
+        return answer
+    finally:
+        store.active.discard(run_id)
+
+
+async def _run(
+    prompt: str,
+    config: dict,
+    on_event: Optional[Callable[[dict], Awaitable[None]]],
+    run_id: Optional[str],
+) -> str:
     agent_type = config.get(
         "agent_type", "single_agent"
     ).lower()  # Default to single_agent if not specified
     if agent_type == "single_agent":
-        return await run_single_agent(prompt, config)
+        run = run_single_agent
     elif agent_type == "planner_agent":
-        return await run_planner_agent(prompt, config)
+        run = run_planner_agent
     else:
         raise ValueError(
             f"Unknown agent type: {agent_type}. Supported types are 'single_agent' and 'planner_agent'."
         )
+
+    in_flight = metrics.RUNS_IN_FLIGHT.labels(agent_type)
+    in_flight.inc()
+    try:
+        with _cassette_scope(config.get("cassette")):
+            if agent_type == "single_agent":
+                return await run(
+                    prompt, config, on_event, run_id=run_id
+                )
+            return await run(prompt, config, on_event)
+    except Exception as e:
+        metrics.ERRORS.labels("run", type(e).__name__).inc()
+        raise
+    finally:
+        in_flight.dec()
+
+
+def _cassette_scope(settings: Optional[dict]):
+    """
+    Record or replay the run with the cassette given in its config as
+    {"name", "mode", "strict"}, see api.cassette. Configs can come from
+    HTTP clients, so the cassette is a bare file name in cassettes.dir
+    rather than a path.
+
+    Raises:
+        ValueError: If the name is not a plain file name.
+    """
+    if not settings:
+        return nullcontext()
+    directory = _cassettes_config.get("dir", ".cache/cassettes")
+    name = settings.get("name")
+    if (
+        not isinstance(name, str)
+        or not name
+        or name.startswith(".")
+        or os.path.basename(name) != name
+        or (os.altsep is not None and os.altsep in name)
+    ):
+        raise ValueError(
+            f"Invalid cassette name {name!r}: give a file name in "
+            f"{directory}"
+        )
+    return use_cassette(
+        os.path.join(directory, name),
+        settings.get("mode", "replay"),
+        settings.get("strict", False),
+    )
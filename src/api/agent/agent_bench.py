@@ -0,0 +1,355 @@
+"""
+Offline benchmark of the agent loop with a fake model and fake tools.
+
+Runs run_agent end to end (Memory, model router, tool dispatch) against
+the scripted fake provider and fake tools, so it needs no network or
+API keys and every run is reproducible from its seed. Scenarios:
+
+    single_step  one model call answers directly, runs one at a time
+    multi_step   long runs, each step calling two tools in parallel
+    concurrent   many short multi-step runs at once
+
+For each scenario it reports throughput, p50/p99 run latency with the
+configured model and tool latencies, the framework's own time per step
+with all latencies at zero, and the peak Python memory of that
+zero-latency pass. Every pass also checks that each run gave the
+scripted answer with one model call per step and the scripted tool
+calls, and that no errors were counted. Results can be saved and
+compared against a saved baseline, or held to absolute limits, to
+catch regressions; the exit code is 1 if a check fails.
+
+Run from src/:
+    python -m api.agent.agent_bench
+    python -m api.agent.agent_bench --scenario multi_step --save base.json
+    python -m api.agent.agent_bench --baseline base.json --tolerance 0.2
+    python -m api.agent.agent_bench --max-us-per-step 500 --max-peak-mb 50
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import tracemalloc
+
+from api import metrics, trace
+from api.agent import run_agent
+from api.models.fake_provider import Latency, register_fake_model
+from api.tools.fake_tools import register_fake_tool
+
+# name: (model steps with tool calls, runs, runs at once)
+SCENARIOS = {
+    "single_step": (0, 50, 1),
+    "multi_step": (20, 5, 1),
+    "concurrent": (4, 200, 200),
+}
+
+# Steps timed per zero-latency pass
+MIN_OVERHEAD_STEPS = 1000
+
+# Compared against a baseline; all lower is better
+REGRESSION_KEYS = (
+    "p50_seconds",
+    "p99_seconds",
+    "us_per_step",
+    "peak_mb",
+)
+
+# Tools every step of the scripts calls once
+TOOLS = ("fake_search", "fake_fetch")
+
+
+def _script(tool_steps: int) -> list:
+    script = [
+        {
+            "content": f"Thought: step {step} needs more sources.",
+            "tool_calls": [
+                {
+                    "name": "fake_search",
+                    "arguments": {"query": f"q{step}"},
+                },
+                {
+                    "name": "fake_fetch",
+                    "arguments": {"query": f"u{step}"},
+                },
+            ],
+        }
+        for step in range(tool_steps)
+    ]
+    script.append("Thought: I have enough.\nFinal Answer: 42")
+    return script
+
+
+def _register(args, scale: float, seed: int) -> dict:
+    """Register the fake models and tools; return them by name."""
+
+    def latency(p50: float, p99: float, offset: int) -> Latency:
+        return Latency(p50 * scale, p99 * scale, seed=seed + offset)
+
+    fakes = {}
+    for index, (name, (tool_steps, _, _)) in enumerate(
+        SCENARIOS.items()
+    ):
+        fakes[name] = register_fake_model(
+            f"bench-{name}",
+            _script(tool_steps),
+            latency(args.model_p50, args.model_p99, index),
+        )
+    fakes["fake_search"] = register_fake_tool(
+        "fake_search",
+        latency(args.tool_p50, args.tool_p99, 100),
+        output_chars=args.tool_output_chars,
+    )
+    fakes["fake_fetch"] = register_fake_tool(
+        "fake_fetch",
+        latency(args.tool_p50, args.tool_p99, 200),
+        output_chars=args.tool_output_chars,
+        sync=True,
+    )
+    return fakes
+
+
+def _errors() -> float:
+    return sum(value for _, _, value in metrics.ERRORS._samples())
+
+
+async def _run_scenario(
+    name: str, runs: int, concurrency: int, fakes: dict, failures: list
+) -> dict:
+    """
+    Run a scenario and append to failures whatever its runs did other
+    than the script says.
+    """
+    tool_steps = SCENARIOS[name][0]
+    config = {
+        "agent_type": "single_agent",
+        "provider": "fake",
+        "model": f"bench-{name}",
+        "max_steps": tool_steps + 1,
+        "knowledge": False,
+    }
+    semaphore = asyncio.Semaphore(concurrency)
+    durations = []
+    answers = []
+    calls = {key: fakes[key].calls for key in (name,) + TOOLS}
+    errors = _errors()
+
+    async def one(index: int):
+        async with semaphore:
+            start = time.perf_counter()
+            answer = await run_agent(f"Question {index}", config)
+            durations.append(time.perf_counter() - start)
+            answers.append(answer)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(runs)))
+    wall = time.perf_counter() - start
+
+    wrong = [
+        answer for answer in answers if not answer.startswith("42")
+    ]
+    if wrong:
+        failures.append(f"{name}: a run answered {wrong[0]!r}")
+    expected = {key: tool_steps for key in TOOLS}
+    expected[name] = tool_steps + 1
+    for key, before in calls.items():
+        per_run = (fakes[key].calls - before) / runs
+        if per_run != expected[key]:
+            failures.append(
+                f"{name}: {per_run:g} calls of {key} per run, "
+                f"expected {expected[key]}"
+            )
+    if _errors() != errors:
+        failures.append(f"{name}: errors were counted")
+    return {
+        "wall": wall,
+        "durations": durations,
+        "steps": runs * (tool_steps + 1),
+    }
+
+
+def _percentile(samples: list, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _measure(args, name: str, failures: list) -> dict:
+    _, runs, concurrency = SCENARIOS[name]
+    runs = args.runs or runs
+
+    fakes = _register(args, 1.0, args.seed)
+    timed = asyncio.run(
+        _run_scenario(name, runs, concurrency, fakes, failures)
+    )
+
+    # Framework time only: every fake latency set to zero. Best of a
+    # few passes, as scheduler noise only ever adds time
+    fakes = _register(args, 0.0, args.seed)
+    steps_per_run = SCENARIOS[name][0] + 1
+    overhead_runs = max(runs, -(-MIN_OVERHEAD_STEPS // steps_per_run))
+    asyncio.run(  # warm
+        _run_scenario(name, min(runs, 10), concurrency, fakes, failures)
+    )
+    us_per_step = min(
+        overhead["wall"] / overhead["steps"] * 1e6
+        for overhead in (
+            asyncio.run(
+                _run_scenario(
+                    name, overhead_runs, concurrency, fakes, failures
+                )
+            )
+            for _ in range(args.repeats)
+        )
+    )
+
+    tracemalloc.start()
+    asyncio.run(_run_scenario(name, runs, concurrency, fakes, failures))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "runs": runs,
+        "concurrency": concurrency,
+        "runs_per_second": runs / timed["wall"],
+        "p50_seconds": _percentile(timed["durations"], 0.5),
+        "p99_seconds": _percentile(timed["durations"], 0.99),
+        "us_per_step": us_per_step,
+        "peak_mb": peak / 2**20,
+    }
+
+
+def _compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for name, result in results.items():
+        for key in REGRESSION_KEYS:
+            before = baseline.get(name, {}).get(key)
+            if before and result[key] > before * (1 + tolerance):
+                regressions.append(
+                    f"{name} {key}: {before:.4g} -> {result[key]:.4g} "
+                    f"(+{result[key] / before - 1:.0%})"
+                )
+    return regressions
+
+
+def _over_limits(results: dict, limits: dict) -> list:
+    exceeded = []
+    for name, result in results.items():
+        for key, limit in limits.items():
+            if limit is not None and result[key] > limit:
+                exceeded.append(
+                    f"{name} {key}: {result[key]:.4g} > {limit:.4g}"
+                )
+    return exceeded
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Offline agent loop benchmark"
+    )
+    parser.add_argument(
+        "--scenario",
+        choices=list(SCENARIOS),
+        nargs="+",
+        default=list(SCENARIOS),
+    )
+    parser.add_argument(
+        "--runs", type=int, help="Override the runs of each scenario"
+    )
+    parser.add_argument("--model-p50", type=float, default=0.05)
+    parser.add_argument("--model-p99", type=float, default=0.25)
+    parser.add_argument("--tool-p50", type=float, default=0.02)
+    parser.add_argument("--tool-p99", type=float, default=0.1)
+    parser.add_argument("--tool-output-chars", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        default=5,
+        help="Zero-latency passes per scenario for us/step",
+    )
+    parser.add_argument(
+        "--trace-level",
+        default="off",
+        help="Tracing level during the runs (off, info, debug)",
+    )
+    parser.add_argument("--save", help="Write the results as JSON here")
+    parser.add_argument(
+        "--baseline", help="Compare with results saved by --save"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed slowdown against the baseline",
+    )
+    parser.add_argument(
+        "--max-p99-seconds",
+        type=float,
+        help="Fail if a scenario's p99 run latency is higher",
+    )
+    parser.add_argument(
+        "--max-us-per-step",
+        type=float,
+        help="Fail if a scenario's framework time per step is higher",
+    )
+    parser.add_argument(
+        "--max-peak-mb",
+        type=float,
+        help="Fail if a scenario's peak memory is higher",
+    )
+    args = parser.parse_args()
+    trace.set_level(args.trace_level)
+
+    print(
+        f"model p50/p99 {args.model_p50 * 1000:.0f}/"
+        f"{args.model_p99 * 1000:.0f} ms, tool p50/p99 "
+        f"{args.tool_p50 * 1000:.0f}/{args.tool_p99 * 1000:.0f} ms, "
+        f"{args.tool_output_chars} chars per tool output\n"
+    )
+    print(
+        f"{'scenario':>12} | {'runs':>4} | {'at once':>7} | "
+        f"{'runs/s':>7} | {'p50 s':>6} | {'p99 s':>6} | "
+        f"{'us/step':>7} | {'peak MB':>7}"
+    )
+    results = {}
+    failures = []
+    for name in args.scenario:
+        result = results[name] = _measure(args, name, failures)
+        print(
+            f"{name:>12} | {result['runs']:>4} | "
+            f"{result['concurrency']:>7} | "
+            f"{result['runs_per_second']:>7.1f} | "
+            f"{result['p50_seconds']:>6.3f} | "
+            f"{result['p99_seconds']:>6.3f} | "
+            f"{result['us_per_step']:>7.0f} | "
+            f"{result['peak_mb']:>7.1f}"
+        )
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    failures += _over_limits(
+        results,
+        {
+            "p99_seconds": args.max_p99_seconds,
+            "us_per_step": args.max_us_per_step,
+            "peak_mb": args.max_peak_mb,
+        },
+    )
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = _compare(
+                results, json.load(f), args.tolerance
+            )
+        if not regressions:
+            print("\nNo regressions against the baseline")
+        failures += regressions
+    if failures:
+        # Every pass of a scenario reports the same failures
+        failures = list(dict.fromkeys(failures))
+        print("\nFailed checks:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
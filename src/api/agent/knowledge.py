@@ -0,0 +1,927 @@
+"""
+Long-term research memory: findings distilled from the answers of
+earlier runs, recalled into the prompt of later runs on the same topic
+so that recurring questions need fewer searches and model calls.
+
+When a run gives a final answer, the sentences of the answer that state
+something are saved as findings, each with the source it cites when the
+run's search or fetch results name one. A finding that repeats a stored
+one, exactly or nearly, refreshes it instead of adding a row. At the
+start of a run the findings most relevant to the question are added
+after the system prompt, up to a token budget. Relevance is the cosine
+similarity of embeddings when knowledge.embedding names a model and
+numpy is installed, else the share of the question's terms a finding
+contains, looked up in an SQLite FTS5 index. Findings neither saved nor
+recalled for max_age_days are evicted, and the least recently used go
+once the store holds more than max_findings.
+
+The store is one SQLite file (knowledge.sqlite_path in
+default_config.yaml) shared by all workers and callers on the host, so
+it is off unless enabled: what one caller's runs concluded, unverified,
+is recalled as fact into another's. Turn it on for a deployment with
+knowledge.enabled, or per run with "knowledge": true. Embeddings are
+float32 blobs, read into one numpy matrix per process and read again
+only when another connection has changed the file. Saving runs in a
+background task, so it never delays the answer.
+"""
+
+import asyncio
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+from api import metrics, trace
+from api.agent.token_counter import count_text_tokens
+from api.config_loader import load_default_config
+from api.models.embeddings import embed_texts
+from api.tools.search_index import tokenize
+
+# numpy, imported by _load_numpy() when embeddings are first used
+np = None
+_numpy_probed = False
+
+_knowledge_config = load_default_config().get("knowledge", {})
+
+
+def _load_numpy():
+    """numpy, imported on first call; None if it is not installed."""
+    global np, _numpy_probed
+    if not _numpy_probed:
+        _numpy_probed = True
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        np = numpy
+    return np
+
+
+RECALL_HEADER = (
+    "Findings from earlier research on related questions. Use them "
+    "instead of searching again where they answer the question, and "
+    "check them against current sources where they matter:"
+)
+# Words a sentence of an answer needs to be saved as a finding
+MIN_CLAIM_WORDS = 6
+MAX_CLAIM_CHARS = 600
+# Candidates read from the full-text index per lookup
+LEXICAL_CANDIDATES = 50
+
+# Left out of term matching on top of the search index stopwords
+_QUESTION_WORDS = frozenset(
+    "can could did do does how many much should there whom whose why "
+    "would".split()
+)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+_LIST_MARKER = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+")
+_CITATION = re.compile(r"\[(\d+)\]")
+_URL = re.compile(r"https?://[^\s)\]>,;]+")
+# "[n] Title" followed by "Source: url", as search and fetch print them
+_CITED_SOURCE = re.compile(r"^\[(\d+)\][^\n]*\nSource: (\S+)", re.M)
+
+
+class Finding:
+    """
+    A stored finding.
+
+    Args:
+        claim (str): What the finding states.
+        source (Optional[str]): URL or citation it rests on.
+        question (str): Question of the run that found it.
+        created_at (float): When it was first saved.
+        score (float): Relevance to the question it was recalled for.
+    """
+
+    __slots__ = ("claim", "source", "question", "created_at", "score")
+
+    def __init__(
+        self,
+        claim: str,
+        source: Optional[str],
+        question: str,
+        created_at: float,
+        score: float = 0.0,
+    ):
+        self.claim = claim
+        self.source = source
+        self.question = question
+        self.created_at = created_at
+        self.score = score
+
+    def to_text(self) -> str:
+        date = time.strftime("%Y-%m-%d", time.gmtime(self.created_at))
+        source = f"; source: {self.source}" if self.source else ""
+        return f"- {self.claim} ({date}{source})"
+
+
+def distill_findings(
+    answer: str, tool_outputs: List[str], limit: int = 8
+) -> List[Tuple[str, Optional[str]]]:
+    """
+    Findings stated by a final answer, without a model call.
+
+    Every sentence or list item of the answer with at least
+    MIN_CLAIM_WORDS words is a claim. Its source is the first URL it
+    contains, else the source of the first result it cites as [n] in
+    the run's tool outputs (the latest output listing [n] wins).
+    Claims with a source come first.
+
+    Args:
+        answer (str): The run's final answer.
+        tool_outputs (List[str]): The run's tool results, in order.
+        limit (int): Most findings returned.
+
+    Returns:
+        List[Tuple[str, Optional[str]]]: (claim, source) pairs.
+    """
+    sources: Dict[str, str] = {}
+    for output in tool_outputs:
+        for rank, url in _CITED_SOURCE.findall(output or ""):
+            sources[rank] = url
+
+    findings = []
+    seen = set()
+    for sentence in _SENTENCE_END.split(answer):
+        claim = _LIST_MARKER.sub("", sentence).strip()
+        if (
+            len(claim.split()) < MIN_CLAIM_WORDS
+            or len(claim) > MAX_CLAIM_CHARS
+        ):
+            continue
+        key = _claim_hash(claim)
+        if key in seen:
+            continue
+        seen.add(key)
+        url = _URL.search(claim)
+        source = url.group(0) if url else None
+        if source is None:
+            source = next(
+                (
+                    sources[rank]
+                    for rank in _CITATION.findall(claim)
+                    if rank in sources
+                ),
+                None,
+            )
+        # Citation numbers mean nothing outside the run
+        findings.append((re.sub(r"\s*\[\d+\]", "", claim), source))
+    findings.sort(key=lambda finding: finding[1] is None)
+    return findings[:limit]
+
+
+def _claim_hash(claim: str) -> str:
+    # Citation numbers differ between runs that state the same thing
+    normalized = " ".join(
+        re.findall(r"\w+", _CITATION.sub(" ", claim).lower())
+    )
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def _terms(text: str) -> Set[str]:
+    return set(tokenize(text)) - _QUESTION_WORDS
+
+
+def _match_query(terms: List[str], column: Optional[str]) -> str:
+    # Tokens are word characters only, so quoting them is enough
+    query = " OR ".join(f'"{term}"' for term in terms)
+    return f"{column} : ({query})" if column else query
+
+
+def _claim_terms(claim: str) -> Set[str]:
+    return _terms(_CITATION.sub(" ", claim))
+
+
+def _overlap(other: Set[str], weights: Dict[str, float]) -> float:
+    total = sum(weights.values())
+    shared = sum(weights[term] for term in other if term in weights)
+    return shared / total if total else 0.0
+
+
+class _Vectors:
+    """
+    Unit embeddings of the findings that have one, as rows of a matrix
+    grown by doubling. Rows of deleted findings are zeroed, so they
+    never reach a similarity threshold.
+    """
+
+    def __init__(self, ids: List[int], blobs: List[bytes]):
+        dim = len(blobs[-1]) // 4 if blobs else 0
+        self.count = len(ids)
+        self.ids = np.array(ids, dtype=np.int64)
+        self.matrix = np.zeros((len(ids), dim), dtype=np.float32)
+        for row, blob in enumerate(blobs):
+            # Rows of another embedding model stay zero
+            if len(blob) == dim * 4:
+                self.matrix[row] = np.frombuffer(blob, np.float32)
+        self.rows = {
+            finding_id: row for row, finding_id in enumerate(ids)
+        }
+
+    def fits(self, vector) -> bool:
+        return not self.count or len(vector) == self.matrix.shape[1]
+
+    def put(self, finding_id: int, vector):
+        row = self.rows.get(finding_id)
+        if row is None:
+            if self.count == len(self.ids):
+                capacity = max(16, 2 * self.count)
+                ids = np.full(capacity, -1, dtype=np.int64)
+                ids[: self.count] = self.ids[: self.count]
+                matrix = np.zeros((capacity, len(vector)), np.float32)
+                if self.count:
+                    matrix[: self.count] = self.matrix[: self.count]
+                self.ids, self.matrix = ids, matrix
+            row = self.count
+            self.count += 1
+            self.ids[row] = finding_id
+            self.rows[finding_id] = row
+        self.matrix[row] = vector
+
+    def delete(self, finding_id: int):
+        row = self.rows.pop(finding_id, None)
+        if row is not None:
+            self.matrix[row] = 0
+
+    def closest(
+        self, vectors: list
+    ) -> List[Tuple[Optional[int], float]]:
+        """(id, similarity) of the closest row to each of the vectors."""
+        if not self.count or not self.fits(vectors[0]):
+            return [(None, 0.0)] * len(vectors)
+        scores = self.matrix[: self.count] @ np.stack(vectors).T
+        rows = scores.argmax(axis=0)
+        return [
+            (int(self.ids[row]), float(scores[row, column]))
+            for column, row in enumerate(rows)
+        ]
+
+    def nearest(self, vector, limit: int) -> List[Tuple[int, float]]:
+        if not self.count or not self.fits(vector):
+            return []
+        scores = self.matrix[: self.count] @ vector
+        if len(scores) > limit:
+            top = np.argpartition(-scores, limit)[:limit]
+            top = top[np.argsort(-scores[top])]
+        else:
+            top = np.argsort(-scores)
+        return [(int(self.ids[row]), float(scores[row])) for row in top]
+
+
+class KnowledgeStore:
+    """
+    SQLite store of findings. Queries run in a thread so the event loop
+    is not blocked on disk I/O.
+
+    Args:
+        path (str): Database file.
+        max_age_days (float): Findings neither saved nor recalled for
+            this long are evicted when findings are saved.
+        max_findings (int): Most findings kept; the least recently
+            used beyond it are evicted.
+        duplicate_similarity (float): Embedding cosine similarity from
+            which a new finding counts as a stored one.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_age_days: float = 90,
+        max_findings: int = 100000,
+        duplicate_similarity: float = 0.97,
+    ):
+        self.max_age_days = max_age_days
+        self.max_findings = max_findings
+        self.duplicate_similarity = duplicate_similarity
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS findings ("
+            " id INTEGER PRIMARY KEY,"
+            " claim TEXT NOT NULL,"
+            " source TEXT,"
+            " question TEXT NOT NULL,"
+            " claim_hash TEXT NOT NULL UNIQUE,"
+            " embedding BLOB,"
+            " created_at REAL NOT NULL,"
+            " used_at REAL NOT NULL,"
+            " uses INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS findings_used"
+            " ON findings (used_at)"
+        )
+        # Claim and question of each finding, rowid = findings.id
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS findings_text"
+            " USING fts5(claim, question,"
+            " tokenize='unicode61 remove_diacritics 0')"
+        )
+        # Number of findings each term occurs in; fts5vocab would read
+        # the postings of every term it counts
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS finding_terms ("
+            " term TEXT PRIMARY KEY,"
+            " findings INTEGER NOT NULL) WITHOUT ROWID"
+        )
+        # Embeddings as of _vectors_version
+        self._vectors = None
+        self._vectors_version = None
+        # Background saves, awaited by flush()
+        self._pending: Set[asyncio.Task] = set()
+
+    # Synchronous queries, run in a thread with the lock held
+
+    def _data_version(self) -> int:
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _matrix(self) -> _Vectors:
+        """The embeddings, read again if another connection wrote."""
+        version = self._data_version()
+        if self._vectors is None or version != self._vectors_version:
+            rows = self._conn.execute(
+                "SELECT id, embedding FROM findings"
+                " WHERE embedding IS NOT NULL"
+            ).fetchall()
+            self._vectors = _Vectors(
+                [row[0] for row in rows], [row[1] for row in rows]
+            )
+            self._vectors_version = version
+        return self._vectors
+
+    def _weights(self, terms: Set[str]) -> Dict[str, float]:
+        """
+        BM25 inverse document frequency of the terms among the findings.
+        Terms no finding contains are left out: they cannot tell stored
+        findings apart.
+        """
+        total = self._conn.execute(
+            "SELECT COUNT(*) FROM findings"
+        ).fetchone()[0]
+        counts = dict(
+            self._conn.execute(
+                "SELECT term, findings FROM finding_terms WHERE term IN"
+                f" ({','.join('?' * len(terms))})",
+                tuple(terms),
+            ).fetchall()
+        )
+        return {
+            term: math.log(1 + (total - count + 0.5) / (count + 0.5))
+            for term, count in counts.items()
+        }
+
+    def _lexical(
+        self,
+        terms: Set[str],
+        min_overlap: float,
+        column: Optional[str] = None,
+    ) -> List[Tuple[int, float, str]]:
+        """
+        Findings containing at least min_overlap of the stored terms,
+        weighted by inverse document frequency, as (id, overlap,
+        claim), highest overlap first. Only findings with one of the
+        rarest terms can reach min_overlap, so only those are read from
+        the index.
+        """
+        if not terms:
+            return []
+        weights = self._weights(terms)
+        needed = min_overlap * sum(weights.values())
+        frequent = dict(weights)
+        rare = []
+        while frequent and sum(frequent.values()) >= needed:
+            term = max(frequent, key=frequent.get)
+            del frequent[term]
+            rare.append(term)
+        rows = (
+            self._conn.execute(
+                "SELECT rowid, claim, question FROM findings_text"
+                " WHERE findings_text MATCH ? ORDER BY rank LIMIT ?",
+                (_match_query(rare, column), LEXICAL_CANDIDATES),
+            ).fetchall()
+            if rare
+            else []
+        )
+        scored = []
+        for finding_id, claim, question in rows:
+            text = claim if column == "claim" else f"{claim} {question}"
+            overlap = _overlap(_terms(text), weights)
+            if overlap >= min_overlap:
+                scored.append((finding_id, overlap, claim))
+        scored.sort(key=lambda item: -item[1])
+        return scored
+
+    def _recall(
+        self,
+        question: str,
+        vector,
+        limit: int,
+        min_similarity: float,
+        min_term_overlap: float,
+    ) -> List[Finding]:
+        with self._lock:
+            if vector is not None:
+                candidates = [
+                    (finding_id, score)
+                    for finding_id, score in self._matrix().nearest(
+                        vector, limit
+                    )
+                    if score >= min_similarity
+                ]
+            else:
+                candidates = [
+                    (finding_id, score)
+                    for finding_id, score, _ in self._lexical(
+                        _terms(question), min_term_overlap
+                    )
+                ][:limit]
+            if not candidates:
+                return []
+            scores = dict(candidates)
+            marks = ",".join("?" * len(scores))
+            rows = self._conn.execute(
+                "SELECT id, claim, source, question, created_at"
+                f" FROM findings WHERE id IN ({marks})",
+                tuple(scores),
+            ).fetchall()
+            self._conn.execute(
+                "UPDATE findings SET used_at = ?, uses = uses + 1"
+                f" WHERE id IN ({marks})",
+                (time.time(), *scores),
+            )
+        findings = [
+            Finding(
+                claim, source, asked, created_at, scores[finding_id]
+            )
+            for finding_id, claim, source, asked, created_at in rows
+        ]
+        findings.sort(key=lambda finding: -finding.score)
+        return findings
+
+    def _duplicate(
+        self,
+        claim: str,
+        vector,
+        changes: Dict[int, object],
+        closest: Tuple[Optional[int], float],
+    ) -> Tuple[Optional[int], bool]:
+        """
+        (id, exact) of a stored finding the claim repeats, or (None,
+        False). Near duplicates have an embedding within
+        duplicate_similarity, or without embeddings, the same terms
+        apart from numbers, e.g. a figure that was updated.
+        """
+        row = self._conn.execute(
+            "SELECT id FROM findings WHERE claim_hash = ?",
+            (_claim_hash(claim),),
+        ).fetchone()
+        if row is not None:
+            return row[0], True
+        if vector is not None:
+            # Rows written by this save are not in the matrix yet
+            for finding_id, other in changes.items():
+                if (
+                    other is not None
+                    and float(other @ vector)
+                    >= self.duplicate_similarity
+                ):
+                    return finding_id, False
+            finding_id, score = closest
+            if score >= self.duplicate_similarity:
+                return finding_id, False
+            return None, False
+        words = {
+            term for term in _claim_terms(claim) if not term.isdigit()
+        }
+        for finding_id, _, stored in self._lexical(words, 1.0, "claim"):
+            if words == {
+                term
+                for term in _claim_terms(stored)
+                if not term.isdigit()
+            }:
+                return finding_id, False
+        return None, False
+
+    def _count_terms(self, texts: List[str], delta: int):
+        """Add delta to the finding count of the terms of each text."""
+        counts = Counter(
+            term for text in texts for term in _terms(text)
+        )
+        self._conn.executemany(
+            "INSERT INTO finding_terms VALUES (?, ?)"
+            " ON CONFLICT (term) DO UPDATE"
+            " SET findings = findings + excluded.findings",
+            [(term, count * delta) for term, count in counts.items()],
+        )
+        if delta < 0:
+            self._conn.execute(
+                "DELETE FROM finding_terms WHERE findings <= 0"
+            )
+
+    def _evict(self, now: float) -> List[int]:
+        """Delete old findings and those over max_findings."""
+        evicted = []
+        for where, params in (
+            ("used_at < ?", (now - self.max_age_days * 86400,)),
+            (
+                "id IN (SELECT id FROM findings"
+                " ORDER BY used_at DESC, id DESC LIMIT -1 OFFSET ?)",
+                (self.max_findings,),
+            ),
+        ):
+            rows = self._conn.execute(
+                "SELECT id, claim, question FROM findings"
+                f" WHERE {where}",
+                params,
+            ).fetchall()
+            if not rows:
+                continue
+            self._count_terms(
+                [f"{claim} {question}" for _, claim, question in rows],
+                -1,
+            )
+            self._conn.execute(
+                "DELETE FROM findings_text WHERE rowid IN"
+                f" (SELECT id FROM findings WHERE {where})",
+                params,
+            )
+            self._conn.execute(
+                f"DELETE FROM findings WHERE {where}", params
+            )
+            evicted.extend(row[0] for row in rows)
+        return evicted
+
+    def _save(
+        self,
+        question: str,
+        findings: List[Tuple[str, Optional[str]]],
+        vectors: Optional[list],
+    ) -> Dict[str, int]:
+        now = time.time()
+        counts = {"added": 0, "refreshed": 0, "evicted": 0}
+        # Embeddings written, by finding id, and None for evictions
+        changes: Dict[int, object] = {}
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Stored embeddings closest to each finding, in one pass
+                closest = (
+                    [(None, 0.0)] * len(findings)
+                    if vectors is None
+                    else self._matrix().closest(vectors)
+                )
+                for index, (claim, source) in enumerate(findings):
+                    vector = None if vectors is None else vectors[index]
+                    finding_id, exact = self._duplicate(
+                        claim, vector, changes, closest[index]
+                    )
+                    if exact:
+                        self._conn.execute(
+                            "UPDATE findings SET used_at = ?,"
+                            " source = COALESCE(source, ?)"
+                            " WHERE id = ?",
+                            (now, source, finding_id),
+                        )
+                        counts["refreshed"] += 1
+                        continue
+                    if finding_id is not None:
+                        # A restatement, likely with newer figures,
+                        # replaces the stored claim
+                        self._replace(
+                            finding_id, claim, source, vector, now
+                        )
+                        if vector is not None:
+                            changes[finding_id] = vector
+                        counts["refreshed"] += 1
+                        continue
+                    finding_id = self._conn.execute(
+                        "INSERT INTO findings (claim, source, question,"
+                        " claim_hash, embedding, created_at, used_at)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            claim,
+                            source,
+                            question,
+                            _claim_hash(claim),
+                            (
+                                None
+                                if vector is None
+                                else vector.tobytes()
+                            ),
+                            now,
+                            now,
+                        ),
+                    ).lastrowid
+                    self._conn.execute(
+                        "INSERT INTO findings_text (rowid, claim,"
+                        " question) VALUES (?, ?, ?)",
+                        (finding_id, claim, question),
+                    )
+                    self._count_terms([f"{claim} {question}"], 1)
+                    if vector is not None:
+                        changes[finding_id] = vector
+                    counts["added"] += 1
+                evicted = self._evict(now)
+                counts["evicted"] = len(evicted)
+                changes.update(dict.fromkeys(evicted))
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            # data_version does not change for this connection's own
+            # writes, so the cached matrix is updated here
+            if self._vectors is not None:
+                for finding_id, vector in changes.items():
+                    if vector is None:
+                        self._vectors.delete(finding_id)
+                    elif self._vectors.fits(vector):
+                        self._vectors.put(finding_id, vector)
+                    else:
+                        self._vectors = None
+                        break
+        return counts
+
+    def _replace(
+        self,
+        finding_id: int,
+        claim: str,
+        source: Optional[str],
+        vector,
+        now: float,
+    ):
+        stored, question = self._conn.execute(
+            "SELECT claim, question FROM findings WHERE id = ?",
+            (finding_id,),
+        ).fetchone()
+        self._count_terms([f"{stored} {question}"], -1)
+        self._count_terms([f"{claim} {question}"], 1)
+        self._conn.execute(
+            "UPDATE findings SET claim = ?, source = ?, claim_hash = ?,"
+            " embedding = COALESCE(?, embedding), created_at = ?,"
+            " used_at = ? WHERE id = ?",
+            (
+                claim,
+                source,
+                _claim_hash(claim),
+                None if vector is None else vector.tobytes(),
+                now,
+                now,
+                finding_id,
+            ),
+        )
+        self._conn.execute(
+            "UPDATE findings_text SET claim = ? WHERE rowid = ?",
+            (claim, finding_id),
+        )
+
+    def _count(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM findings"
+            ).fetchone()[0]
+
+    # Async API
+
+    async def recall(
+        self, question: str, settings: Optional[dict] = None
+    ) -> List[Finding]:
+        """
+        The stored findings most relevant to a question, most relevant
+        first; recalling them counts as a use for eviction.
+
+        Args:
+            question (str): The run's question.
+            settings (Optional[dict]): Knowledge settings, see
+                knowledge_settings().
+
+        Returns:
+            List[Finding]: Up to recall_limit findings.
+        """
+        settings = settings or _knowledge_config
+        vector = None
+        embedding = settings.get("embedding")
+        if embedding and _load_numpy() is not None:
+            vector = _unit(
+                (await embed_texts([question], embedding))[0]
+            )
+        return await asyncio.to_thread(
+            self._recall,
+            question,
+            vector,
+            settings.get("recall_limit", 10),
+            settings.get("min_similarity", 0.75),
+            settings.get("min_term_overlap", 0.5),
+        )
+
+    async def add(
+        self,
+        question: str,
+        findings: List[Tuple[str, Optional[str]]],
+        settings: Optional[dict] = None,
+    ) -> Dict[str, int]:
+        """
+        Save findings, refreshing the stored ones they repeat.
+
+        Args:
+            question (str): Question of the run that found them.
+            findings (List[Tuple[str, Optional[str]]]): (claim,
+                source) pairs, e.g. from distill_findings().
+            settings (Optional[dict]): Knowledge settings, see
+                knowledge_settings().
+
+        Returns:
+            Dict[str, int]: Findings added, refreshed and evicted.
+        """
+        if not findings:
+            return {"added": 0, "refreshed": 0, "evicted": 0}
+        settings = settings or _knowledge_config
+        vectors = None
+        embedding = settings.get("embedding")
+        if embedding and _load_numpy() is not None:
+            vectors = [
+                _unit(vector)
+                for vector in await embed_texts(
+                    [claim for claim, _ in findings], embedding
+                )
+            ]
+        counts = await asyncio.to_thread(
+            self._save, question, findings, vectors
+        )
+        for event, count in counts.items():
+            if count:
+                metrics.KNOWLEDGE.labels(event).inc(count)
+        return counts
+
+    def save(
+        self,
+        question: str,
+        findings: List[Tuple[str, Optional[str]]],
+        settings: Optional[dict] = None,
+    ) -> asyncio.Task:
+        """
+        Save findings in the background and return at once.
+
+        Returns:
+            asyncio.Task: The save, which never raises.
+        """
+
+        async def write():
+            try:
+                with trace.span(
+                    "knowledge.save", findings=len(findings)
+                ) as span:
+                    span.set(
+                        **await self.add(question, findings, settings)
+                    )
+            except Exception as e:
+                metrics.ERRORS.labels(
+                    "knowledge", type(e).__name__
+                ).inc()
+                trace.debug("Saving findings failed", error=str(e))
+
+        task = asyncio.ensure_future(write())
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+        return task
+
+    async def count(self) -> int:
+        """Number of stored findings."""
+        return await asyncio.to_thread(self._count)
+
+    async def flush(self):
+        """Wait for the background saves."""
+        if self._pending:
+            await asyncio.wait(list(self._pending))
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+def knowledge_settings(config: dict) -> Optional[dict]:
+    """
+    Knowledge settings of a run: the knowledge section of
+    default_config.yaml updated with the run config's "knowledge" entry,
+    which may also be true or false to turn recall and saving on or off.
+
+    Returns:
+        Optional[dict]: The settings, None if disabled.
+    """
+    override = config.get("knowledge", {})
+    if override is False:
+        return None
+    if override is True:
+        override = {"enabled": True}
+    settings = {**_knowledge_config, **(override or {})}
+    if not settings.get("enabled", False):
+        return None
+    return settings
+
+
+async def recall_context(
+    question: str, settings: dict, model: str = "gpt-4o"
+) -> Optional[str]:
+    """
+    The findings recalled for a question as a prompt section of at most
+    settings["recall_tokens"] tokens.
+
+    Args:
+        question (str): The run's question.
+        settings (dict): Knowledge settings, see knowledge_settings().
+        model (str): Model whose tokenizer counts the budget.
+
+    Returns:
+        Optional[str]: RECALL_HEADER and one line per finding, or None
+            if no finding is relevant or recall failed.
+    """
+    with trace.span("knowledge.recall") as span:
+        try:
+            findings = await get_knowledge_store().recall(
+                question, settings
+            )
+        except Exception as e:
+            # The run works without its findings
+            metrics.ERRORS.labels("knowledge", type(e).__name__).inc()
+            span.set(error=str(e))
+            return None
+        budget = settings.get("recall_tokens", 800)
+        tokens = count_text_tokens(RECALL_HEADER, model)
+        lines = []
+        for finding in findings:
+            line = finding.to_text()
+            line_tokens = count_text_tokens(line, model)
+            if tokens + line_tokens > budget:
+                break
+            lines.append(line)
+            tokens += line_tokens
+        span.set(findings=len(lines), tokens=tokens if lines else 0)
+        if not lines:
+            return None
+        metrics.KNOWLEDGE.labels("recalled").inc(len(lines))
+        return "\n".join([RECALL_HEADER, *lines])
+
+
+def save_findings(
+    question: str,
+    answer: str,
+    tool_outputs: List[str],
+    settings: dict,
+) -> Optional[asyncio.Task]:
+    """
+    Distill the findings of a finished run and save them in the
+    background.
+
+    Returns:
+        Optional[asyncio.Task]: The save, None if the answer states
+            nothing to keep.
+    """
+    findings = distill_findings(
+        answer, tool_outputs, settings.get("max_findings_per_run", 8)
+    )
+    if not findings:
+        return None
+    return get_knowledge_store().save(question, findings, settings)
+
+
+_knowledge_store: Optional[KnowledgeStore] = None
+
+
+def get_knowledge_store() -> KnowledgeStore:
+    """
+    Get the process-wide knowledge store, opening the database from
+    the knowledge section of default_config.yaml on first use.
+
+    Returns:
+        KnowledgeStore: The shared knowledge store.
+    """
+    global _knowledge_store
+    if _knowledge_store is None:
+        _knowledge_store = KnowledgeStore(
+            path=_knowledge_config.get(
+                "sqlite_path", ".cache/knowledge.sqlite"
+            ),
+            max_age_days=_knowledge_config.get("max_age_days", 90),
+            max_findings=_knowledge_config.get("max_findings", 100000),
+            duplicate_similarity=_knowledge_config.get(
+                "duplicate_similarity", 0.97
+            ),
+        )
+    return _knowledge_store
+
+
+async def flush_knowledge_store():
+    """Wait for outstanding saves of findings, e.g. on shutdown."""
+    if _knowledge_store is not None:
+        await _knowledge_store.flush()
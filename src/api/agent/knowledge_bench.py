@@ -0,0 +1,307 @@
+"""
+Benchmark of the long-term knowledge store.
+
+recurring   Runs run_agent over topics that are each asked several times
+            in different words, once without and once with knowledge,
+            against a fake model that researches with tool calls for
+            --steps steps unless the prompt recalls findings on the
+            question's topic, and then answers at once. Reports model
+            calls, tool calls, wall time and the findings stored.
+store       Fills stores of several sizes with synthetic findings and
+            times saving the findings of one run and recalling for one
+            question, by term overlap and, with numpy, by embedding.
+
+Each pass uses a fresh store in a temporary directory.
+
+Run from src/:
+    python -m api.agent.knowledge_bench --topics 20 --repeats 5
+    python -m api.agent.knowledge_bench --sizes 1000 10000 100000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+
+from api.agent import knowledge, run_agent
+from api.agent.knowledge import KnowledgeStore
+from api.models import fake_provider
+from api.models.fake_provider import FakeModel, Latency
+from api.tools.fake_tools import register_fake_tool
+
+QUESTIONS = (
+    "What is the market outlook for {topic}?",
+    "How much did the {topic} market grow in 2025?",
+    "Which regions drive the growth of the {topic} market?",
+)
+VOCABULARY = 20000
+
+
+def _answer(topic: str, number: int) -> str:
+    return (
+        "Thought: I have enough.\n"
+        f"Final Answer: The {topic} market grew by {number % 40 + 5} "
+        "percent in 2025 according to industry data [1]. Growth of "
+        f"the {topic} market is driven by demand in Asia and Europe [2]."
+    )
+
+
+def _research(topic: str, steps: int) -> list:
+    return [
+        {
+            "content": f"Thought: I need sources on {topic}.",
+            "tool_calls": [
+                {
+                    "name": "bench_search",
+                    "arguments": {"query": f"{topic} step {step}"},
+                }
+            ],
+        }
+        for step in range(steps)
+    ]
+
+
+class RecallingModel(FakeModel):
+    """
+    Fake researcher over several topics: each topic has its own script
+    of research steps and answer, and a prompt that recalls findings on
+    the question's topic is answered at once.
+    """
+
+    def __init__(self, name: str, topics: list, steps: int, latency):
+        super().__init__(name, ["unused"], latency)
+        self.topics = {
+            topic: FakeModel(
+                name,
+                _research(topic, steps) + [_answer(topic, number)],
+                latency,
+            )
+            for number, topic in enumerate(topics)
+        }
+
+    def completion_for(self, messages: list):
+        question = next(
+            message["content"]
+            for message in messages
+            if message["role"] == "user"
+        )
+        topic = re.search(r"product\d+", question).group(0)
+        script = self.topics[topic]
+        recalled = any(
+            message["role"] == "system"
+            and knowledge.RECALL_HEADER in message["content"]
+            and f" {topic} " in message["content"]
+            for message in messages
+        )
+        if recalled:
+            return script.completions[-1]
+        return script.completion_for(messages)
+
+
+async def _recurring(args, enabled: bool) -> dict:
+    topics = [f"product{number}" for number in range(args.topics)]
+    model = RecallingModel(
+        "bench-knowledge",
+        topics,
+        args.steps,
+        Latency(args.model_latency),
+    )
+    fake_provider._models[model.name] = model
+    tool = register_fake_tool(
+        "bench_search", Latency(args.tool_latency), output_chars=2000
+    )
+    tool.calls = 0
+    config = {
+        "agent_type": "single_agent",
+        "provider": "fake",
+        "model": model.name,
+        "max_steps": args.steps + 1,
+        "knowledge": {"enabled": enabled},
+    }
+    start = time.perf_counter()
+    for repeat in range(args.repeats):
+        template = QUESTIONS[repeat % len(QUESTIONS)]
+        await asyncio.gather(
+            *(
+                run_agent(template.format(topic=topic), config)
+                for topic in topics
+            )
+        )
+        # Findings of this round are there for the next one
+        await knowledge.flush_knowledge_store()
+    wall = time.perf_counter() - start
+    return {
+        "model_calls": model.calls,
+        "tool_calls": tool.calls,
+        "wall": wall,
+        "findings": (
+            await knowledge.get_knowledge_store().count()
+            if enabled
+            else 0
+        ),
+    }
+
+
+def _claims(count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    words = [f"w{rank}" for rank in range(VOCABULARY)]
+    cumulative = []
+    total = 0.0
+    for rank in range(VOCABULARY):
+        total += 1 / (rank + 1) ** 1.1
+        cumulative.append(total)
+    return [
+        (
+            " ".join(rng.choices(words, cum_weights=cumulative, k=15)),
+            f"https://example.com/{index}",
+        )
+        for index in range(count)
+    ]
+
+
+def _vectors(count: int, dim: int, seed: int):
+    np = knowledge._load_numpy()
+    if not dim or np is None:
+        return None
+    vectors = np.random.default_rng(seed).standard_normal(
+        (count, dim), dtype=np.float32
+    )
+    return list(
+        vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    )
+
+
+def _percentiles(latencies: list) -> str:
+    latencies.sort()
+    return (
+        f"{latencies[len(latencies) // 2] * 1000:>6.2f} | "
+        f"{latencies[int(len(latencies) * 0.99)] * 1000:>6.2f}"
+    )
+
+
+def _store(args, directory: str):
+    print(
+        f"{'findings':>8} | {'mode':>7} | {'fill s':>6} | {'MB':>5} | "
+        f"{'save ms':>7} | {'p50 ms':>6} | {'p99 ms':>6}"
+    )
+    modes = ["terms"]
+    if args.dim and knowledge._load_numpy() is not None:
+        modes.append("vectors")
+    for size in args.sizes:
+        claims = _claims(size + args.queries * 8, args.seed)
+        for mode in modes:
+            path = os.path.join(directory, f"{size}-{mode}.sqlite")
+            store = KnowledgeStore(path, max_findings=size * 2)
+            dim = args.dim if mode == "vectors" else 0
+            vectors = _vectors(len(claims), dim, args.seed)
+            start = time.perf_counter()
+            for offset in range(0, size, 1000):
+                batch = claims[offset : min(offset + 1000, size)]
+                store._save(
+                    "filler question",
+                    batch,
+                    vectors and vectors[offset : offset + len(batch)],
+                )
+            fill = time.perf_counter() - start
+
+            saves = []
+            recalls = []
+            for query in range(args.queries):
+                offset = size + query * 8
+                batch = claims[offset : offset + 8]
+                question = batch[0][0]
+                start = time.perf_counter()
+                store._save(
+                    question,
+                    batch,
+                    vectors and vectors[offset : offset + 8],
+                )
+                saves.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                store._recall(
+                    question,
+                    vectors[offset] if vectors else None,
+                    10,
+                    0.75,
+                    0.5,
+                )
+                recalls.append(time.perf_counter() - start)
+            megabytes = sum(
+                os.path.getsize(path + suffix)
+                for suffix in ("", "-wal")
+                if os.path.exists(path + suffix)
+            )
+            print(
+                f"{size:>8} | {mode:>7} | {fill:>6.1f} | "
+                f"{megabytes / 2**20:>5.1f} | "
+                f"{sum(saves) / len(saves) * 1000:>7.2f} | "
+                f"{_percentiles(recalls)}"
+            )
+
+
+async def _bench_recurring(args, directory: str):
+    print(
+        f"{args.topics} topics asked {args.repeats} times, "
+        f"{args.steps} research steps per answer\n"
+    )
+    print(
+        f"{'knowledge':>9} | {'model calls':>11} | {'tool calls':>10} | "
+        f"{'seconds':>7} | findings"
+    )
+    for enabled in (False, True):
+        knowledge._knowledge_store = KnowledgeStore(
+            os.path.join(directory, "recurring.sqlite")
+        )
+        result = await _recurring(args, enabled)
+        print(
+            f"{'on' if enabled else 'off':>9} | "
+            f"{result['model_calls']:>11} | {result['tool_calls']:>10} | "
+            f"{result['wall']:>7.2f} | {result['findings']}"
+        )
+    knowledge._knowledge_store = None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Knowledge store benchmark"
+    )
+    parser.add_argument(
+        "--scenario",
+        choices=["recurring", "store", "all"],
+        default="all",
+    )
+    parser.add_argument("--topics", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--steps", type=int, default=4)
+    parser.add_argument("--model-latency", type=float, default=0.05)
+    parser.add_argument("--tool-latency", type=float, default=0.05)
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1000, 10000, 100000]
+    )
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument(
+        "--dim",
+        type=int,
+        default=256,
+        help="Embedding size; 0 for term overlap only",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp(prefix="knowledge_bench_")
+    try:
+        if args.scenario in ("recurring", "all"):
+            asyncio.run(_bench_recurring(args, directory))
+        if args.scenario == "all":
+            print()
+        if args.scenario in ("store", "all"):
+            _store(args, directory)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,326 @@
+import asyncio
+from typing import List, Optional
+
+from api import trace
+from api.agent.messages import Message
+from api.config_loader import load_default_config
+from api.agent.token_counter import (
+    count_message_tokens,
+    count_text_tokens,
+)
+
+_memory_config = load_default_config().get("memory", {})
+
+SUMMARY_HEADER = "Summary of earlier research steps:"
+TRUNCATION_MARKER = "\n[... {tokens} tokens of tool output truncated]"
+
+
 class Memory:
-    def __init__(self):
-        self.messages = []
+    """
+    Chat history of one agent run.
+
+    When max_tokens is set, each message's token count is tracked and
+    the history is compacted before it is handed to the model once the
+    total exceeds the budget: first old, large tool outputs are cut to
+    a preview, then the oldest turns are folded into a summary message.
+    Compaction goes down to low_water * max_tokens so it runs rarely and
+    the prompt prefix stays stable between compactions: until then
+    messages are only appended, so every request repeats the previous
+    one byte for byte and can be served from the provider's prompt
+    cache. The system prompt, the user question and the most recent
+    turns are never touched, and an assistant tool call is always kept
+    or dropped together with its tool results.
+
+    Messages are kept as compact Message records (see
+    api.agent.messages), each building its wire format once, so
+    get_messages() only does work for the messages added since the
+    previous step.
+
+    The history can be checkpointed to a run store after each step;
+    only messages changed since the previous checkpoint are written.
+
+    Args:
+        max_tokens (Optional[int]): Prompt token budget, None for
+            unbounded history.
+        model (str): Model whose tokenizer is used for counting.
+        keep_recent_turns (int): Number of latest turns kept verbatim.
+        tool_output_preview_tokens (int): Tokens of a truncated tool
+            output that are kept.
+        low_water (float): Fraction of max_tokens compaction aims for.
+    """
+
+    def __init__(
+        self,
+        max_tokens: Optional[int] = None,
+        model: str = "gpt-4o",
+        keep_recent_turns: int = 2,
+        tool_output_preview_tokens: int = 200,
+        low_water: float = 0.75,
+    ):
+        self.messages: List[Message] = []
+        self.token_counts: List[int] = []
+        self.total_tokens = 0
+        self.max_tokens = max_tokens
+        self.model = model
+        self.keep_recent_turns = keep_recent_turns
+        self.tool_output_preview_tokens = tool_output_preview_tokens
+        self.low_water = low_water
+        # Index of the first message changed since the last checkpoint
+        self._dirty_from = 0
+
+    @classmethod
+    def from_config(cls, config: dict, model: str) -> "Memory":
+        """
+        Create a Memory with the context budget of a model, from the
+        memory section of default_config.yaml. A `context_budget` in the
+        request config overrides the per-model budget.
+
+        Args:
+            config (dict): Merged agent configuration.
+            model (str): The model the history is sent to.
+
+        Returns:
+            Memory: An empty Memory.
+        """
+        max_tokens = config.get(
+            "context_budget",
+            _memory_config.get("context_budget", {}).get(model),
+        )
+        return cls(
+            max_tokens=max_tokens,
+            model=model,
+            keep_recent_turns=_memory_config.get(
+                "keep_recent_turns", 2
+            ),
+            tool_output_preview_tokens=_memory_config.get(
+                "tool_output_preview_tokens", 200
+            ),
+            low_water=_memory_config.get("low_water", 0.75),
+        )
+
+    def _insert(self, index: int, message: Message):
+        tokens = count_message_tokens(message.wire(), self.model)
+        self._dirty_from = min(self._dirty_from, index)
+        self.messages.insert(index, message)
+        self.token_counts.insert(index, tokens)
+        self.total_tokens += tokens
+
+    def _append(self, message: Message):
+        self._insert(len(self.messages), message)
+
+    def _replace(self, index: int, message: Message):
+        tokens = count_message_tokens(message.wire(), self.model)
+        self.total_tokens += tokens - self.token_counts[index]
+        self._dirty_from = min(self._dirty_from, index)
+        self.messages[index] = message
+        self.token_counts[index] = tokens
 
     def add_system_prompt(self, prompt: str):
-        self.messages.insert(0, {"role": "system", "content": prompt})
+        """Add the system prompt; call first, on an empty Memory."""
+        self._append(Message("system", prompt))
+
+    def add_context(self, text: str):
+        """Add a system message after the system prompt, e.g. recalled
+        findings; call before add_user_input."""
+        self._append(Message("system", text))
 
     def add_user_input(self, prompt: str):
-        self.messages.append({"role": "user", "content": prompt})
+        self._append(Message("user", prompt))
 
     def add_model_step(self, content):
         """Add a model response to memory.
-        
+
         Args:
             content: Can be a string or a message object with tool calls
         """
-        if isinstance(content, str):
-            # Regular text response
-            self.messages.append({"role": "assistant", "content": content})
-        elif hasattr(content, 'tool_calls') and content.tool_calls:
-            # Message object with tool calls
-            message_dict = {
-                "role": "assistant",
-                "content": content.content,
-                "tool_calls": []
-            }
-            for tool_call in content.tool_calls:
-                message_dict["tool_calls"].append({
-                    "id": tool_call.id,
-                    "type": "function",
-                    "function": {
-                        "name": tool_call.function.name,
-                        "arguments": tool_call.function.arguments
-                    }
-                })
-            self.messages.append(message_dict)
-        else:
-            # Fallback for other message objects
-            content_str = getattr(content, 'content', str(content))
-            self.messages.append({"role": "assistant", "content": content_str})
+        self._append(Message.from_response(content))
 
     def add_tool_step(self, tool_call_id: str, content: str):
-        self.messages.append(
-            {
-                "role": "tool",
-                "tool_call_id": tool_call_id,
-                "content": content,
-            }
+        self._append(
+            Message("tool", content, tool_call_id=tool_call_id)
         )
 
     def get_messages(self):
-        return self.messages.copy()
+        if self.max_tokens and self.total_tokens > self.max_tokens:
+            before = list(self.messages)
+            tokens_before = self.total_tokens
+            self.compact()
+            # Provider prompt caching only covers the messages before
+            # the first one compaction changed
+            stable = next(
+                (
+                    index
+                    for index, (old, new) in enumerate(
+                        zip(before, self.messages)
+                    )
+                    if old is not new
+                ),
+                min(len(before), len(self.messages)),
+            )
+            trace.current_span().event(
+                "memory.compact",
+                tokens_before=tokens_before,
+                tokens_after=self.total_tokens,
+                stable_prefix_messages=stable,
+            )
+        return [message.wire() for message in self.messages]
+
+    # Checkpoints
+
+    def checkpoint(self, store, run_id: str, step: int) -> asyncio.Task:
+        """
+        Save the messages changed since the last checkpoint without
+        waiting for the write.
+
+        Args:
+            store (RunStore): Store from api.agent.run_store.
+            run_id (str): The run this history belongs to.
+            step (int): Number of completed steps.
+
+        Returns:
+            asyncio.Task: The background write.
+        """
+        start = self._dirty_from
+        self._dirty_from = len(self.messages)
+        return store.save_step(
+            run_id,
+            step,
+            start,
+            [message.wire() for message in self.messages[start:]],
+            self.token_counts[start:],
+        )
+
+    def restore(self, messages: List[dict], token_counts: List[int]):
+        """Replace the history with a checkpoint loaded from a store."""
+        self.messages = [Message.from_wire(m) for m in messages]
+        self.token_counts = list(token_counts)
+        self.total_tokens = sum(self.token_counts)
+        self._dirty_from = len(self.messages)
+
+    # Compaction
+
+    def _head_end(self) -> int:
+        """Index after the system prompt, user question and summary"""
+        index = 0
+        while (
+            index < len(self.messages)
+            and self.messages[index].role == "system"
+        ):
+            index += 1
+        if (
+            index < len(self.messages)
+            and self.messages[index].role == "user"
+        ):
+            index += 1
+        if index < len(self.messages) and _is_summary(
+            self.messages[index]
+        ):
+            index += 1
+        return index
+
+    def _turn_starts(self, head_end: int) -> List[int]:
+        # A turn is a model or user message plus the tool results that
+        # answer it
+        return [
+            index
+            for index in range(head_end, len(self.messages))
+            if self.messages[index].role != "tool"
+        ]
+
+    def compact(self):
+        """Shrink the history to low_water * max_tokens, if possible."""
+        target = int(self.max_tokens * self.low_water)
+        head_end = self._head_end()
+        turn_starts = self._turn_starts(head_end)
+        old_turns = len(turn_starts) - self.keep_recent_turns
+        if old_turns <= 0:
+            return
+        old_end = turn_starts[old_turns]
+
+        # 1. Cut large tool outputs of old turns down to a preview
+        for index in range(head_end, old_end):
+            if self.total_tokens <= target:
+                return
+            message = self.messages[index]
+            if (
+                message.role == "tool"
+                and self.token_counts[index]
+                > 2 * self.tool_output_preview_tokens
+            ):
+                self._replace(
+                    index,
+                    message.with_content(
+                        self._truncate(message.content)
+                    ),
+                )
+
+        # 2. Fold the oldest whole turns into the summary message
+        drop_end = head_end
+        dropped_tokens = 0
+        for turn_end in turn_starts[1 : old_turns + 1]:
+            if self.total_tokens - dropped_tokens <= target:
+                break
+            dropped_tokens += sum(self.token_counts[drop_end:turn_end])
+            drop_end = turn_end
+        if drop_end == head_end:
+            return
+
+        summary_lines = []
+        summary_index = head_end - 1
+        if summary_index >= 0 and _is_summary(
+            self.messages[summary_index]
+        ):
+            summary_lines = self.messages[
+                summary_index
+            ].content.splitlines()[1:]
+        else:
+            summary_index = None
+        for message in self.messages[head_end:drop_end]:
+            summary_lines.extend(_summarize_message(message))
+
+        self._dirty_from = min(self._dirty_from, head_end)
+        del self.messages[head_end:drop_end]
+        del self.token_counts[head_end:drop_end]
+        self.total_tokens = sum(self.token_counts)
+
+        summary = Message(
+            "assistant", "\n".join([SUMMARY_HEADER] + summary_lines)
+        )
+        if summary_index is None:
+            self._insert(head_end, summary)
+        else:
+            self._replace(summary_index, summary)
+
+    def _truncate(self, content: str) -> str:
+        tokens = count_text_tokens(content, self.model)
+        # Tokens average about four characters
+        preview = content[: self.tool_output_preview_tokens * 4]
+        return preview + TRUNCATION_MARKER.format(
+            tokens=tokens - self.tool_output_preview_tokens
+        )
+
+
+def _is_summary(message: Message) -> bool:
+    return message.role == "assistant" and (
+        message.content or ""
+    ).startswith(SUMMARY_HEADER)
+
+
+def _clip(text: str, limit: int = 200) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+def _summarize_message(message: Message) -> List[str]:
+    lines = []
+    if message.role == "tool":
+        lines.append(f"- Result: {_clip(message.content)}")
+        return lines
+    if message.content:
+        lines.append(f"- {_clip(message.content)}")
+    for tool_call in message.tool_calls or ():
+        lines.append(
+            f"- Called {tool_call.name}"
+            f"({_clip(tool_call.arguments, 120)})"
+        )
+    return lines
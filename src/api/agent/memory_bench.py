@@ -0,0 +1,148 @@
+"""
+Benchmark prompt size over steps with and without a context budget.
+
+Simulates a long research run where every step issues a search and gets
+a large tool output back, and prints the prompt tokens sent per step.
+It then holds the histories of many such runs at once, as a worker
+does, and prints the memory they take per run. The runs fetch the same
+pages, each as its own string, like separate requests would.
+
+Run from src/:
+    python -m api.agent.memory_bench --steps 30 --budget 16000
+    python -m api.agent.memory_bench --runs 200 --pages 10
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from openai.types.chat import ChatCompletionMessage
+
+from api.agent.memory import Memory
+
+
+def _tool_call_message(step: int) -> ChatCompletionMessage:
+    return ChatCompletionMessage.model_validate(
+        {
+            "role": "assistant",
+            "content": f"Thought: I need more data for step {step}.",
+            "tool_calls": [
+                {
+                    "id": f"call_{step}",
+                    "type": "function",
+                    "function": {
+                        "name": "search",
+                        "arguments": f'{{"query": "topic {step}"}}',
+                    },
+                }
+            ],
+        }
+    )
+
+
+def _run(memory: Memory, steps: int, tool_output_chars: int) -> list:
+    memory.add_system_prompt("You are a helpful research assistant.")
+    memory.add_user_input("How much revenue did NVIDIA make in 2024?")
+    tool_output = "lorem ipsum dolor sit amet " * (
+        tool_output_chars // 27
+    )
+
+    rows = []
+    for step in range(1, steps + 1):
+        start = time.perf_counter()
+        messages = memory.get_messages()
+        elapsed_us = (time.perf_counter() - start) * 1e6
+        rows.append(
+            (step, len(messages), memory.total_tokens, elapsed_us)
+        )
+        memory.add_model_step(_tool_call_message(step))
+        memory.add_tool_step(f"call_{step}", tool_output)
+    return rows
+
+
+def _bytes_per_run(
+    runs: int, steps: int, tool_output_chars: int, pages: int
+) -> float:
+    tracemalloc.start()
+    memories = []
+    for run in range(runs):
+        memory = Memory()
+        memory.add_system_prompt(
+            "You are a helpful research assistant."
+        )
+        memory.add_user_input(f"Question {run}")
+        for step in range(1, steps + 1):
+            memory.add_model_step(_tool_call_message(step))
+            # A new string per run, as if fetched again
+            page = (
+                f"page {step % pages} "
+                + "lorem ipsum dolor sit amet "
+                * (tool_output_chars // 27)
+            )
+            memory.add_tool_step(f"call_{step}", page)
+            memory.get_messages()
+        memories.append(memory)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current / runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory benchmark")
+    parser.add_argument("--steps", type=int, default=30)
+    parser.add_argument("--budget", type=int, default=16000)
+    parser.add_argument(
+        "--tool-output-chars",
+        type=int,
+        default=8000,
+        help="Size of each simulated tool output",
+    )
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=100,
+        help="Runs held at once for the memory measurement",
+    )
+    parser.add_argument(
+        "--pages",
+        type=int,
+        default=10,
+        help="Distinct tool outputs the runs share",
+    )
+    args = parser.parse_args()
+
+    unbounded = _run(Memory(), args.steps, args.tool_output_chars)
+    budgeted = _run(
+        Memory(max_tokens=args.budget),
+        args.steps,
+        args.tool_output_chars,
+    )
+
+    print(
+        f"{'step':>4} | {'unbounded tokens':>16} | "
+        f"{'budgeted tokens':>15} | {'messages':>8} | {'build us':>8}"
+    )
+    for (step, _, tokens, _), (_, count, b_tokens, b_us) in zip(
+        unbounded, budgeted
+    ):
+        print(
+            f"{step:>4} | {tokens:>16} | {b_tokens:>15} | "
+            f"{count:>8} | {b_us:>8.1f}"
+        )
+    print(
+        f"\ntotal prompt tokens: unbounded "
+        f"{sum(row[2] for row in unbounded)}, budgeted "
+        f"{sum(row[2] for row in budgeted)}"
+    )
+
+    per_run = _bytes_per_run(
+        args.runs, args.steps, args.tool_output_chars, args.pages
+    )
+    print(
+        f"unbounded history of {args.runs} runs at once: "
+        f"{per_run / 1024:.1f} KiB per run"
+    )
+
+
+if __name__ == "__main__":
+    main()
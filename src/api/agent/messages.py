@@ -0,0 +1,227 @@
+"""
+Compact records for the messages of a chat history.
+
+Memory keeps one Message per message instead of a provider wire dict:
+a slotted record with an interned role whose tool calls are slotted
+records too, so a long history costs a fraction of the dicts it stands
+for. Large contents, typically tool outputs, are shared between all
+messages holding an equal text, so the same page fetched by many
+concurrent runs is stored once per process. The wire format is built
+by wire() the first time it is needed and then kept, so each step's
+request only builds the dicts of the messages added since the last.
+The same goes for their JSON (see WireMessage.json_parts), which lets
+the request body be encoded without serializing the history again.
+"""
+
+import json
+import sys
+import weakref
+from typing import Any, Dict, Optional, Tuple
+
+# Contents at least this long are shared between equal messages
+SHARED_CONTENT_CHARS = 1024
+
+# content -> a live Message holding it, whose content object is reused
+_shared_contents: "weakref.WeakValueDictionary[str, Message]" = (
+    weakref.WeakValueDictionary()
+)
+
+
+class _EncodedText(str):
+    """JSON of a shared content; a str subclass so it can be weakly
+    referenced."""
+
+
+# content -> its JSON, while a message's encoding holds it
+_encoded_contents: "weakref.WeakValueDictionary[str, _EncodedText]" = (
+    weakref.WeakValueDictionary()
+)
+
+
+def _encode(value: Any) -> str:
+    # The encoding httpx uses for JSON bodies
+    return json.dumps(
+        value,
+        ensure_ascii=False,
+        separators=(",", ":"),
+        allow_nan=False,
+    )
+
+
+def _encode_content(content: str) -> str:
+    encoded = _encoded_contents.get(content)
+    if encoded is None:
+        encoded = _EncodedText(_encode(content))
+        _encoded_contents[content] = encoded
+    return encoded
+
+
+class WireMessage(dict):
+    """
+    A message in provider wire format, as returned by Message.wire().
+    Read-only: its JSON is computed once and reused for every request.
+    """
+
+    __slots__ = ("_json",)
+
+    def json_parts(self) -> Tuple[str, ...]:
+        """
+        The message's JSON, in parts to be concatenated. A large
+        content is its own part, shared with every message holding an
+        equal text, so the encoding is not stored once per run.
+        """
+        try:
+            return self._json
+        except AttributeError:
+            pass
+        parts = []
+        text = ""
+        for index, (key, value) in enumerate(self.items()):
+            text += ("," if index else "{") + _encode(key) + ":"
+            if (
+                key == "content"
+                and value is not None
+                and len(value) >= SHARED_CONTENT_CHARS
+            ):
+                parts += (text, _encode_content(value))
+                text = ""
+            else:
+                text += _encode(value)
+        parts.append(text + "}")
+        self._json = tuple(parts)
+        return self._json
+
+
+class ToolCall:
+    """A function call requested by the model."""
+
+    __slots__ = ("id", "name", "arguments")
+
+    def __init__(self, id: str, name: str, arguments: str):
+        self.id = id
+        self.name = sys.intern(name)
+        self.arguments = arguments
+
+    def wire(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "type": "function",
+            "function": {
+                "name": self.name,
+                "arguments": self.arguments,
+            },
+        }
+
+
+class Message:
+    """
+    One message of a chat history. Records are never mutated, so they
+    can be shared with checkpoints and compaction snapshots.
+
+    Args:
+        role (str): "system", "user", "assistant" or "tool".
+        content (Optional[str]): Text of the message.
+        tool_calls (Optional[Tuple[ToolCall, ...]]): Calls of an
+            assistant message.
+        tool_call_id (Optional[str]): Call a tool message answers.
+    """
+
+    __slots__ = (
+        "role",
+        "content",
+        "tool_calls",
+        "tool_call_id",
+        "_wire",
+        "__weakref__",
+    )
+
+    def __init__(
+        self,
+        role: str,
+        content: Optional[str] = None,
+        tool_calls: Optional[Tuple[ToolCall, ...]] = None,
+        tool_call_id: Optional[str] = None,
+    ):
+        self.role = sys.intern(role)
+        self.content = content
+        self.tool_calls = tool_calls
+        self.tool_call_id = tool_call_id
+        self._wire = None
+        if content is not None and len(content) >= SHARED_CONTENT_CHARS:
+            shared = _shared_contents.get(content)
+            if shared is None:
+                _shared_contents[content] = self
+            else:
+                self.content = shared.content
+
+    @classmethod
+    def from_response(cls, response) -> "Message":
+        """Message for a model response, text or message object."""
+        if isinstance(response, str):
+            return cls("assistant", response)
+        tool_calls = getattr(response, "tool_calls", None)
+        if tool_calls:
+            return cls(
+                "assistant",
+                response.content,
+                tuple(
+                    ToolCall(
+                        tool_call.id,
+                        tool_call.function.name,
+                        tool_call.function.arguments,
+                    )
+                    for tool_call in tool_calls
+                ),
+            )
+        return cls(
+            "assistant", getattr(response, "content", str(response))
+        )
+
+    @classmethod
+    def from_wire(cls, message: Dict[str, Any]) -> "Message":
+        """Message for a dict in provider wire format."""
+        tool_calls = message.get("tool_calls")
+        return cls(
+            message["role"],
+            message.get("content"),
+            (
+                tuple(
+                    ToolCall(
+                        tool_call["id"],
+                        tool_call["function"]["name"],
+                        tool_call["function"]["arguments"],
+                    )
+                    for tool_call in tool_calls
+                )
+                if tool_calls
+                else None
+            ),
+            message.get("tool_call_id"),
+        )
+
+    def with_content(self, content: str) -> "Message":
+        return Message(
+            self.role, content, self.tool_calls, self.tool_call_id
+        )
+
+    def wire(self) -> WireMessage:
+        """
+        The message in provider wire format. Built on the first call and
+        returned by every later one, so treat it as read-only.
+        """
+        if self._wire is not None:
+            return self._wire
+        if self.tool_call_id is not None:
+            message = WireMessage(
+                role=self.role,
+                tool_call_id=self.tool_call_id,
+                content=self.content,
+            )
+        else:
+            message = WireMessage(role=self.role, content=self.content)
+            if self.tool_calls:
+                message["tool_calls"] = [
+                    tool_call.wire() for tool_call in self.tool_calls
+                ]
+        self._wire = message
+        return message
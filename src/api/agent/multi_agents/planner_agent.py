@@ -1,15 +1,221 @@
-async def run_planner_agent(prompt: str, config: dict) -> str:
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from api import trace
+from api.config_loader import load_default_config
+from api.models.model_router import call_model
+from api.agent.single_agent import emit_event, run_single_agent
+from api.agent.multi_agents.task_graph import (
+    TaskNode,
+    parse_plan,
+    run_task_graph,
+    timing_report,
+)
+
+_planner_config = load_default_config().get("planner", {})
+
+PLANNER_PROMPT = (
+    "You are the planner of a research team. Break the user's research "
+    "question into a small number of focused sub-tasks that research "
+    "assistants with web search and Python tools can each answer on "
+    "their own. Tasks that do not need each other's results must not "
+    "depend on each other, so they can run in parallel. Only add a "
+    "dependency when a task really needs another task's result, e.g. "
+    "to compute with figures found by it.\n\n"
+    "Respond with JSON only, in this format:\n"
+    '{"tasks": [\n'
+    '  {"id": "t1", "task": "...", "depends_on": []},\n'
+    '  {"id": "t2", "task": "...", "depends_on": ["t1"]}\n'
+    "]}\n"
+    "Use at most {max_tasks} tasks."
+)
+
+SUMMARIZER_PROMPT = (
+    "You are the lead researcher. Research assistants have worked on "
+    "sub-tasks of the user's question. Write the final answer to the "
+    "question from their findings. Point out where findings conflict "
+    "or are missing instead of making things up."
+)
+
+
+def _subtask_prompt(
+    question: str, node: TaskNode, inputs: Dict[str, str]
+) -> str:
+    parts = [
+        f"Overall research question: {question}",
+        f"Your sub-task: {node.task}",
+    ]
+    if inputs:
+        parts.append("Results of the tasks this one depends on:")
+        for dep, result in inputs.items():
+            parts.append(f"[{dep}] {result}")
+    return "\n\n".join(parts)
+
+
+def _content(response) -> str:
+    if isinstance(response, str):
+        return response
+    return getattr(response, "content", None) or ""
+
+
+async def _plan(prompt: str, config: dict) -> List[TaskNode]:
+    """Ask the planner model for a task graph, or fall back to one task"""
+    max_tasks = max(
+        1,
+        int(
+            config.get(
+                "max_subtasks", _planner_config.get("max_tasks", 6)
+            )
+        ),
+    )
+    response = await call_model(
+        [
+            {
+                "role": "system",
+                "content": PLANNER_PROMPT.replace(
+                    "{max_tasks}", str(max_tasks)
+                ),
+            },
+            {"role": "user", "content": prompt},
+        ],
+        config,
+        agent_id="planner_agent",
+    )
+    try:
+        return parse_plan(_content(response), max_tasks)
+    except ValueError as e:
+        trace.debug(
+            "Invalid plan, running the question as one task",
+            error=str(e),
+        )
+        return [TaskNode("t1", prompt, [])]
+
+
+async def _summarize(
+    prompt: str, nodes: List[TaskNode], config: dict
+) -> str:
+    findings = "\n\n".join(
+        f"[{node.id}] {node.task}\n"
+        f"{node.result if node.error is None else 'Error: ' + node.error}"
+        for node in nodes
+    )
+    response = await call_model(
+        [
+            {"role": "system", "content": SUMMARIZER_PROMPT},
+            {
+                "role": "user",
+                "content": f"Question: {prompt}\n\nFindings:\n\n{findings}",
+            },
+        ],
+        config,
+        agent_id="summarizer_agent",
+    )
+    return _content(response)
+
+
+async def run_planner_agent(
+    prompt: str,
+    config: dict,
+    on_event: Optional[Callable[[dict], Awaitable[None]]] = None,
+) -> str:
     """
-    Run the planner agent with the provided prompt and configuration.
-    
+    Plan the question as a graph of sub-tasks, run them as concurrent
+    sub-agents along the dependency edges and merge their results.
+
     Args:
         prompt (str): The input prompt for the planner agent.
         config (dict): Configuration dictionary for the planner agent.
-        
+        on_event (Optional[Callable[[dict], Awaitable[None]]]): Async
+            callback receiving progress events. Planner events (plan,
+            subtask_start, subtask_result, timing) have step 0;
+            sub-agent events carry the task_id they belong to.
+
     Returns:
-        str: The response from the planner agent.
+        str: The merged answer.
     """
-    # Placeholder for actual planner agent logic
-    # This should include the logic to process the prompt and return a response
-    # For now, we will just return a mock response
-    return f"[Planner Agent Stub] You said: {prompt} with config: {config}"
\ No newline at end of file
+    with trace.span("planner.run", prompt_chars=len(prompt)) as span:
+        answer, report = await _run_plan(prompt, config, on_event)
+        span.set(
+            tasks=len(report["tasks"]),
+            critical_path=report["critical_path"],
+            critical_path_seconds=report["critical_path_seconds"],
+            sum_task_seconds=report["sum_task_seconds"],
+        )
+    return answer
+
+
+async def _run_plan(
+    prompt: str,
+    config: dict,
+    on_event: Optional[Callable[[dict], Awaitable[None]]],
+) -> Tuple[str, dict]:
+    origin = time.monotonic()
+    with trace.span("planner.plan") as span:
+        nodes = await _plan(prompt, config)
+        span.set(tasks=len(nodes))
+    await emit_event(
+        on_event, "plan", 0, tasks=[node.to_dict() for node in nodes]
+    )
+
+    subagent_config = {
+        **config,
+        "max_steps": config.get(
+            "subagent_max_steps",
+            _planner_config.get("subagent_max_steps", 5),
+        ),
+    }
+
+    async def run_node(node: TaskNode, inputs: Dict[str, str]) -> str:
+        await emit_event(
+            on_event,
+            "subtask_start",
+            0,
+            task_id=node.id,
+            task=node.task,
+        )
+
+        async def on_subagent_event(event: dict):
+            await on_event({**event, "task_id": node.id})
+
+        with trace.span(
+            "planner.task",
+            task_id=node.id,
+            depends_on=node.depends_on,
+            queued_seconds=round(node.started_at - node.ready_at, 3),
+        ):
+            result = await run_single_agent(
+                _subtask_prompt(prompt, node, inputs),
+                subagent_config,
+                on_subagent_event if on_event is not None else None,
+                agent_id="search_agent",
+            )
+        await emit_event(
+            on_event,
+            "subtask_result",
+            0,
+            task_id=node.id,
+            content=result,
+            seconds=round(time.monotonic() - node.started_at, 3),
+        )
+        return result
+
+    await run_task_graph(
+        nodes,
+        run_node,
+        # From the request; 0 would never start a task
+        max_parallel=max(
+            1,
+            int(
+                config.get(
+                    "max_parallel_subtasks",
+                    _planner_config.get("max_parallel_tasks", 4),
+                )
+            ),
+        ),
+    )
+    with trace.span("planner.summarize"):
+        answer = await _summarize(prompt, nodes, config)
+
+    report = timing_report(nodes, origin, time.monotonic())
+    await emit_event(on_event, "timing", 0, **report)
+    return answer, report
@@ -0,0 +1,250 @@
+"""
+Dependency graph of planner sub-tasks and its concurrent execution.
+
+Every task starts as soon as all of its dependencies have finished and
+a concurrency slot is free, so the wall-clock time of a plan follows
+its critical path rather than the number of tasks.
+"""
+
+import asyncio
+import json
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+class TaskNode:
+    """
+    One sub-task of a plan.
+
+    Args:
+        id (str): Task ID, unique within the plan.
+        task (str): What the sub-agent should find out.
+        depends_on (List[str]): IDs of tasks whose results it needs.
+    """
+
+    def __init__(self, id: str, task: str, depends_on: List[str]):
+        self.id = id
+        self.task = task
+        self.depends_on = depends_on
+        self.result: Optional[str] = None
+        self.error: Optional[str] = None
+        # time.monotonic() when dependencies were met, when the task
+        # got a concurrency slot and when it finished
+        self.ready_at: Optional[float] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def duration(self) -> float:
+        if self.started_at is None or self.finished_at is None:
+            return 0.0
+        return self.finished_at - self.started_at
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "task": self.task,
+            "depends_on": self.depends_on,
+        }
+
+
+def _extract_json(text: str) -> dict:
+    # Models like to wrap JSON in prose or code fences
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        raise ValueError("No JSON object in plan")
+    return json.loads(text[start : end + 1])
+
+
+def parse_plan(text: str, max_tasks: int) -> List[TaskNode]:
+    """
+    Parse a planner response of the form
+    {"tasks": [{"id": "t1", "task": "...", "depends_on": []}, ...]}.
+    Unknown dependencies are dropped.
+
+    Args:
+        text (str): Model response.
+        max_tasks (int): Tasks beyond this are ignored.
+
+    Returns:
+        List[TaskNode]: The tasks in plan order.
+
+    Raises:
+        ValueError: If the plan is not valid JSON, does not have the
+            shape above, has no tasks or contains a dependency cycle.
+    """
+    data = _extract_json(text)
+    if not isinstance(data, dict):
+        raise ValueError("Plan is not a JSON object")
+    tasks = data.get("tasks", [])
+    if not isinstance(tasks, list):
+        raise ValueError("Plan tasks are not a list")
+    nodes = []
+    for index, item in enumerate(tasks[:max_tasks]):
+        if not isinstance(item, dict):
+            raise ValueError(f"Plan task {index + 1} is not an object")
+        task = str(item.get("task", "")).strip()
+        if not task:
+            continue
+        depends_on = item.get("depends_on") or []
+        if not isinstance(depends_on, list):
+            raise ValueError(
+                f"depends_on of plan task {index + 1} is not a list"
+            )
+        nodes.append(
+            TaskNode(
+                str(item.get("id") or f"t{index + 1}"),
+                task,
+                [str(dep) for dep in depends_on],
+            )
+        )
+    if not nodes:
+        raise ValueError("Plan has no tasks")
+    ids = {node.id for node in nodes}
+    if len(ids) != len(nodes):
+        raise ValueError("Plan has duplicate task IDs")
+    for node in nodes:
+        node.depends_on = [
+            dep
+            for dep in node.depends_on
+            if dep in ids and dep != node.id
+        ]
+    topological_order(nodes)
+    return nodes
+
+
+def topological_order(nodes: List[TaskNode]) -> List[TaskNode]:
+    """
+    Order tasks so that each comes after its dependencies.
+
+    Raises:
+        ValueError: If the dependencies contain a cycle.
+    """
+    remaining = {node.id: len(node.depends_on) for node in nodes}
+    dependents: Dict[str, List[TaskNode]] = {
+        node.id: [] for node in nodes
+    }
+    for node in nodes:
+        for dep in node.depends_on:
+            dependents[dep].append(node)
+
+    order = [node for node in nodes if not node.depends_on]
+    for node in order:
+        for dependent in dependents[node.id]:
+            remaining[dependent.id] -= 1
+            if remaining[dependent.id] == 0:
+                order.append(dependent)
+    if len(order) != len(nodes):
+        raise ValueError("Plan has a dependency cycle")
+    return order
+
+
+async def run_task_graph(
+    nodes: List[TaskNode],
+    run_node: Callable[[TaskNode, Dict[str, str]], Awaitable[str]],
+    max_parallel: int,
+):
+    """
+    Run every task once its dependencies are done, at most
+    max_parallel at a time. A failed task records its error and its
+    dependents still run, seeing the error as that dependency's result.
+
+    Args:
+        nodes (List[TaskNode]): The plan.
+        run_node (Callable[[TaskNode, Dict[str, str]], Awaitable[str]]):
+            Runs one task given {dependency ID: result}.
+        max_parallel (int): Maximum number of tasks running at once.
+    """
+    by_id = {node.id: node for node in nodes}
+    semaphore = asyncio.Semaphore(max_parallel)
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def run(node: TaskNode):
+        await asyncio.gather(*(tasks[dep] for dep in node.depends_on))
+        node.ready_at = time.monotonic()
+        async with semaphore:
+            node.started_at = time.monotonic()
+            inputs = {
+                dep: by_id[dep].result or f"Error: {by_id[dep].error}"
+                for dep in node.depends_on
+            }
+            try:
+                node.result = await run_node(node, inputs)
+            except Exception as e:
+                node.error = f"{type(e).__name__}: {e}"
+            finally:
+                node.finished_at = time.monotonic()
+
+    for node in topological_order(nodes):
+        tasks[node.id] = asyncio.ensure_future(run(node))
+    try:
+        await asyncio.gather(*tasks.values())
+    finally:
+        for task in tasks.values():
+            task.cancel()
+
+
+def critical_path(nodes: List[TaskNode]) -> Tuple[float, List[str]]:
+    """
+    Longest chain of task run times through the dependency graph.
+
+    Returns:
+        Tuple[float, List[str]]: Its length in seconds and task IDs.
+    """
+    best: Dict[str, Tuple[float, List[str]]] = {}
+    for node in topological_order(nodes):
+        before = max(
+            (best[dep] for dep in node.depends_on),
+            key=lambda entry: entry[0],
+            default=(0.0, []),
+        )
+        best[node.id] = (
+            before[0] + node.duration,
+            before[1] + [node.id],
+        )
+    return max(best.values(), key=lambda entry: entry[0])
+
+
+def timing_report(
+    nodes: List[TaskNode], origin: float, finished_at: float
+) -> Dict:
+    """
+    Per-task timings relative to origin, plus how the wall-clock time
+    compares to the critical path and to running tasks one by one.
+
+    Args:
+        nodes (List[TaskNode]): The executed plan.
+        origin (float): time.monotonic() when the run started.
+        finished_at (float): time.monotonic() when the run finished.
+
+    Returns:
+        Dict: Timing report.
+    """
+
+    def offset(moment: Optional[float]) -> Optional[float]:
+        return None if moment is None else round(moment - origin, 3)
+
+    path_seconds, path = critical_path(nodes)
+    return {
+        "tasks": [
+            {
+                "id": node.id,
+                "depends_on": node.depends_on,
+                "ready": offset(node.ready_at),
+                "started": offset(node.started_at),
+                "finished": offset(node.finished_at),
+                "queued_seconds": round(
+                    (node.started_at or 0) - (node.ready_at or 0), 3
+                ),
+                "run_seconds": round(node.duration, 3),
+                "error": node.error,
+            }
+            for node in nodes
+        ],
+        "critical_path": path,
+        "critical_path_seconds": round(path_seconds, 3),
+        "sum_task_seconds": round(
+            sum(node.duration for node in nodes), 3
+        ),
+        "wall_seconds": round(finished_at - origin, 3),
+    }
@@ -0,0 +1,351 @@
+"""
+Persistent agent runs: each run's prompt, config, status and Memory
+checkpoints, so a run interrupted by a worker restart or an error can
+be fetched and resumed from its last completed step.
+
+Checkpoints are incremental: after a step only the messages that
+changed since the previous checkpoint are written, and the write runs
+in a background task over a thread, so the ReAct loop never waits on
+disk. Writes of one run are applied in order. The SQLite file
+(runs.sqlite_path in default_config.yaml) is shared by all uvicorn
+workers on the host.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Set, Tuple
+
+from api import metrics, trace
+from api.config_loader import load_default_config
+
+_runs_config = load_default_config().get("runs", {})
+
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class RunInProgressError(Exception):
+    """The run is already executing in this process."""
+
+    def __init__(self, run_id: str):
+        super().__init__(f"Run {run_id} is already in progress")
+        self.run_id = run_id
+
+
+def new_run_id() -> str:
+    return uuid.uuid4().hex
+
+
+class RunStore:
+    """
+    SQLite store of agent runs and their message history. Queries run
+    in a thread so the event loop is not blocked on disk I/O.
+
+    Args:
+        path (str): Database file.
+        ttl_seconds (float): Runs not updated for this long are
+            deleted when new runs are created.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = 604800):
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " run_id TEXT PRIMARY KEY,"
+            " prompt TEXT NOT NULL,"
+            " config TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " step INTEGER NOT NULL DEFAULT 0,"
+            " answer TEXT,"
+            " error TEXT,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS runs_updated ON runs (updated_at)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS run_messages ("
+            " run_id TEXT NOT NULL,"
+            " position INTEGER NOT NULL,"
+            " message TEXT NOT NULL,"
+            " tokens INTEGER NOT NULL,"
+            " PRIMARY KEY (run_id, position))"
+        )
+        # Runs executing in this process
+        self.active: Set[str] = set()
+        # Last checkpoint write of each run, which the next one waits for
+        self._pending: Dict[str, asyncio.Task] = {}
+        # Runs whose checkpoint write failed; their later deltas would
+        # leave a gap, so the last complete checkpoint is kept instead
+        self._failed: Set[str] = set()
+
+    # Synchronous queries, run in a thread
+
+    def _execute_many(self, statements: List[Tuple[str, tuple]]):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, params in statements:
+                    self._conn.execute(sql, params)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _create(self, run_id: str, prompt: str, config: str):
+        now = time.time()
+        self._execute_many(
+            [
+                (
+                    "DELETE FROM run_messages WHERE run_id IN ("
+                    " SELECT run_id FROM runs WHERE updated_at < ?)",
+                    (now - self.ttl_seconds,),
+                ),
+                (
+                    "DELETE FROM runs WHERE updated_at < ?",
+                    (now - self.ttl_seconds,),
+                ),
+                (
+                    "INSERT INTO runs (run_id, prompt, config, status,"
+                    " created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (run_id, prompt, config, RUNNING, now, now),
+                ),
+            ]
+        )
+
+    def _get(self, run_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT run_id, prompt, config, status, step, answer,"
+                " error, created_at, updated_at FROM runs"
+                " WHERE run_id = ?",
+                (run_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        keys = (
+            "run_id",
+            "prompt",
+            "config",
+            "status",
+            "step",
+            "answer",
+            "error",
+            "created_at",
+            "updated_at",
+        )
+        run = dict(zip(keys, row))
+        run["config"] = json.loads(run["config"])
+        return run
+
+    def _load_messages(
+        self, run_id: str
+    ) -> Tuple[List[dict], List[int]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT message, tokens FROM run_messages"
+                " WHERE run_id = ? ORDER BY position",
+                (run_id,),
+            ).fetchall()
+        return [json.loads(m) for m, _ in rows], [t for _, t in rows]
+
+    def _save_step(
+        self,
+        run_id: str,
+        step: int,
+        start: int,
+        messages: List[dict],
+        token_counts: List[int],
+    ):
+        rows = [
+            (run_id, start + offset, json.dumps(message), tokens)
+            for offset, (message, tokens) in enumerate(
+                zip(messages, token_counts)
+            )
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "DELETE FROM run_messages"
+                    " WHERE run_id = ? AND position >= ?",
+                    (run_id, start),
+                )
+                self._conn.executemany(
+                    "INSERT INTO run_messages VALUES (?, ?, ?, ?)", rows
+                )
+                self._conn.execute(
+                    "UPDATE runs SET step = ?, updated_at = ?"
+                    " WHERE run_id = ?",
+                    (step, time.time(), run_id),
+                )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _set_status(
+        self,
+        run_id: str,
+        status: str,
+        answer: Optional[str],
+        error: Optional[str],
+    ):
+        self._execute_many(
+            [
+                (
+                    "UPDATE runs SET status = ?, answer = ?, error = ?,"
+                    " updated_at = ? WHERE run_id = ?",
+                    (status, answer, error, time.time(), run_id),
+                )
+            ]
+        )
+
+    # Async API
+
+    async def create(self, run_id: str, prompt: str, config: dict):
+        """Record a new run with status running."""
+        await asyncio.to_thread(
+            self._create,
+            run_id,
+            prompt,
+            json.dumps(config, default=str),
+        )
+
+    async def get(self, run_id: str) -> Optional[Dict]:
+        """The run's record, or None if it is unknown."""
+        return await asyncio.to_thread(self._get, run_id)
+
+    async def load_messages(
+        self, run_id: str
+    ) -> Tuple[List[dict], List[int]]:
+        """Messages and their token counts as of the last checkpoint."""
+        await self.flush(run_id)
+        return await asyncio.to_thread(self._load_messages, run_id)
+
+    def save_step(
+        self,
+        run_id: str,
+        step: int,
+        start: int,
+        messages: List[dict],
+        token_counts: List[int],
+    ) -> asyncio.Task:
+        """
+        Write a checkpoint in the background and return at once.
+
+        Args:
+            run_id (str): The run.
+            step (int): Number of completed steps.
+            start (int): Index of the first changed message; stored
+                messages from there on are replaced.
+            messages (List[dict]): Messages from start on. They must
+                not be mutated afterwards; Memory replaces messages
+                instead of changing them.
+            token_counts (List[int]): Their token counts.
+
+        Returns:
+            asyncio.Task: The write, which never raises.
+        """
+        previous = self._pending.get(run_id)
+
+        async def write():
+            if previous is not None:
+                await asyncio.wait([previous])
+            if run_id in self._failed:
+                return
+            try:
+                await asyncio.to_thread(
+                    self._save_step,
+                    run_id,
+                    step,
+                    start,
+                    messages,
+                    token_counts,
+                )
+            except (sqlite3.Error, TypeError, ValueError) as e:
+                self._failed.add(run_id)
+                metrics.ERRORS.labels(
+                    "checkpoint", type(e).__name__
+                ).inc()
+                trace.debug(
+                    "Checkpoint failed", run_id=run_id, error=str(e)
+                )
+
+        task = asyncio.ensure_future(write())
+        self._pending[run_id] = task
+
+        def done(_):
+            if self._pending.get(run_id) is task:
+                del self._pending[run_id]
+
+        task.add_done_callback(done)
+        return task
+
+    async def flush(self, run_id: Optional[str] = None):
+        """Wait for the checkpoint writes of a run, or of all runs."""
+        if run_id is None:
+            pending = list(self._pending.values())
+        else:
+            pending = (
+                [self._pending[run_id]]
+                if run_id in self._pending
+                else []
+            )
+        if pending:
+            await asyncio.wait(pending)
+
+    async def finish(
+        self,
+        run_id: str,
+        status: str,
+        answer: Optional[str] = None,
+        error: Optional[str] = None,
+    ):
+        """Record the outcome of a run after its last checkpoint."""
+        await self.flush(run_id)
+        self._failed.discard(run_id)
+        await asyncio.to_thread(
+            self._set_status, run_id, status, answer, error
+        )
+
+
+_run_store: Optional[RunStore] = None
+
+
+def get_run_store() -> RunStore:
+    """
+    Get the process-wide run store, opening the database from the runs
+    section of default_config.yaml on first use.
+
+    Returns:
+        RunStore: The shared run store.
+    """
+    global _run_store
+    if _run_store is None:
+        _run_store = RunStore(
+            path=_runs_config.get("sqlite_path", ".cache/runs.sqlite"),
+            ttl_seconds=_runs_config.get("ttl_seconds", 604800),
+        )
+    return _run_store
+
+
+async def flush_run_store():
+    """Wait for outstanding checkpoint writes, e.g. on shutdown."""
+    if _run_store is not None:
+        await _run_store.flush()
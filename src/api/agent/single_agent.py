@@ -1,15 +1,21 @@
 import json
-
-from api.models.model_router import call_model
+from typing import Awaitable, Callable, Optional
+
+from api import metrics, trace
+from api.models.model_router import call_model, get_model_config
+from api.agent.knowledge import (
+    knowledge_settings,
+    recall_context,
+    save_findings,
+)
 from api.agent.memory import Memory
+from api.agent.run_store import get_run_store
+from api.models.prompt import PromptPrefix
 from api.tools import (
-    get_available_tools,
     get_tools_openai_format,
-    execute_tool,
+    execute_tool_calls,
 )
 
-tools = get_available_tools()
-
 SYSTEM_PROMPT = (
     "You are a helpful research assistant following the ReAct (Reasoning and Acting) framework. "
     "You have access to tools that can help you answer questions. "
@@ -35,41 +41,25 @@ SYSTEM_PROMPT = (
     "Always think step by step and use the tools to gather information before providing your final answer."
 )
 
+_prompt_prefix: Optional[PromptPrefix] = None
 
-def print_tool_call_debug(
-    tool_name: str,
-    tool_args: str,
-    tool_call_id: str,
-    tool_result: str,
-):
-    """Print debug output for tool call steps"""
-    print(f"> Tool name: {tool_name}")
-    print(f"> Tool arg: {tool_args}")
-    print(f"> Tool call ID: {tool_call_id}")
-    print(f"< Tool result: {tool_result}")
-
-
-def print_text_step_debug(step_count: int, content: str):
-    """Print debug output for text response steps"""
-    print(content)
 
-
-def print_react_debug(
-    step_count: int,
-    thought: str = None,
-    action: str = None,
-    action_input: str = None,
-    tool_result: str = None,
-):
-    """Print ReAct-style debug output"""
-    if thought:
-        print(f"- {thought}")
-    if action:
-        print(f"- {action}")
-    if action_input:
-        print(f"- {action_input}")
-    if tool_result:
-        print(f"- Tool Result: {tool_result}")
+def get_prompt_prefix() -> PromptPrefix:
+    """
+    System prompt and tool schemas every request starts with. Built
+    once and shared by all runs, so each request of a run begins with
+    the same bytes; rebuilt only if tools are registered later.
+    """
+    global _prompt_prefix
+    tools_openai_format = get_tools_openai_format()
+    if (
+        _prompt_prefix is None
+        or _prompt_prefix.tools is not tools_openai_format
+    ):
+        _prompt_prefix = PromptPrefix(
+            SYSTEM_PROMPT, tools_openai_format
+        )
+    return _prompt_prefix
 
 
 def extract_react_components(response_content: str) -> dict:
@@ -120,151 +110,257 @@ def extract_react_components(response_content: str) -> dict:
     }
 
 
-# ReAct Agent Loop
-async def run_single_agent(prompt: str, config: dict) -> str:
-    memory = Memory()
-    memory.add_system_prompt(SYSTEM_PROMPT)
-    memory.add_user_input(prompt)
+async def emit_event(
+    on_event: Optional[Callable[[dict], Awaitable[None]]],
+    event_type: str,
+    step: int,
+    **data,
+):
+    """Send an agent progress event to the caller, if it listens"""
+    if on_event is not None:
+        await on_event({"type": event_type, "step": step, **data})
+
+
+async def emit_react_event(
+    on_event: Optional[Callable[[dict], Awaitable[None]]],
+    step: int,
+    content: str,
+):
+    """Send the ReAct components of a model response as a thought event"""
+    if on_event is None or not content:
+        return
+    react_components = extract_react_components(content)
+    if any(react_components.values()):
+        await emit_event(on_event, "thought", step, **react_components)
+
 
+# ReAct Agent Loop
+async def run_single_agent(
+    prompt: str,
+    config: dict,
+    on_event: Optional[Callable[[dict], Awaitable[None]]] = None,
+    agent_id: str = "single_agent",
+    run_id: Optional[str] = None,
+) -> str:
+    """
+    Run the ReAct loop until the model gives a final answer or
+    max_steps is reached.
+
+    Args:
+        prompt (str): The user question.
+        config (dict): Merged agent configuration.
+        on_event (Optional[Callable[[dict], Awaitable[None]]]): Async
+            callback receiving progress events (resumed, step, token,
+            thought, action, tool_result) as they happen. When set, model
+            responses are streamed token by token.
+        agent_id (str): Model slot in default_config.yaml to use, e.g.
+            "search_agent" for planner sub-agents.
+        run_id (Optional[str]): Run in the run store to checkpoint
+            after every step. If it has a checkpoint, the loop resumes
+            after its last completed step.
+
+    Unless knowledge is disabled, findings of earlier runs relevant to
+    the prompt are added after the system prompt, and the findings of
+    the final answer are saved (see api.agent.knowledge).
+
+    Returns:
+        str: The final answer, or a stop message.
+    """
+    model = get_model_config(config, agent_id).get("model", "")
+    memory = Memory.from_config(config, model)
     step_count = 0
+    store = None
+    if run_id is not None:
+        store = get_run_store()
+        messages, token_counts = await store.load_messages(run_id)
+        if messages:
+            memory.restore(messages, token_counts)
+            run = await store.get(run_id)
+            step_count = run["step"] if run else 0
+    prefix = get_prompt_prefix()
+    knowledge = knowledge_settings(config)
+    if not memory.messages:
+        memory.add_system_prompt(prefix.system_prompt)
+        if knowledge is not None:
+            context = await recall_context(prompt, knowledge, model)
+            if context is not None:
+                memory.add_context(context)
+        memory.add_user_input(prompt)
+
     max_steps = config.get("max_steps", 5)
-    tools_openai_format = get_tools_openai_format()
+    tools_openai_format = prefix.tools
+
+    with trace.span(
+        "agent.run",
+        agent_id=agent_id,
+        model=model,
+        prompt_chars=len(prompt),
+        max_steps=max_steps,
+        run_id=run_id,
+        resumed_from_step=step_count,
+    ) as run_span:
+        if step_count:
+            await emit_event(on_event, "resumed", step_count)
+        if trace.debug_enabled():
+            trace.debug("Tool schemas", tools=tools_openai_format)
+
+        steps = metrics.STEPS.labels(agent_id)
+        try:
+            while step_count < max_steps:
+                step_count += 1
+                steps.inc()
+                await emit_event(on_event, "step", step_count)
+                with trace.span("agent.step", step=step_count):
+                    final_answer = await _run_step(
+                        memory,
+                        config,
+                        agent_id,
+                        tools_openai_format,
+                        step_count,
+                        on_event,
+                    )
+                if store is not None:
+                    memory.checkpoint(store, run_id, step_count)
+                if final_answer is not None:
+                    run_span.set(
+                        steps=step_count, answer_chars=len(final_answer)
+                    )
+                    metrics.RUNS.labels(agent_id, "answer").inc()
+                    if knowledge is not None:
+                        save_findings(
+                            prompt,
+                            final_answer,
+                            [
+                                message.content
+                                for message in memory.messages
+                                if message.role == "tool"
+                            ],
+                            knowledge,
+                        )
+                    return final_answer
+        except Exception:
+            metrics.RUNS.labels(agent_id, "error").inc()
+            raise
+
+        run_span.set(steps=step_count, final_answer=False)
+        metrics.RUNS.labels(agent_id, "max_steps").inc()
+        return f"[Stopped after {max_steps} steps - no final answer]"
+
+
+async def _run_step(
+    memory: Memory,
+    config: dict,
+    agent_id: str,
+    tools_openai_format: list,
+    step_count: int,
+    on_event: Optional[Callable[[dict], Awaitable[None]]],
+) -> Optional[str]:
+    """Run one model call and its tool calls; return the final answer"""
+    messages = memory.get_messages()
+    trace.current_span().set(
+        messages=len(messages), prompt_tokens=memory.total_tokens
+    )
 
-    # Debug: Print available tools and schemas when agent starts
-    print("\n" + "=" * 60)
-    print("AGENT STARTING - AVAILABLE TOOLS:")
-    for tool in tools_openai_format:
-        tool_name = tool["function"]["name"]
-        tool_desc = tool["function"]["description"]
-        print(f"  • {tool_name}: {tool_desc}")
-    print("=" * 60)
-
-    print(f"\nTOOL SCHEMAS:")
-    print(json.dumps(tools_openai_format, indent=2))
-
-    # Log initial user question (not as a model thought)
-    print("\n" + "=" * 60)
-    print(f"\nUSER QUESTION: {prompt}")
-    print("=" * 60)
-
-    while step_count < max_steps:
-        step_count += 1
-        print(f"\n=== STEP {step_count} ===")
-
-        # Call model with tools
-        response = call_model(
-            memory.get_messages(),
+    # Call model with tools
+    if on_event is None:
+        response = await call_model(
+            messages,
             config,
-            agent_id="single_agent",
+            agent_id=agent_id,
             tools=tools_openai_format,
         )
-
-        # Check if response is a message object (with tool calls) or string
-        print(f"\n*** Raw response ***\n {response}")
-
-        if hasattr(response, "tool_calls") and response.tool_calls:
-
-            # Handle tool calls - extract components from response content
-            response_content = (
-                response.content if hasattr(response, "content") else ""
+    else:
+        stream = await call_model(
+            messages,
+            config,
+            agent_id=agent_id,
+            tools=tools_openai_format,
+            stream=True,
+        )
+        async for delta in stream:
+            await emit_event(
+                on_event, "token", step_count, content=delta
             )
+        response = stream.result
 
-            # Log the full response for debugging
-            print(f"\n### Response has Tool Calls ###")
-            print(f"Tool calls: {len(response.tool_calls)}")
+    trace.debug("Raw response", response=response)
 
-            react_components = extract_react_components(
-                response_content
+    if hasattr(response, "tool_calls") and response.tool_calls:
+        # Handle tool calls - extract components from response content
+        response_content = (
+            response.content if hasattr(response, "content") else ""
+        )
+        trace.current_span().set(tool_calls=len(response.tool_calls))
+        if trace.debug_enabled():
+            trace.debug(
+                "Response has tool calls",
+                **extract_react_components(response_content),
             )
-
-            # Log the model's ReAct components first
-            if (
-                react_components["thought"]
-                or react_components["action"]
-                or react_components["action_input"]
-            ):
-                print(f"\n### Response also has TEXT ###")
-                print_react_debug(
-                    step_count,
-                    thought=react_components["thought"],
-                    action=react_components["action"],
-                    action_input=react_components["action_input"],
-                )
-
-            # Add model response to memory
-            memory.add_model_step(response)
-
-            for tool_call in response.tool_calls:
-                tool_name = tool_call.function.name
-                tool_args_json = tool_call.function.arguments
-                tool_call_id = tool_call.id
-
-                try:
-                    parsed_args = json.loads(tool_args_json)
-                except Exception as e:
-                    print(f"Error parsing tool args: {e}")
-                    parsed_args = {"input": tool_args_json}
-
-                # Execute the tool using the tools module
-                tool_result = execute_tool(tool_name, parsed_args)
-
-                # Print tool call debug in the new format
-                tool_result_text = (
-                    tool_result[:500] + "..."
-                    if len(str(tool_result)) > 500
-                    else str(tool_result)
-                )
-                print_tool_call_debug(
-                    tool_name,
-                    tool_args_json,
-                    tool_call_id,
-                    tool_result_text,
+        await emit_react_event(on_event, step_count, response_content)
+
+        # Add model response to memory
+        memory.add_model_step(response)
+
+        # Parse every call of the step, then run them concurrently
+        tool_calls = []
+        for tool_call in response.tool_calls:
+            tool_args_json = tool_call.function.arguments
+            try:
+                parsed_args = json.loads(tool_args_json)
+            except Exception as e:
+                trace.debug(
+                    "Error parsing tool args",
+                    error=str(e),
+                    arguments=tool_args_json,
                 )
-
-                # Add tool result to memory
-                memory.add_tool_step(tool_call_id, tool_result)
-
-        elif isinstance(response, str):
-            # Handle regular text response
-            print(f"\n### Response is TEXT only ###")
-
-            print_text_step_debug(step_count, response)
-
-            memory.add_model_step(response)
-
-            # Check for final answer
-            if "Final Answer" in response:
-                final_answer = response.split("Final Answer:", 1)[
-                    -1
-                ].strip()
-                return final_answer
-
-        else:
-            # Handle message object without tool calls
-            content = (
-                response.content
-                if hasattr(response, "content")
-                else str(response)
+                parsed_args = {"input": tool_args_json}
+            tool_calls.append((tool_call.function.name, parsed_args))
+            await emit_event(
+                on_event,
+                "action",
+                step_count,
+                tool_call_id=tool_call.id,
+                tool_name=tool_call.function.name,
+                tool_args=parsed_args,
             )
 
-            print(f"\n### Response is neither TOOL CALL nor TEXT ###")
-            print(f"Response content: {content}")
-            print(f"Response type: {type(response)}")
-
-            memory.add_model_step(content)
+        # Execute the tools using the tools module
+        tool_results = await execute_tool_calls(tool_calls)
+
+        # Results come back in tool_call order
+        for tool_call, tool_result in zip(
+            response.tool_calls, tool_results
+        ):
+            await emit_event(
+                on_event,
+                "tool_result",
+                step_count,
+                tool_call_id=tool_call.id,
+                tool_name=tool_call.function.name,
+                content=tool_result,
+            )
 
-            # Check for final answer
-            if "Final Answer" in content:
-                final_answer = content.split("Final Answer:", 1)[
-                    -1
-                ].strip()
-                return final_answer
+            # Add tool result to memory
+            memory.add_tool_step(tool_call.id, tool_result)
+        return None
+
+    if isinstance(response, str):
+        # Handle regular text response
+        content = response
+    else:
+        # Handle message object without tool calls
+        content = (
+            response.content
+            if hasattr(response, "content")
+            else str(response)
+        )
+    await emit_react_event(on_event, step_count, content)
+    memory.add_model_step(content)
 
-    final_result = (
-        f"[Stopped after {max_steps} steps - no final answer]"
-    )
-    print(f"\n{final_result}")
-    return final_result
+    # Check for final answer
+    if "Final Answer" in content:
+        return content.split("Final Answer:", 1)[-1].strip()
+    return None
 
 
 ##############
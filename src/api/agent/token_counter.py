@@ -0,0 +1,67 @@
+"""
+Approximate token counting for chat messages.
+
+Uses tiktoken when it is installed, otherwise falls back to about four
+characters per token, which is close enough for budgeting prompts.
+"""
+
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Per-message framing tokens added by the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_text_tokens(text: str, model: str = "gpt-4o") -> int:
+    """
+    Count the tokens of a text.
+
+    Args:
+        text (str): The text to count.
+        model (str): Model whose tokenizer to use, if available.
+
+    Returns:
+        int: Number of tokens.
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(message: dict, model: str = "gpt-4o") -> int:
+    """
+    Count the tokens a message contributes to a prompt.
+
+    Args:
+        message (dict): Message in provider wire format.
+        model (str): Model whose tokenizer to use, if available.
+
+    Returns:
+        int: Number of tokens, including per-message overhead.
+    """
+    tokens = MESSAGE_OVERHEAD_TOKENS
+    tokens += count_text_tokens(message.get("content") or "", model)
+    for tool_call in message.get("tool_calls") or []:
+        function = tool_call["function"]
+        tokens += count_text_tokens(function["name"], model)
+        tokens += count_text_tokens(function["arguments"], model)
+    if "tool_call_id" in message:
+        tokens += count_text_tokens(message["tool_call_id"], model)
+    return tokens
@@ -0,0 +1,338 @@
+"""
+Batch runs: many research prompts through the agent with shared
+scheduling.
+
+run_batch() deduplicates the items of a batch (same prompt and config),
+runs the unique ones on a bounded pool of workers and yields a result
+for every item as soon as its run finishes. Each run takes a slot of
+the run limiter shared with /run_agent, so a batch uses spare capacity
+without flooding the provider or starving interactive requests. With
+the provider Batch API (see api.models.batch_api) the runs instead
+leave the limiter alone and their model calls are submitted as provider
+batches.
+
+Runs are persisted under IDs derived from the batch ID and the item, so
+submitting a batch again under the same batch_id returns the answers
+that finished and resumes the other runs from their last checkpoint.
+
+Run from src/:
+    python -m api.batch prompts.jsonl --out results.jsonl
+    python -m api.batch prompts.jsonl --batch-id nightly-2024-06-01
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import sys
+import time
+from contextlib import AsyncExitStack
+from typing import AsyncIterator, Iterable, List, Optional, Union
+
+from api import metrics, trace
+from api.agent import run_agent
+from api.agent.run_store import flush_run_store, new_run_id
+from api.config_loader import load_default_config
+from api.scheduler import QueueFullError, run_limiter
+
+_batch_config = load_default_config().get("batch", {})
+
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+def parse_items(lines: Iterable[str]) -> List[dict]:
+    """
+    Read batch items from JSONL: one prompt string or one
+    {"prompt", "id", "config"} object per line. Blank lines are
+    skipped.
+
+    Raises:
+        ValueError: If a line is not a prompt or an object with one.
+    """
+    items = []
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            items.append(normalize_item(json.loads(line)))
+        except ValueError as e:
+            raise ValueError(f"Line {number}: {e}") from None
+    return items
+
+
+def normalize_item(item: Union[str, dict]) -> dict:
+    """
+    Turn a prompt string or item object into {"prompt", "id",
+    "config"}.
+
+    Raises:
+        ValueError: If the item has no prompt.
+    """
+    if isinstance(item, str):
+        item = {"prompt": item}
+    if not isinstance(item, dict) or not isinstance(
+        item.get("prompt"), str
+    ):
+        raise ValueError("Batch items need a prompt string")
+    return {
+        "prompt": item["prompt"],
+        "id": item.get("id"),
+        "config": item.get("config") or {},
+    }
+
+
+def _item_key(prompt: str, config: dict) -> str:
+    return hashlib.sha256(
+        json.dumps(
+            [prompt, config], sort_keys=True, default=str
+        ).encode()
+    ).hexdigest()
+
+
+async def _run_one(
+    prompt: str, config: dict, run_id: str, limited: bool
+):
+    if not limited:
+        return await run_agent(
+            prompt=prompt, config=config, run_id=run_id
+        )
+    while True:
+        try:
+            async with run_limiter.slot():
+                return await run_agent(
+                    prompt=prompt, config=config, run_id=run_id
+                )
+        except QueueFullError as e:
+            # Batches are patient: wait for the queue to drain
+            await asyncio.sleep(e.retry_after)
+
+
+async def run_batch(
+    items: List[dict],
+    config: dict,
+    batch_id: Optional[str] = None,
+    max_concurrency: Optional[int] = None,
+) -> AsyncIterator[dict]:
+    """
+    Run a batch of agent prompts and yield events as it progresses.
+
+    Yields a "batch" event first, then a "result" event per item in
+    completion order, then a "summary" event. Items with the same
+    prompt and config share one run; the result of every copy after
+    the first carries duplicate_of, the index of the first. Closing the
+    iterator cancels the runs that have not finished.
+
+    Args:
+        items (List[dict]): Items from normalize_item or parse_items.
+        config (dict): Config of every run, overridden by the item's.
+            "batch_api": true sends model calls through the provider
+            Batch API.
+        batch_id (Optional[str]): Batch ID; reuse one to resume a batch.
+        max_concurrency (Optional[int]): Runs executing at once,
+            defaults to batch.max_concurrent_runs.
+
+    Yields:
+        dict: Batch, result and summary events.
+    """
+    # Loads the provider SDK, so only once a batch runs
+    from api.models.batch_api import (
+        batch_api_scope,
+        is_batch_api_enabled,
+    )
+
+    batch_id = batch_id or new_run_id()
+    use_batch_api = is_batch_api_enabled(config)
+    if max_concurrency is None:
+        max_concurrency = (
+            _batch_config.get("batch_api", {}).get(
+                "max_concurrent_runs", 1000
+            )
+            if use_batch_api
+            else _batch_config.get("max_concurrent_runs", 8)
+        )
+    max_concurrency = max(1, max_concurrency)
+
+    # key -> indexes of the items sharing a run
+    groups = {}
+    for index, item in enumerate(items):
+        merged = {**config, **item["config"]}
+        key = _item_key(item["prompt"], merged)
+        groups.setdefault(key, (item["prompt"], merged, []))[2].append(
+            index
+        )
+
+    start = time.monotonic()
+    yield {
+        "type": "batch",
+        "batch_id": batch_id,
+        "items": len(items),
+        "unique": len(groups),
+        "batch_api": use_batch_api,
+    }
+
+    work: asyncio.Queue = asyncio.Queue()
+    for key, group in groups.items():
+        work.put_nowait((key, *group))
+    results: asyncio.Queue = asyncio.Queue()
+
+    async def worker():
+        while True:
+            try:
+                key, prompt, merged, indexes = work.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            run_id = f"{batch_id}-{key[:16]}"
+            run_start = time.monotonic()
+            outcome = {"run_id": run_id}
+            try:
+                outcome["response"] = await _run_one(
+                    prompt, merged, run_id, limited=not use_batch_api
+                )
+                outcome["status"] = COMPLETED
+            except Exception as e:
+                outcome["status"] = FAILED
+                outcome["error"] = f"{type(e).__name__}: {e}"
+            outcome["seconds"] = round(time.monotonic() - run_start, 3)
+            await results.put((indexes, outcome))
+
+    async def execute():
+        # Runs in its own task so the span and Batch API scope are
+        # set and reset in one context, not across the yields below
+        async with AsyncExitStack() as stack:
+            if use_batch_api:
+                await stack.enter_async_context(batch_api_scope())
+            with trace.use_span(span):
+                workers = [
+                    asyncio.create_task(worker())
+                    for _ in range(min(max_concurrency, len(groups)))
+                ]
+            try:
+                await asyncio.gather(*workers)
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+
+    span = trace.start_span(
+        "batch.run",
+        batch_id=batch_id,
+        items=len(items),
+        unique=len(groups),
+        batch_api=use_batch_api,
+    )
+
+    async def next_result():
+        # Wait on the supervisor too: if execute() fails before its
+        # workers post every result, its error is raised here
+        while results.empty():
+            if supervisor.done():
+                supervisor.result()
+                raise RuntimeError(
+                    "Batch workers stopped before every run finished"
+                )
+            getter = asyncio.ensure_future(results.get())
+            await asyncio.wait(
+                [getter, supervisor],
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if getter.done():
+                return getter.result()
+            getter.cancel()
+        return results.get_nowait()
+
+    counts = {COMPLETED: 0, FAILED: 0}
+    supervisor = asyncio.create_task(execute())
+    try:
+        for _ in range(len(groups)):
+            indexes, outcome = await next_result()
+            metrics.BATCH_ITEMS.labels(outcome["status"]).inc(
+                len(indexes)
+            )
+            counts[outcome["status"]] += len(indexes)
+            for index in indexes:
+                yield {
+                    "type": "result",
+                    "index": index,
+                    "id": items[index]["id"],
+                    **outcome,
+                    "duplicate_of": (
+                        None if index == indexes[0] else indexes[0]
+                    ),
+                }
+        await supervisor
+    finally:
+        supervisor.cancel()
+        await asyncio.gather(supervisor, return_exceptions=True)
+        span.set(**counts)
+        span.end()
+
+    yield {
+        "type": "summary",
+        "batch_id": batch_id,
+        **counts,
+        "deduplicated": len(items) - len(groups),
+        "seconds": round(time.monotonic() - start, 3),
+    }
+
+
+async def _main(args) -> int:
+    with open(args.input, encoding="utf-8") as f:
+        items = parse_items(f)
+    config = {**load_default_config(), **json.loads(args.config)}
+    if args.batch_api:
+        config["batch_api"] = True
+    out = (
+        open(args.out, "a", encoding="utf-8")
+        if args.out
+        else sys.stdout
+    )
+    failed = 0
+    try:
+        async for event in run_batch(
+            items, config, args.batch_id, args.concurrency
+        ):
+            if event["type"] == "result":
+                failed += event["status"] == FAILED
+                out.write(json.dumps(event) + "\n")
+                out.flush()
+            else:
+                print(json.dumps(event), file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        await flush_run_store()
+        trace.flush()
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run a JSONL file of research prompts as a batch"
+    )
+    parser.add_argument(
+        "input",
+        help="JSONL of prompts or {prompt, id, config} objects",
+    )
+    parser.add_argument(
+        "--out", help="Append results as JSONL here, default stdout"
+    )
+    parser.add_argument(
+        "--batch-id", help="Reuse to resume an interrupted batch"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, help="Runs executing at once"
+    )
+    parser.add_argument(
+        "--config", default="{}", help="JSON config overrides"
+    )
+    parser.add_argument(
+        "--batch-api",
+        action="store_true",
+        help="Send model calls through the provider Batch API",
+    )
+    sys.exit(asyncio.run(_main(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Benchmark batch runs against a local stub model.
+
+Runs the same list of prompts (a share of them duplicates) three ways:
+one /run_agent-style run at a time, all at once through the shared run
+limiter (as a client firing every request would), and with run_batch().
+Optionally also through the provider Batch API of the stub, with every
+unique prompt running at once.
+
+Checks that every prompt completed, except those the run limiter
+rejected when all arrive at once: exactly the ones beyond its slots and
+queue, with never more runs holding a slot than it has. The exit code
+is 1 if a check fails.
+
+Run from src/:
+    python -m api.batch_bench --prompts 200 --duplicates 0.25
+    python -m api.batch_bench --batch-api --batch-latency 2
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from api.models.stub_server import StubServer
+
+CONFIG = {
+    "provider": "openai",
+    "model": "gpt-4o",
+    "max_steps": 2,
+    "knowledge": False,
+}
+
+
+def _serve(port: int, latency: float, batch_latency: float):
+    server = StubServer(
+        port=port, latency=latency, batch_latency=batch_latency
+    )
+    asyncio.run(server.serve_forever())
+
+
+def _prompts(count: int, duplicates: float) -> list:
+    unique = max(1, round(count * (1 - duplicates)))
+    prompts = [f"Research question {i}" for i in range(unique)]
+    rng = random.Random(0)
+    prompts += [rng.choice(prompts) for _ in range(count - unique)]
+    rng.shuffle(prompts)
+    return prompts
+
+
+async def _sequential(prompts: list) -> dict:
+    from api.agent import run_agent
+
+    for prompt in prompts:
+        await run_agent(prompt, CONFIG)
+    return {"completed": len(prompts), "rejected": 0}
+
+
+async def _all_at_once(prompts: list) -> dict:
+    from api.agent import run_agent
+    from api.scheduler import QueueFullError, run_limiter
+
+    active = peak = 0
+
+    async def one(prompt):
+        nonlocal active, peak
+        try:
+            async with run_limiter.slot():
+                active += 1
+                peak = max(peak, active)
+                try:
+                    await run_agent(prompt, CONFIG)
+                finally:
+                    active -= 1
+            return True
+        except QueueFullError:
+            return False
+
+    done = await asyncio.gather(*(one(prompt) for prompt in prompts))
+    failures = []
+    if peak > run_limiter.max_concurrent:
+        failures.append(
+            f"{peak} runs held a slot at once, the limit is "
+            f"{run_limiter.max_concurrent}"
+        )
+    expected = max(
+        0,
+        len(prompts)
+        - run_limiter.max_concurrent
+        - run_limiter.max_queue,
+    )
+    if done.count(False) != expected:
+        failures.append(
+            f"{done.count(False)} runs rejected, expected {expected}"
+        )
+    return {
+        "completed": sum(done),
+        "rejected": done.count(False),
+        "failures": failures,
+    }
+
+
+async def _batch(
+    prompts: list, concurrency: int, batch_api: bool = False
+) -> dict:
+    from api.batch import normalize_item, run_batch
+
+    if batch_api:
+        from api.models import batch_api as provider_batches
+
+        # The stub finishes batches in seconds, not hours
+        provider_batches._batch_api_config["poll_interval_seconds"] = (
+            0.2
+        )
+
+    config = {**CONFIG, "batch_api": batch_api}
+    items = [normalize_item(prompt) for prompt in prompts]
+    completed = 0
+    async for event in run_batch(items, config, None, concurrency):
+        if event["type"] == "result":
+            completed += event["status"] == "completed"
+    return {"completed": completed, "rejected": 0}
+
+
+async def _run(scenario) -> tuple:
+    from api.agent.run_store import flush_run_store
+    from api.models.clients import close_clients
+
+    start = time.perf_counter()
+    result = await scenario
+    elapsed = time.perf_counter() - start
+    await flush_run_store()
+    await close_clients()
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch run benchmark")
+    parser.add_argument("--port", type=int, default=8902)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.05,
+        help="Stub seconds/request",
+    )
+    parser.add_argument("--prompts", type=int, default=200)
+    parser.add_argument(
+        "--duplicates",
+        type=float,
+        default=0.25,
+        help="Share of prompts that repeat another one",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=16, help="Batch pool size"
+    )
+    parser.add_argument(
+        "--batch-api",
+        action="store_true",
+        help="Also run through the stub's Batch API",
+    )
+    parser.add_argument(
+        "--batch-latency",
+        type=float,
+        default=2.0,
+        help="Stub seconds until a provider batch completes",
+    )
+    args = parser.parse_args()
+
+    os.environ["OPENAI_KEY"] = "stub"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.port}/v1"
+
+    server = multiprocessing.Process(
+        target=_serve,
+        args=(args.port, args.latency, args.batch_latency),
+        daemon=True,
+    )
+    server.start()
+    time.sleep(0.5)
+
+    prompts = _prompts(args.prompts, args.duplicates)
+    scenarios = [
+        ("sequential", lambda: _sequential(prompts)),
+        ("all at once", lambda: _all_at_once(prompts)),
+        (
+            f"batch x{args.concurrency}",
+            lambda: _batch(prompts, args.concurrency),
+        ),
+    ]
+    if args.batch_api:
+        scenarios.append(
+            (
+                "batch API",
+                lambda: _batch(prompts, None, True),
+            )
+        )
+
+    try:
+        print(
+            f"{len(prompts)} prompts, {len(set(prompts))} unique, "
+            f"stub latency {args.latency * 1000:.0f} ms/request\n"
+        )
+        print(
+            f"{'scenario':>12} | {'done':>5} | {'rejected':>8} | "
+            f"{'seconds':>7} | {'prompts/s':>9}"
+        )
+        failures = []
+        for name, scenario in scenarios:
+            result, elapsed = asyncio.run(_run(scenario()))
+            failures += [
+                f"{name}: {failure}"
+                for failure in result.get("failures", [])
+            ]
+            if result["completed"] + result["rejected"] != len(prompts):
+                failures.append(
+                    f"{name}: {result['completed']} of {len(prompts)} "
+                    f"prompts completed"
+                )
+            print(
+                f"{name:>12} | {result['completed']:>5} | "
+                f"{result['rejected']:>8} | {elapsed:>7.2f} | "
+                f"{result['completed'] / elapsed:>9.1f}"
+            )
+    finally:
+        server.terminate()
+    if failures:
+        print("\nFailed checks:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+"""
+Record and replay of model and tool interactions.
+
+Inside use_cassette(path, "record"), every call_model response and
+every tool result is captured with the hash of its request. Inside
+use_cassette(path, "replay") the same requests are answered from the
+cassette without calling the provider or the tool, so a recorded run
+replays in milliseconds and the framework's own overhead can be
+profiled apart from provider latency. Requests not in the cassette go
+to the provider or tool as usual, unless the cassette is strict: then
+they raise CassetteMismatchError, as does leaving the scope with
+recorded interactions that were never replayed.
+
+A request recorded several times is replayed in the recorded order.
+Cassettes are gzipped JSON lines: a header, then one {"kind", "key",
+"value"} line per interaction. Runs can also use a cassette through
+the "cassette" entry of their config, see api.agent.run_agent.
+
+Run from src/:
+    python -m api.cassette record run.cassette.gz --prompt "..."
+    python -m api.cassette replay run.cassette.gz --strict
+    python -m api.cassette show run.cassette.gz
+"""
+
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional, Union
+
+from api import trace
+
+RECORD = "record"
+REPLAY = "replay"
+MODEL = "model"
+TOOL = "tool"
+_VERSION = 1
+
+_cassette: ContextVar[Optional["Cassette"]] = ContextVar(
+    "cassette", default=None
+)
+
+
+class CassetteMismatchError(Exception):
+    """Raised by a strict cassette when a run diverges from it."""
+
+
+def tool_key(tool_name: str, tool_args: Dict[str, Any]) -> str:
+    """Hash of a tool call; unlike the tool cache, whitespace counts."""
+    payload = json.dumps(
+        [tool_name, tool_args],
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _encode(kind: str, value) -> Any:
+    if kind == MODEL and not isinstance(value, str):
+        return {"message": value.model_dump(exclude_none=True)}
+    return value
+
+
+def _decode(kind: str, value) -> Any:
+    if kind == MODEL and isinstance(value, dict):
+        from openai.types.chat import ChatCompletionMessage
+
+        return ChatCompletionMessage.model_validate(value["message"])
+    return value
+
+
+class Cassette:
+    """
+    Interactions of one cassette file.
+
+    Args:
+        path (str): Cassette file.
+        mode (str): "record" or "replay".
+        strict (bool): In replay mode, fail on requests that are not in
+            the cassette and on recorded ones that are never replayed.
+        metadata (Optional[Dict]): Stored in the header when recording,
+            e.g. the prompt and config of the run.
+
+    Raises:
+        FileNotFoundError: In replay mode, if the file does not exist.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        mode: str = REPLAY,
+        strict: bool = False,
+        metadata: Optional[Dict] = None,
+    ):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.strict = strict
+        self.metadata = metadata or {}
+        self.interactions = []
+        # (kind, key) -> recorded values, and how many were replayed
+        self._recorded: Dict[tuple, list] = defaultdict(list)
+        self._replayed: Counter = Counter()
+        self.replays = 0
+        self.misses = 0
+        if mode == REPLAY:
+            self._load()
+
+    def _load(self):
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            self.metadata = header.get("metadata", {})
+            for line in f:
+                entry = json.loads(line)
+                self.interactions.append(entry)
+                self._recorded[(entry["kind"], entry["key"])].append(
+                    entry["value"]
+                )
+
+    def replay(
+        self, kind: str, key: str, request: str
+    ) -> Optional[Any]:
+        """
+        The recorded response of a request, None if there is none.
+
+        Args:
+            kind (str): "model" or "tool".
+            key (str): Request hash.
+            request (str): Short description for errors.
+
+        Raises:
+            CassetteMismatchError: On a miss in strict mode.
+        """
+        if self.mode != REPLAY:
+            return None
+        values = self._recorded.get((kind, key))
+        index = self._replayed[(kind, key)]
+        if values and (index < len(values) or not self.strict):
+            self._replayed[(kind, key)] += 1
+            self.replays += 1
+            return _decode(kind, values[min(index, len(values) - 1)])
+        self.misses += 1
+        trace.current_span().event("cassette_miss", kind=kind, key=key)
+        if self.strict:
+            raise CassetteMismatchError(
+                f"{kind} request not in cassette {self.path} "
+                f"(replayed {self.replays} so far): {request}"
+            )
+        return None
+
+    def record(self, kind: str, key: str, value):
+        if self.mode == RECORD:
+            self.interactions.append(
+                {
+                    "kind": kind,
+                    "key": key,
+                    "value": _encode(kind, value),
+                }
+            )
+
+    def close(self):
+        """
+        Write a recorded cassette; check a strict replay was complete.
+
+        Raises:
+            CassetteMismatchError: If a strict replay left recorded
+                interactions unused.
+        """
+        if self.mode == RECORD:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                f.write(
+                    json.dumps(
+                        {
+                            "cassette": _VERSION,
+                            "metadata": self.metadata,
+                        }
+                    )
+                    + "\n"
+                )
+                for entry in self.interactions:
+                    f.write(
+                        json.dumps(entry, separators=(",", ":")) + "\n"
+                    )
+            os.replace(tmp_path, self.path)
+        elif self.strict:
+            unused = sum(
+                len(values) - self._replayed[key]
+                for key, values in self._recorded.items()
+                if len(values) > self._replayed[key]
+            )
+            if unused:
+                raise CassetteMismatchError(
+                    f"{unused} recorded interactions of {self.path} "
+                    "were not replayed"
+                )
+
+    def stats(self) -> Dict:
+        return {
+            "mode": self.mode,
+            "interactions": len(self.interactions),
+            "replays": self.replays,
+            "misses": self.misses,
+        }
+
+
+def current_cassette() -> Optional[Cassette]:
+    return _cassette.get()
+
+
+@contextmanager
+def use_cassette(
+    path: str,
+    mode: str = REPLAY,
+    strict: bool = False,
+    metadata: Optional[Dict] = None,
+):
+    """
+    Record or replay the model and tool calls made inside the scope,
+    including in tasks it starts. Yields the Cassette.
+    """
+    cassette = Cassette(path, mode, strict, metadata)
+    token = _cassette.set(cassette)
+    try:
+        yield cassette
+    except BaseException:
+        # Keep what a failed recording captured, skip the strict check
+        if mode == RECORD:
+            cassette.close()
+        raise
+    finally:
+        _cassette.reset(token)
+    cassette.close()
+
+
+def describe_model_request(messages: list) -> str:
+    last = messages[-1] if messages else {}
+    if not isinstance(last, dict):
+        last = last.model_dump(exclude_none=True)
+    return (
+        f"{last.get('role')} message {str(last.get('content'))[:80]!r}"
+    )
+
+
+def _show(path: str):
+    cassette = Cassette(path)
+    counts = Counter(entry["kind"] for entry in cassette.interactions)
+    print(
+        json.dumps(
+            {
+                "metadata": cassette.metadata,
+                "bytes": os.path.getsize(path),
+                "model": counts[MODEL],
+                "tool": counts[TOOL],
+            },
+            indent=2,
+        )
+    )
+
+
+async def _run(args) -> Union[str, None]:
+    # Imported here: the agent imports this module through the router
+    from api.agent import run_agent
+    from api.config_loader import load_default_config
+    from api.models.clients import close_clients
+
+    if args.command == RECORD:
+        prompt = args.prompt
+        config = json.loads(args.config)
+    else:
+        metadata = Cassette(args.cassette).metadata
+        prompt = args.prompt or metadata.get("prompt")
+        config = (
+            json.loads(args.config)
+            if args.config
+            else metadata.get("config", {})
+        )
+    if not prompt:
+        raise SystemExit("No prompt given or stored in the cassette")
+
+    start = time.perf_counter()
+    try:
+        with use_cassette(
+            args.cassette,
+            args.command,
+            args.strict,
+            {"prompt": prompt, "config": config},
+        ) as cassette:
+            # Recalled findings would make the prompts depend on the
+            # local knowledge store, so they are off unless configured
+            answer = await run_agent(
+                prompt,
+                {**load_default_config(), "knowledge": False, **config},
+            )
+    finally:
+        await close_clients()
+    print(answer)
+    print(
+        json.dumps(
+            {
+                **cassette.stats(),
+                "seconds": round(time.perf_counter() - start, 3),
+            }
+        ),
+        file=sys.stderr,
+    )
+    return answer
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Record or replay an agent run"
+    )
+    parser.add_argument("command", choices=[RECORD, REPLAY, "show"])
+    parser.add_argument("cassette", help="Cassette file (.gz)")
+    parser.add_argument(
+        "--prompt", help="Defaults to the recorded prompt on replay"
+    )
+    parser.add_argument(
+        "--config",
+        help="JSON config overrides; defaults to {} when recording "
+        "and to the recorded config on replay",
+    )
+    parser.add_argument(
+        "--strict",
+        action="store_true",
+        help="Fail when the run diverges from the cassette",
+    )
+    args = parser.parse_args()
+    if args.command == "show":
+        _show(args.cassette)
+        return
+    if args.command == RECORD and not args.prompt:
+        parser.error("record needs --prompt")
+    args.config = args.config or (
+        "{}" if args.command == RECORD else None
+    )
+    try:
+        asyncio.run(_run(args))
+    except CassetteMismatchError as e:
+        print(f"Diverged: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        trace.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,28 @@
-import yaml
+import functools
 import os
 
+import yaml
+
+# The C parser when PyYAML was built with libyaml
+_Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+@functools.lru_cache(maxsize=None)
 def load_default_config():
+    """
+    Load default_config.yaml, parsed once per process. Every caller
+    gets the same dict, so treat it as read-only: merge overrides into
+    a copy, e.g. {**load_default_config(), **config}.
+
+    Returns:
+        dict: The default configuration, empty if the file is missing.
+    """
     config_path = os.path.join(os.path.dirname(__file__), 'default_config.yaml')
     if not os.path.exists(config_path):
         return {}
     with open(config_path, 'r') as file:
-        return yaml.safe_load(file)
-    
+        return yaml.load(file, Loader=_Loader)
+
 ## Example loaded config
 # {
 #   "models": {
@@ -0,0 +1,710 @@
+"""
+Background agent runs submitted as jobs.
+
+POST /jobs stores a queued job and returns its ID at once; a pool of
+worker tasks in each server process claims queued jobs and runs them
+with run_agent, recording their progress events (without per-token
+events) and outcome. GET /jobs/{id} long-polls for new events and the
+final answer, and cancelling a job cancels its task, which stops the
+ReAct loop at its next await.
+
+A job's ID is also its run ID, so its steps are checkpointed in the run
+store. Running jobs hold a lease their worker renews; a job whose worker
+died (or shut down) goes back to the queue and resumes from its last
+completed step in whichever worker claims it.
+
+Backends (jobs.backend in default_config.yaml):
+    memory: jobs live in one process and are lost on restart
+    sqlite: on-disk tables shared by all uvicorn workers on the host
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from api import metrics, trace
+from api.config_loader import load_default_config
+from api.agent import run_agent
+
+_jobs_config = load_default_config().get("jobs", {})
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (COMPLETED, FAILED, CANCELLED)
+
+# Progress events not worth storing: one per streamed token
+_SKIPPED_EVENTS = {"token"}
+
+
+def _new_job(job_id: str, prompt: str, config: dict) -> Dict:
+    now = time.time()
+    return {
+        "job_id": job_id,
+        "prompt": prompt,
+        "config": config,
+        "status": QUEUED,
+        "owner": None,
+        "lease_until": None,
+        "cancel_requested": False,
+        "answer": None,
+        "error": None,
+        "created_at": now,
+        "started_at": None,
+        "finished_at": None,
+    }
+
+
+class MemoryJobStore:
+    """
+    Jobs and their events in dicts of the current process.
+
+    Args:
+        ttl_seconds (float): Finished jobs older than this are deleted
+            when new jobs are created.
+    """
+
+    def __init__(self, ttl_seconds: float = 86400):
+        self.ttl_seconds = ttl_seconds
+        self._jobs: Dict[str, Dict] = {}
+        self._events: Dict[str, List[Dict]] = {}
+
+    async def create(self, job_id: str, prompt: str, config: dict):
+        expired = time.time() - self.ttl_seconds
+        for old_id, job in list(self._jobs.items()):
+            if (
+                job["status"] in FINISHED
+                and job["finished_at"] < expired
+            ):
+                del self._jobs[old_id]
+                del self._events[old_id]
+        self._jobs[job_id] = _new_job(job_id, prompt, config)
+        self._events[job_id] = []
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        job = self._jobs.get(job_id)
+        return None if job is None else dict(job)
+
+    async def claim(
+        self, owner: str, lease_seconds: float
+    ) -> Optional[Dict]:
+        now = time.time()
+        for job in self._jobs.values():
+            if job["status"] == QUEUED or (
+                job["status"] == RUNNING and job["lease_until"] < now
+            ):
+                job.update(
+                    status=RUNNING,
+                    owner=owner,
+                    lease_until=now + lease_seconds,
+                    started_at=job["started_at"] or now,
+                )
+                return dict(job)
+        return None
+
+    async def renew(
+        self, job_id: str, owner: str, lease_seconds: float
+    ) -> Optional[bool]:
+        job = self._jobs.get(job_id)
+        if job is None or job["owner"] != owner:
+            return None
+        job["lease_until"] = time.time() + lease_seconds
+        return job["cancel_requested"]
+
+    async def release(self, job_id: str, owner: str):
+        job = self._jobs.get(job_id)
+        if job is not None and job["owner"] == owner:
+            job.update(status=QUEUED, owner=None, lease_until=None)
+
+    async def add_event(self, job_id: str, event: Dict):
+        self._events[job_id].append(event)
+
+    async def get_events(self, job_id: str, after: int) -> List[Dict]:
+        return self._events.get(job_id, [])[after:]
+
+    async def finish(
+        self,
+        job_id: str,
+        owner: str,
+        status: str,
+        answer: Optional[str] = None,
+        error: Optional[str] = None,
+    ):
+        job = self._jobs.get(job_id)
+        if job is None or job["owner"] != owner:
+            return
+        job.update(
+            status=status,
+            owner=None,
+            lease_until=None,
+            answer=answer,
+            error=error,
+            finished_at=time.time(),
+        )
+
+    async def cancel(self, job_id: str) -> Optional[str]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        if job["status"] == QUEUED:
+            job.update(status=CANCELLED, finished_at=time.time())
+        elif job["status"] == RUNNING:
+            job["cancel_requested"] = True
+        return job["status"]
+
+
+_JOB_COLUMNS = (
+    "job_id",
+    "prompt",
+    "config",
+    "status",
+    "owner",
+    "lease_until",
+    "cancel_requested",
+    "answer",
+    "error",
+    "created_at",
+    "started_at",
+    "finished_at",
+)
+
+
+class SQLiteJobStore:
+    """
+    SQLite store of jobs and their events, shared across worker
+    processes. Queries run in a thread so the event loop is not blocked
+    on disk I/O.
+
+    Args:
+        path (str): Database file.
+        ttl_seconds (float): Finished jobs older than this are deleted
+            when new jobs are created.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = 86400):
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_id TEXT PRIMARY KEY,"
+            " prompt TEXT NOT NULL,"
+            " config TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " owner TEXT,"
+            " lease_until REAL,"
+            " cancel_requested INTEGER NOT NULL DEFAULT 0,"
+            " answer TEXT,"
+            " error TEXT,"
+            " created_at REAL NOT NULL,"
+            " started_at REAL,"
+            " finished_at REAL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_status"
+            " ON jobs (status, created_at)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_events ("
+            " job_id TEXT NOT NULL,"
+            " seq INTEGER NOT NULL,"
+            " event TEXT NOT NULL,"
+            " PRIMARY KEY (job_id, seq))"
+        )
+
+    def _transaction(self, work):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    @staticmethod
+    def _row_to_job(row: Tuple) -> Dict:
+        job = dict(zip(_JOB_COLUMNS, row))
+        job["config"] = json.loads(job["config"])
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def _create(self, job_id: str, prompt: str, config: str):
+        def work(conn):
+            expired = time.time() - self.ttl_seconds
+            conn.execute(
+                "DELETE FROM job_events WHERE job_id IN ("
+                " SELECT job_id FROM jobs WHERE finished_at < ?)",
+                (expired,),
+            )
+            conn.execute(
+                "DELETE FROM jobs WHERE finished_at < ?", (expired,)
+            )
+            job = _new_job(job_id, prompt, config)
+            conn.execute(
+                f"INSERT INTO jobs ({', '.join(_JOB_COLUMNS)})"
+                f" VALUES ({', '.join('?' for _ in _JOB_COLUMNS)})",
+                tuple(job[column] for column in _JOB_COLUMNS),
+            )
+
+        self._transaction(work)
+
+    def _get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(_JOB_COLUMNS)} FROM jobs"
+                " WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()
+        return None if row is None else self._row_to_job(row)
+
+    def _claim(
+        self, owner: str, lease_seconds: float
+    ) -> Optional[Dict]:
+        def work(conn):
+            now = time.time()
+            row = conn.execute(
+                "SELECT job_id FROM jobs WHERE status = ?"
+                " OR (status = ? AND lease_until < ?)"
+                " ORDER BY created_at LIMIT 1",
+                (QUEUED, RUNNING, now),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, owner = ?, lease_until = ?,"
+                " started_at = COALESCE(started_at, ?) WHERE job_id = ?",
+                (RUNNING, owner, now + lease_seconds, now, row[0]),
+            )
+            return row[0]
+
+        job_id = self._transaction(work)
+        return None if job_id is None else self._get(job_id)
+
+    def _renew(
+        self, job_id: str, owner: str, lease_seconds: float
+    ) -> Optional[bool]:
+        with self._lock:
+            renewed = self._conn.execute(
+                "UPDATE jobs SET lease_until = ?"
+                " WHERE job_id = ? AND owner = ?",
+                (time.time() + lease_seconds, job_id, owner),
+            ).rowcount
+            if not renewed:
+                return None
+            row = self._conn.execute(
+                "SELECT cancel_requested FROM jobs WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()
+        return bool(row and row[0])
+
+    def _release(self, job_id: str, owner: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, owner = NULL,"
+                " lease_until = NULL WHERE job_id = ? AND owner = ?",
+                (QUEUED, job_id, owner),
+            )
+
+    def _add_event(self, job_id: str, event: str):
+        self._transaction(
+            lambda conn: conn.execute(
+                "INSERT INTO job_events SELECT ?, COALESCE(MAX(seq), 0)"
+                " + 1, ? FROM job_events WHERE job_id = ?",
+                (job_id, event, job_id),
+            )
+        )
+
+    def _get_events(self, job_id: str, after: int) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT event FROM job_events"
+                " WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after),
+            ).fetchall()
+        return [json.loads(event) for (event,) in rows]
+
+    def _finish(
+        self,
+        job_id: str,
+        owner: str,
+        status: str,
+        answer: Optional[str],
+        error: Optional[str],
+    ):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, owner = NULL,"
+                " lease_until = NULL, answer = ?, error = ?,"
+                " finished_at = ? WHERE job_id = ? AND owner = ?",
+                (status, answer, error, time.time(), job_id, owner),
+            )
+
+    def _cancel(self, job_id: str) -> Optional[str]:
+        def work(conn):
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?"
+                " WHERE job_id = ? AND status = ?",
+                (CANCELLED, now, job_id, QUEUED),
+            )
+            conn.execute(
+                "UPDATE jobs SET cancel_requested = 1"
+                " WHERE job_id = ? AND status = ?",
+                (job_id, RUNNING),
+            )
+            row = conn.execute(
+                "SELECT status FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            return None if row is None else row[0]
+
+        return self._transaction(work)
+
+    async def create(self, job_id: str, prompt: str, config: dict):
+        await asyncio.to_thread(
+            self._create,
+            job_id,
+            prompt,
+            json.dumps(config, default=str),
+        )
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        return await asyncio.to_thread(self._get, job_id)
+
+    async def claim(
+        self, owner: str, lease_seconds: float
+    ) -> Optional[Dict]:
+        return await asyncio.to_thread(
+            self._claim, owner, lease_seconds
+        )
+
+    async def renew(
+        self, job_id: str, owner: str, lease_seconds: float
+    ) -> Optional[bool]:
+        return await asyncio.to_thread(
+            self._renew, job_id, owner, lease_seconds
+        )
+
+    async def release(self, job_id: str, owner: str):
+        await asyncio.to_thread(self._release, job_id, owner)
+
+    async def add_event(self, job_id: str, event: Dict):
+        await asyncio.to_thread(
+            self._add_event, job_id, json.dumps(event, default=str)
+        )
+
+    async def get_events(self, job_id: str, after: int) -> List[Dict]:
+        return await asyncio.to_thread(self._get_events, job_id, after)
+
+    async def finish(
+        self,
+        job_id: str,
+        owner: str,
+        status: str,
+        answer: Optional[str] = None,
+        error: Optional[str] = None,
+    ):
+        await asyncio.to_thread(
+            self._finish, job_id, owner, status, answer, error
+        )
+
+    async def cancel(self, job_id: str) -> Optional[str]:
+        return await asyncio.to_thread(self._cancel, job_id)
+
+
+class JobManager:
+    """
+    Pool of worker tasks that claim jobs from a store and run them.
+
+    Stores implement create, get, claim, renew, release, add_event,
+    get_events, finish and cancel; claim hands out queued jobs and
+    running jobs whose lease has expired. renew returns whether a
+    cancellation was requested, or None once the owner has lost the
+    job to another worker; release and finish only apply to a job the
+    owner still holds.
+
+    Args:
+        store: MemoryJobStore or SQLiteJobStore.
+        max_workers (int): Jobs run at once by this process.
+        poll_interval (float): Seconds between checks for jobs
+            submitted, cancelled or updated by other processes.
+        lease_seconds (float): How long a claimed job stays with its
+            worker without a renewal.
+        max_wait (float): Longest long-poll in seconds.
+    """
+
+    def __init__(
+        self,
+        store,
+        max_workers: int = 4,
+        poll_interval: float = 0.5,
+        lease_seconds: float = 30,
+        max_wait: float = 30,
+    ):
+        self.store = store
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_wait = max_wait
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._workers: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        # Set when a job of this process changes, to end long-polls
+        self._changed: Dict[str, asyncio.Event] = {}
+        self._closing = False
+
+    async def start(self):
+        if self._workers:
+            return
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self._workers = [
+            asyncio.create_task(self._worker())
+            for _ in range(self.max_workers)
+        ]
+
+    async def close(self):
+        """
+        Stop the workers. Jobs they were running go back to the queue
+        and resume from their checkpoint in the next worker.
+        """
+        self._closing = True
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, prompt: str, config: dict) -> str:
+        """Queue a job and return its ID."""
+        job_id = uuid.uuid4().hex
+        await self.store.create(job_id, prompt, config)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    async def cancel(self, job_id: str) -> Optional[str]:
+        """
+        Cancel a queued job, or ask the worker of a running job to
+        cancel it.
+
+        Returns:
+            Optional[str]: The job's status, None if it is unknown.
+        """
+        status = await self.store.cancel(job_id)
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+        self._notify(job_id)
+        return status
+
+    async def poll(
+        self, job_id: str, after: int = 0, wait: float = 0
+    ) -> Optional[Dict]:
+        """
+        The job with its events after the first `after` ones. Waits up
+        to `wait` seconds for a new event or for the job to finish.
+
+        Returns:
+            Optional[Dict]: The job, None if it is unknown.
+        """
+        deadline = time.monotonic() + min(wait, self.max_wait)
+        while True:
+            job = await self.store.get(job_id)
+            if job is None:
+                return None
+            events = await self.store.get_events(job_id, after)
+            remaining = deadline - time.monotonic()
+            if events or job["status"] in FINISHED or remaining <= 0:
+                break
+            changed = self._changed.setdefault(job_id, asyncio.Event())
+            try:
+                await asyncio.wait_for(
+                    changed.wait(), min(remaining, self.poll_interval)
+                )
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._changed.pop(job_id, None)
+        job["events"] = events
+        job["next"] = after + len(events)
+        return job
+
+    def _notify(self, job_id: str):
+        changed = self._changed.get(job_id)
+        if changed is not None:
+            changed.set()
+
+    async def _worker(self):
+        while True:
+            try:
+                job = await self.store.claim(
+                    self.owner, self.lease_seconds
+                )
+            except sqlite3.Error as e:
+                trace.debug("Claiming a job failed", error=str(e))
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(
+                        self._wakeup.wait(), self.poll_interval
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+            try:
+                await self._execute(job)
+            except sqlite3.Error as e:
+                # The worker goes on with the next job; this one is
+                # claimed again once its lease runs out
+                metrics.ERRORS.labels("jobs", type(e).__name__).inc()
+                trace.debug(
+                    "Running a job failed",
+                    job_id=job["job_id"],
+                    error=str(e),
+                )
+
+    async def _execute(self, job: Dict):
+        job_id = job["job_id"]
+
+        async def on_event(event: dict):
+            if event["type"] not in _SKIPPED_EVENTS:
+                await self.store.add_event(job_id, event)
+                self._notify(job_id)
+
+        async def run() -> str:
+            with trace.span("job.run", job_id=job_id):
+                return await run_agent(
+                    job["prompt"],
+                    job["config"],
+                    on_event,
+                    run_id=job_id,
+                )
+
+        task = asyncio.create_task(run())
+        self._running[job_id] = task
+        renewed = time.monotonic()
+        lost = False
+        try:
+            if job["cancel_requested"]:
+                task.cancel()
+            while not task.done():
+                # Renew the lease and pick up cancellations made
+                # through other processes
+                await asyncio.wait(
+                    [task], timeout=self.lease_seconds / 3
+                )
+                if task.done():
+                    break
+                try:
+                    cancel = await self.store.renew(
+                        job_id, self.owner, self.lease_seconds
+                    )
+                except sqlite3.Error as e:
+                    trace.debug(
+                        "Renewing a lease failed",
+                        job_id=job_id,
+                        error=str(e),
+                    )
+                    if time.monotonic() - renewed < self.lease_seconds:
+                        continue
+                    # The lease has run out and another worker may
+                    # claim the job, so stop running it here
+                    raise
+                renewed = time.monotonic()
+                if cancel is None:
+                    # Claimed by another worker after the lease ran
+                    # out; that one runs the job from here
+                    lost = True
+                    task.cancel()
+                elif cancel:
+                    task.cancel()
+        except asyncio.CancelledError:
+            # Shutdown: hand the job back to the queue
+            task.cancel()
+            await asyncio.wait([task])
+            try:
+                await self.store.release(job_id, self.owner)
+            except sqlite3.Error as e:
+                trace.debug(
+                    "Releasing a job failed",
+                    job_id=job_id,
+                    error=str(e),
+                )
+            raise
+        finally:
+            if not task.done():
+                task.cancel()
+                await asyncio.wait([task])
+            del self._running[job_id]
+
+        if lost:
+            trace.debug("Lost the lease of a job", job_id=job_id)
+        elif task.cancelled():
+            await self.store.finish(job_id, self.owner, CANCELLED)
+        elif task.exception() is not None:
+            error = task.exception()
+            await self.store.finish(
+                job_id,
+                self.owner,
+                FAILED,
+                error=f"{type(error).__name__}: {error}",
+            )
+        else:
+            await self.store.finish(
+                job_id, self.owner, COMPLETED, answer=task.result()
+            )
+        self._notify(job_id)
+
+
+_job_manager: Optional[JobManager] = None
+
+
+def get_job_manager() -> JobManager:
+    """
+    Get the process-wide job manager, building its store from the jobs
+    section of default_config.yaml on first use.
+
+    Returns:
+        JobManager: The shared job manager.
+    """
+    global _job_manager
+    if _job_manager is None:
+        backend = _jobs_config.get("backend", "memory")
+        ttl_seconds = _jobs_config.get("ttl_seconds", 86400)
+        if backend == "memory":
+            store = MemoryJobStore(ttl_seconds)
+        elif backend == "sqlite":
+            store = SQLiteJobStore(
+                _jobs_config.get("sqlite_path", ".cache/jobs.sqlite"),
+                ttl_seconds,
+            )
+        else:
+            raise ValueError(
+                f"Unknown jobs backend: {backend}. "
+                "Supported backends are 'memory' and 'sqlite'."
+            )
+        _job_manager = JobManager(
+            store,
+            max_workers=_jobs_config.get("max_workers", 4),
+            poll_interval=_jobs_config.get(
+                "poll_interval_seconds", 0.5
+            ),
+            lease_seconds=_jobs_config.get("lease_seconds", 30),
+            max_wait=_jobs_config.get("max_wait_seconds", 30),
+        )
+    return _job_manager
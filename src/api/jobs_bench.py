@@ -0,0 +1,302 @@
+"""
+Benchmark background jobs with a fake model and check their leases.
+
+throughput  Submits --jobs jobs to --managers job managers (each
+            standing for a server process) sharing one store and
+            waits for them, once per backend. Jobs run longer than
+            their lease, so they only run once if workers keep renewing
+            it.
+takeover    Claims --jobs jobs as a worker that then dies without
+            renewing its lease, starts a manager and times how long
+            until the jobs are done elsewhere.
+
+Reports jobs per second and submit-to-finish latency, and checks that
+every job completed with the scripted answer, that the fake model was
+called exactly once per step of every job (a job run twice calls it
+more), that no errors were counted and that a dead worker's jobs were
+taken over only once its lease ran out. The exit code is 1 if a check
+fails. The SQLite store goes to a temporary directory.
+
+Run from src/:
+    python -m api.jobs_bench --jobs 40 --managers 2 --lease 0.5
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+from api import metrics
+from api.agent.run_store import flush_run_store
+from api.jobs import (
+    COMPLETED,
+    FINISHED,
+    JobManager,
+    MemoryJobStore,
+    SQLiteJobStore,
+)
+from api.models.fake_provider import Latency, register_fake_model
+from api.tools.fake_tools import register_fake_tool
+
+MODEL = "bench-jobs"
+
+
+def _script(steps: int) -> list:
+    script = [
+        {
+            "content": f"Thought: step {step} needs more sources.",
+            "tool_calls": [
+                {
+                    "name": "fake_search",
+                    "arguments": {"query": f"q{step}"},
+                }
+            ],
+        }
+        for step in range(steps)
+    ]
+    script.append("Thought: I have enough.\nFinal Answer: 42")
+    return script
+
+
+def _errors() -> float:
+    return sum(value for _, _, value in metrics.ERRORS._samples())
+
+
+def _percentile(samples: list, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def _wait(
+    manager: JobManager, job_id: str, timeout: float
+) -> dict:
+    deadline = time.monotonic() + timeout
+    after = 0
+    while True:
+        job = await manager.poll(job_id, after, wait=1)
+        after = job["next"]
+        if job["status"] in FINISHED or time.monotonic() > deadline:
+            return job
+
+
+def _check_jobs(
+    label: str, jobs: list, model, calls: int, args, failures: list
+):
+    wrong = [
+        job
+        for job in jobs
+        if job["status"] != COMPLETED
+        or not (job["answer"] or "").startswith("42")
+    ]
+    if wrong:
+        failures.append(
+            f"{label}: {len(wrong)} jobs ended {wrong[0]['status']} "
+            f"with {wrong[0]['answer'] or wrong[0]['error']!r}"
+        )
+    expected = len(jobs) * (args.steps + 1)
+    if model.calls - calls != expected:
+        failures.append(
+            f"{label}: {model.calls - calls} model calls, expected "
+            f"{expected}"
+        )
+
+
+def _managers(store, args) -> list:
+    return [
+        JobManager(
+            store,
+            max_workers=args.workers,
+            poll_interval=args.poll_interval,
+            lease_seconds=args.lease,
+        )
+        for _ in range(args.managers)
+    ]
+
+
+async def _throughput(store, args, model, failures: list) -> dict:
+    label = f"throughput {type(store).__name__}"
+    managers = _managers(store, args)
+    for manager in managers:
+        await manager.start()
+    calls = model.calls
+    config = {
+        "agent_type": "single_agent",
+        "provider": "fake",
+        "model": MODEL,
+        "max_steps": args.steps + 1,
+        "knowledge": False,
+    }
+
+    async def one(index: int) -> tuple:
+        manager = managers[index % len(managers)]
+        start = time.perf_counter()
+        job_id = await manager.submit(f"Question {index}", config)
+        job = await _wait(manager, job_id, args.timeout)
+        return job, time.perf_counter() - start
+
+    start = time.perf_counter()
+    try:
+        done = await asyncio.gather(
+            *(one(index) for index in range(args.jobs))
+        )
+    finally:
+        wall = time.perf_counter() - start
+        for manager in managers:
+            await manager.close()
+    _check_jobs(
+        label, [job for job, _ in done], model, calls, args, failures
+    )
+    latencies = [seconds for _, seconds in done]
+    return {
+        "wall": wall,
+        "p50": _percentile(latencies, 0.5),
+        "p99": _percentile(latencies, 0.99),
+    }
+
+
+async def _takeover(store, args, model, failures: list) -> dict:
+    label = f"takeover {type(store).__name__}"
+    config = {
+        "agent_type": "single_agent",
+        "provider": "fake",
+        "model": MODEL,
+        "max_steps": args.steps + 1,
+        "knowledge": False,
+    }
+    job_ids = [uuid.uuid4().hex for _ in range(args.jobs)]
+    for index, job_id in enumerate(job_ids):
+        await store.create(job_id, f"Takeover {index}", config)
+    # A worker claims every job and dies at once
+    for _ in job_ids:
+        await store.claim("dead-worker", args.lease)
+    died = time.perf_counter()
+    calls = model.calls
+
+    manager = JobManager(
+        store,
+        max_workers=args.workers * args.managers,
+        poll_interval=args.poll_interval,
+        lease_seconds=args.lease,
+    )
+    await manager.start()
+    try:
+        # Nothing may run while the dead worker's leases hold
+        await asyncio.sleep(args.lease * 0.8)
+        if model.calls != calls:
+            failures.append(
+                f"{label}: jobs ran before their worker's lease ran out"
+            )
+        jobs = await asyncio.gather(
+            *(
+                _wait(manager, job_id, args.timeout)
+                for job_id in job_ids
+            )
+        )
+    finally:
+        wall = time.perf_counter() - died
+        await manager.close()
+    _check_jobs(label, jobs, model, calls, args, failures)
+    return {"wall": wall}
+
+
+async def _bench(args, directory: str) -> list:
+    failures = []
+    tool_latency = Latency(args.tool_seconds)
+    register_fake_tool("fake_search", tool_latency, output_chars=2000)
+    model = register_fake_model(
+        MODEL, _script(args.steps), Latency(args.model_seconds)
+    )
+    errors = _errors()
+    job_seconds = (
+        args.steps * (args.model_seconds + args.tool_seconds)
+        + args.model_seconds
+    )
+    print(
+        f"{args.jobs} jobs of {args.steps + 1} steps, about "
+        f"{job_seconds:.2f}s each, {args.managers} managers of "
+        f"{args.workers} workers, {args.lease}s lease\n"
+    )
+    print(
+        f"{'scenario':>10} | {'backend':>7} | {'seconds':>7} | "
+        f"{'jobs/s':>6} | {'p50 s':>6} | {'p99 s':>6}"
+    )
+    backends = {
+        "memory": lambda: MemoryJobStore(),
+        "sqlite": lambda: SQLiteJobStore(
+            os.path.join(directory, f"jobs-{time.time_ns()}.sqlite")
+        ),
+    }
+    for backend, new_store in backends.items():
+        if args.scenario in ("throughput", "all"):
+            result = await _throughput(
+                new_store(), args, model, failures
+            )
+            print(
+                f"{'throughput':>10} | {backend:>7} | "
+                f"{result['wall']:>7.2f} | "
+                f"{args.jobs / result['wall']:>6.1f} | "
+                f"{result['p50']:>6.2f} | {result['p99']:>6.2f}"
+            )
+        if args.scenario in ("takeover", "all"):
+            result = await _takeover(new_store(), args, model, failures)
+            print(
+                f"{'takeover':>10} | {backend:>7} | "
+                f"{result['wall']:>7.2f} | "
+                f"{args.jobs / result['wall']:>6.1f} | "
+                f"{'':>6} | {'':>6}"
+            )
+    await flush_run_store()
+    if _errors() != errors:
+        failures.append(f"{_errors() - errors:.0f} errors counted")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Background job benchmark"
+    )
+    parser.add_argument(
+        "--scenario",
+        choices=["throughput", "takeover", "all"],
+        default="all",
+    )
+    parser.add_argument("--jobs", type=int, default=40)
+    parser.add_argument("--steps", type=int, default=4)
+    parser.add_argument(
+        "--managers",
+        type=int,
+        default=2,
+        help="Job managers sharing a store, as server processes do",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=4, help="Workers per manager"
+    )
+    parser.add_argument(
+        "--lease", type=float, default=0.5, help="Lease seconds"
+    )
+    parser.add_argument("--poll-interval", type=float, default=0.05)
+    parser.add_argument("--model-seconds", type=float, default=0.1)
+    parser.add_argument("--tool-seconds", type=float, default=0.05)
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=60,
+        help="Seconds to wait for a job",
+    )
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp(prefix="jobs_bench_")
+    try:
+        failures = asyncio.run(_bench(args, directory))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    if failures:
+        print("\nFailed checks:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,373 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import List, Optional, Union
+
 from fastapi import FastAPI, Request
+from fastapi.responses import (
+    JSONResponse,
+    PlainTextResponse,
+    StreamingResponse,
+)
 from pydantic import BaseModel
 
+from api import trace
+from api.metrics import render_metrics
 from api.config_loader import load_default_config
 from api.agent import run_agent
+from api.batch import normalize_item, parse_items, run_batch
+from api.jobs import get_job_manager
+from api.agent.knowledge import flush_knowledge_store
+from api.agent.run_store import (
+    RunInProgressError,
+    flush_run_store,
+    get_run_store,
+    new_run_id,
+)
+from api.models.clients import close_clients
+from api.models.cache import get_response_cache
+from api.models.routing import get_routing_stats
+from api.tools import close_tools
+from api.tools.tool_cache import get_tool_cache
+from api.scheduler import (
+    QueueFullError,
+    get_scheduler_stats,
+    run_limiter,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await get_job_manager().start()
+    yield
+    # Hand running jobs back to the queue, then drain the pooled
+    # provider connections and code workers
+    await get_job_manager().close()
+    await close_clients()
+    await close_tools()
+    await flush_run_store()
+    await flush_knowledge_store()
+    trace.flush()
 
-app = FastAPI(title="Deep Research Agent Server")
+
+app = FastAPI(title="Deep Research Agent Server", lifespan=lifespan)
 default_config = load_default_config()
 
+# Seconds of silence before an SSE keep-alive comment is sent, so
+# gateways do not drop the connection during long tool calls
+SSE_KEEPALIVE_INTERVAL = 15
+
+
 class AgentRequest(BaseModel):
     prompt: str
     config: dict = {}
+    # Resume (or fetch the answer of) an earlier run
+    run_id: Optional[str] = None
+
+
+class BatchRequest(BaseModel):
+    # Prompt strings or {"prompt", "id", "config"} objects
+    prompts: List[Union[str, dict]]
+    config: dict = {}
+    # Reuse to resume an interrupted batch
+    batch_id: Optional[str] = None
+    max_concurrency: Optional[int] = None
+
+
+def _too_many_requests(e: QueueFullError) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"error": str(e)},
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+def _run_in_progress(e: RunInProgressError) -> JSONResponse:
+    return JSONResponse(
+        status_code=409, content={"run_id": e.run_id, "error": str(e)}
+    )
+
+
+async def _run_persisted(prompt: str, config: dict, run_id: str):
+    try:
+        async with run_limiter.slot():
+            response = await run_agent(
+                prompt=prompt, config=config, run_id=run_id
+            )
+        return {"run_id": run_id, "response": response}
+    except QueueFullError as e:
+        return _too_many_requests(e)
+    except RunInProgressError as e:
+        return _run_in_progress(e)
+    except Exception as e:
+        return {"run_id": run_id, "error": str(e)}
+
 
 @app.post("/run_agent")
 async def run_agent_endpoint(data: AgentRequest):
     """
     Endpoint to run the agent with the provided prompt and configuration.
+    Runs beyond scheduler.max_concurrent_runs wait in a bounded queue;
+    when it is full the request is rejected with 429 and Retry-After.
+
+    Every run is checkpointed after each step under the returned
+    run_id. Retrying with that run_id continues the run from its last
+    completed step, or returns its answer if it finished.
     """
     merged_config = {**default_config, **data.config}
+    return await _run_persisted(
+        data.prompt, merged_config, data.run_id or new_run_id()
+    )
+
+
+@app.get("/runs/{run_id}")
+async def get_run_endpoint(run_id: str, messages: bool = False):
+    """
+    Status, completed steps and answer or error of a run; with
+    ?messages=true also its history as of the last checkpoint.
+    """
+    store = get_run_store()
+    run = await store.get(run_id)
+    if run is None:
+        return JSONResponse(
+            status_code=404, content={"error": f"Unknown run {run_id}"}
+        )
+    run.pop("config")
+    run["active"] = run_id in store.active
+    if messages:
+        run["messages"], _ = await store.load_messages(run_id)
+    return run
+
+
+@app.post("/runs/{run_id}/resume")
+async def resume_run_endpoint(run_id: str):
+    """
+    Continue an interrupted or failed run from its last completed
+    step, with its original prompt and config.
+    """
+    run = await get_run_store().get(run_id)
+    if run is None:
+        return JSONResponse(
+            status_code=404, content={"error": f"Unknown run {run_id}"}
+        )
+    return await _run_persisted(run["prompt"], run["config"], run_id)
+
+
+def _format_sse(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+@app.post("/run_agent/stream")
+async def run_agent_stream_endpoint(data: AgentRequest):
+    """
+    Endpoint to run the agent and stream its progress as server-sent
+    events: step, token, thought, action and tool_result while it runs,
+    then a final_answer or error event carrying the run_id.
+    """
+    merged_config = {**default_config, **data.config}
+    run_id = data.run_id or new_run_id()
+    events: asyncio.Queue = asyncio.Queue()
+
+    # Reject up front; a queued run waits inside the open stream
+    if run_limiter.is_full():
+        return _too_many_requests(
+            QueueFullError(run_limiter.name, run_limiter.retry_after())
+        )
+
+    async def run():
+        try:
+            async with run_limiter.slot():
+                response = await run_agent(
+                    prompt=data.prompt,
+                    config=merged_config,
+                    on_event=events.put,
+                    run_id=run_id,
+                )
+            await events.put(
+                {
+                    "type": "final_answer",
+                    "run_id": run_id,
+                    "response": response,
+                }
+            )
+        except Exception as e:
+            await events.put(
+                {"type": "error", "run_id": run_id, "error": str(e)}
+            )
+        finally:
+            await events.put(None)
+
+    async def event_stream():
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        events.get(), SSE_KEEPALIVE_INTERVAL
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    break
+                yield _format_sse(event)
+        finally:
+            # Stop the run if the client went away
+            task.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
 
+@app.post("/run_agent/batch")
+async def run_agent_batch_endpoint(
+    request: Request,
+    batch_id: Optional[str] = None,
+    max_concurrency: Optional[int] = None,
+):
+    """
+    Run many prompts on a bounded pool of agent runs, sharing the run
+    limiter with /run_agent. The body is a BatchRequest, or a JSONL
+    file of prompts (Content-Type application/x-ndjson or
+    application/jsonl) with batch_id and max_concurrency as query
+    parameters. Identical prompts with identical configs run once.
+
+    Streams newline-delimited JSON: a batch event, then a result event
+    per item as its run finishes (status completed or failed, with
+    run_id, response or error and duplicate_of), then a summary.
+    Submitting again with the same batch_id returns finished answers
+    and resumes the rest.
+    """
+    body = await request.body()
     try:
-        response = await run_agent(prompt=data.prompt, config=merged_config)
-        return {"response": response}
-    except Exception as e:
-        return {"error": str(e)}
-    
+        if request.headers.get("content-type", "").startswith(
+            ("application/x-ndjson", "application/jsonl")
+        ):
+            items = parse_items(body.decode().splitlines())
+            config = {}
+        else:
+            data = BatchRequest.model_validate_json(body)
+            items = [normalize_item(item) for item in data.prompts]
+            config = data.config
+            batch_id = data.batch_id or batch_id
+            max_concurrency = data.max_concurrency or max_concurrency
+    except ValueError as e:
+        return JSONResponse(status_code=422, content={"error": str(e)})
+    merged_config = {**default_config, **config}
+
+    async def result_stream():
+        async for event in run_batch(
+            items, merged_config, batch_id, max_concurrency
+        ):
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(
+        result_stream(),
+        media_type="application/x-ndjson",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job_endpoint(data: AgentRequest):
+    """
+    Queue an agent run and return its job ID at once. Workers in the
+    server processes pick it up in submission order.
+    """
+    merged_config = {**default_config, **data.config}
+    job_id = await get_job_manager().submit(data.prompt, merged_config)
+    return {"job_id": job_id, "status": "queued"}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job_endpoint(
+    job_id: str, after: int = 0, wait: float = 0
+):
+    """
+    Status, progress events and final answer or error of a job.
+
+    Events are returned from index `after` on, together with `next`,
+    the index to pass on the next poll. With `wait`, the request is
+    held for up to that many seconds (capped by jobs.max_wait_seconds)
+    until there is a new event or the job finishes.
+    """
+    job = await get_job_manager().poll(job_id, after, wait)
+    if job is None:
+        return JSONResponse(
+            status_code=404, content={"error": f"Unknown job {job_id}"}
+        )
+    for internal in ("config", "owner", "lease_until"):
+        job.pop(internal)
+    return job
+
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job_endpoint(job_id: str):
+    """
+    Cancel a job. A running job stops at the next await of its ReAct
+    loop; its status turns to cancelled once it has.
+    """
+    status = await get_job_manager().cancel(job_id)
+    if status is None:
+        return JSONResponse(
+            status_code=404, content={"error": f"Unknown job {job_id}"}
+        )
+    return {"job_id": job_id, "status": status}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """
+    Prometheus scrape endpoint. Async, like the stats endpoints below,
+    so it runs on the event loop thread that updates what it reads.
+    """
+    return PlainTextResponse(
+        render_metrics(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
 @app.get("/health")
 def health_check():
     """
     Health check endpoint to verify the server is running.
     """
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    Model response and tool result cache counters.
+    """
+    return {
+        "model": get_response_cache().stats(),
+        "tool": get_tool_cache().stats(),
+    }
+
+
+@app.get("/routing/stats")
+async def routing_stats():
+    """
+    Circuit breaker state, error rate and median latency of each model
+    deployment.
+    """
+    return get_routing_stats()
+
+
+@app.get("/scheduler/stats")
+async def scheduler_stats():
+    """
+    Queue depth, concurrency and wait times of agent runs and model
+    calls.
+    """
+    return get_scheduler_stats()
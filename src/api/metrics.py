@@ -0,0 +1,312 @@
+"""
+Prometheus-style metrics served by /metrics.
+
+Counters, gauges and histograms are plain in-process objects: a labeled
+child is looked up once per call and updating it is a few integer and
+float additions, with no locks, so metrics can stay on in production.
+They are updated from the event loop thread; each server process
+(uvicorn worker) keeps and exposes its own values, which Prometheus
+aggregates across scrape targets.
+"""
+
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Seconds; model calls run from sub-second to minutes for reasoning
+# models
+LATENCY_BUCKETS = (
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    120,
+    300,
+)
+TOKEN_BUCKETS = (64, 256, 1024, 4096, 8192, 16384, 32768, 65536, 131072)
+
+
+def _escape(value: str) -> str:
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\n", "\\n")
+        .replace('"', '\\"')
+    )
+
+
+def _format_labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(value)}"'
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(
+        self, name: str, help: str, labelnames: Sequence[str] = ()
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple, object] = {}
+        _registry.append(self)
+
+    def labels(self, *values):
+        """Get the child for one combination of label values."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(
+                    f"{self.name} takes labels {self.labelnames}"
+                )
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> List[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for name, labels, value in self._samples():
+            lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    """Monotonic count; names end in _total."""
+
+    type = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def _samples(self):
+        # Over a copy, in case another thread adds a label child while
+        # a scrape renders
+        return [
+            (
+                self.name,
+                _format_labels(self.labelnames, values),
+                c.value,
+            )
+            for values, c in list(self._children.items())
+        ]
+
+
+class Gauge(Counter):
+    """
+    Value that goes up and down. An unlabeled gauge can instead read
+    its value from a function at scrape time.
+    """
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        function: Optional[Callable[[], float]] = None,
+    ):
+        super().__init__(name, help, labelnames)
+        self.function = function
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def _samples(self):
+        if self.function is not None:
+            return [(self.name, "", self.function())]
+        return super()._samples()
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    """Distribution of observations in cumulative buckets."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _samples(self):
+        samples = []
+        for values, h in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(
+                self.buckets + (float("inf"),), h.counts
+            ):
+                cumulative += count
+                samples.append(
+                    (
+                        f"{self.name}_bucket",
+                        _format_labels(
+                            self.labelnames + ("le",),
+                            values + (_format_value(bound),),
+                        ),
+                        cumulative,
+                    )
+                )
+            labels = _format_labels(self.labelnames, values)
+            samples.append((f"{self.name}_sum", labels, h.sum))
+            samples.append((f"{self.name}_count", labels, h.count))
+        return samples
+
+
+_registry: List[_Metric] = []
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+MODEL_CALL_SECONDS = Histogram(
+    "agent_model_call_seconds",
+    "Latency of model calls, including retries and reading streams",
+    ("agent_id", "provider", "model"),
+)
+MODEL_PROMPT_TOKENS = Histogram(
+    "agent_model_prompt_tokens",
+    "Prompt tokens per model call",
+    ("agent_id", "provider", "model"),
+    buckets=TOKEN_BUCKETS,
+)
+MODEL_COMPLETION_TOKENS = Histogram(
+    "agent_model_completion_tokens",
+    "Completion tokens per model call",
+    ("agent_id", "provider", "model"),
+    buckets=TOKEN_BUCKETS,
+)
+MODEL_CACHED_TOKENS = Histogram(
+    "agent_model_cached_tokens",
+    "Prompt tokens per model call served from the provider's prompt "
+    "cache",
+    ("agent_id", "provider", "model"),
+    buckets=(0,) + TOKEN_BUCKETS,
+)
+TOOL_CALL_SECONDS = Histogram(
+    "agent_tool_call_seconds",
+    "Latency of tool calls, including waiting for a concurrency slot",
+    ("tool",),
+)
+RUNS = Counter(
+    "agent_runs_total",
+    "Finished agent runs by outcome (answer, max_steps, error)",
+    ("agent_id", "outcome"),
+)
+STEPS = Counter(
+    "agent_steps_total",
+    "ReAct steps taken; divide by agent_runs_total for steps per run",
+    ("agent_id",),
+)
+CACHE_REQUESTS = Counter(
+    "agent_cache_requests_total",
+    "Model and tool cache lookups by result (hit, miss, coalesced)",
+    ("cache", "result"),
+)
+BATCH_ITEMS = Counter(
+    "agent_batch_items_total",
+    "Batch items by outcome (completed, failed)",
+    ("status",),
+)
+FETCHES = Counter(
+    "agent_fetches_total",
+    "Pages read by the fetch tool by result (fetched, fresh, "
+    "revalidated, error)",
+    ("result",),
+)
+TOOL_OUTPUTS = Counter(
+    "agent_tool_outputs_total",
+    "Tool results by how they reached the model (whole, stored)",
+    ("tool", "result"),
+)
+KNOWLEDGE = Counter(
+    "agent_knowledge_findings_total",
+    "Long-term findings by event (recalled, added, refreshed, evicted)",
+    ("event",),
+)
+ERRORS = Counter(
+    "agent_errors_total",
+    "Errors by component (model, tool, run) and exception type",
+    ("component", "type"),
+)
+RUNS_IN_FLIGHT = Gauge(
+    "agent_runs_in_flight",
+    "Agent runs currently executing",
+    ("agent_type",),
+)
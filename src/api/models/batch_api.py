@@ -0,0 +1,324 @@
+"""
+Provider Batch API for the model calls of offline batch runs.
+
+Inside batch_api_scope(), non-streamed model calls to a provider that
+supports batches are not sent one by one. They are collected for up to
+window_seconds, uploaded as one JSONL file and submitted as a provider
+batch, which is then polled until it finishes. Batched calls cost about
+half as much and do not use the per-minute quota of the deployment,
+but a batch can take up to its completion window, so this only suits
+offline runs: each step of every agent run in the scope becomes one
+request of the next provider batch.
+
+Settings come from batch.batch_api in default_config.yaml.
+"""
+
+import asyncio
+import itertools
+import json
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import openai
+from openai.types.chat import ChatCompletion
+
+from api import trace
+from api.config_loader import load_default_config
+from api.models.clients import get_client
+
+_batch_api_config = (
+    load_default_config().get("batch", {}).get("batch_api", {})
+)
+
+_FINAL_STATES = ("completed", "failed", "expired", "cancelled")
+
+_STATUS_ERRORS = {
+    400: openai.BadRequestError,
+    401: openai.AuthenticationError,
+    403: openai.PermissionDeniedError,
+    404: openai.NotFoundError,
+    409: openai.ConflictError,
+    422: openai.UnprocessableEntityError,
+    429: openai.RateLimitError,
+}
+
+# provider -> ProviderBatch of the current batch_api_scope
+_batches: ContextVar[Optional[Dict[str, "ProviderBatch"]]] = ContextVar(
+    "provider_batches", default=None
+)
+
+
+class BatchAPIError(openai.OpenAIError):
+    """Raised when a provider batch fails or omits a request."""
+
+
+def batch_api_providers() -> Dict[str, str]:
+    """Providers that accept batches, with their endpoint URL."""
+    return _batch_api_config.get(
+        "providers", {"openai": "/v1/chat/completions"}
+    )
+
+
+def is_batch_api_enabled(config: dict) -> bool:
+    return bool(
+        config.get("batch_api", _batch_api_config.get("enabled", False))
+    )
+
+
+def _status_error(status: int, body: dict) -> openai.APIStatusError:
+    """The error the SDK would raise for a failed batched request."""
+    error = body.get("error") if isinstance(body, dict) else None
+    message = (
+        error.get("message")
+        if isinstance(error, dict)
+        else f"Error code: {status}"
+    )
+    response = httpx.Response(
+        status,
+        json=body,
+        request=httpx.Request("POST", "https://batch.invalid"),
+    )
+    if status in _STATUS_ERRORS:
+        cls = _STATUS_ERRORS[status]
+    elif status >= 500:
+        cls = openai.InternalServerError
+    else:
+        cls = openai.APIStatusError
+    return cls(message, response=response, body=body)
+
+
+class ProviderBatch:
+    """
+    Collects the chat completion requests of one provider and submits
+    them together as provider batches.
+
+    A batch is submitted window_seconds after its first request, or at
+    once when it reaches max_requests. Each request waits until the
+    batch it is part of has finished.
+
+    Args:
+        provider (str): Model provider.
+        endpoint (str): Endpoint URL of the batched requests.
+        window_seconds (float): How long requests are collected.
+        max_requests (int): Requests per provider batch.
+        poll_interval (float): Seconds between batch status checks.
+        completion_window (str): The provider's completion window.
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        endpoint: str,
+        window_seconds: float = 2.0,
+        max_requests: int = 50000,
+        poll_interval: float = 30.0,
+        completion_window: str = "24h",
+    ):
+        self.provider = provider
+        self.endpoint = endpoint
+        self.window_seconds = window_seconds
+        self.max_requests = max_requests
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        self._ids = itertools.count()
+        self._pending: List[Tuple[str, dict, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+        # Provider batch IDs not finished yet, cancelled on close
+        self._open: set = set()
+        self.batches_submitted = 0
+        self.requests_submitted = 0
+
+    async def submit(self, body: dict) -> ChatCompletion:
+        """
+        Add a request body to the next provider batch and wait for its
+        completion.
+
+        Raises:
+            openai.APIStatusError: If the request failed in the batch.
+            BatchAPIError: If the whole batch failed.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(
+            (f"request-{next(self._ids)}", body, future)
+        )
+        if len(self._pending) >= self.max_requests:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.window_seconds, self._flush
+            )
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        pending = [entry for entry in pending if not entry[2].done()]
+        if not pending:
+            return
+        task = asyncio.create_task(self._run(pending))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(
+        self, pending: List[Tuple[str, dict, asyncio.Future]]
+    ):
+        try:
+            results = await self._execute(
+                [(custom_id, body) for custom_id, body, _ in pending]
+            )
+        except Exception as e:
+            results = {custom_id: e for custom_id, _, _ in pending}
+        for custom_id, _, future in pending:
+            if future.done():
+                continue
+            result = results.get(custom_id)
+            if result is None:
+                result = BatchAPIError(
+                    f"Provider batch returned no result for {custom_id}"
+                )
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def _execute(self, requests: List[Tuple[str, dict]]) -> Dict:
+        client = get_client(self.provider)
+        lines = b"".join(
+            json.dumps(
+                {
+                    "custom_id": custom_id,
+                    "method": "POST",
+                    "url": self.endpoint,
+                    "body": body,
+                },
+                separators=(",", ":"),
+            ).encode()
+            + b"\n"
+            for custom_id, body in requests
+        )
+        input_file = await client.files.create(
+            file=("batch.jsonl", lines), purpose="batch"
+        )
+        batch = await client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=self.endpoint,
+            completion_window=self.completion_window,
+        )
+        self.batches_submitted += 1
+        self.requests_submitted += len(requests)
+        trace.current_span().event(
+            "provider_batch",
+            provider=self.provider,
+            batch_id=batch.id,
+            requests=len(requests),
+        )
+        # Until it finishes, so that close() cancels a batch whose
+        # polling was cancelled or failed
+        self._open.add(batch.id)
+        while batch.status not in _FINAL_STATES:
+            await asyncio.sleep(self.poll_interval)
+            batch = await client.batches.retrieve(batch.id)
+        self._open.discard(batch.id)
+
+        results = {}
+        # An expired batch still returns the requests it completed
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            content = await client.files.content(file_id)
+            for line in content.text.splitlines():
+                if line.strip():
+                    record = json.loads(line)
+                    results[record["custom_id"]] = _parse_result(record)
+        if batch.status != "completed" and not results:
+            raise BatchAPIError(
+                f"Provider batch {batch.id} {batch.status}"
+            )
+        return results
+
+    async def close(self):
+        """Fail waiting requests and cancel unfinished provider batches."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for _, _, future in self._pending:
+            future.cancel()
+        self._pending = []
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        client = get_client(self.provider)
+        for batch_id in list(self._open):
+            try:
+                await client.batches.cancel(batch_id)
+            except openai.OpenAIError as e:
+                trace.debug(
+                    "Cancelling a provider batch failed",
+                    batch_id=batch_id,
+                    error=str(e),
+                )
+        self._open.clear()
+
+    def stats(self) -> Dict:
+        return {
+            "batches_submitted": self.batches_submitted,
+            "requests_submitted": self.requests_submitted,
+        }
+
+
+def _parse_result(record: dict):
+    response = record.get("response") or {}
+    status = response.get("status_code", 0)
+    body = response.get("body") or {}
+    if status == 200:
+        return ChatCompletion.model_validate(body)
+    if status:
+        return _status_error(status, body)
+    return BatchAPIError(
+        f"Batched request {record['custom_id']} failed: "
+        f"{record.get('error')}"
+    )
+
+
+def current_batch(provider: str) -> Optional[ProviderBatch]:
+    """The provider batch model calls to provider go to, if any."""
+    batches = _batches.get()
+    if batches is None:
+        return None
+    return batches.get(provider)
+
+
+@asynccontextmanager
+async def batch_api_scope():
+    """
+    Send the non-streamed model calls made inside the scope (including
+    tasks it starts) through the Batch API of the providers that
+    support it. Yields the ProviderBatch of each provider.
+    """
+    batches = {
+        provider: ProviderBatch(
+            provider,
+            endpoint,
+            window_seconds=_batch_api_config.get("window_seconds", 2.0),
+            max_requests=_batch_api_config.get("max_requests", 50000),
+            poll_interval=_batch_api_config.get(
+                "poll_interval_seconds", 30.0
+            ),
+            completion_window=_batch_api_config.get(
+                "completion_window", "24h"
+            ),
+        )
+        for provider, endpoint in batch_api_providers().items()
+    }
+    token = _batches.set(batches)
+    try:
+        yield batches
+    finally:
+        _batches.reset(token)
+        for batch in batches.values():
+            await batch.close()
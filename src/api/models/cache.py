@@ -0,0 +1,310 @@
+"""
+Content-addressed cache for model responses.
+
+Keys are a SHA-256 over provider, model, normalized messages, tools
+schema and sampling params, so byte-identical requests (after key
+ordering and None fields are normalized away) share an entry. Values are
+stored as JSON so they can be shared across workers by the SQLite store.
+
+Backends (model_cache.backend in default_config.yaml):
+    memory: in-process LRU bounded by max_entries and ttl_seconds
+    sqlite: on-disk table shared by all uvicorn workers on the host
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, Optional, Tuple, Union
+
+from api.config_loader import load_default_config
+
+if TYPE_CHECKING:
+    from openai.types.chat import ChatCompletionMessage
+
+_cache_config = load_default_config().get("model_cache", {})
+
+
+def _normalize(value):
+    # Provider message objects and dicts normalize to the same form
+    if hasattr(value, "model_dump"):
+        value = value.model_dump(exclude_none=True)
+    if isinstance(value, dict):
+        return {
+            key: _normalize(item)
+            for key, item in value.items()
+            if item is not None
+        }
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def make_cache_key(
+    provider: str,
+    model: str,
+    messages: list,
+    tools: Optional[list],
+    sampling_params: dict,
+) -> str:
+    """
+    Compute the stable cache key of a model request.
+
+    Args:
+        provider (str): Model provider.
+        model (str): Model name.
+        messages (list): Messages sent to the model.
+        tools (Optional[list]): Tools schema sent to the model.
+        sampling_params (dict): Sampling and length arguments.
+
+    Returns:
+        str: Hex SHA-256 digest.
+    """
+    payload = json.dumps(
+        {
+            "provider": provider,
+            "model": model,
+            "messages": _normalize(messages),
+            # Frozen ToolSchemas are hashed once, not at every call
+            "tools": getattr(tools, "digest", None)
+            or _normalize(tools or []),
+            "params": sampling_params,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def serialize_response(
+    response: Union[str, "ChatCompletionMessage"],
+) -> str:
+    if isinstance(response, str):
+        return json.dumps({"content": response})
+    return json.dumps(
+        {"message": response.model_dump(exclude_none=True)}
+    )
+
+
+def deserialize_response(
+    value: str,
+) -> Union[str, "ChatCompletionMessage"]:
+    data = json.loads(value)
+    if "message" in data:
+        from openai.types.chat import ChatCompletionMessage
+
+        return ChatCompletionMessage.model_validate(data["message"])
+    return data["content"]
+
+
+class LRUCacheStore:
+    """In-process LRU store with entry count and TTL bounds."""
+
+    def __init__(
+        self, max_entries: int = 1024, ttl_seconds: float = 3600
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = (
+            OrderedDict()
+        )
+
+    async def get(self, key: str) -> Tuple[Optional[str], int]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, 0
+        stored_at, value = entry
+        if time.time() - stored_at > self.ttl_seconds:
+            del self._entries[key]
+            return None, 1
+        self._entries.move_to_end(key)
+        return value, 0
+
+    async def set(self, key: str, value: str) -> int:
+        self._entries[key] = (time.time(), value)
+        self._entries.move_to_end(key)
+        evicted = 0
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            evicted += 1
+        return evicted
+
+
+class SQLiteCacheStore:
+    """
+    SQLite store shared across worker processes. Queries run in a thread
+    so the event loop is not blocked on disk I/O.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 100000,
+        ttl_seconds: float = 86400,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS model_cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " stored_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS model_cache_accessed"
+            " ON model_cache (accessed_at)"
+        )
+
+    def _get(self, key: str) -> Tuple[Optional[str], int]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, stored_at FROM model_cache WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None, 0
+            value, stored_at = row
+            if now - stored_at > self.ttl_seconds:
+                self._conn.execute(
+                    "DELETE FROM model_cache WHERE key = ?", (key,)
+                )
+                return None, 1
+            self._conn.execute(
+                "UPDATE model_cache SET accessed_at = ? WHERE key = ?",
+                (now, key),
+            )
+            return value, 0
+
+    def _set(self, key: str, value: str) -> int:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO model_cache VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM model_cache"
+            ).fetchone()
+            excess = count - self.max_entries
+            if excess <= 0:
+                return 0
+            self._conn.execute(
+                "DELETE FROM model_cache WHERE key IN ("
+                " SELECT key FROM model_cache"
+                " ORDER BY accessed_at LIMIT ?)",
+                (excess,),
+            )
+            return excess
+
+    async def get(self, key: str) -> Tuple[Optional[str], int]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: str) -> int:
+        return await asyncio.to_thread(self._set, key, value)
+
+
+class ResponseCache:
+    """
+    Model response cache over a pluggable store, with hit, miss and
+    eviction counters. Stores return (value, evicted) from get and the
+    number of evicted entries from set.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def get(
+        self, key: str
+    ) -> Optional[Union[str, "ChatCompletionMessage"]]:
+        value, evicted = await self.store.get(key)
+        self.evictions += evicted
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return deserialize_response(value)
+
+    async def set(
+        self, key: str, response: Union[str, "ChatCompletionMessage"]
+    ):
+        self.evictions += await self.store.set(
+            key, serialize_response(response)
+        )
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "backend": type(self.store).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+_response_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    Get the process-wide response cache, building its store from the
+    model_cache section of default_config.yaml on first use.
+
+    Returns:
+        ResponseCache: The shared response cache.
+    """
+    global _response_cache
+    if _response_cache is None:
+        backend = _cache_config.get("backend", "memory")
+        if backend == "memory":
+            store = LRUCacheStore(
+                max_entries=_cache_config.get("max_entries", 1024),
+                ttl_seconds=_cache_config.get("ttl_seconds", 3600),
+            )
+        elif backend == "sqlite":
+            store = SQLiteCacheStore(
+                path=_cache_config.get(
+                    "sqlite_path", ".cache/model_cache.sqlite"
+                ),
+                max_entries=_cache_config.get("max_entries", 100000),
+                ttl_seconds=_cache_config.get("ttl_seconds", 86400),
+            )
+        else:
+            raise ValueError(
+                f"Unknown model cache backend: {backend}. "
+                "Supported backends are 'memory' and 'sqlite'."
+            )
+        _response_cache = ResponseCache(store)
+    return _response_cache
+
+
+def is_cacheable(model_config: dict, sampling_params: dict) -> bool:
+    """
+    Caching is opt-in per agent (`cache: true`) and only applies to
+    deterministic sampling, i.e. temperature 0.
+
+    Args:
+        model_config (dict): Resolved model configuration.
+        sampling_params (dict): Sampling and length arguments.
+
+    Returns:
+        bool: Whether responses for this call may be cached.
+    """
+    return bool(model_config.get("cache")) and (
+        sampling_params.get("temperature") == 0
+    )
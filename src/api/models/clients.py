@@ -0,0 +1,161 @@
+"""
+Long-lived async provider clients sharing one pooled httpx transport.
+
+Clients are cached per event loop: httpx connections are bound to the
+loop that opened them, so the FastAPI server reuses a single pool for
+its lifetime while blocking callers (see call_model_sync) get a fresh
+pool per asyncio.run().
+
+httpx, the openai SDK and the .env file are loaded with the first
+client rather than at import, which keeps worker startup fast.
+
+JSON request bodies are encoded with encode_request_body, which reuses
+the JSON cached on history messages and tool schemas.
+"""
+
+import asyncio
+import functools
+import importlib.util
+import os
+import weakref
+from typing import TYPE_CHECKING, Dict, Union
+
+from api.config_loader import load_default_config
+from api.models.prompt import encode_request_body
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncAzureOpenAI, AsyncOpenAI
+
+_http_config = load_default_config().get("http_client", {})
+
+# event loop -> {"http": httpx.AsyncClient, "<provider>": client}
+_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+@functools.lru_cache(maxsize=None)
+def http_client_class() -> type:
+    """
+    The httpx.AsyncClient subclass provider clients send through. It
+    encodes JSON bodies with encode_request_body instead of json.dumps,
+    so a request carrying a long history is not serialized in full.
+
+    Returns:
+        type: A subclass of httpx.AsyncClient.
+    """
+    import httpx
+
+    class RequestBodyClient(httpx.AsyncClient):
+        def build_request(self, method, url, *, json=None, **kwargs):
+            if (
+                isinstance(json, dict)
+                and kwargs.get("content") is None
+                and not kwargs.get("data")
+                and not kwargs.get("files")
+            ):
+                headers = httpx.Headers(kwargs.pop("headers", None))
+                headers.setdefault("Content-Type", "application/json")
+                kwargs["content"] = encode_request_body(json)
+                kwargs["headers"] = headers
+                json = None
+            return super().build_request(
+                method, url, json=json, **kwargs
+            )
+
+    return RequestBodyClient
+
+
+def _create_http_client() -> "httpx.AsyncClient":
+    """
+    Build the shared httpx client with keep-alive and connection limits
+    from the `http_client` section of default_config.yaml.
+
+    Returns:
+        httpx.AsyncClient: The pooled HTTP client.
+    """
+    import httpx
+
+    limits = httpx.Limits(
+        max_connections=_http_config.get("max_connections", 200),
+        max_keepalive_connections=_http_config.get(
+            "max_keepalive_connections", 50
+        ),
+        keepalive_expiry=_http_config.get("keepalive_expiry", 30),
+    )
+    timeout = httpx.Timeout(
+        _http_config.get("timeout", 600),
+        connect=_http_config.get("connect_timeout", 10),
+    )
+    # HTTP/2 needs the optional `h2` package
+    http2 = _http_config.get("http2", True) and _http2_available()
+    return http_client_class()(
+        limits=limits, timeout=timeout, http2=http2
+    )
+
+
+def _create_provider_client(
+    provider: str, http_client: "httpx.AsyncClient"
+) -> Union["AsyncAzureOpenAI", "AsyncOpenAI"]:
+    from dotenv import load_dotenv
+    from openai import AsyncAzureOpenAI, AsyncOpenAI
+
+    # Endpoints and credentials may come from a .env file
+    load_dotenv()
+    if provider == "aoai":
+        return AsyncAzureOpenAI(
+            azure_endpoint=os.getenv("AOAI_ENDPOINT"),
+            api_key=os.getenv("AOAI_KEY"),
+            api_version=os.getenv("AOAI_VERSION"),
+            http_client=http_client,
+            # Retries are handled by api.models.resilience
+            max_retries=0,
+        )
+    elif provider == "openai":
+        return AsyncOpenAI(
+            api_key=os.getenv("OPENAI_KEY"),
+            base_url=os.getenv("OPENAI_BASE_URL"),
+            http_client=http_client,
+            max_retries=0,
+        )
+    else:
+        raise ValueError(
+            f"No client available for model provider: {provider}"
+        )
+
+
+def get_client(
+    provider: str,
+) -> Union["AsyncAzureOpenAI", "AsyncOpenAI"]:
+    """
+    Get the long-lived async client for a provider, creating it (and
+    the shared connection pool) on first use in the running loop.
+
+    Args:
+        provider (str): Model provider, "aoai" or "openai".
+
+    Returns:
+        Union[AsyncAzureOpenAI, AsyncOpenAI]: The provider client.
+    """
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = _pools[loop] = {"http": _create_http_client()}
+    client = pool.get(provider)
+    if client is None:
+        client = pool[provider] = _create_provider_client(
+            provider, pool["http"]
+        )
+    return client
+
+
+async def close_clients():
+    """Close the connection pool owned by the running event loop."""
+    pool = _pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool["http"].aclose()
@@ -0,0 +1,49 @@
+"""
+Text embeddings from the model providers, for vector retrieval.
+
+The embedding model is configured per use, e.g. the `embedding` entry
+of the `search` section of default_config.yaml:
+{"provider": "openai", "model": "text-embedding-3-small"}.
+"""
+
+from typing import Dict, List
+
+from api import metrics, trace
+from api.models.clients import get_client
+
+# Inputs per embeddings request
+BATCH_SIZE = 256
+
+
+async def embed_texts(
+    texts: List[str], embedding: Dict
+) -> List[List[float]]:
+    """
+    Embed texts with the configured provider and model.
+
+    Args:
+        texts (List[str]): Texts to embed.
+        embedding (Dict): {"provider", "model"} of the embedding model.
+
+    Returns:
+        List[List[float]]: One vector per text, in order.
+    """
+    client = get_client(embedding["provider"])
+    vectors = []
+    with trace.span(
+        "model.embed",
+        provider=embedding["provider"],
+        model=embedding["model"],
+        texts=len(texts),
+    ):
+        for start in range(0, len(texts), BATCH_SIZE):
+            try:
+                response = await client.embeddings.create(
+                    model=embedding["model"],
+                    input=texts[start : start + BATCH_SIZE],
+                )
+            except Exception as e:
+                metrics.ERRORS.labels("embed", type(e).__name__).inc()
+                raise
+            vectors.extend(item.embedding for item in response.data)
+    return vectors
@@ -0,0 +1,313 @@
+"""
+Scriptable fake model provider for offline benchmarks.
+
+register_fake_model() gives a model name a script of responses; calls
+with {"provider": "fake", "model": <name>} are then answered from it
+after a sampled latency, with no network access. A run gets the script
+entry for its step (the number of assistant messages in its history),
+so concurrent runs each replay the script from the start; runs that
+go past its end get the last entry again.
+
+Script entries are a text response (str), {"tool_calls": [{"name",
+"arguments"}], "content"} or a recorded chat completion (a dict with
+"choices", e.g. from ChatCompletion.model_dump()).
+"""
+
+import asyncio
+import json
+import math
+import random
+from typing import (
+    TYPE_CHECKING,
+    AsyncIterator,
+    Dict,
+    List,
+    Optional,
+    Union,
+)
+
+if TYPE_CHECKING:
+    from openai.types.chat import ChatCompletion, ChatCompletionChunk
+    from openai.types.completion_usage import CompletionUsage
+
+FAKE_PROVIDER = "fake"
+
+# Standard normal quantile of 0.99
+_Z99 = 2.326
+
+
+class Latency:
+    """
+    Lognormal latency given by its median and 99th percentile; fixed
+    when p99 is omitted or equal to p50.
+
+    Args:
+        p50 (float): Median seconds.
+        p99 (Optional[float]): 99th percentile seconds.
+        seed (Optional[int]): Seed of the sampler.
+    """
+
+    def __init__(
+        self,
+        p50: float = 0.0,
+        p99: Optional[float] = None,
+        seed: Optional[int] = None,
+    ):
+        self.p50 = p50
+        self.p99 = p50 if p99 is None else p99
+        self._random = random.Random(seed)
+        self._sigma = (
+            math.log(self.p99 / p50) / _Z99
+            if p50 > 0 and self.p99 > p50
+            else 0.0
+        )
+
+    @classmethod
+    def parse(
+        cls, spec: Union[None, float, dict, "Latency"]
+    ) -> "Latency":
+        """A Latency from seconds, {"p50", "p99", "seed"} or None."""
+        if isinstance(spec, Latency):
+            return spec
+        if spec is None:
+            return cls()
+        if isinstance(spec, dict):
+            return cls(**spec)
+        return cls(float(spec))
+
+    def sample(self) -> float:
+        if not self._sigma:
+            return self.p50
+        return self._random.lognormvariate(
+            math.log(self.p50), self._sigma
+        )
+
+
+class FakeModel:
+    """
+    A registered script with its latency and call counters.
+
+    Args:
+        name (str): Model name.
+        responses (List): Script entries, see the module docstring.
+        latency (Latency): Latency of each call.
+        stream_chunks (int): Content chunks of a streamed text answer.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        responses: List,
+        latency: Latency,
+        stream_chunks: int = 8,
+    ):
+        if not responses:
+            raise ValueError(f"Fake model '{name}' needs a response")
+        self.name = name
+        self.completions = [
+            _completion(name, step, entry)
+            for step, entry in enumerate(responses)
+        ]
+        self.latency = latency
+        self.stream_chunks = stream_chunks
+        self.calls = 0
+        self.latency_seconds = 0.0
+
+    def completion_for(self, messages: list) -> "ChatCompletion":
+        step = sum(
+            1
+            for message in messages
+            if (
+                message.get("role")
+                if isinstance(message, dict)
+                else getattr(message, "role", None)
+            )
+            == "assistant"
+        )
+        return self.completions[min(step, len(self.completions) - 1)]
+
+
+_models: Dict[str, FakeModel] = {}
+
+
+def _completion(model: str, step: int, entry) -> "ChatCompletion":
+    from openai.types.chat import ChatCompletion
+
+    if isinstance(entry, dict) and "choices" in entry:
+        return ChatCompletion.model_validate(entry)
+    if isinstance(entry, str):
+        message = {"role": "assistant", "content": entry}
+    else:
+        message = {
+            "role": "assistant",
+            "content": entry.get("content"),
+            "tool_calls": [
+                {
+                    "id": f"call_{step}_{index}",
+                    "type": "function",
+                    "function": {
+                        "name": call["name"],
+                        "arguments": (
+                            call["arguments"]
+                            if isinstance(call["arguments"], str)
+                            else json.dumps(call["arguments"])
+                        ),
+                    },
+                }
+                for index, call in enumerate(entry["tool_calls"])
+            ],
+        }
+    return ChatCompletion.model_validate(
+        {
+            "id": f"chatcmpl-fake-{step}",
+            "object": "chat.completion",
+            "created": 0,
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": (
+                        "tool_calls"
+                        if message.get("tool_calls")
+                        else "stop"
+                    ),
+                    "message": message,
+                }
+            ],
+        }
+    )
+
+
+def register_fake_model(
+    name: str,
+    responses: List,
+    latency: Union[None, float, dict, Latency] = None,
+    stream_chunks: int = 8,
+) -> FakeModel:
+    """
+    Register (or replace) the script of a fake model.
+
+    Args:
+        name (str): Model name to call it by.
+        responses (List): Script entries, see the module docstring.
+        latency (Union[None, float, dict, Latency]): Seconds per call,
+            or {"p50", "p99", "seed"} for a lognormal distribution.
+        stream_chunks (int): Content chunks of a streamed text answer.
+
+    Returns:
+        FakeModel: The registered model, whose counters can be read.
+    """
+    model = FakeModel(
+        name, responses, Latency.parse(latency), stream_chunks
+    )
+    _models[name] = model
+    return model
+
+
+def fake_models() -> List[str]:
+    return list(_models)
+
+
+def _usage(
+    messages: list, completion: "ChatCompletion"
+) -> "CompletionUsage":
+    from openai.types.completion_usage import CompletionUsage
+
+    # About four characters per token, enough to exercise usage metrics
+    prompt_chars = sum(
+        len(str(message.get("content") or ""))
+        for message in messages
+        if isinstance(message, dict)
+    )
+    message = completion.choices[0].message
+    completion_chars = len(message.content or "") + sum(
+        len(call.function.arguments)
+        for call in message.tool_calls or []
+    )
+    prompt_tokens = prompt_chars // 4 + 1
+    completion_tokens = completion_chars // 4 + 1
+    return CompletionUsage(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+    )
+
+
+async def call_fake(
+    messages: list, model: str, stream: bool = False
+) -> Union["ChatCompletion", AsyncIterator["ChatCompletionChunk"]]:
+    """
+    Answer a call from the script of a fake model.
+
+    Returns:
+        Union[ChatCompletion, AsyncIterator[ChatCompletionChunk]]: The
+            completion, or a chunk iterator when streaming.
+
+    Raises:
+        ValueError: If no script is registered for the model.
+    """
+    fake = _models.get(model)
+    if fake is None:
+        raise ValueError(f"No fake model registered as '{model}'")
+    completion = fake.completion_for(messages)
+    completion = completion.model_copy(
+        update={"usage": _usage(messages, completion)}
+    )
+    seconds = fake.latency.sample()
+    fake.calls += 1
+    fake.latency_seconds += seconds
+    if seconds:
+        await asyncio.sleep(seconds)
+    if stream:
+        return _chunks(completion, fake.stream_chunks)
+    return completion
+
+
+def _chunk(completion: "ChatCompletion", delta: dict, **fields):
+    from openai.types.chat import ChatCompletionChunk
+
+    return ChatCompletionChunk.model_validate(
+        {
+            "id": completion.id,
+            "object": "chat.completion.chunk",
+            "created": completion.created,
+            "model": completion.model,
+            "choices": (
+                [{"index": 0, "delta": delta, "finish_reason": None}]
+                if delta is not None
+                else []
+            ),
+            **fields,
+        }
+    )
+
+
+async def _chunks(
+    completion: "ChatCompletion", stream_chunks: int
+) -> AsyncIterator["ChatCompletionChunk"]:
+    message = completion.choices[0].message
+    content = message.content or ""
+    size = max(1, math.ceil(len(content) / stream_chunks))
+    for start in range(0, len(content), size):
+        delta = {"content": content[start : start + size]}
+        if start == 0:
+            delta["role"] = "assistant"
+        yield _chunk(completion, delta)
+    for index, call in enumerate(message.tool_calls or []):
+        yield _chunk(
+            completion,
+            {
+                "tool_calls": [
+                    {
+                        "index": index,
+                        "id": call.id,
+                        "type": "function",
+                        "function": {
+                            "name": call.function.name,
+                            "arguments": call.function.arguments,
+                        },
+                    }
+                ]
+            },
+        )
+    yield _chunk(completion, None, usage=completion.usage.model_dump())
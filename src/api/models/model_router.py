@@ -1,33 +1,74 @@
-from typing import Union
-import os
-from openai import AzureOpenAI, OpenAI
-from dotenv import load_dotenv
-
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Optional, Union
+import asyncio
+import sys
+import time
+
+from api import metrics, trace
+from api.cassette import (
+    MODEL,
+    RECORD,
+    current_cassette,
+    describe_model_request,
+)
 from api.config_loader import load_default_config
-
-load_dotenv()
-
-# Endpoints and credntials
-## AOAI
-AOAI_ENDPOINT = os.getenv("AOAI_ENDPOINT")
-AOAI_KEY = os.getenv("AOAI_KEY")
-AOAI_VERSION = os.getenv("AOAI_VERSION")
-## OpenAI
-OPENAI_KEY = os.getenv("OPENAI_KEY")
+from api.models.clients import get_client, close_clients
+from api.models.fake_provider import (
+    FAKE_PROVIDER,
+    call_fake,
+    fake_models,
+)
+from api.models.streaming import ModelStream
+from api.scheduler import get_model_limiter
+from api.models.resilience import (
+    estimate_request_tokens,
+    get_alternate,
+    get_rate_limiter,
+    hedge_delay,
+    hedged_call,
+    is_hedging_enabled,
+    retry_call,
+)
+from api.models.routing import (
+    get_deployment_health,
+    is_deployment_error,
+    is_routing_enabled,
+    retries_before_fallback,
+    route,
+)
+from api.models.cache import (
+    get_response_cache,
+    is_cacheable,
+    make_cache_key,
+)
+
+if TYPE_CHECKING:
+    from openai import AsyncAzureOpenAI, AsyncOpenAI, AsyncStream
+    from openai.types.chat import ChatCompletion
+
+# Endpoints and credentials (AOAI_ENDPOINT, AOAI_KEY, AOAI_VERSION,
+# OPENAI_KEY, OPENAI_BASE_URL, also from .env) are read by
+# api.models.clients when it creates the first client
 
 # load default configuration
 # _default_config = load_default_config()
 _default_model_config = load_default_config().get("models", {})
 _supported_providers_models = _default_model_config.get("supported", {})
 
+# Token usage of the call_model call being served
+_call_usage: ContextVar[Optional[dict]] = ContextVar(
+    "call_usage", default=None
+)
+
 
 # Model call dispatcher
-def call_model(
+async def call_model(
     messages: list,
     model_config: dict = {},
     agent_id: str = "default",
     tools: list = None,
-) -> Union[str, object]:
+    stream: bool = False,
+) -> Union[str, object, ModelStream]:
     """
     Call the model with the provided messages and configuration.
 
@@ -37,38 +78,429 @@ def call_model(
             E.g. {"provider": "aoai", "model": "gpt-4o"}
         agent_id (str): Identifier for the agent, default is "default".
         tools (list, optional): List of tools available to the model.
+        stream (bool): Stream the response token by token.
+
+    Responses are served from the model cache when the agent has
+    `cache: true` and deterministic sampling (temperature 0).
 
     Returns:
-        Union[str, object]: The response from the model. Returns str for
-            regular content, or message object when tool calls are made.
+        Union[str, object, ModelStream]: The response from the model.
+            Returns str for regular content, or message object when tool
+            calls are made. With stream=True, returns a ModelStream that
+            yields text deltas and then holds the same value in
+            `.result`.
     """
-    model_config = _get_model_config(model_config, agent_id)
+    model_config = get_model_config(model_config, agent_id)
     model_provider = model_config.get("provider", "")
     model = model_config.get("model", "")
 
-    if model_provider not in _supported_providers_models:
+    supported = _supported_providers_models
+    if model_provider == FAKE_PROVIDER:
+        # Offline benchmarks register their scripted models at runtime
+        supported = {FAKE_PROVIDER: fake_models()}
+    if model_provider not in supported:
         raise ValueError(
             f"Model provider '{model_provider}' is not supported. "
             f"Supported providers are: {_supported_providers_models.keys()}"
         )
-    if model not in _supported_providers_models.get(model_provider, []):
+    if model not in supported.get(model_provider, []):
         raise ValueError(
             f"Model '{model}' is not supported for provider "
             f"'{model_provider}'. Supported models are: "
-            f"{_supported_providers_models.get(model_provider, [])}"
+            f"{supported.get(model_provider, [])}"
+        )
+
+    span = trace.start_span(
+        "model.call",
+        agent_id=agent_id,
+        provider=model_provider,
+        model=model,
+        stream=stream,
+        messages=len(messages),
+        tools=len(tools or []),
+    )
+    # Filled with token usage by call_aoai / call_openai
+    usage = {}
+    usage_token = _call_usage.set(usage)
+    start = time.perf_counter()
+    try:
+        with trace.use_span(span):
+            response = await _get_response(
+                model_provider,
+                model,
+                messages,
+                tools,
+                model_config,
+                stream,
+            )
+    except BaseException as e:
+        if not isinstance(e, asyncio.CancelledError):
+            metrics.ERRORS.labels("model", type(e).__name__).inc()
+        span.set_error(e)
+        span.end()
+        raise
+    finally:
+        _call_usage.reset(usage_token)
+
+    labels = (agent_id, model_provider, model)
+    if not stream:
+        _record_call_metrics(labels, time.perf_counter() - start, usage)
+        span.set(response_chars=len(_response_text(response)))
+        span.end()
+        return response
+
+    # A stream's span and latency cover reading it to the end
+    release = response.on_close
+
+    def close_stream():
+        if release is not None:
+            release()
+        if response.usage is not None:
+            usage.update(usage_tokens(response.usage))
+            span.set(**usage)
+        _record_call_metrics(labels, time.perf_counter() - start, usage)
+        span.end()
+
+    response.on_close = close_stream
+    return response
+
+
+def _record_call_metrics(labels: tuple, seconds: float, usage: dict):
+    metrics.MODEL_CALL_SECONDS.labels(*labels).observe(seconds)
+    if "prompt_tokens" in usage:
+        metrics.MODEL_PROMPT_TOKENS.labels(*labels).observe(
+            usage["prompt_tokens"]
+        )
+        metrics.MODEL_COMPLETION_TOKENS.labels(*labels).observe(
+            usage["completion_tokens"]
+        )
+        metrics.MODEL_CACHED_TOKENS.labels(*labels).observe(
+            usage["cached_tokens"]
+        )
+
+
+async def _get_response(
+    model_provider: str,
+    model: str,
+    messages: list,
+    tools: list,
+    model_config: dict,
+    stream: bool,
+) -> Union[str, object, ModelStream]:
+    """Serve a call from the model cache or the provider"""
+    sampling_params = _get_sampling_params(model, model_config)
+
+    cassette = current_cassette()
+    request_key = None
+    if cassette is not None:
+        request_key = make_cache_key(
+            model_provider, model, messages, tools, sampling_params
+        )
+        replayed = cassette.replay(
+            MODEL, request_key, describe_model_request(messages)
+        )
+        trace.current_span().set(cassette=cassette.mode)
+        if replayed is not None:
+            trace.current_span().set(replayed=True)
+            if stream:
+                return ModelStream.from_result(replayed)
+            return replayed
+
+    cache_key = None
+    if is_cacheable(model_config, sampling_params):
+        cache = get_response_cache()
+        cache_key = request_key or make_cache_key(
+            model_provider, model, messages, tools, sampling_params
+        )
+        cached = await cache.get(cache_key)
+        trace.current_span().set(cache_hit=cached is not None)
+        metrics.CACHE_REQUESTS.labels(
+            "model", "miss" if cached is None else "hit"
+        ).inc()
+        if cached is not None:
+            response = (
+                ModelStream.from_result(cached) if stream else cached
+            )
+            return _record(cassette, request_key, response)
+
+    response = await _call_with_fallback(
+        model_provider, model, messages, tools, model_config, stream
+    )
+
+    if cache_key is not None:
+        if stream:
+            response.on_complete = lambda result: cache.set(
+                cache_key, result
+            )
+        else:
+            await cache.set(cache_key, response)
+    return _record(cassette, request_key, response)
+
+
+def _record(cassette, request_key: Optional[str], response):
+    """Capture a response on a recording cassette."""
+    if cassette is None or cassette.mode != RECORD:
+        return response
+    if not isinstance(response, ModelStream):
+        cassette.record(MODEL, request_key, response)
+    elif response.result is not None:
+        cassette.record(MODEL, request_key, response.result)
+    else:
+        on_complete = response.on_complete
+
+        async def record_result(result):
+            cassette.record(MODEL, request_key, result)
+            if on_complete is not None:
+                await on_complete(result)
+
+        response.on_complete = record_result
+    return response
+
+
+def _response_text(response) -> str:
+    if isinstance(response, str):
+        return response
+    return getattr(response, "content", None) or ""
+
+
+async def _call_with_fallback(
+    model_provider: str,
+    model: str,
+    messages: list,
+    tools: list,
+    model_config: dict,
+    stream: bool,
+) -> Union[str, object, ModelStream]:
+    """
+    Call the deployments of the model in routing order, falling back to
+    the next one when a deployment fails. Without routing only the
+    configured deployment is called.
+    """
+    if is_routing_enabled(model_config):
+        deployments = route(
+            model_provider, model, _supported_providers_models, stream
+        )
+        max_retries = retries_before_fallback()
+    else:
+        deployments = [(model_provider, model)]
+        max_retries = None
+
+    span = trace.current_span()
+    for index, deployment in enumerate(deployments):
+        last = index == len(deployments) - 1
+        try:
+            if stream:
+                response = await _call_deployment(
+                    *deployment,
+                    messages,
+                    tools,
+                    model_config,
+                    stream,
+                    max_retries=None if last else max_retries,
+                )
+            else:
+                response = await _call_with_hedging(
+                    deployment,
+                    None if last else deployments[index + 1],
+                    messages,
+                    tools,
+                    model_config,
+                    max_retries=None if last else max_retries,
+                )
+        except Exception as e:
+            if last or not is_deployment_error(e):
+                raise
+            span.event(
+                "fallback",
+                deployment="/".join(deployment),
+                to="/".join(deployments[index + 1]),
+                error=type(e).__name__,
+            )
+            continue
+        if len(deployments) > 1:
+            span.set(served_by="/".join(deployment))
+        return response
+
+
+async def _call_with_hedging(
+    deployment: tuple,
+    alternate: Optional[tuple],
+    messages: list,
+    tools: list,
+    model_config: dict,
+    max_retries: Optional[int] = None,
+) -> Union[str, object]:
+    """
+    Call a deployment, hedging to an alternate one when the call is
+    slower than the configured latency percentile and hedging is
+    enabled. The alternate is the next deployment in routing order, or
+    else one from the supported table.
+    """
+
+    async def primary():
+        return await _call_deployment(
+            *deployment,
+            messages,
+            tools,
+            model_config,
+            max_retries=max_retries,
         )
 
+    if is_hedging_enabled(model_config):
+        delay = hedge_delay(*deployment)
+        if alternate is None:
+            alternate = get_alternate(
+                *deployment, _supported_providers_models
+            )
+        if delay is not None and alternate is not None:
+
+            async def hedge():
+                return await _call_deployment(
+                    *alternate, messages, tools, model_config
+                )
+
+            return await hedged_call(primary, hedge, delay)
+    return await primary()
+
+
+def _current_batch(provider: str):
+    # Batches only exist inside batch_api_scope, so until batch_api is
+    # imported there are none, and the SDK it needs is not loaded
+    batch_api = sys.modules.get("api.models.batch_api")
+    if batch_api is None:
+        return None
+    return batch_api.current_batch(provider)
+
+
+async def _call_deployment(
+    model_provider: str,
+    model: str,
+    messages: list,
+    tools: list,
+    model_config: dict,
+    stream: bool = False,
+    max_retries: Optional[int] = None,
+) -> Union[str, object, ModelStream]:
+    """
+    Call one provider deployment within its concurrency slot and rate
+    limits, retrying transient errors with backoff. Every attempt
+    updates the deployment's health profile.
+    """
+    sampling_params = _get_sampling_params(model, model_config)
+    rate_limiter = get_rate_limiter(model_provider, model)
+    request_tokens = estimate_request_tokens(
+        messages, tools, sampling_params
+    )
+    health = get_deployment_health(model_provider, model)
+
+    batch = None if stream else _current_batch(model_provider)
+    if batch is not None:
+        # Batched calls wait hours rather than seconds, so they skip
+        # the concurrency slots, rate limits and latency profile of
+        # interactive calls
+        body = build_request_body(
+            model, messages, tools, False, sampling_params
+        )
+
+        async def batched():
+            return _completion_output(await batch.submit(body))
+
+        return await retry_call(batched, max_retries)
+
+    async def attempt():
+        await rate_limiter.acquire(request_tokens)
+        start = time.monotonic()
+        try:
+            response = await _dispatch(
+                model_provider,
+                messages,
+                model,
+                tools,
+                stream,
+                sampling_params,
+            )
+        except Exception as e:
+            if is_deployment_error(e):
+                health.record_failure(e)
+            raise
+        health.record_success(time.monotonic() - start, stream)
+        return response
+
+    # Cap in-flight calls per provider and model; a stream holds its
+    # slot until it has been read to the end
+    limiter = get_model_limiter(model_provider, model)
+    if stream:
+        await limiter.acquire()
+        try:
+            response = await retry_call(attempt, max_retries)
+        except BaseException:
+            limiter.release()
+            raise
+        response.on_close = limiter.release
+        return response
+    async with limiter.slot():
+        return await retry_call(attempt, max_retries)
+
+
+async def _dispatch(
+    model_provider: str,
+    messages: list,
+    model: str,
+    tools: list,
+    stream: bool,
+    sampling_params: dict,
+) -> Union[str, object, ModelStream]:
     if model_provider == "aoai":
-        return call_aoai(messages, model, tools)
+        return await call_aoai(
+            messages, model, tools, stream, sampling_params
+        )
     elif model_provider == "openai":
-        return call_openai(messages, model, tools)
+        return await call_openai(
+            messages, model, tools, stream, sampling_params
+        )
+    elif model_provider == FAKE_PROVIDER:
+        response = await call_fake(messages, model, stream)
+        if stream:
+            return ModelStream(response)
+        return _completion_output(response)
     else:
         raise ValueError(
             f"Handler not implemented for model provider: {model_provider}"
         )
 
 
-def _get_model_config(
+def call_model_sync(
+    messages: list,
+    model_config: dict = {},
+    agent_id: str = "default",
+    tools: list = None,
+) -> Union[str, object]:
+    """
+    Blocking shim around call_model for CLI scripts and tests. Must not
+    be called from inside a running event loop.
+
+    Args:
+        messages (list): List of messages to send to the model.
+        model_config (dict): Configuration dictionary for the model call.
+        agent_id (str): Identifier for the agent, default is "default".
+        tools (list, optional): List of tools available to the model.
+
+    Returns:
+        Union[str, object]: The response from the model, as call_model.
+    """
+
+    async def _call():
+        try:
+            return await call_model(
+                messages, model_config, agent_id, tools
+            )
+        finally:
+            await close_clients()
+
+    return asyncio.run(_call())
+
+
+def get_model_config(
     model_config: dict, agent_id: str = "default"
 ) -> dict:
     """
@@ -99,9 +531,119 @@ def _is_oai_nextgen_model(model: str) -> bool:
     return model.startswith("o")
 
 
-def call_aoai(
-    messages: list, model: str, tools: list = None
-) -> Union[str, object]:
+def _get_sampling_params(model: str, model_config: dict) -> dict:
+    """
+    Build the sampling and length arguments for a completion request.
+    temperature, top_p and seed can be set per agent in
+    default_config.yaml or per request.
+
+    Args:
+        model (str): The model name.
+        model_config (dict): Resolved model configuration.
+
+    Returns:
+        dict: Keyword arguments for chat.completions.create.
+    """
+    params = {
+        "temperature": model_config.get("temperature", 1.0),
+        "top_p": model_config.get("top_p", 1.0),
+    }
+    if model_config.get("seed") is not None:
+        params["seed"] = model_config["seed"]
+    if _is_oai_nextgen_model(model):
+        params["max_completion_tokens"] = 10000
+    else:
+        params["max_tokens"] = 4096
+    return params
+
+
+def build_request_body(
+    model: str,
+    messages: list,
+    tools: Optional[list],
+    stream: bool,
+    sampling_params: dict,
+) -> dict:
+    """
+    Build the JSON body of a chat completion request.
+
+    The body references the caller's message dicts and the frozen tool
+    schemas instead of copying them, so building it costs the same at
+    every step however long the history is. Messages that are still
+    provider objects are converted to dicts. The provider clients
+    encode it with encode_request_body (see api.models.clients), which
+    reuses the JSON kept on Memory's messages and the tool schemas, so
+    the history is not serialized again either.
+
+    Args:
+        model (str): The model name.
+        messages (list): Messages to send.
+        tools (Optional[list]): Tool schemas, ideally the ToolSchemas
+            from get_tools_openai_format.
+        stream (bool): Request a streamed response with usage.
+        sampling_params (dict): Sampling and length arguments.
+
+    Returns:
+        dict: The request body.
+    """
+    if not all(isinstance(message, dict) for message in messages):
+        messages = [
+            (
+                message
+                if isinstance(message, dict)
+                else message.model_dump(exclude_none=True)
+            )
+            for message in messages
+        ]
+    body = {"model": model, "messages": messages, **sampling_params}
+    if tools:
+        body["tools"] = tools
+        body["tool_choice"] = "auto"
+    if stream:
+        body["stream"] = True
+        body["stream_options"] = {"include_usage": True}
+    return body
+
+
+async def create_completion(
+    client: Union["AsyncAzureOpenAI", "AsyncOpenAI"], body: dict
+) -> Union["ChatCompletion", "AsyncStream"]:
+    """
+    Send a body from build_request_body to /chat/completions.
+
+    This goes through the client's generic post() rather than
+    chat.completions.create(), which walks and copies every message
+    and tool schema to validate it on every call; that cost grows with
+    the history. Azure clients still route the request to the
+    deployment named by the body's model.
+
+    Args:
+        client (Union[AsyncAzureOpenAI, AsyncOpenAI]): Provider client.
+        body (dict): The request body.
+
+    Returns:
+        Union[ChatCompletion, AsyncStream]: The completion, or a chunk
+            stream if the body asks for one.
+    """
+    from openai import AsyncStream
+    from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+    return await client.post(
+        "/chat/completions",
+        body=body,
+        cast_to=ChatCompletion,
+        stream=body.get("stream", False),
+        stream_cls=AsyncStream[ChatCompletionChunk],
+    )
+
+
+async def call_aoai(
+    messages: list,
+    model: str,
+    tools: list = None,
+    stream: bool = False,
+    sampling_params: dict = None,
+) -> Union[str, object, ModelStream]:
     """
     Call the Azure OpenAI model with the provided messages.
 
@@ -109,48 +651,41 @@ def call_aoai(
         messages (list): List of messages to send to the model.
         model (str): The model name to use for the call.
         tools (list, optional): List of tools available to the model.
+        stream (bool): Return a ModelStream instead of waiting for the
+            full response.
+        sampling_params (dict, optional): Sampling and length arguments
+            from _get_sampling_params.
 
     Returns:
-        Union[str, object]: The response from the Azure OpenAI model.
-            Returns str for regular content, or message object with tool calls.
+        Union[str, object, ModelStream]: The response from the Azure
+            OpenAI model. Returns str for regular content, or message
+            object with tool calls.
     """
-    client = AzureOpenAI(
-        azure_endpoint=AOAI_ENDPOINT,
-        api_key=AOAI_KEY,
-        api_version=AOAI_VERSION,
+    client = get_client("aoai")
+
+    body = build_request_body(
+        model,
+        messages,
+        tools,
+        stream,
+        sampling_params or _get_sampling_params(model, {}),
     )
-
-    kwargs = {
-        "model": model,
-        "messages": messages,
-        "temperature": 1.0,
-        "top_p": 1.0,
-    }
-
-    print(
-        f"\n- Model Router DEBUG: Passing messages to AOAI model: {messages[-1]}"
+    trace.debug(
+        "Calling AOAI model",
+        last_message=messages[-1],
+        tools=[tool["function"]["name"] for tool in tools or []],
     )
 
-    if tools:
-        kwargs["tools"] = tools
-        kwargs["tool_choice"] = "auto"
-        print(
-            f"\n- Model Router DEBUG: Passing {len(tools)} tools to AOAI model"
-        )
-        print(
-            f"- Model Router DEBUG: Tools: {[tool['function']['name'] for tool in tools]}"
-        )
-    else:
-        print(
-            f"\n- Model Router DEBUG: No tools provided to AOAI model"
-        )
+    if stream:
+        return ModelStream(await create_completion(client, body))
 
-    if _is_oai_nextgen_model(model):
-        kwargs["max_completion_tokens"] = 10000
-    else:
-        kwargs["max_tokens"] = 4096
+    return _completion_output(await create_completion(client, body))
 
-    response = client.chat.completions.create(**kwargs)
+
+def _completion_output(
+    response: "ChatCompletion",
+) -> Union[str, object]:
+    _record_usage(response.usage)
 
     # Handle tool calls vs regular content
     message = response.choices[0].message
@@ -160,9 +695,37 @@ def call_aoai(
         return message.content
 
 
-def call_openai(
-    messages: list, model: str, tools: list = None
-) -> Union[str, object]:
+def usage_tokens(usage) -> dict:
+    """
+    Prompt, completion and cached prompt tokens of a usage report.
+    Cached tokens are the prompt prefix the provider served from its
+    prompt cache.
+    """
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "cached_tokens": getattr(details, "cached_tokens", None) or 0,
+    }
+
+
+def _record_usage(usage):
+    if usage is None:
+        return
+    tokens = usage_tokens(usage)
+    trace.current_span().set(**tokens)
+    record = _call_usage.get()
+    if record is not None:
+        record.update(tokens)
+
+
+async def call_openai(
+    messages: list,
+    model: str,
+    tools: list = None,
+    stream: bool = False,
+    sampling_params: dict = None,
+) -> Union[str, object, ModelStream]:
     """
     Call the OpenAI model with the provided messages.
 
@@ -170,43 +733,35 @@ def call_openai(
         messages (list): List of messages to send to the model.
         model (str): The model name to use for the call.
         tools (list, optional): List of tools available to the model.
+        stream (bool): Return a ModelStream instead of waiting for the
+            full response.
+        sampling_params (dict, optional): Sampling and length arguments
+            from _get_sampling_params.
 
     Returns:
-        Union[str, object]: The response from the OpenAI model.
-            Returns str for regular content, or message object with tool calls.
+        Union[str, object, ModelStream]: The response from the OpenAI
+            model. Returns str for regular content, or message object
+            with tool calls.
     """
-    client = OpenAI(api_key=OPENAI_KEY)
-
-    kwargs = {
-        "model": model,
-        "messages": messages,
-        "temperature": 1.0,
-        "top_p": 1.0,
-    }
-
-    if tools:
-        kwargs["tools"] = tools
-        kwargs["tool_choice"] = "auto"
-        print(f"DEBUG: Passing {len(tools)} tools to OpenAI model")
-        print(
-            f"DEBUG: Tools: {[tool['function']['name'] for tool in tools]}"
-        )
-    else:
-        print(f"DEBUG: No tools provided to OpenAI model")
-
-    if _is_oai_nextgen_model(model):
-        kwargs["max_completion_tokens"] = 10000
-    else:
-        kwargs["max_tokens"] = 4096
+    client = get_client("openai")
+
+    body = build_request_body(
+        model,
+        messages,
+        tools,
+        stream,
+        sampling_params or _get_sampling_params(model, {}),
+    )
+    trace.debug(
+        "Calling OpenAI model",
+        last_message=messages[-1],
+        tools=[tool["function"]["name"] for tool in tools or []],
+    )
 
-    response = client.chat.completions.create(**kwargs)
+    if stream:
+        return ModelStream(await create_completion(client, body))
 
-    # Handle tool calls vs regular content
-    message = response.choices[0].message
-    if message.tool_calls:
-        return message  # Return the full message with tool calls
-    else:
-        return message.content
+    return _completion_output(await create_completion(client, body))
 
 
 ##############
@@ -0,0 +1,113 @@
+"""
+Benchmark call_model throughput against a local stub server.
+
+Compares the pooled async router with the previous behaviour of
+building a blocking client per call, at 1, 16 and 64 concurrent agents.
+
+Run from src/:
+    python -m api.models.model_router_bench --latency 0.05 --calls 20
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import time
+
+from api.models.stub_server import StubServer
+
+MESSAGES = [
+    {"role": "system", "content": "You are a helpful assistant."},
+    {"role": "user", "content": "What is the capital of Germany?"},
+]
+MODEL_CONFIG = {"provider": "openai", "model": "gpt-4o"}
+
+
+def _serve(port: int, latency: float):
+    server = StubServer(port=port, latency=latency)
+    asyncio.run(server.serve_forever())
+
+
+async def _pooled_agent(calls: int):
+    from api.models.model_router import call_model
+
+    for _ in range(calls):
+        await call_model(MESSAGES, MODEL_CONFIG)
+
+
+async def _per_call_client_agent(calls: int):
+    # Previous behaviour: fresh blocking client on every call, run on
+    # the event loop thread
+    from openai import OpenAI
+
+    for _ in range(calls):
+        client = OpenAI(
+            api_key=os.environ["OPENAI_KEY"],
+            base_url=os.environ["OPENAI_BASE_URL"],
+        )
+        client.chat.completions.create(
+            model="gpt-4o", messages=MESSAGES, max_tokens=4096
+        )
+        client.close()
+
+
+async def _run(agent, concurrency: int, calls: int) -> float:
+    from api.models.clients import close_clients
+
+    start = time.perf_counter()
+    await asyncio.gather(*(agent(calls) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    await close_clients()
+    return concurrency * calls / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Model router benchmark"
+    )
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.05,
+        help="Stub seconds/request",
+    )
+    parser.add_argument(
+        "--calls", type=int, default=20, help="Calls per agent"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, nargs="+", default=[1, 16, 64]
+    )
+    args = parser.parse_args()
+
+    os.environ["OPENAI_KEY"] = "stub"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.port}/v1"
+
+    server = multiprocessing.Process(
+        target=_serve, args=(args.port, args.latency), daemon=True
+    )
+    server.start()
+    time.sleep(0.5)
+
+    try:
+        print(f"stub latency {args.latency * 1000:.0f} ms/request\n")
+        print(
+            f"{'agents':>6} | {'per-call client':>16} | {'pooled async':>13}"
+        )
+        for concurrency in args.concurrency:
+            legacy = asyncio.run(
+                _run(_per_call_client_agent, concurrency, args.calls)
+            )
+            pooled = asyncio.run(
+                _run(_pooled_agent, concurrency, args.calls)
+            )
+            print(
+                f"{concurrency:>6} | {legacy:>12.1f} r/s"
+                f" | {pooled:>9.1f} r/s"
+            )
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
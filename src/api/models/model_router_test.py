@@ -1,5 +1,5 @@
 import argparse
-from api.models.model_router import call_model
+from api.models.model_router import call_model_sync
 
 def main():
     parser = argparse.ArgumentParser(description="Test model router via CLI")
@@ -25,7 +25,7 @@ def main():
 
     try:
         print(f"\n Calling {args.provider or 'default provider aoai'} | {args.model or 'default model gpt-4o'} for Agent single_agent: {args.agent}")
-        respose = call_model(messages, model_config=config, agent_id=args.agent)
+        respose = call_model_sync(messages, model_config=config, agent_id=args.agent)
         print(f"\nModel response: {respose}")
     except Exception as e:
         print(f"\nError: {str(e)}")
@@ -0,0 +1,114 @@
+"""
+Static request prefix shared by every step of an agent.
+
+The system prompt and tool schemas are the same for every call an agent
+makes, so they are built once and frozen. Requests then start with the
+same bytes at every step, which is what provider-side prompt caching
+keys on, and their cache key digest and size estimate are computed
+once instead of on every call.
+
+encode_request_body() encodes a request body from the JSON its parts
+already carry, the frozen tool schemas and the history messages (see
+api.agent.messages.WireMessage), so a step does not serialize the
+whole history again.
+"""
+
+import hashlib
+import json
+from typing import Any, Dict, Iterable
+
+
+class ToolSchemas(tuple):
+    """
+    Frozen tool schemas in OpenAI format, usable wherever the tools list
+    of a request is expected. The schemas are private copies, so later
+    changes to their source do not leak into requests.
+
+    Attributes:
+        json (str): Canonical JSON of the schemas.
+        digest (str): Hex SHA-256 of that JSON, for cache keys.
+    """
+
+    def __new__(cls, tools: Iterable[Dict]):
+        serialized = json.dumps(
+            list(tools),
+            sort_keys=True,
+            separators=(",", ":"),
+            ensure_ascii=False,
+        )
+        schemas = super().__new__(cls, json.loads(serialized))
+        schemas.json = serialized
+        schemas.digest = hashlib.sha256(serialized.encode()).hexdigest()
+        return schemas
+
+
+class PromptPrefix:
+    """
+    System prompt and tool schemas at the start of every request of an
+    agent. Frozen: attributes cannot be reassigned.
+
+    Args:
+        system_prompt (str): The agent's system prompt.
+        tools (Iterable[Dict]): Tool schemas in OpenAI format.
+    """
+
+    __slots__ = ("system_prompt", "tools")
+
+    def __init__(self, system_prompt: str, tools: Iterable[Dict]):
+        object.__setattr__(self, "system_prompt", system_prompt)
+        object.__setattr__(
+            self,
+            "tools",
+            (
+                tools
+                if isinstance(tools, ToolSchemas)
+                else ToolSchemas(tools)
+            ),
+        )
+
+    def __setattr__(self, name, value):
+        raise AttributeError("PromptPrefix is frozen")
+
+
+def _encode(value: Any) -> str:
+    # The encoding httpx uses for JSON bodies
+    return json.dumps(
+        value,
+        ensure_ascii=False,
+        separators=(",", ":"),
+        allow_nan=False,
+    )
+
+
+def encode_request_body(body: Dict) -> bytes:
+    """
+    Encode a JSON request body. Messages with json_parts() and frozen
+    ToolSchemas contribute the JSON they carry; everything else is
+    encoded as httpx would.
+
+    Args:
+        body (Dict): Request body, e.g. from build_request_body.
+
+    Returns:
+        bytes: The UTF-8 JSON of the body.
+    """
+    parts = []
+    for key, value in body.items():
+        parts.append(("," if parts else "{") + _encode(key) + ":")
+        if key == "messages" and isinstance(value, list):
+            parts.append("[")
+            for index, message in enumerate(value):
+                if index:
+                    parts.append(",")
+                json_parts = getattr(message, "json_parts", None)
+                if json_parts is not None:
+                    parts.extend(json_parts())
+                else:
+                    parts.append(_encode(message))
+            parts.append("]")
+        elif isinstance(value, ToolSchemas):
+            parts.append(value.json)
+        else:
+            parts.append(_encode(value))
+    parts.append("}" if parts else "{}")
+    return "".join(parts).encode()
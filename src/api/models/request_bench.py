@@ -0,0 +1,200 @@
+"""
+Benchmark the per-step cost of building and sending a model request as
+an agent's history grows.
+
+Each step appends a tool call and its output to the history, as
+Message records like Memory keeps, and sends the whole history, as the
+single agent does. The clients are built on the pooled client class
+and their transport is an in-process mock that answers immediately, so
+the timings are the client-side cost only: chat.completions.create()
+(which validates and copies every message and tool schema) against
+build_request_body() + create_completion(). Also checks that every
+request starts with the exact bytes of the previous one, which provider
+prompt caching needs.
+
+Run from src/:
+    python -m api.models.request_bench --steps 40 --every 5
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+from openai import AsyncOpenAI
+
+from api.agent.messages import Message, ToolCall
+from api.models.clients import http_client_class
+from api.models.model_router import (
+    build_request_body,
+    create_completion,
+)
+from api.models.prompt import PromptPrefix
+
+SAMPLING_PARAMS = {"temperature": 1.0, "max_tokens": 4096}
+TOOL_OUTPUT = "lorem ipsum dolor sit amet " * 200
+
+COMPLETION = {
+    "id": "chatcmpl-bench",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-4o",
+    "choices": [
+        {
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": "ok"},
+        }
+    ],
+    "usage": {
+        "prompt_tokens": 10,
+        "completion_tokens": 1,
+        "total_tokens": 11,
+    },
+}
+
+
+def _client(bodies: list) -> AsyncOpenAI:
+    def handler(request: httpx.Request) -> httpx.Response:
+        bodies.append(request.content)
+        return httpx.Response(200, json=COMPLETION)
+
+    return AsyncOpenAI(
+        api_key="bench",
+        base_url="http://bench.local/v1",
+        http_client=http_client_class()(
+            transport=httpx.MockTransport(handler)
+        ),
+    )
+
+
+def _prefix() -> PromptPrefix:
+    try:
+        from api.tools import get_tools_openai_format
+
+        tools = get_tools_openai_format()
+    except ImportError:
+        tools = [
+            {
+                "type": "function",
+                "function": {
+                    "name": name,
+                    "description": f"The {name} tool",
+                    "parameters": {
+                        "type": "object",
+                        "properties": {"query": {"type": "string"}},
+                        "required": ["query"],
+                    },
+                },
+            }
+            for name in ("search", "code")
+        ]
+    return PromptPrefix("You are a research assistant. " * 40, tools)
+
+
+def _add_step(messages: list, step: int):
+    tool_call = ToolCall(
+        f"call_{step}", "search", json.dumps({"query": f"q{step}"})
+    )
+    messages.append(
+        Message(
+            "assistant", f"Thought: step {step}", (tool_call,)
+        ).wire()
+    )
+    messages.append(
+        Message("tool", TOOL_OUTPUT, tool_call_id=f"call_{step}").wire()
+    )
+
+
+def _messages_end(body: bytes, messages: list) -> int:
+    # Offset just past the last message, before the closing bracket
+    encoded = json.dumps(
+        messages, ensure_ascii=False, separators=(",", ":")
+    ).encode()[:-1]
+    start = body.index(encoded)
+    return start + len(encoded)
+
+
+async def _time(send, repeats: int) -> float:
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        await send()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1e6
+
+
+async def _run(steps: int, every: int, repeats: int):
+    prefix = _prefix()
+    sdk_bodies, prebuilt_bodies = [], []
+    sdk_client = _client(sdk_bodies)
+    prebuilt_client = _client(prebuilt_bodies)
+    messages = [
+        Message("system", prefix.system_prompt).wire(),
+        Message("user", "What changed in the last year?").wire(),
+    ]
+
+    async def sdk():
+        await sdk_client.chat.completions.create(
+            model="gpt-4o",
+            messages=messages,
+            tools=list(prefix.tools),
+            tool_choice="auto",
+            **SAMPLING_PARAMS,
+        )
+
+    async def prebuilt():
+        body = build_request_body(
+            "gpt-4o", messages, prefix.tools, False, SAMPLING_PARAMS
+        )
+        await create_completion(prebuilt_client, body)
+
+    print(f"tool schemas: {len(prefix.tools.json)} bytes")
+    print(
+        f"{'step':>4} | {'messages':>8} | {'body KB':>7} | "
+        f"{'create() us':>11} | {'prebuilt us':>11} | prefix stable"
+    )
+    previous = None
+    stable = True
+    for step in range(1, steps + 1):
+        _add_step(messages, step)
+        await prebuilt()
+        body = prebuilt_bodies[-1]
+        if previous is not None:
+            end = _messages_end(previous[0], previous[1])
+            stable = stable and body[:end] == previous[0][:end]
+        previous = (body, list(messages))
+        if step % every:
+            continue
+        sdk_us = await _time(sdk, repeats)
+        prebuilt_us = await _time(prebuilt, repeats)
+        assert json.loads(sdk_bodies[-1]) == json.loads(
+            prebuilt_bodies[-1]
+        )
+        print(
+            f"{step:>4} | {len(messages):>8} | {len(body) / 1024:>7.0f} | "
+            f"{sdk_us:>11.0f} | {prebuilt_us:>11.0f} | {stable}"
+        )
+    await sdk_client.close()
+    await prebuilt_client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Request building benchmark"
+    )
+    parser.add_argument("--steps", type=int, default=40)
+    parser.add_argument(
+        "--every", type=int, default=5, help="Report every N steps"
+    )
+    parser.add_argument(
+        "--repeats", type=int, default=20, help="Timed calls per row"
+    )
+    args = parser.parse_args()
+    asyncio.run(_run(args.steps, args.every, args.repeats))
+
+
+if __name__ == "__main__":
+    main()
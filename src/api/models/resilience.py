@@ -0,0 +1,356 @@
+"""
+Resilience for provider calls: client-side rate limiting, retries with
+backoff, and hedged requests.
+
+- RateLimiter: token buckets for requests/min and tokens/min per
+  provider and model (models.rate_limits in default_config.yaml).
+  Tokens are estimated the way providers do, prompt plus max output.
+- retry_call: retries 429, 5xx, timeouts and connection errors with
+  full-jitter exponential backoff, waiting at least the Retry-After the
+  provider asked for.
+- hedged_call: if the primary call is slower than a latency percentile
+  of recent calls, fires the same request at an alternate deployment
+  and returns whichever succeeds first.
+"""
+
+import asyncio
+import email.utils
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from api import trace
+from api.config_loader import load_default_config
+
+_default_config = load_default_config()
+_models_config = _default_config.get("models", {})
+_rate_limits_config = _models_config.get("rate_limits", {})
+_resilience_config = _default_config.get("resilience", {})
+_hedging_config = _resilience_config.get("hedging", {})
+
+
+def _retryable_errors() -> Tuple[type, ...]:
+    # The SDK is imported on the first provider error, not at startup
+    import openai
+
+    return (
+        openai.RateLimitError,
+        openai.InternalServerError,
+        openai.APIConnectionError,
+    )
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at per_minute / 60 per second.
+    Reservations may drive the balance negative; callers then sleep
+    off the debt, which serves them in arrival order without a lock.
+
+    Args:
+        per_minute (float): Bucket capacity and refill per minute.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def reserve(self, amount: float) -> float:
+        """
+        Take amount from the bucket.
+
+        Returns:
+            float: Seconds to wait before the reservation is covered.
+        """
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity,
+            self.tokens + (now - self.updated) * self.rate,
+        )
+        self.updated = now
+        self.tokens -= min(amount, self.capacity)
+        return max(0.0, -self.tokens / self.rate)
+
+
+class RateLimiter:
+    """Requests/min and tokens/min buckets for one deployment."""
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+    ):
+        self.requests = (
+            TokenBucket(requests_per_minute)
+            if requests_per_minute
+            else None
+        )
+        self.tokens = (
+            TokenBucket(tokens_per_minute)
+            if tokens_per_minute
+            else None
+        )
+        self.throttled_seconds = 0.0
+
+    async def acquire(self, tokens: int):
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.reserve(tokens))
+        if wait:
+            self.throttled_seconds += wait
+            trace.current_span().event("throttled", seconds=wait)
+            await asyncio.sleep(wait)
+
+
+_rate_limiters: Dict[str, RateLimiter] = {}
+
+
+def get_rate_limiter(provider: str, model: str) -> RateLimiter:
+    """
+    Get the rate limiter of a deployment from
+    models.rate_limits.<provider>.<model>. Unconfigured deployments get
+    a limiter that never waits.
+
+    Args:
+        provider (str): Model provider.
+        model (str): Model name.
+
+    Returns:
+        RateLimiter: The shared rate limiter.
+    """
+    key = f"{provider}/{model}"
+    limiter = _rate_limiters.get(key)
+    if limiter is None:
+        limits = _rate_limits_config.get(provider, {}).get(model, {})
+        limiter = _rate_limiters[key] = RateLimiter(
+            limits.get("requests_per_minute"),
+            limits.get("tokens_per_minute"),
+        )
+    return limiter
+
+
+def estimate_request_tokens(
+    messages: list, tools: Optional[list], sampling_params: dict
+) -> int:
+    """
+    Estimate the tokens a request counts against tokens/min: prompt
+    characters / 4 plus the requested maximum output.
+    """
+    chars = 0
+    for message in messages:
+        content = (
+            message.get("content")
+            if isinstance(message, dict)
+            else getattr(message, "content", None)
+        )
+        chars += len(content or "")
+    if tools:
+        # Frozen ToolSchemas carry their serialized form
+        chars += len(getattr(tools, "json", None) or str(tools))
+    max_output = sampling_params.get(
+        "max_completion_tokens", sampling_params.get("max_tokens", 0)
+    )
+    return chars // 4 + max_output
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        date = email.utils.parsedate_to_datetime(retry_after)
+        return max(0.0, date.timestamp() - time.time())
+
+
+def backoff_delay(
+    attempt: int, error: Optional[Exception] = None
+) -> float:
+    """
+    Full-jitter exponential backoff, never shorter than the error's
+    Retry-After.
+
+    Args:
+        attempt (int): Zero-based retry number.
+        error (Optional[Exception]): The error being retried.
+
+    Returns:
+        float: Seconds to wait.
+    """
+    base = _resilience_config.get("backoff_base_seconds", 0.5)
+    cap = _resilience_config.get("backoff_max_seconds", 30)
+    delay = random.uniform(0, min(cap, base * 2**attempt))
+    retry_after = _retry_after_seconds(error) if error else None
+    if retry_after is not None:
+        delay = max(delay, retry_after + random.uniform(0, base))
+    return delay
+
+
+async def retry_call(
+    call: Callable[[], Awaitable],
+    max_retries: Optional[int] = None,
+):
+    """
+    Await call(), retrying transient provider errors.
+
+    Args:
+        call (Callable[[], Awaitable]): Makes one attempt.
+        max_retries (Optional[int]): Defaults to resilience.max_retries.
+
+    Returns:
+        The result of the first successful attempt.
+
+    Raises:
+        The last error once retries are exhausted, or any
+        non-retryable error immediately.
+    """
+    if max_retries is None:
+        max_retries = _resilience_config.get("max_retries", 4)
+    attempt = 0
+    while True:
+        try:
+            return await call()
+        except _retryable_errors() as e:
+            if attempt >= max_retries:
+                raise
+            delay = backoff_delay(attempt, e)
+            trace.current_span().event(
+                "retry",
+                attempt=attempt + 1,
+                error=type(e).__name__,
+                delay_seconds=round(delay, 3),
+            )
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+class LatencyTracker:
+    """Rolling window of call latencies of one deployment."""
+
+    def __init__(self, window: int = 200):
+        self.samples: deque = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(fraction * len(ordered)))
+        return ordered[index]
+
+
+_latency_trackers: Dict[str, LatencyTracker] = {}
+
+
+def get_latency_tracker(provider: str, model: str) -> LatencyTracker:
+    key = f"{provider}/{model}"
+    tracker = _latency_trackers.get(key)
+    if tracker is None:
+        tracker = _latency_trackers[key] = LatencyTracker(
+            _hedging_config.get("window", 200)
+        )
+    return tracker
+
+
+def hedge_delay(provider: str, model: str) -> Optional[float]:
+    """
+    Seconds to wait on the primary before hedging, i.e. the configured
+    latency percentile of recent calls, or None while there are too
+    few samples.
+    """
+    tracker = get_latency_tracker(provider, model)
+    if len(tracker.samples) < _hedging_config.get("min_samples", 20):
+        return None
+    return tracker.percentile(_hedging_config.get("percentile", 0.95))
+
+
+def is_hedging_enabled(model_config: dict) -> bool:
+    return bool(
+        model_config.get(
+            "hedging", _hedging_config.get("enabled", False)
+        )
+    )
+
+
+def get_alternate(
+    provider: str, model: str, supported: Dict[str, list]
+) -> Optional[Tuple[str, str]]:
+    """
+    Pick the deployment to hedge to: resilience.hedging.alternates
+    when configured, else the same model on another supported provider.
+
+    Args:
+        provider (str): Primary provider.
+        model (str): Primary model.
+        supported (Dict[str, list]): The models.supported table.
+
+    Returns:
+        Optional[Tuple[str, str]]: (provider, model) or None.
+    """
+    alternate = _hedging_config.get("alternates", {}).get(
+        f"{provider}/{model}"
+    )
+    if alternate:
+        alternate_provider, alternate_model = alternate.split("/", 1)
+        return alternate_provider, alternate_model
+    for other_provider, models in supported.items():
+        if other_provider != provider and model in models:
+            return other_provider, model
+    return None
+
+
+async def hedged_call(
+    primary: Callable[[], Awaitable],
+    alternate: Callable[[], Awaitable],
+    delay: float,
+):
+    """
+    Run primary; if it has not finished after delay seconds, also run
+    alternate and return the first successful result. The loser is
+    cancelled. If both fail, the last error is raised.
+
+    Args:
+        primary (Callable[[], Awaitable]): The normal call.
+        alternate (Callable[[], Awaitable]): The hedge call.
+        delay (float): Seconds before hedging.
+
+    Returns:
+        The result of whichever call succeeded first.
+    """
+    tasks = [asyncio.ensure_future(primary())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return tasks[0].result()
+        trace.current_span().event("hedge", delay_seconds=delay)
+        tasks.append(asyncio.ensure_future(alternate()))
+        pending = set(tasks)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
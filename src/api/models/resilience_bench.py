@@ -0,0 +1,219 @@
+"""
+Benchmark call_model resilience against stub servers with injected
+faults.
+
+- errors: a fraction of calls fail with 429 + Retry-After; compares the
+  success rate with retries disabled and enabled.
+- slow tail: a fraction of calls to the primary provider are slow;
+  compares p50/p99 latency without and with hedging to a second
+  provider.
+- routing: the configured provider is slower than the other one, then
+  down; compares latency and success without and with latency-based
+  routing and fallback.
+
+Run from src/:
+    python -m api.models.resilience_bench --error-rate 0.2 --slow-rate 0.03
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from api.models import resilience, routing
+from api.models.stub_server import StubServer
+
+MESSAGES = [
+    {"role": "system", "content": "You are a helpful assistant."},
+    {"role": "user", "content": "What is the capital of Germany?"},
+]
+
+
+def _percentile(samples: list, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def _drive(
+    model_config: dict, calls: int, concurrency: int
+) -> tuple:
+    from api.models.clients import close_clients
+    from api.models.model_router import call_model
+
+    latencies = []
+    failures = 0
+    queue = list(range(calls))
+
+    async def worker():
+        nonlocal failures
+        while queue:
+            queue.pop()
+            start = time.perf_counter()
+            try:
+                await call_model(MESSAGES, model_config)
+            except Exception:
+                failures += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    await close_clients()
+    return latencies, failures
+
+
+async def _errors(args) -> None:
+    server = StubServer(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        retry_after=args.retry_after,
+        seed=1,
+    )
+    await server.start()
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    model_config = {"provider": "openai", "model": "gpt-4o"}
+
+    print(
+        f"errors: {args.error_rate:.0%} of calls fail with 429, "
+        f"Retry-After {args.retry_after}s"
+    )
+    print(
+        f"{'retries':>7} | {'success':>8} | {'p50 ms':>7} | {'p99 ms':>7}"
+    )
+    for max_retries in (
+        0,
+        resilience._resilience_config["max_retries"],
+    ):
+        resilience._resilience_config["max_retries"] = max_retries
+        latencies, failures = await _drive(
+            model_config, args.calls, args.concurrency
+        )
+        print(
+            f"{max_retries:>7} | "
+            f"{len(latencies) / args.calls:>8.1%} | "
+            f"{_percentile(latencies, 0.5) * 1000:>7.0f} | "
+            f"{_percentile(latencies, 0.99) * 1000:>7.0f}"
+        )
+    await server.stop()
+
+
+async def _slow_tail(args) -> None:
+    primary = StubServer(
+        latency=args.latency,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+        seed=2,
+    )
+    alternate = StubServer(latency=args.latency)
+    await primary.start()
+    await alternate.start()
+    os.environ["OPENAI_BASE_URL"] = primary.base_url
+    os.environ["AOAI_ENDPOINT"] = f"http://127.0.0.1:{alternate.port}"
+    model_config = {"provider": "openai", "model": "gpt-4o"}
+
+    print(
+        f"\nslow tail: {args.slow_rate:.0%} of primary calls take "
+        f"{args.slow_latency}s, alternate is aoai"
+    )
+    print(
+        f"{'hedging':>7} | {'success':>8} | {'p50 ms':>7} | "
+        f"{'p99 ms':>7} | {'hedges':>6}"
+    )
+    for hedging in (False, True):
+        served = alternate.requests_served
+        latencies, _ = await _drive(
+            {**model_config, "hedging": hedging},
+            args.calls,
+            args.concurrency,
+        )
+        print(
+            f"{str(hedging):>7} | "
+            f"{len(latencies) / args.calls:>8.1%} | "
+            f"{_percentile(latencies, 0.5) * 1000:>7.0f} | "
+            f"{_percentile(latencies, 0.99) * 1000:>7.0f} | "
+            f"{alternate.requests_served - served:>6}"
+        )
+    await primary.stop()
+    await alternate.stop()
+
+
+async def _routing(args) -> None:
+    print(
+        f"\nrouting: configured openai takes {args.latency * 4:.2f}s, "
+        f"aoai {args.latency:.2f}s; then openai fails every call with 500"
+    )
+    print(
+        f"{'scenario':>8} | {'routing':>7} | {'success':>8} | "
+        f"{'p50 ms':>7} | {'p99 ms':>7} | {'to aoai':>7}"
+    )
+    model_config = {"provider": "openai", "model": "gpt-4o"}
+    for scenario, primary in (
+        ("slow", StubServer(latency=args.latency * 4)),
+        (
+            "down",
+            StubServer(
+                latency=args.latency, error_rate=1.0, error_status=500
+            ),
+        ),
+    ):
+        alternate = StubServer(latency=args.latency)
+        await primary.start()
+        await alternate.start()
+        os.environ["OPENAI_BASE_URL"] = primary.base_url
+        os.environ["AOAI_ENDPOINT"] = (
+            f"http://127.0.0.1:{alternate.port}"
+        )
+        for enabled in (False, True):
+            # Start each run without a health profile
+            routing._health.clear()
+            resilience._latency_trackers.clear()
+            served = alternate.requests_served
+            latencies, _ = await _drive(
+                {**model_config, "routing": enabled},
+                args.calls,
+                args.concurrency,
+            )
+            print(
+                f"{scenario:>8} | {str(enabled):>7} | "
+                f"{len(latencies) / args.calls:>8.1%} | "
+                f"{_percentile(latencies, 0.5) * 1000 if latencies else 0:>7.0f} | "
+                f"{_percentile(latencies, 0.99) * 1000 if latencies else 0:>7.0f} | "
+                f"{(alternate.requests_served - served) / args.calls:>7.0%}"
+            )
+        await primary.stop()
+        await alternate.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Model call resilience benchmark"
+    )
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.02,
+        help="Stub seconds/request",
+    )
+    parser.add_argument("--error-rate", type=float, default=0.2)
+    parser.add_argument("--retry-after", type=float, default=0.05)
+    parser.add_argument("--slow-rate", type=float, default=0.03)
+    parser.add_argument("--slow-latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    os.environ["OPENAI_KEY"] = "stub"
+    os.environ["AOAI_KEY"] = "stub"
+    os.environ["AOAI_VERSION"] = "2024-10-21"
+    # Keep the benchmark short; Retry-After still sets the floor
+    resilience._resilience_config["backoff_base_seconds"] = 0.05
+    # Stubs have no quota; the configured aoai limits would throttle
+    # the benchmark once calls move there
+    resilience._rate_limits_config.clear()
+
+    asyncio.run(_errors(args))
+    asyncio.run(_slow_tail(args))
+    asyncio.run(_routing(args))
+
+
+if __name__ == "__main__":
+    main()
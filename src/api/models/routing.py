@@ -0,0 +1,342 @@
+"""
+Latency-based routing of a model across the providers that serve it.
+
+Every deployment (provider and model) keeps a health profile: a rolling
+window of call latencies and outcomes, and a circuit breaker that opens
+after consecutive failures and lets a trial call through after a
+cooldown. route() orders the deployments of a model fastest healthy
+first, and the model router falls back along that order when a
+deployment fails. A small share of calls explores the other healthy
+deployments so their profiles stay current.
+
+Settings come from resilience.routing in default_config.yaml. The
+route taken, fallbacks and breaker changes are recorded as events on
+the model.call span.
+"""
+
+import random
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from api import trace
+from api.config_loader import load_default_config
+from api.models.resilience import LatencyTracker, get_latency_tracker
+
+_routing_config = (
+    load_default_config().get("resilience", {}).get("routing", {})
+)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def is_deployment_error(error: BaseException) -> bool:
+    """
+    Whether an error counts against a deployment's health and should
+    fall back to another one: throttling, server errors, timeouts,
+    connection errors and missing credentials or deployments, but not
+    bad requests.
+    """
+    # Imported on first use, not at startup
+    import openai
+
+    if isinstance(error, openai.APIStatusError):
+        # Status errors that are the deployment's fault rather than
+        # the request's, so another deployment may well succeed
+        return isinstance(
+            error,
+            (
+                openai.RateLimitError,
+                openai.InternalServerError,
+                openai.AuthenticationError,
+                openai.PermissionDeniedError,
+                openai.NotFoundError,
+            ),
+        )
+    return isinstance(error, openai.OpenAIError)
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures. Once
+    cooldown_seconds have passed it is half open: calls are let through
+    again, and the next outcome closes or reopens it.
+
+    Args:
+        failure_threshold (int): Consecutive failures that open it.
+        cooldown_seconds (float): How long it stays open.
+    """
+
+    def __init__(self, failure_threshold: int, cooldown_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return CLOSED
+        if time.monotonic() - self.opened_at < self.cooldown_seconds:
+            return OPEN
+        return HALF_OPEN
+
+    def record_success(self) -> bool:
+        """Record a success; returns True if this closed the breaker."""
+        self.consecutive_failures = 0
+        was_open = self.opened_at is not None
+        self.opened_at = None
+        return was_open
+
+    def record_failure(self) -> bool:
+        """Record a failure; returns True if this opened the breaker."""
+        self.consecutive_failures += 1
+        if self.opened_at is not None:
+            # A failed trial call starts a new cooldown
+            self.opened_at = time.monotonic()
+            return False
+        if self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+
+class DeploymentHealth:
+    """
+    Rolling latency and error profile of one deployment.
+
+    Latencies of whole calls are shared with hedging; streams, whose
+    length depends on the answer, are profiled by the time until the
+    stream opens.
+
+    Args:
+        provider (str): Provider name.
+        model (str): Model name.
+        window (int): Calls the error rate and stream latencies cover.
+        failure_threshold (int): See CircuitBreaker.
+        cooldown_seconds (float): See CircuitBreaker.
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        model: str,
+        window: int = 100,
+        failure_threshold: int = 5,
+        cooldown_seconds: float = 30,
+    ):
+        self.provider = provider
+        self.model = model
+        self.latency = get_latency_tracker(provider, model)
+        self.stream_latency = LatencyTracker(window)
+        self.outcomes: deque = deque(maxlen=window)
+        self.breaker = CircuitBreaker(
+            failure_threshold, cooldown_seconds
+        )
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def record_success(self, seconds: float, stream: bool):
+        (self.stream_latency if stream else self.latency).record(
+            seconds
+        )
+        self.outcomes.append(True)
+        if self.breaker.record_success():
+            trace.current_span().event(
+                "circuit_closed", deployment=self.name
+            )
+
+    def record_failure(self, error: BaseException):
+        self.outcomes.append(False)
+        if self.breaker.record_failure():
+            trace.current_span().event(
+                "circuit_open",
+                deployment=self.name,
+                error=type(error).__name__,
+            )
+
+    def median_latency(
+        self, stream: bool, min_samples: int
+    ) -> Optional[float]:
+        """p50 of the matching latency window, None if too few calls."""
+        tracker = self.stream_latency if stream else self.latency
+        if len(tracker.samples) < min_samples:
+            return None
+        return tracker.percentile(0.5)
+
+    @property
+    def name(self) -> str:
+        return f"{self.provider}/{self.model}"
+
+    def stats(self) -> Dict:
+        return {
+            "state": self.breaker.state,
+            "error_rate": round(self.error_rate, 3),
+            "calls": len(self.outcomes),
+            "p50_seconds": self.latency.percentile(0.5),
+            "stream_p50_seconds": self.stream_latency.percentile(0.5),
+        }
+
+
+_health: Dict[str, DeploymentHealth] = {}
+
+
+def get_deployment_health(
+    provider: str, model: str
+) -> DeploymentHealth:
+    key = f"{provider}/{model}"
+    health = _health.get(key)
+    if health is None:
+        health = _health[key] = DeploymentHealth(
+            provider,
+            model,
+            window=_routing_config.get("window", 100),
+            failure_threshold=_routing_config.get(
+                "failure_threshold", 5
+            ),
+            cooldown_seconds=_routing_config.get(
+                "cooldown_seconds", 30
+            ),
+        )
+    return health
+
+
+def is_routing_enabled(model_config: dict) -> bool:
+    return bool(
+        model_config.get(
+            "routing", _routing_config.get("enabled", False)
+        )
+    )
+
+
+def retries_before_fallback() -> int:
+    """Retries on a deployment before falling back to the next one."""
+    return _routing_config.get("retries_before_fallback", 1)
+
+
+def get_deployments(
+    provider: str, model: str, supported: Dict[str, list]
+) -> List[Tuple[str, str]]:
+    """
+    Deployments that can serve a call configured for provider and
+    model: resilience.routing.deployments when listed for the model,
+    else the model on every supported provider. The configured one
+    comes first.
+
+    Args:
+        provider (str): Configured provider.
+        model (str): Configured model.
+        supported (Dict[str, list]): The models.supported table.
+
+    Returns:
+        List[Tuple[str, str]]: (provider, model) pairs.
+    """
+    deployments = [(provider, model)]
+    listed = _routing_config.get("deployments", {}).get(model)
+    if listed:
+        candidates = [tuple(entry.split("/", 1)) for entry in listed]
+    else:
+        candidates = [
+            (other, model)
+            for other, models in supported.items()
+            if model in models
+        ]
+    for candidate in candidates:
+        if candidate not in deployments:
+            deployments.append(candidate)
+    return deployments
+
+
+def route(
+    provider: str,
+    model: str,
+    supported: Dict[str, list],
+    stream: bool = False,
+) -> List[Tuple[str, str]]:
+    """
+    Order the deployments of a call: healthy ones by median latency
+    (those without enough calls yet after them, in configured order),
+    then ones with a high error rate, half-open and finally open
+    breakers. With probability profile_rate a healthy deployment with
+    too few calls to rank, else with probability explore_rate any
+    other healthy deployment, is moved to the front.
+
+    Args:
+        provider (str): Configured provider.
+        model (str): Configured model.
+        supported (Dict[str, list]): The models.supported table.
+        stream (bool): Rank by stream open latency.
+
+    Returns:
+        List[Tuple[str, str]]: Deployments to try in order.
+    """
+    deployments = get_deployments(provider, model, supported)
+    if len(deployments) == 1:
+        return deployments
+
+    min_samples = _routing_config.get("min_samples", 5)
+    max_error_rate = _routing_config.get("max_error_rate", 0.5)
+    state_rank = {CLOSED: 0, HALF_OPEN: 2, OPEN: 3}
+    ranked = []
+    for index, deployment in enumerate(deployments):
+        health = get_deployment_health(*deployment)
+        rank = state_rank[health.breaker.state]
+        if rank == 0 and health.error_rate > max_error_rate:
+            rank = 1
+        latency = health.median_latency(stream, min_samples)
+        ranked.append(
+            (
+                (rank, latency is None, latency or 0.0, index),
+                deployment,
+                latency,
+            )
+        )
+    ranked.sort(key=lambda entry: entry[0])
+    order = [deployment for _, deployment, _ in ranked]
+
+    reason = "fastest"
+    others = [entry for entry in ranked[1:] if entry[0][0] == 0]
+    unprofiled = [entry for entry in others if entry[2] is None]
+    if unprofiled and random.random() < _routing_config.get(
+        "profile_rate", 0.25
+    ):
+        # Build the profile of a deployment that has too few calls
+        chosen = random.choice(unprofiled)[1]
+        reason = "profile"
+    elif others and random.random() < _routing_config.get(
+        "explore_rate", 0.05
+    ):
+        chosen = random.choice(others)[1]
+        reason = "explore"
+    else:
+        chosen = None
+    if chosen is not None:
+        order.remove(chosen)
+        order.insert(0, chosen)
+    elif ranked[0][0][0] == 3:
+        reason = "all_open"
+    elif ranked[0][2] is None:
+        reason = "no_profile"
+
+    trace.current_span().event(
+        "route",
+        deployment="/".join(order[0]),
+        reason=reason,
+        order=["/".join(deployment) for deployment in order],
+        p50_seconds={
+            "/".join(deployment): latency
+            for _, deployment, latency in ranked
+        },
+    )
+    return order
+
+
+def get_routing_stats() -> Dict[str, Dict]:
+    """Health of every deployment that has been called."""
+    return {name: health.stats() for name, health in _health.items()}
@@ -0,0 +1,133 @@
+"""
+Streaming model responses.
+
+ModelStream wraps a provider chat completion chunk stream. Iterating it
+yields text deltas as they arrive; once exhausted, `result` holds the
+same value a non-streaming call_model would have returned: the content
+string, or a ChatCompletionMessage when the model made tool calls. Tool
+call ids, names and argument fragments are reassembled by index.
+"""
+
+from typing import (
+    TYPE_CHECKING,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Optional,
+    Union,
+)
+
+if TYPE_CHECKING:
+    from openai.types.chat import ChatCompletionMessage
+
+
+class ModelStream:
+    def __init__(self, chunks: Optional[AsyncIterator]):
+        self._chunks = chunks
+        self._content = []
+        self._tool_calls: Dict[int, Dict] = {}
+        self.usage = None
+        self.result: Optional[Union[str, "ChatCompletionMessage"]] = (
+            None
+        )
+        # Awaited with the result once the stream is exhausted
+        self.on_complete: Optional[
+            Callable[[Union[str, "ChatCompletionMessage"]], Awaitable]
+        ] = None
+        # Called when iteration ends for any reason, e.g. to free the
+        # model concurrency slot held by the stream
+        self.on_close: Optional[Callable[[], None]] = None
+
+    @classmethod
+    def from_result(
+        cls, result: Union[str, "ChatCompletionMessage"]
+    ) -> "ModelStream":
+        """Stream an already complete response, e.g. a cache hit."""
+        stream = cls(None)
+        stream.result = result
+        return stream
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[str]:
+        if self._chunks is None:
+            # Complete already, but closed and completed like a live
+            # stream so its caller's span and metrics are recorded
+            content = (
+                self.result
+                if isinstance(self.result, str)
+                else self.result.content
+            )
+            try:
+                if content:
+                    yield content
+            finally:
+                if self.on_close is not None:
+                    self.on_close()
+            if self.on_complete is not None:
+                await self.on_complete(self.result)
+            return
+        try:
+            async for chunk in self._chunks:
+                if chunk.usage is not None:
+                    self.usage = chunk.usage
+                # AOAI sends content-filter chunks without choices
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.tool_calls:
+                    for tool_call_delta in delta.tool_calls:
+                        self._add_tool_call_delta(tool_call_delta)
+                if delta.content:
+                    self._content.append(delta.content)
+                    yield delta.content
+        finally:
+            if self.on_close is not None:
+                self.on_close()
+        self.result = self._build_result()
+        if self.on_complete is not None:
+            await self.on_complete(self.result)
+
+    def _add_tool_call_delta(self, tool_call_delta):
+        # The first delta of a call carries its id and name, later
+        # ones only append argument fragments
+        tool_call = self._tool_calls.setdefault(
+            tool_call_delta.index,
+            {"id": None, "name": "", "arguments": []},
+        )
+        if tool_call_delta.id:
+            tool_call["id"] = tool_call_delta.id
+        function = tool_call_delta.function
+        if function is not None:
+            if function.name:
+                tool_call["name"] += function.name
+            if function.arguments:
+                tool_call["arguments"].append(function.arguments)
+
+    def _build_result(self) -> Union[str, "ChatCompletionMessage"]:
+        content = "".join(self._content)
+        if not self._tool_calls:
+            return content
+        from openai.types.chat import ChatCompletionMessage
+        from openai.types.chat.chat_completion_message_tool_call import (
+            ChatCompletionMessageToolCall,
+            Function,
+        )
+
+        return ChatCompletionMessage(
+            role="assistant",
+            content=content or None,
+            tool_calls=[
+                ChatCompletionMessageToolCall(
+                    id=tool_call["id"],
+                    type="function",
+                    function=Function(
+                        name=tool_call["name"],
+                        arguments="".join(tool_call["arguments"]),
+                    ),
+                )
+                for _, tool_call in sorted(self._tool_calls.items())
+            ],
+        )
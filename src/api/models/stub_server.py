@@ -0,0 +1,437 @@
+"""
+Minimal OpenAI-compatible chat completions server for local benchmarks.
+
+Answers any POST ending in /chat/completions (OpenAI or AOAI deployment
+paths) with a canned assistant message after a configurable delay,
+as a single JSON body or as an SSE chunk stream when "stream" is set.
+Also serves the Batch API: JSONL uploads to /files, /batches jobs that
+complete batch_latency seconds after submission, and their output
+files.
+Can inject faults: a fraction of requests fail with an HTTP error
+(429 with Retry-After by default) and a fraction are slow.
+HTTP/1.1 keep-alive only, no external dependencies.
+
+Run from src/:
+    python -m api.models.stub_server --port 8900 --latency 0.05
+    python -m api.models.stub_server --error-rate 0.2 --slow-rate 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Optional
+
+
+def _completion_body(model: str, content: str) -> bytes:
+    return json.dumps(
+        {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {
+                        "role": "assistant",
+                        "content": content,
+                    },
+                }
+            ],
+            "usage": {
+                "prompt_tokens": 10,
+                "completion_tokens": 5,
+                "total_tokens": 15,
+            },
+        }
+    ).encode()
+
+
+def _multipart_file(body: bytes, content_type: str) -> bytes:
+    boundary = content_type.partition("boundary=")[2].strip('"')
+    for part in body.split(b"--" + boundary.encode()):
+        head, _, content = part.partition(b"\r\n\r\n")
+        if b'name="file"' in head:
+            return content[: -len(b"\r\n")]
+    return b""
+
+
+def _chunk_events(model: str, content: str) -> list:
+    events = []
+    for i, word in enumerate(content.split(" ")):
+        delta = {"content": word if i == 0 else " " + word}
+        if i == 0:
+            delta["role"] = "assistant"
+        events.append(
+            {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {"index": 0, "delta": delta, "finish_reason": None}
+                ],
+            }
+        )
+    events[-1]["choices"][0]["finish_reason"] = "stop"
+    return events
+
+
+def _chunk(data: bytes) -> bytes:
+    return f"{len(data):x}\r\n".encode() + data + b"\r\n"
+
+
+_REASONS = {
+    200: "OK",
+    404: "Not Found",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+def _response(
+    status: int, body: bytes, extra_headers: dict = None
+) -> bytes:
+    head = f"HTTP/1.1 {status} {_REASONS.get(status, 'Error')}\r\n"
+    for key, value in (extra_headers or {}).items():
+        head += f"{key}: {value}\r\n"
+    head += (
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "Connection: keep-alive\r\n\r\n"
+    )
+    return head.encode() + body
+
+
+def _error_body(status: int) -> bytes:
+    return json.dumps(
+        {
+            "error": {
+                "message": f"Injected error {status}",
+                "type": "stub_error",
+                "code": str(status),
+            }
+        }
+    ).encode()
+
+
+class StubServer:
+    """
+    Stub chat completions server.
+
+    Args:
+        host (str): Interface to bind.
+        port (int): Port to bind, 0 picks a free one.
+        latency (float): Seconds to wait before answering each request.
+        content (str): Assistant message content to return.
+        error_rate (float): Fraction of requests answered with
+            error_status.
+        error_status (int): HTTP status of injected errors.
+        retry_after (Optional[float]): Retry-After seconds sent with
+            injected errors.
+        slow_rate (float): Fraction of requests that take slow_latency
+            instead of latency.
+        slow_latency (float): Seconds a slow request takes.
+        batch_latency (float): Seconds until a submitted batch has
+            completed.
+        seed (Optional[int]): Seed for fault injection.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.05,
+        content: str = "Final Answer: stub",
+        error_rate: float = 0.0,
+        error_status: int = 429,
+        retry_after: Optional[float] = None,
+        slow_rate: float = 0.0,
+        slow_latency: float = 1.0,
+        batch_latency: float = 1.0,
+        seed: Optional[int] = None,
+    ):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.content = content
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.batch_latency = batch_latency
+        self._files = {}
+        self._batches = {}
+        self._random = random.Random(seed)
+        self.requests_served = 0
+        self.errors_injected = 0
+        self._server = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def start(self):
+        self._server = await asyncio.start_server(
+            self._handle, self.host, self.port
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def serve_forever(self):
+        await self.start()
+        print(f"Stub server listening on {self.base_url}")
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode().partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                body = (
+                    await reader.readexactly(length) if length else b""
+                )
+
+                method, path, _ = request_line.decode().split(" ", 2)
+                path = path.split("?", 1)[0]
+                if method == "POST" and path.endswith(
+                    "/chat/completions"
+                ):
+                    payload = json.loads(body or b"{}")
+                    latency = self.latency
+                    if self._random.random() < self.slow_rate:
+                        latency = self.slow_latency
+                    if latency:
+                        await asyncio.sleep(latency)
+                    if self._random.random() < self.error_rate:
+                        response = self._error_response()
+                    elif payload.get("stream"):
+                        await self._stream(writer, payload)
+                        self.requests_served += 1
+                        continue
+                    else:
+                        response = _response(
+                            200,
+                            _completion_body(
+                                payload.get("model", "stub"),
+                                self.content,
+                            ),
+                        )
+                elif "/files" in path or "/batches" in path:
+                    response = self._batch_api(
+                        method, path, headers, body
+                    )
+                else:
+                    response = _response(404, b'{"error": "not found"}')
+                self.requests_served += 1
+                writer.write(response)
+                await writer.drain()
+        except (
+            ConnectionError,
+            asyncio.IncompleteReadError,
+            asyncio.CancelledError,
+        ):
+            # Client went away or the server is shutting down
+            pass
+        finally:
+            writer.close()
+
+    def _batch_api(
+        self, method: str, path: str, headers: dict, body: bytes
+    ) -> bytes:
+        parts = path.rstrip("/").split("/")
+        now = int(time.time())
+        if method == "POST" and parts[-1] == "files":
+            file_id = f"file-{len(self._files)}"
+            self._files[file_id] = _multipart_file(
+                body, headers.get("content-type", "")
+            )
+            return _response(
+                200,
+                json.dumps(
+                    {
+                        "id": file_id,
+                        "object": "file",
+                        "bytes": len(self._files[file_id]),
+                        "created_at": now,
+                        "filename": "batch.jsonl",
+                        "purpose": "batch",
+                        "status": "processed",
+                    }
+                ).encode(),
+            )
+        if method == "GET" and parts[-1] == "content":
+            content = self._files.get(parts[-2])
+            if content is None:
+                return _response(404, b'{"error": "not found"}')
+            return _response(200, content)
+        if method == "POST" and parts[-1] == "batches":
+            payload = json.loads(body)
+            batch = {
+                "id": f"batch-{len(self._batches)}",
+                "object": "batch",
+                "endpoint": payload["endpoint"],
+                "input_file_id": payload["input_file_id"],
+                "completion_window": payload["completion_window"],
+                "created_at": now,
+                "status": "in_progress",
+                "submitted": time.monotonic(),
+            }
+            self._batches[batch["id"]] = batch
+        else:
+            batch = self._batches.get(
+                parts[-2] if parts[-1] == "cancel" else parts[-1]
+            )
+            if batch is None:
+                return _response(404, b'{"error": "not found"}')
+            if parts[-1] == "cancel":
+                batch["status"] = "cancelled"
+            elif batch["status"] == "in_progress" and (
+                time.monotonic() - batch["submitted"]
+                >= self.batch_latency
+            ):
+                self._complete_batch(batch)
+        return _response(
+            200,
+            json.dumps(
+                {k: v for k, v in batch.items() if k != "submitted"}
+            ).encode(),
+        )
+
+    def _complete_batch(self, batch: dict):
+        lines = []
+        for line in self._files[batch["input_file_id"]].splitlines():
+            request = json.loads(line)
+            if self._random.random() < self.error_rate:
+                self.errors_injected += 1
+                status = self.error_status
+                response_body = json.loads(_error_body(status))
+            else:
+                status = 200
+                response_body = json.loads(
+                    _completion_body(
+                        request["body"].get("model", "stub"),
+                        self.content,
+                    )
+                )
+            lines.append(
+                json.dumps(
+                    {
+                        "id": f"response-{len(lines)}",
+                        "custom_id": request["custom_id"],
+                        "response": {
+                            "status_code": status,
+                            "body": response_body,
+                        },
+                        "error": None,
+                    }
+                )
+            )
+        output_id = f"file-{len(self._files)}"
+        self._files[output_id] = "\n".join(lines).encode()
+        batch.update(status="completed", output_file_id=output_id)
+
+    def _error_response(self) -> bytes:
+        self.errors_injected += 1
+        headers = {}
+        if self.retry_after is not None:
+            headers["Retry-After"] = f"{self.retry_after:g}"
+        return _response(
+            self.error_status, _error_body(self.error_status), headers
+        )
+
+    async def _stream(self, writer, payload: dict):
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Transfer-Encoding: chunked\r\n"
+            b"Connection: keep-alive\r\n\r\n"
+        )
+        for event in _chunk_events(
+            payload.get("model", "stub"), self.content
+        ):
+            data = f"data: {json.dumps(event)}\n\n".encode()
+            writer.write(_chunk(data))
+            await writer.drain()
+        writer.write(_chunk(b"data: [DONE]\n\n") + _chunk(b""))
+        await writer.drain()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Stub OpenAI-compatible chat completions server"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.05,
+        help="Seconds per request",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of requests that fail",
+    )
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument(
+        "--retry-after",
+        type=float,
+        default=None,
+        help="Retry-After seconds sent with errors",
+    )
+    parser.add_argument(
+        "--slow-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of requests that are slow",
+    )
+    parser.add_argument("--slow-latency", type=float, default=1.0)
+    parser.add_argument(
+        "--batch-latency",
+        type=float,
+        default=1.0,
+        help="Seconds until a batch completes",
+    )
+    args = parser.parse_args()
+
+    server = StubServer(
+        args.host,
+        args.port,
+        args.latency,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        retry_after=args.retry_after,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+        batch_latency=args.batch_latency,
+    )
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Admission control for agent runs and model calls.
+
+Each limiter caps how many holders run at once and keeps a bounded FIFO
+queue of waiters; once the queue is full new arrivals are rejected with
+QueueFullError, which the API turns into 429 with Retry-After. Limits
+come from default_config.yaml: `scheduler` for agent runs and
+`models.limits` for in-flight calls per provider and model.
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from api import metrics
+from api.config_loader import load_default_config
+
+_default_config = load_default_config()
+_scheduler_config = _default_config.get("scheduler", {})
+_model_limits_config = _default_config.get("models", {}).get(
+    "limits", {}
+)
+
+
+class QueueFullError(Exception):
+    """Raised when a limiter's wait queue is full."""
+
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(
+            f"Too many requests queued for {name}, "
+            f"retry after {retry_after}s"
+        )
+        self.name = name
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    """
+    Concurrency cap with a bounded, first-come first-served wait queue.
+
+    Args:
+        name (str): Name used in stats and errors.
+        max_concurrent (int): Maximum number of concurrent holders.
+        max_queue (int): Maximum number of waiters.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self._active = 0
+        self._waiters: deque = deque()
+        self.admitted = 0
+        self.rejected = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        # Moving average of how long a holder keeps its slot
+        self._avg_hold_seconds: Optional[float] = None
+
+    async def acquire(self):
+        """
+        Wait for a slot.
+
+        Raises:
+            QueueFullError: If the wait queue is full.
+        """
+        if self._active < self.max_concurrent and not self._waiters:
+            self._active += 1
+            self._record_admission(0.0)
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise QueueFullError(self.name, self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        start = time.monotonic()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we were cancelled
+                self.release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+        self._record_admission(time.monotonic() - start)
+
+    def is_full(self) -> bool:
+        """Whether a new acquire would be rejected right now."""
+        return len(self._waiters) >= self.max_queue and (
+            self._active >= self.max_concurrent or self._waiters
+        )
+
+    def release(self):
+        # Hand the slot straight to the oldest live waiter
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._record_hold(time.monotonic() - start)
+            self.release()
+
+    def _record_admission(self, wait_seconds: float):
+        self.admitted += 1
+        self.total_wait_seconds += wait_seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+
+    def _record_hold(self, hold_seconds: float):
+        if self._avg_hold_seconds is None:
+            self._avg_hold_seconds = hold_seconds
+        else:
+            self._avg_hold_seconds += 0.1 * (
+                hold_seconds - self._avg_hold_seconds
+            )
+
+    def retry_after(self) -> int:
+        """Seconds until the queue has likely drained one position."""
+        if self._avg_hold_seconds is None:
+            return _scheduler_config.get("retry_after_seconds", 5)
+        estimate = (
+            self._avg_hold_seconds
+            * (len(self._waiters) + 1)
+            / self.max_concurrent
+        )
+        return min(max(math.ceil(estimate), 1), 300)
+
+    def stats(self) -> Dict:
+        return {
+            "active": self._active,
+            "queued": len(self._waiters),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_wait_seconds": (
+                self.total_wait_seconds / self.admitted
+                if self.admitted
+                else 0.0
+            ),
+            "max_wait_seconds": self.max_wait_seconds,
+        }
+
+
+run_limiter = ConcurrencyLimiter(
+    "agent runs",
+    max_concurrent=_scheduler_config.get("max_concurrent_runs", 16),
+    max_queue=_scheduler_config.get("max_queued_runs", 64),
+)
+
+metrics.Gauge(
+    "agent_runs_queued",
+    "Agent runs waiting for a slot",
+    function=lambda: len(run_limiter._waiters),
+)
+
+_model_limiters: Dict[str, ConcurrencyLimiter] = {}
+
+
+def get_model_limiter(provider: str, model: str) -> ConcurrencyLimiter:
+    """
+    Get the limiter for in-flight calls to a provider's model. Limits
+    are looked up in models.limits.<provider>.<model>, falling back to
+    models.limits.default.
+
+    Args:
+        provider (str): Model provider.
+        model (str): Model name.
+
+    Returns:
+        ConcurrencyLimiter: The shared limiter for this model.
+    """
+    key = f"{provider}/{model}"
+    limiter = _model_limiters.get(key)
+    if limiter is None:
+        limits = {
+            **_model_limits_config.get("default", {}),
+            **_model_limits_config.get(provider, {}).get(model, {}),
+        }
+        limiter = _model_limiters[key] = ConcurrencyLimiter(
+            key,
+            max_concurrent=limits.get("max_concurrent_calls", 32),
+            max_queue=limits.get("max_queued_calls", 512),
+        )
+    return limiter
+
+
+def get_scheduler_stats() -> Dict:
+    """
+    Queue depth, concurrency and wait times of every limiter.
+
+    Returns:
+        Dict: {"runs": stats, "models": {"<provider>/<model>": stats}}.
+    """
+    return {
+        "runs": run_limiter.stats(),
+        "models": {
+            key: limiter.stats()
+            for key, limiter in _model_limiters.items()
+        },
+    }
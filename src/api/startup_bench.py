@@ -0,0 +1,122 @@
+"""
+Benchmark of worker cold start.
+
+Starts --repeats fresh interpreters, each in an empty temporary working
+directory (so the run store, caches and knowledge store start empty),
+and times in each:
+
+    import      import api.main
+    first call  registering a fake model and the first POST /run_agent
+                against it, which pays for everything loaded on first
+                use
+    next call   a second POST /run_agent, for comparison
+
+and prints the median of each. Requests go through the ASGI app in
+process (httpx.ASGITransport), without the lifespan.
+
+Run from src/:
+    python -m api.startup_bench --repeats 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+_CHILD = """
+import sys
+import time
+
+start = time.perf_counter()
+import api.main
+imported = time.perf_counter()
+modules = len(sys.modules)
+
+import asyncio
+import json
+import httpx
+
+# The script is built from the SDK's response types, so registering it
+# counts towards the first call, as loading the SDK would for a real
+# provider
+begin = time.perf_counter()
+from api.models.fake_provider import register_fake_model
+
+register_fake_model(
+    "bench-startup",
+    ["Thought: I know this.\\nFinal Answer: Paris."],
+)
+body = {
+    "prompt": "What is the capital of France?",
+    "config": {"provider": "fake", "model": "bench-startup"},
+}
+
+
+async def call(client, begin):
+    response = await client.post("/run_agent", json=body)
+    assert response.json().get("response"), response.text
+    return time.perf_counter() - begin
+
+
+async def main():
+    transport = httpx.ASGITransport(app=api.main.app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        first = await call(client, begin)
+        return first, await call(client, time.perf_counter())
+
+
+first, second = asyncio.run(main())
+print(json.dumps({
+    "import": imported - start,
+    "first": first,
+    "next": second,
+    "modules_imported": modules,
+    "modules_called": len(sys.modules),
+}))
+"""
+
+
+def _run_child(source_dir: str) -> dict:
+    with tempfile.TemporaryDirectory(prefix="startup_bench_") as cwd:
+        env = {**os.environ, "PYTHONPATH": source_dir}
+        result = subprocess.run(
+            [sys.executable, "-c", _CHILD],
+            cwd=cwd,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start benchmark")
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+    source_dir = os.path.dirname(
+        os.path.dirname(os.path.abspath(__file__))
+    )
+    _run_child(source_dir)  # Warm the OS page cache and .pyc files
+    samples = [_run_child(source_dir) for _ in range(args.repeats)]
+    print(f"Median of {args.repeats} fresh interpreters\n")
+    print(f"{'phase':>10} | {'ms':>7}")
+    for phase in ("import", "first", "next"):
+        median = statistics.median(sample[phase] for sample in samples)
+        label = {"first": "first call", "next": "next call"}.get(
+            phase, phase
+        )
+        print(f"{label:>10} | {median * 1000:>7.1f}")
+    print(
+        f"\nModules loaded: {samples[-1]['modules_imported']} after "
+        f"import, {samples[-1]['modules_called']} after the calls"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,65 @@
-from typing import Dict, Callable, List, Optional, Any
+import asyncio
+import importlib
+import inspect
+import sys
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Callable, List, Optional, Any, Tuple
+
+from api import metrics, trace
+from api.cassette import TOOL, current_cassette, tool_key
+from api.config_loader import load_default_config
+from api.models.prompt import ToolSchemas
 from api.tools.registry import tool_registry
+from api.tools.tool_cache import get_tool_cache, make_tool_cache_key
+from api.tools.tool_output import (
+    BoundedOutput,
+    bound_output,
+    bound_output_async,
+)
+
+_executor_config = load_default_config().get("tool_executor", {})
+_executor: Optional[ThreadPoolExecutor] = None
+# Modules that register the built-in tools when imported. They pull in
+# their own dependencies, so they are loaded on first use of the
+# registry rather than with this package
+_TOOL_MODULES = (
+    "api.tools.search",
+    "api.tools.code_executor",
+    "api.tools.fetch",
+)
+_tools_loaded = False
+# Schemas built for the registry size they were built at; tools are
+# only ever added
+_tool_schemas: Optional[Tuple[int, ToolSchemas]] = None
+
+# event loop -> {tool name: asyncio.Semaphore}
+_tool_semaphores: (
+    "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict]"
+) = weakref.WeakKeyDictionary()
+
+
+def load_tools():
+    """Import the built-in tool modules, registering their tools."""
+    global _tools_loaded
+    if not _tools_loaded:
+        _tools_loaded = True
+        for module in _TOOL_MODULES:
+            importlib.import_module(module)
+
+
+async def close_tools():
+    """
+    Release the connection pool and code workers of the built-in tools
+    in the running event loop, if they were ever loaded.
+    """
+    code_executor = sys.modules.get("api.tools.code_executor")
+    if code_executor is not None:
+        await code_executor.close_code_pool()
+    fetch = sys.modules.get("api.tools.fetch")
+    if fetch is not None:
+        await fetch.close_fetcher()
 
 
 def get_available_tools() -> Dict[str, str]:
@@ -10,37 +70,72 @@ def get_available_tools() -> Dict[str, str]:
         Dict[str, str]: A dictionary where keys are tool names and
         values are their descriptions.
     """
+    load_tools()
     return {
         name: data["description"]
         for name, data in tool_registry.items()
     }
 
 
-def get_tools_openai_format() -> List[Dict]:
+def get_tools_openai_format() -> ToolSchemas:
     """
-    Convert internal tools to OpenAI tool format.
+    Convert internal tools to OpenAI tool format. The result is built
+    once and shared by every request, so its bytes and cache key digest
+    stay the same from step to step.
 
     Returns:
-        List[Dict]: List of tools in OpenAI format for API calls.
+        ToolSchemas: Frozen list of tools in OpenAI format for API calls.
     """
-    openai_tools = []
-    for tool_name, tool_data in tool_registry.items():
-        openai_tools.append(
-            {
-                "type": "function",
-                "function": {
-                    "name": tool_name,
-                    "description": tool_data["description"],
-                    "parameters": tool_data["parameters"],
-                },
-            }
-        )
-    return openai_tools
+    global _tool_schemas
+    load_tools()
+    if _tool_schemas is None or _tool_schemas[0] != len(tool_registry):
+        openai_tools = []
+        for tool_name, tool_data in tool_registry.items():
+            openai_tools.append(
+                {
+                    "type": "function",
+                    "function": {
+                        "name": tool_name,
+                        "description": tool_data["description"],
+                        "parameters": tool_data["parameters"],
+                    },
+                }
+            )
+        _tool_schemas = (len(tool_registry), ToolSchemas(openai_tools))
+    return _tool_schemas[1]
+
+
+def _call_handler(handler: Callable, tool_args: Dict[str, Any]):
+    # For tools that expect a single argument, try to extract it
+    # Otherwise, pass the full arguments dict
+    try:
+        # Try to call with unpacked arguments first
+        return handler(**tool_args)
+    except TypeError:
+        # If that fails, try with a single argument
+        # This handles legacy tools that expect a single string parameter
+        if len(tool_args) == 1:
+            return handler(next(iter(tool_args.values())))
+        else:
+            # If multiple args but handler doesn't support **kwargs,
+            # pass the whole dict
+            return handler(tool_args)
+
+
+def _get_tool_data(tool_name: str) -> Dict:
+    load_tools()
+    if tool_name not in tool_registry:
+        raise ValueError(f"Tool '{tool_name}' is not registered.")
+    return tool_registry[tool_name]
 
 
 def execute_tool(tool_name: str, tool_args: Dict[str, Any]) -> str:
     """
-    Execute a tool with the given arguments.
+    Execute a tool with the given arguments, blocking until it returns.
+    Async handlers are driven with asyncio.run, so this must not be
+    called from inside a running event loop; use execute_tool_async
+    there. Results longer than the tool's max_output_chars are stored
+    and previewed (see api.tools.tool_output).
 
     Args:
         tool_name (str): The name of the tool to execute.
@@ -52,27 +147,226 @@ def execute_tool(tool_name: str, tool_args: Dict[str, Any]) -> str:
     Raises:
         ValueError: If the tool is not registered.
     """
-    if tool_name not in tool_registry:
-        raise ValueError(f"Tool '{tool_name}' is not registered.")
+    tool_data = _get_tool_data(tool_name)
+    if tool_data["cacheable"]:
+        cache = get_tool_cache()
+        cache_key = make_tool_cache_key(tool_name, tool_args)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            cache.hits += 1
+            return cached
+        cache.misses += 1
 
-    handler = tool_registry[tool_name]["handler"]
+    result = _call_handler(tool_data["handler"], tool_args)
+    if inspect.isasyncgen(result):
+        output = asyncio.run(
+            bound_output_async(
+                result, tool_name, tool_data["max_output_chars"]
+            )
+        )
+    else:
+        if tool_data["is_async"]:
+            result = asyncio.run(result)
+        output = bound_output(
+            result, tool_name, tool_data["max_output_chars"]
+        )
+    result = output.text()
 
-    # For tools that expect a single argument, try to extract it
-    # Otherwise, pass the full arguments dict
+    if tool_data["cacheable"]:
+        cache.set(cache_key, result, tool_data["cache_ttl"])
+    return result
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=_executor_config.get("max_workers", 16),
+            thread_name_prefix="tool",
+        )
+    return _executor
+
+
+def _get_semaphore(
+    tool_name: str, max_concurrency: Optional[int]
+) -> Optional[asyncio.Semaphore]:
+    if not max_concurrency:
+        return None
+    semaphores = _tool_semaphores.setdefault(
+        asyncio.get_running_loop(), {}
+    )
+    if tool_name not in semaphores:
+        semaphores[tool_name] = asyncio.Semaphore(max_concurrency)
+    return semaphores[tool_name]
+
+
+def _call_bounded(
+    tool_name: str, tool_data: Dict, tool_args: Dict[str, Any]
+) -> BoundedOutput:
+    # On the thread pool, so chunks of a sync generator are consumed
+    # and spilled there too
+    return bound_output(
+        _call_handler(tool_data["handler"], tool_args),
+        tool_name,
+        tool_data["max_output_chars"],
+    )
+
+
+def _discard_output(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().discard()
+
+
+async def _run_handler(
+    tool_name: str, tool_data: Dict, tool_args: Dict[str, Any]
+) -> BoundedOutput:
+    max_chars = tool_data["max_output_chars"]
+    if tool_data["is_async"]:
+        result = _call_handler(tool_data["handler"], tool_args)
+        if inspect.isasyncgen(result):
+            return await bound_output_async(
+                result, tool_name, max_chars
+            )
+        return bound_output(await result, tool_name, max_chars)
+    future = _get_executor().submit(
+        _call_bounded, tool_name, tool_data, tool_args
+    )
     try:
-        # Try to call with unpacked arguments first
-        return handler(**tool_args)
-    except TypeError:
-        # If that fails, try with a single argument
-        # This handles legacy tools that expect a single string parameter
-        if len(tool_args) == 1:
-            return handler(next(iter(tool_args.values())))
-        else:
-            # If multiple args but handler doesn't support **kwargs,
-            # pass the whole dict
-            return handler(tool_args)
+        return await asyncio.wrap_future(future)
+    except BaseException:
+        # Abandoned on timeout: drop the partial blob once the handler
+        # is done with it
+        future.add_done_callback(_discard_output)
+        raise
+
+
+async def execute_tool_async(
+    tool_name: str, tool_args: Dict[str, Any]
+) -> str:
+    """
+    Execute a tool without blocking the event loop. Sync handlers run
+    on the bounded tool thread pool, calls are capped by the tool's
+    max_concurrency and abandoned after its timeout. Results of
+    cacheable tools are memoized, and identical concurrent calls run
+    only once. Results longer than the tool's max_output_chars are
+    stored and previewed (see api.tools.tool_output). Inside a
+    cassette scope, results are recorded or replayed (see
+    api.cassette).
+
+    Args:
+        tool_name (str): The name of the tool to execute.
+        tool_args (Dict[str, Any]): The arguments to pass to the tool.
+
+    Returns:
+        str: The result from the tool execution, or an error message
+            if the tool timed out.
+
+    Raises:
+        ValueError: If the tool is not registered.
+    """
+    tool_data = _get_tool_data(tool_name)
+    cassette = current_cassette()
+    if cassette is None:
+        return await _execute_tool(tool_name, tool_data, tool_args)
+
+    key = tool_key(tool_name, tool_args)
+    replayed = cassette.replay(TOOL, key, f"{tool_name}({tool_args})")
+    if replayed is not None:
+        return replayed
+    result = await _execute_tool(tool_name, tool_data, tool_args)
+    cassette.record(TOOL, key, result)
+    return result
+
+
+async def _execute_tool(
+    tool_name: str, tool_data: Dict, tool_args: Dict[str, Any]
+) -> str:
+    timeout = tool_data["timeout"] or _executor_config.get(
+        "default_timeout", 60
+    )
+    semaphore = _get_semaphore(tool_name, tool_data["max_concurrency"])
+    # Set only when this call ran the handler, not on a cache hit
+    output: Optional[BoundedOutput] = None
+
+    async def run():
+        nonlocal output
+        # The timeout covers time spent waiting for a concurrency slot
+        async with asyncio.timeout(timeout):
+            if semaphore is None:
+                output = await _run_handler(
+                    tool_name, tool_data, tool_args
+                )
+            else:
+                async with semaphore:
+                    output = await _run_handler(
+                        tool_name, tool_data, tool_args
+                    )
+        return output.text()
 
+    start = time.perf_counter()
+    with trace.span(
+        "tool.call", tool=tool_name, args_chars=len(str(tool_args))
+    ) as span:
+        try:
+            if tool_data["cacheable"]:
+                result = await get_tool_cache().get_or_run(
+                    make_tool_cache_key(tool_name, tool_args),
+                    tool_data["cache_ttl"],
+                    run,
+                )
+            else:
+                result = await run()
+        except TimeoutError:
+            # A timed-out sync handler keeps its worker thread until it
+            # returns, but the step no longer waits for it
+            span.set(timed_out=True)
+            metrics.ERRORS.labels("tool", "TimeoutError").inc()
+            return (
+                f"Error: tool '{tool_name}' timed out after {timeout}s"
+            )
+        except Exception as e:
+            metrics.ERRORS.labels("tool", type(e).__name__).inc()
+            raise
+        finally:
+            metrics.TOOL_CALL_SECONDS.labels(tool_name).observe(
+                time.perf_counter() - start
+            )
+        span.set(result_chars=len(result))
+        if output is not None:
+            # Metrics only from the event loop thread
+            span.set(output_chars=output.chars)
+            if output.output_id is not None:
+                span.set(output_id=output.output_id)
+            metrics.TOOL_OUTPUTS.labels(
+                tool_name, "stored" if output.output_id else "whole"
+            ).inc()
+        return result
 
-# Import tools to register them - clean and explicit
-from api.tools import search
-from api.tools import code_executor
+
+async def execute_tool_calls(
+    tool_calls: List[Tuple[str, Dict[str, Any]]],
+) -> List[str]:
+    """
+    Execute the independent tool calls of one model step concurrently.
+
+    Args:
+        tool_calls (List[Tuple[str, Dict[str, Any]]]): (tool name,
+            arguments) pairs in the order the model issued them.
+
+    Returns:
+        List[str]: Tool results in the same order as tool_calls.
+
+    Raises:
+        ValueError: If a tool is not registered. Remaining calls of the
+            step are cancelled.
+    """
+    tasks = [
+        asyncio.ensure_future(execute_tool_async(name, args))
+        for name, args in tool_calls
+    ]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
@@ -1,8 +1,401 @@
+"""
+Python code execution tool backed by a pool of warm worker processes.
+
+Workers (code_worker.py) are started ahead of time in isolated mode
+with a scrubbed environment and the common modules preloaded, so a
+code step costs a pipe round trip instead of an interpreter start. Each
+run gets a CPU time limit, the worker's memory and file size limits, an
+output cap, a wall-clock timeout and its own working directory, which
+is removed after the run so no files carry over to the next. A worker
+is replaced after max_runs_per_worker runs, or right away if it
+crashed, hit a limit or was timed out. Limits come from the
+`code_executor` section of default_config.yaml.
+
+Before the first worker starts, the server process is made
+non-dumpable on Linux, so code running as the same user cannot read
+its environment or memory through /proc. Workers still have the file
+access of that user; set code_executor.user to run them as another
+one (the server then has to start as root).
+"""
+
+import asyncio
+import ctypes
+import json
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import weakref
+from typing import Callable, Dict, List, Optional
+
+from api import trace
+from api.config_loader import load_default_config
 from api.tools.registry import register_tool
 
+_code_config = load_default_config().get("code_executor", {})
+
+WORKER_PATH = os.path.join(os.path.dirname(__file__), "code_worker.py")
+
+# Largest frame the worker sends, well above its output frame size
+_PIPE_LIMIT = 1 << 20
+
+
+class ExecutionResult:
+    """
+    Outcome of one code run.
+
+    Args:
+        output (str): Captured stdout and stderr, interleaved.
+        error (Optional[str]): Traceback or reason the run failed.
+        truncated (bool): Whether output hit max_output_chars.
+    """
+
+    def __init__(
+        self,
+        output: str = "",
+        error: Optional[str] = None,
+        truncated: bool = False,
+    ):
+        self.output = output
+        self.error = error
+        self.truncated = truncated
+
+    def to_text(self) -> str:
+        parts = []
+        if self.output:
+            parts.append(self.output.rstrip("\n"))
+        if self.truncated:
+            parts.append("[output truncated]")
+        if self.error:
+            parts.append(self.error.rstrip("\n"))
+        return "\n".join(parts) or "(no output)"
+
+
+class _Worker:
+    def __init__(self, process: asyncio.subprocess.Process):
+        self.process = process
+        self.runs = 0
+
+    async def send(self, message: dict):
+        self.process.stdin.write(json.dumps(message).encode() + b"\n")
+        await self.process.stdin.drain()
+
+    async def receive(self) -> dict:
+        line = await self.process.stdout.readline()
+        if not line:
+            raise EOFError("code worker exited")
+        return json.loads(line)
+
+    def kill(self):
+        if self.process.returncode is None:
+            self.process.kill()
+
+
+# prctl option of the dumpable flag, from <linux/prctl.h>
+_PR_SET_DUMPABLE = 4
+
+_server_protected = False
+
+
+def _protect_server():
+    """
+    Make the server process non-dumpable, once. Its /proc files
+    (environ, mem, maps) are then owned by root, so workers running as
+    the same user cannot read the API keys in its environment or
+    memory. Also disables core dumps and ptrace attaches by that user.
+    """
+    global _server_protected
+    if _server_protected or not sys.platform.startswith("linux"):
+        return
+    _server_protected = True
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        failed = libc.prctl(_PR_SET_DUMPABLE, 0, 0, 0, 0) != 0
+        error = os.strerror(ctypes.get_errno())
+    except (OSError, AttributeError) as e:
+        failed, error = True, str(e)
+    if failed:
+        trace.debug(
+            "Making the server non-dumpable failed", error=error
+        )
+
+
+def _worker_env() -> Dict[str, str]:
+    # Only what an interpreter needs, so API keys and the rest of the
+    # server's environment are not passed on (see _protect_server for
+    # reading them through /proc)
+    return {
+        "PATH": os.environ.get("PATH", "/usr/bin:/bin"),
+        "LANG": "C.UTF-8",
+        "PYTHONIOENCODING": "utf-8",
+    }
+
+
+def _primary_group(user: str) -> int:
+    import pwd
+
+    return pwd.getpwnam(user).pw_gid
+
+
+_SIGXCPU = getattr(signal, "SIGXCPU", None)
+
+
+def _exit_reason(returncode: Optional[int]) -> str:
+    if _SIGXCPU is not None and returncode == -_SIGXCPU:
+        return "exceeded the CPU time limit"
+    if returncode is not None and returncode < 0:
+        return f"was killed by signal {-returncode}"
+    return f"exited with status {returncode}"
+
+
+class CodeExecutorPool:
+    """
+    Pool of warm Python worker processes.
+
+    Args:
+        size (int): Number of workers kept warm.
+        max_runs_per_worker (int): Runs before a worker is recycled.
+        timeout (float): Wall-clock seconds per run.
+        cpu_seconds (float): CPU seconds per run.
+        memory_mb (int): Address space limit of a worker.
+        file_size_mb (int): Largest file a worker may write.
+        max_output_chars (int): Output kept per run.
+        preload (List[str]): Modules imported when a worker starts.
+        user (Optional[str]): User to run the workers as, None for the
+            server's own. Needs a server running as root.
+    """
+
+    def __init__(
+        self,
+        size: int = 4,
+        max_runs_per_worker: int = 50,
+        timeout: float = 30,
+        cpu_seconds: float = 10,
+        memory_mb: int = 512,
+        file_size_mb: int = 16,
+        max_output_chars: int = 65536,
+        preload: Optional[List[str]] = None,
+        user: Optional[str] = None,
+    ):
+        self.size = size
+        self.max_runs_per_worker = max_runs_per_worker
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.file_size_mb = file_size_mb
+        self.max_output_chars = max_output_chars
+        self.preload = preload or []
+        self.user = user
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._workers: set = set()
+        self._spawning: set = set()
+        self._workdir = tempfile.mkdtemp(prefix="code-executor-")
+        if user is not None:
+            shutil.chown(self._workdir, user)
+        self._closed = False
+        self.runs = 0
+        self.recycled = 0
+
+    @classmethod
+    def from_config(cls) -> "CodeExecutorPool":
+        return cls(
+            size=_code_config.get("pool_size", 4),
+            max_runs_per_worker=_code_config.get(
+                "max_runs_per_worker", 50
+            ),
+            timeout=_code_config.get("timeout_seconds", 30),
+            cpu_seconds=_code_config.get("cpu_seconds", 10),
+            memory_mb=_code_config.get("memory_mb", 512),
+            file_size_mb=_code_config.get("file_size_mb", 16),
+            max_output_chars=_code_config.get(
+                "max_output_chars", 65536
+            ),
+            preload=_code_config.get("preload", []),
+            user=_code_config.get("user"),
+        )
+
+    async def _spawn(self) -> _Worker:
+        _protect_server()
+        process = await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-I",
+            "-u",
+            WORKER_PATH,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            cwd=self._workdir,
+            env=_worker_env(),
+            limit=_PIPE_LIMIT,
+            user=self.user,
+            group=self.user and _primary_group(self.user),
+            extra_groups=[] if self.user else None,
+        )
+        worker = _Worker(process)
+        try:
+            await worker.send(
+                {
+                    "preload": self.preload,
+                    "memory_mb": self.memory_mb,
+                    "file_size_mb": self.file_size_mb,
+                }
+            )
+            ready = await worker.receive()
+        except BaseException:
+            worker.kill()
+            raise
+        if ready.get("type") != "ready":
+            worker.kill()
+            raise RuntimeError(f"Code worker failed to start: {ready}")
+        return worker
+
+    def _replenish(self):
+        """Start a worker in the background to keep the pool warm."""
+        if self._closed:
+            return
+
+        async def spawn():
+            worker = await self._spawn()
+            if self._closed:
+                worker.kill()
+                return
+            self._workers.add(worker)
+            self._idle.put_nowait(worker)
+
+        task = asyncio.ensure_future(spawn())
+        self._spawning.add(task)
+        task.add_done_callback(self._spawning.discard)
+
+    async def start(self):
+        """Start all workers; run() also does this on first use."""
+        while len(self._workers) + len(self._spawning) < self.size:
+            self._replenish()
+        await asyncio.gather(*self._spawning)
+
+    def _retire(self, worker: _Worker):
+        worker.kill()
+        self._workers.discard(worker)
+        self.recycled += 1
+        self._replenish()
+
+    async def run(
+        self,
+        code: str,
+        on_output: Optional[Callable[[str, str], None]] = None,
+    ) -> ExecutionResult:
+        """
+        Execute code in a warm worker.
+
+        Args:
+            code (str): Python source to execute.
+            on_output (Optional[Callable[[str, str], None]]): Called
+                with (stream, text) as output arrives.
+
+        Returns:
+            ExecutionResult: Output and error of the run.
+        """
+        if not self._workers and not self._spawning:
+            await self.start()
+        worker = await self._idle.get()
+        self.runs += 1
+        output = []
+        workdir = tempfile.mkdtemp(prefix="run-", dir=self._workdir)
+        if self.user is not None:
+            shutil.chown(workdir, self.user)
+        try:
+            async with asyncio.timeout(self.timeout):
+                await worker.send(
+                    {
+                        "code": code,
+                        "cpu_seconds": self.cpu_seconds,
+                        "max_output_chars": self.max_output_chars,
+                        "workdir": workdir,
+                    }
+                )
+                while True:
+                    frame = await worker.receive()
+                    if frame["type"] == "output":
+                        output.append(frame["data"])
+                        if on_output is not None:
+                            on_output(frame["stream"], frame["data"])
+                    elif frame["type"] == "done":
+                        break
+        except TimeoutError:
+            self._retire(worker)
+            return ExecutionResult(
+                "".join(output),
+                f"Error: code execution timed out after {self.timeout}s",
+            )
+        except (EOFError, ConnectionError):
+            await worker.process.wait()
+            reason = _exit_reason(worker.process.returncode)
+            self._retire(worker)
+            return ExecutionResult(
+                "".join(output), f"Error: code execution {reason}"
+            )
+        except BaseException:
+            # Cancelled mid-run; the worker state is unknown
+            self._retire(worker)
+            raise
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        worker.runs += 1
+        if worker.runs >= self.max_runs_per_worker:
+            self._retire(worker)
+        else:
+            self._idle.put_nowait(worker)
+        return ExecutionResult(
+            "".join(output), frame["error"], frame["truncated"]
+        )
+
+    async def close(self):
+        self._closed = True
+        for task in list(self._spawning):
+            task.cancel()
+        for worker in list(self._workers):
+            worker.kill()
+            await worker.process.wait()
+        self._workers.clear()
+        shutil.rmtree(self._workdir, ignore_errors=True)
+
+    def stats(self) -> Dict:
+        return {
+            "workers": len(self._workers),
+            "starting": len(self._spawning),
+            "idle": self._idle.qsize(),
+            "runs": self.runs,
+            "recycled": self.recycled,
+        }
+
+
+# event loop -> CodeExecutorPool; worker pipes are bound to the loop
+_pools: (
+    "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, "
+    "CodeExecutorPool]"
+) = weakref.WeakKeyDictionary()
+
+
+def get_code_pool() -> CodeExecutorPool:
+    """Get the worker pool of the running event loop."""
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = _pools[loop] = CodeExecutorPool.from_config()
+    return pool
+
+
+async def close_code_pool():
+    """Stop the workers owned by the running event loop."""
+    pool = _pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.close()
+
 
-def code_handler(code: str) -> str:
-    return f"Code executor stub, executed code: {code}"
+async def code_handler(code: str) -> str:
+    result = await get_code_pool().run(code)
+    return result.to_text()
 
 
 # Register with explicit parameters schema
@@ -20,4 +413,6 @@ register_tool(
         },
         "required": ["code"],
     },
+    timeout=60,
+    max_concurrency=4,
 )
@@ -0,0 +1,90 @@
+"""
+Benchmark code step latency: a fresh interpreter per run versus the
+warm worker pool.
+
+Cold runs start `python -c` with the same preloaded modules the pool
+workers import, which is what a per-call subprocess executor pays.
+
+Run from src/:
+    python -m api.tools.code_executor_bench --runs 50
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+from api.tools.code_executor import CodeExecutorPool
+
+CODE = "import math\nprint(sum(math.sqrt(i) for i in range(1000)))"
+
+
+def _percentile(samples: list, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def _cold(runs: int, preload: list) -> list:
+    source = "".join(f"import {module}\n" for module in preload) + CODE
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-I",
+            "-c",
+            source,
+            stdout=asyncio.subprocess.PIPE,
+        )
+        await process.communicate()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def _warm(runs: int, preload: list) -> list:
+    pool = CodeExecutorPool(size=1, preload=preload)
+    await pool.start()
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        await pool.run(CODE)
+        latencies.append(time.perf_counter() - start)
+    await pool.close()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Code executor benchmark"
+    )
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument(
+        "--preload",
+        nargs="*",
+        default=["json", "re", "datetime", "statistics", "decimal"],
+        help="Modules imported before the code runs",
+    )
+    args = parser.parse_args()
+
+    # Only measure modules that exist here
+    preload = []
+    for module in args.preload:
+        try:
+            __import__(module)
+            preload.append(module)
+        except ImportError:
+            pass
+
+    print(f"preload: {', '.join(preload) or '(none)'}\n")
+    print(f"{'executor':>10} | {'p50 ms':>7} | {'p99 ms':>7}")
+    for name, bench in (("cold spawn", _cold), ("warm pool", _warm)):
+        latencies = asyncio.run(bench(args.runs, preload))
+        print(
+            f"{name:>10} | "
+            f"{_percentile(latencies, 0.5) * 1000:>7.1f} | "
+            f"{_percentile(latencies, 0.99) * 1000:>7.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Worker process of the code executor pool (see code_executor.py).
+
+Started once with the common modules preloaded, then runs one snippet
+per request line read from the private request pipe. Each snippet gets
+a fresh namespace, its own working directory (the request's workdir,
+made and removed by the pool), a CPU time limit, and captured
+stdout/stderr that is streamed back as JSON frames, one per line:
+
+    {"type": "ready"}
+    {"type": "output", "stream": "stdout", "data": "..."}
+    {"type": "done", "error": null | "traceback", "truncated": bool}
+
+Only the standard library is used so the worker can run in isolated
+mode (python -I).
+"""
+
+import io
+import json
+import os
+import sys
+import traceback
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, limits are then not enforced
+    resource = None
+
+# Characters of output buffered before a frame is sent
+FRAME_BYTES = 4096
+
+
+class OutputLimitExceeded(Exception):
+    pass
+
+
+class _FrameWriter(io.TextIOBase):
+    """Text stream that sends what is written to the parent as frames."""
+
+    def __init__(self, channel, stream: str, budget: dict):
+        self.channel = channel
+        self.stream = stream
+        self.budget = budget
+        self.buffer_text = ""
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        remaining = self.budget["remaining"]
+        if remaining <= 0:
+            self.budget["truncated"] = True
+            raise OutputLimitExceeded()
+        if len(text) > remaining:
+            self.buffer_text += text[:remaining]
+            self.budget["remaining"] = 0
+            self.budget["truncated"] = True
+            self.flush()
+            raise OutputLimitExceeded()
+        self.budget["remaining"] -= len(text)
+        self.buffer_text += text
+        if len(self.buffer_text) >= FRAME_BYTES or "\n" in text:
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        if self.buffer_text:
+            _send(
+                self.channel,
+                {
+                    "type": "output",
+                    "stream": self.stream,
+                    "data": self.buffer_text,
+                },
+            )
+            self.buffer_text = ""
+
+
+def _send(channel, frame: dict):
+    channel.write(json.dumps(frame).encode() + b"\n")
+    channel.flush()
+
+
+def _limit_cpu(cpu_seconds: float):
+    if resource is None or not cpu_seconds:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = usage.ru_utime + usage.ru_stime
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = int(used + cpu_seconds) + 1
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _limit_memory(memory_mb: int):
+    if resource is None or not memory_mb:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    resource.setrlimit(
+        resource.RLIMIT_AS, (memory_mb * 1024 * 1024, hard)
+    )
+
+
+def _limit_file_size(file_size_mb: int):
+    if resource is None or not file_size_mb:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_FSIZE)
+    resource.setrlimit(
+        resource.RLIMIT_FSIZE, (file_size_mb * 1024 * 1024, hard)
+    )
+
+
+def _run(channel, request: dict):
+    budget = {
+        "remaining": request.get("max_output_chars", 65536),
+        "truncated": False,
+    }
+    stdout = _FrameWriter(channel, "stdout", budget)
+    stderr = _FrameWriter(channel, "stderr", budget)
+    sys.stdout, sys.stderr = stdout, stderr
+    error = None
+    home = os.getcwd()
+    try:
+        if request.get("workdir"):
+            os.chdir(request["workdir"])
+        _limit_cpu(request.get("cpu_seconds"))
+        code = compile(request["code"], "<code>", "exec")
+        exec(
+            code, {"__name__": "__main__", "__builtins__": __builtins__}
+        )
+    except OutputLimitExceeded:
+        pass
+    except MemoryError:
+        error = "MemoryError: memory limit exceeded"
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            error = f"SystemExit: {e.code}"
+    except BaseException as e:
+        # Leave this module's frame out of the traceback
+        error = "".join(
+            traceback.format_exception(
+                type(e), e, e.__traceback__.tb_next
+            )
+        )
+    finally:
+        sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+        os.chdir(home)
+    try:
+        stdout.flush()
+        stderr.flush()
+    except OutputLimitExceeded:
+        pass
+    _send(
+        channel,
+        {
+            "type": "done",
+            "error": error,
+            "truncated": budget["truncated"],
+        },
+    )
+
+
+def main():
+    # Keep the protocol pipes private so snippets writing to fd 0/1/2
+    # directly cannot corrupt the frames
+    requests = os.fdopen(os.dup(0), "rb")
+    channel = os.fdopen(os.dup(1), "wb")
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+
+    init = json.loads(requests.readline())
+    for module in init.get("preload", []):
+        try:
+            __import__(module)
+        except ImportError:
+            pass
+    _limit_memory(init.get("memory_mb"))
+    _limit_file_size(init.get("file_size_mb"))
+    _send(channel, {"type": "ready"})
+
+    for line in requests:
+        _run(channel, json.loads(line))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Fake tools for offline benchmarks.
+
+Not imported by api.tools: a benchmark registers the fake tools it
+needs with register_fake_tool(). Each one sleeps for a sampled latency
+(or blocks a tool thread, for sync tools) and returns a deterministic
+output of a set size, or yields it in chunks, so tool dispatch, Memory
+growth and large outputs can be measured without network access.
+"""
+
+import asyncio
+import time
+from typing import AsyncIterator, Iterator, Optional, Union
+
+from api.models.fake_provider import Latency
+from api.tools.registry import register_tool, tool_registry
+
+
+class FakeTool:
+    """
+    Handler of a fake tool with its call counters.
+
+    Args:
+        name (str): Tool name.
+        latency (Latency): Latency of each call.
+        output_chars (int): Length of every result.
+        chunk_chars (int): Length of the chunks yielded by the
+            streaming handlers.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        latency: Latency,
+        output_chars: int,
+        chunk_chars: int = 65536,
+    ):
+        self.name = name
+        self.latency = latency
+        self.output_chars = output_chars
+        self.chunk_chars = chunk_chars
+        self.calls = 0
+        self.latency_seconds = 0.0
+
+    def _output(self, query: str) -> str:
+        text = f"{self.name} result for {query}: "
+        filler = "lorem ipsum dolor sit amet "
+        repeats = (
+            max(0, self.output_chars - len(text)) // len(filler) + 1
+        )
+        return (text + filler * repeats)[: self.output_chars]
+
+    def _chunks(self, query: str) -> Iterator[str]:
+        # Never builds the whole output, however long it is
+        filler = "lorem ipsum dolor sit amet "
+        block = filler * (self.chunk_chars // len(filler) + 1)
+        text = f"{self.name} result for {query}: " + block
+        remaining = self.output_chars
+        while remaining > 0:
+            chunk = text[: min(self.chunk_chars, remaining)]
+            yield chunk
+            remaining -= len(chunk)
+            text = block
+
+    def _sample(self) -> float:
+        seconds = self.latency.sample()
+        self.calls += 1
+        self.latency_seconds += seconds
+        return seconds
+
+    async def run(self, query: str = "") -> str:
+        seconds = self._sample()
+        if seconds:
+            await asyncio.sleep(seconds)
+        return self._output(query)
+
+    def run_sync(self, query: str = "") -> str:
+        seconds = self._sample()
+        if seconds:
+            time.sleep(seconds)
+        return self._output(query)
+
+    async def stream(self, query: str = "") -> AsyncIterator[str]:
+        seconds = self._sample()
+        if seconds:
+            await asyncio.sleep(seconds)
+        for chunk in self._chunks(query):
+            yield chunk
+            await asyncio.sleep(0)
+
+    def stream_sync(self, query: str = "") -> Iterator[str]:
+        seconds = self._sample()
+        if seconds:
+            time.sleep(seconds)
+        yield from self._chunks(query)
+
+
+def register_fake_tool(
+    name: str,
+    latency: Union[None, float, dict, Latency] = None,
+    output_chars: int = 2000,
+    sync: bool = False,
+    max_concurrency: Optional[int] = None,
+    chunk_chars: Optional[int] = None,
+    max_output_chars: Optional[int] = None,
+) -> FakeTool:
+    """
+    Register a fake tool taking a single query argument. Registering a
+    name again returns the existing tool with its settings updated.
+
+    Args:
+        name (str): Tool name.
+        latency (Union[None, float, dict, Latency]): Seconds per call,
+            or {"p50", "p99", "seed"} for a lognormal distribution.
+        output_chars (int): Length of every result.
+        sync (bool): Register a blocking handler, which runs on the
+            tool thread pool like the sync tools of the repo.
+        max_concurrency (Optional[int]): See register_tool.
+        chunk_chars (Optional[int]): Yield the result in chunks of this
+            length from a generator handler instead of returning it.
+        max_output_chars (Optional[int]): See register_tool.
+
+    Returns:
+        FakeTool: The tool, whose counters can be read.
+    """
+    existing = tool_registry.get(name)
+    if existing is not None and isinstance(
+        getattr(existing["handler"], "__self__", None), FakeTool
+    ):
+        tool = existing["handler"].__self__
+        tool.latency = Latency.parse(latency)
+        tool.output_chars = output_chars
+        tool.chunk_chars = chunk_chars or tool.chunk_chars
+        existing["handler"] = _handler(tool, sync, chunk_chars)
+        existing["is_async"] = not sync
+        existing["max_output_chars"] = max_output_chars
+        return tool
+
+    tool = FakeTool(
+        name, Latency.parse(latency), output_chars, chunk_chars or 65536
+    )
+    register_tool(
+        name=name,
+        description=f"Fake {name} tool for benchmarks",
+        handler=_handler(tool, sync, chunk_chars),
+        max_concurrency=max_concurrency,
+        max_output_chars=max_output_chars,
+    )
+    return tool
+
+
+def _handler(tool: FakeTool, sync: bool, chunk_chars: Optional[int]):
+    if chunk_chars:
+        return tool.stream_sync if sync else tool.stream
+    return tool.run_sync if sync else tool.run
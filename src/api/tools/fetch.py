@@ -0,0 +1,664 @@
+"""
+Fetch tool: reads the main text of web pages.
+
+The URLs of one call are fetched concurrently over a pooled httpx
+client per event loop, with at most max_connections_per_host requests
+to a host at once. Bodies are streamed: each chunk goes to the page
+cache on disk and through an incremental HTML text extractor, so a page
+is never held whole in memory, and reading stops after max_page_bytes.
+
+The page cache (fetch.cache_dir in default_config.yaml) keeps the raw
+body, the extracted text and the validators of every page. Pages
+younger than max_age_seconds are served from disk; older ones are
+revalidated with If-None-Match / If-Modified-Since and served from disk
+when the server answers 304 Not Modified. Pages requested while the
+same URL is being fetched share that fetch. Every few hundred pages
+fetched, entries not fetched or revalidated for cache_ttl_seconds are
+removed, then the oldest ones until the cache fits cache_max_bytes.
+
+URLs come from the model, so by default only hosts whose addresses are
+all public are fetched: loopback, private, link-local and other
+non-global addresses are refused, for the first request and for every
+redirect (allow_private_addresses turns this off, e.g. for local test
+servers).
+"""
+
+import asyncio
+import codecs
+import hashlib
+import ipaddress
+import json
+import os
+import re
+import time
+import weakref
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Union
+
+import httpx
+
+from api import metrics, trace
+from api.config_loader import load_default_config
+from api.tools.registry import register_tool
+
+_fetch_config = load_default_config().get("fetch", {})
+
+FRESH = "fresh"
+REVALIDATED = "revalidated"
+FETCHED = "fetched"
+
+# Elements whose text is never page content
+SKIP_TAGS = frozenset(
+    "script style noscript template svg nav header footer aside form "
+    "button iframe select".split()
+)
+# Elements that end a line of text
+BLOCK_TAGS = frozenset(
+    "p div br li ul ol tr table section article main h1 h2 h3 h4 h5 h6 "
+    "pre blockquote dd dt figcaption".split()
+)
+# Elements holding the main content when a page marks it
+MAIN_TAGS = frozenset(("main", "article"))
+# Pages fetched between two sweeps of the page cache
+PRUNE_EVERY = 256
+
+
+class BlockedAddressError(Exception):
+    """Raised for a request to a host with a non-public address."""
+
+
+def _is_public(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+async def check_public_host(host: str):
+    """
+    Check that every address of a host is public.
+
+    Raises:
+        BlockedAddressError: If one is loopback, private, link-local or
+            otherwise not globally routable.
+        OSError: If the host cannot be resolved.
+    """
+    try:
+        ipaddress.ip_address(host)
+        addresses = [host]
+    except ValueError:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, None)
+        addresses = [info[4][0] for info in infos]
+    for address in addresses:
+        if not _is_public(address):
+            raise BlockedAddressError(
+                f"{host} has the non-public address {address}"
+            )
+
+
+class TextExtractor(HTMLParser):
+    """
+    Incremental extractor of a page's title and main text. Feed it
+    decoded chunks as they arrive; only the extracted text is kept, up
+    to max_chars.
+
+    Text inside <main> or <article> is preferred over the rest of the
+    body when there is enough of it.
+    """
+
+    def __init__(self, max_chars: int = 200000):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.title = ""
+        self._parts: List[str] = []
+        self._main_parts: List[str] = []
+        self._chars = 0
+        self._skip_depth = 0
+        self._main_depth = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag: str, attrs):
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in MAIN_TAGS:
+            self._main_depth += 1
+        elif tag == "title":
+            self._in_title = True
+        if tag in BLOCK_TAGS:
+            self._add("\n")
+
+    def handle_endtag(self, tag: str):
+        if tag in SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in MAIN_TAGS:
+            self._main_depth = max(0, self._main_depth - 1)
+        elif tag == "title":
+            self._in_title = False
+        if tag in BLOCK_TAGS:
+            self._add("\n")
+
+    def handle_data(self, data: str):
+        if self._in_title:
+            self.title += data
+        elif not self._skip_depth:
+            self._add(data)
+
+    def _add(self, text: str):
+        if self._chars >= self.max_chars:
+            return
+        self._chars += len(text)
+        self._parts.append(text)
+        if self._main_depth:
+            self._main_parts.append(text)
+
+    def text(self) -> str:
+        main = _normalize("".join(self._main_parts))
+        if len(main) >= 200:
+            return main
+        return _normalize("".join(self._parts))
+
+
+class PlainTextExtractor:
+    """Extractor for text/plain and other textual bodies."""
+
+    def __init__(self, max_chars: int = 200000):
+        self.max_chars = max_chars
+        self.title = ""
+        self._parts: List[str] = []
+        self._chars = 0
+
+    def feed(self, data: str):
+        if self._chars < self.max_chars:
+            self._parts.append(data)
+            self._chars += len(data)
+
+    def close(self):
+        pass
+
+    def text(self) -> str:
+        return "".join(self._parts)[: self.max_chars].strip()
+
+
+_BLANK_LINES = re.compile(r"\n\s*\n+")
+
+
+def _normalize(text: str) -> str:
+    lines = (" ".join(line.split()) for line in text.split("\n"))
+    return _BLANK_LINES.sub("\n\n", "\n".join(lines)).strip()
+
+
+class Page:
+    """
+    A fetched page.
+
+    Args:
+        url (str): Requested URL.
+        final_url (str): URL after redirects.
+        title (str): Page title, may be empty.
+        text (str): Extracted text.
+        source (Optional[str]): "fetched", "fresh" (cache) or
+            "revalidated" (cache, confirmed by the server).
+        error (Optional[str]): Why the page could not be read.
+        truncated (bool): Whether the body exceeded max_page_bytes.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        final_url: str = "",
+        title: str = "",
+        text: str = "",
+        source: Optional[str] = None,
+        error: Optional[str] = None,
+        truncated: bool = False,
+    ):
+        self.url = url
+        self.final_url = final_url or url
+        self.title = title
+        self.text = text
+        self.source = source
+        self.error = error
+        self.truncated = truncated
+
+    def to_text(self, rank: int, max_chars: int) -> str:
+        lines = [f"[{rank}] {self.title or self.final_url}"]
+        lines.append(f"Source: {self.final_url}")
+        if self.error:
+            lines.append(f"Error: {self.error}")
+            return "\n".join(lines)
+        text = self.text
+        if len(text) > max_chars:
+            text = (
+                text[:max_chars]
+                + f"\n[... {len(self.text) - max_chars} more characters]"
+            )
+        lines.append(text)
+        return "\n".join(lines)
+
+
+class PageCache:
+    """
+    On-disk cache of pages: <key>.raw (body), <key>.txt (extracted
+    text) and <key>.json (validators and metadata), where key is the
+    SHA-256 of the URL. The metadata file is written last, so an entry
+    is complete once it exists.
+
+    Args:
+        path (str): Cache directory.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def prune(self, ttl_seconds: float, max_bytes: int) -> int:
+        """
+        Remove entries not written for ttl_seconds, then the oldest
+        until the cache holds at most max_bytes; return how many.
+        Temporary files of downloads are only removed by age.
+        """
+        cutoff = time.time() - ttl_seconds
+        # base path -> [last written, bytes]
+        entries: Dict[str, List[float]] = {}
+        try:
+            shards = [e for e in os.scandir(self.path) if e.is_dir()]
+        except FileNotFoundError:
+            return 0
+        for shard in shards:
+            try:
+                files = list(os.scandir(shard.path))
+            except FileNotFoundError:
+                continue
+            for entry in files:
+                try:
+                    stat = entry.stat()
+                    if entry.name.endswith(".tmp"):
+                        if stat.st_mtime < cutoff:
+                            os.remove(entry.path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                base = os.path.join(
+                    shard.path, entry.name.partition(".")[0]
+                )
+                written, size = entries.get(base, (0, 0))
+                entries[base] = [
+                    max(written, stat.st_mtime),
+                    size + stat.st_size,
+                ]
+        total = sum(size for _, size in entries.values())
+        removed = 0
+        for base, (written, size) in sorted(
+            entries.items(), key=lambda item: item[1][0]
+        ):
+            if written >= cutoff and total <= max_bytes:
+                break
+            # Metadata first, so the entry is incomplete from then on
+            for suffix in (".json", ".txt", ".raw"):
+                try:
+                    os.remove(base + suffix)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            removed += 1
+        return removed
+
+    def _base(self, url: str) -> str:
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.path, key[:2], key)
+
+    def load(self, url: str) -> Optional[Dict]:
+        try:
+            with open(self._base(url) + ".json") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def page(self, url: str, meta: Dict, source: str) -> Page:
+        with open(self._base(url) + ".txt", encoding="utf-8") as f:
+            text = f.read()
+        return Page(
+            url,
+            meta["final_url"],
+            meta["title"],
+            text,
+            source,
+            truncated=meta["truncated"],
+        )
+
+    def open_raw(self, url: str):
+        """Temporary file for a body being downloaded."""
+        base = self._base(url)
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        return open(f"{base}.raw.{os.getpid()}.{id(self)}.tmp", "wb")
+
+    def commit(self, url: str, raw_file, text: str, meta: Dict):
+        base = self._base(url)
+        os.replace(raw_file.name, base + ".raw")
+        self._write(base + ".txt", text)
+        self._write(base + ".json", json.dumps(meta))
+
+    def touch(self, url: str, meta: Dict):
+        """Mark a revalidated entry as fresh again."""
+        self._write(
+            self._base(url) + ".json",
+            json.dumps({**meta, "fetched_at": time.time()}),
+        )
+
+    def _write(self, path: str, content: str):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp, path)
+
+
+class Fetcher:
+    """
+    Concurrent page fetcher bound to one event loop.
+
+    Args:
+        cache_dir (str): Page cache directory.
+        max_connections (int): Connections of the pool.
+        max_connections_per_host (int): Requests to one host at once.
+        timeout (float): Seconds allowed per page, including the wait
+            for a host slot.
+        max_page_bytes (int): Bytes of a body read at most.
+        max_age_seconds (float): Age until a cached page is
+            revalidated.
+        user_agent (str): User-Agent header.
+        allow_private_addresses (bool): Also fetch from loopback,
+            private and link-local addresses.
+        cache_ttl_seconds (float): Age after which a page not
+            revalidated is removed from the cache.
+        cache_max_bytes (int): Size the page cache is pruned to.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = ".cache/pages",
+        max_connections: int = 100,
+        max_connections_per_host: int = 4,
+        timeout: float = 20,
+        max_page_bytes: int = 5000000,
+        max_age_seconds: float = 3600,
+        user_agent: str = "deep-research-agent/0.1",
+        allow_private_addresses: bool = False,
+        cache_ttl_seconds: float = 604800,
+        cache_max_bytes: int = 1073741824,
+    ):
+        self.cache = PageCache(cache_dir)
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout = timeout
+        self.max_page_bytes = max_page_bytes
+        self.max_age_seconds = max_age_seconds
+        self.allow_private_addresses = allow_private_addresses
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self.cache_max_bytes = cache_max_bytes
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            timeout=httpx.Timeout(timeout),
+            follow_redirects=True,
+            headers={"User-Agent": user_agent},
+            # Runs for redirects too
+            event_hooks={"request": [self._check_request]},
+        )
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._fetched = 0
+        self._pruning: Optional[asyncio.Future] = None
+
+    @classmethod
+    def from_config(cls) -> "Fetcher":
+        return cls(
+            cache_dir=_fetch_config.get("cache_dir", ".cache/pages"),
+            max_connections=_fetch_config.get("max_connections", 100),
+            max_connections_per_host=_fetch_config.get(
+                "max_connections_per_host", 4
+            ),
+            timeout=_fetch_config.get("timeout", 20),
+            max_page_bytes=_fetch_config.get("max_page_bytes", 5000000),
+            max_age_seconds=_fetch_config.get("max_age_seconds", 3600),
+            user_agent=_fetch_config.get(
+                "user_agent", "deep-research-agent/0.1"
+            ),
+            allow_private_addresses=_fetch_config.get(
+                "allow_private_addresses", False
+            ),
+            cache_ttl_seconds=_fetch_config.get(
+                "cache_ttl_seconds", 604800
+            ),
+            cache_max_bytes=_fetch_config.get(
+                "cache_max_bytes", 1073741824
+            ),
+        )
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def _check_request(self, request: httpx.Request):
+        if not self.allow_private_addresses:
+            await check_public_host(request.url.host)
+
+    async def fetch_many(self, urls: List[str]) -> List[Page]:
+        """Fetch pages concurrently; results are in the order of urls."""
+        return await asyncio.gather(*(self.fetch(url) for url in urls))
+
+    async def fetch(self, url: str) -> Page:
+        """
+        Read a page from the cache or the web. Never raises for network
+        or HTTP errors; they are reported in Page.error.
+        """
+        future = self._in_flight.get(url)
+        if future is not None:
+            return await asyncio.shield(future)
+        future = asyncio.ensure_future(self._fetch(url))
+        self._in_flight[url] = future
+        future.add_done_callback(
+            lambda _: self._in_flight.pop(url, None)
+        )
+        return await asyncio.shield(future)
+
+    async def _fetch(self, url: str) -> Page:
+        with trace.span("fetch.page", url=url) as span:
+            try:
+                page = await self._read(url)
+            except (
+                httpx.HTTPError,
+                httpx.InvalidURL,
+                BlockedAddressError,
+                TimeoutError,
+                OSError,
+                LookupError,
+            ) as e:
+                page = Page(url, error=f"{type(e).__name__}: {e}")
+            result = page.source or "error"
+            span.set(result=result, text_chars=len(page.text))
+            metrics.FETCHES.labels(result).inc()
+            return page
+
+    async def _read(self, url: str) -> Page:
+        request = httpx.URL(url)
+        if request.scheme not in ("http", "https"):
+            return Page(
+                url, error="Only http and https URLs are fetched"
+            )
+        meta = self.cache.load(url)
+        if (
+            meta is not None
+            and time.time() - meta["fetched_at"] < self.max_age_seconds
+        ):
+            return self.cache.page(url, meta, FRESH)
+        headers = {}
+        if meta is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        host = self._hosts.get(request.netloc)
+        if host is None:
+            host = self._hosts[request.netloc] = asyncio.Semaphore(
+                self.max_connections_per_host
+            )
+        async with asyncio.timeout(self.timeout), host:
+            async with self.client.stream(
+                "GET", url, headers=headers
+            ) as response:
+                if response.status_code == 304 and meta is not None:
+                    self.cache.touch(url, meta)
+                    return self.cache.page(url, meta, REVALIDATED)
+                if response.status_code >= 400:
+                    return Page(
+                        url,
+                        str(response.url),
+                        error=f"HTTP {response.status_code}",
+                    )
+                return await self._download(url, response)
+
+    async def _download(
+        self, url: str, response: httpx.Response
+    ) -> Page:
+        content_type = response.headers.get("content-type", "")
+        media_type = content_type.partition(";")[0].strip().lower()
+        if media_type in ("", "text/html", "application/xhtml+xml"):
+            extractor = TextExtractor()
+        elif media_type.startswith("text/") or media_type.endswith(
+            ("json", "xml")
+        ):
+            extractor = PlainTextExtractor()
+        else:
+            return Page(
+                url,
+                str(response.url),
+                error=f"Unsupported content type {media_type}",
+            )
+
+        decoder = codecs.getincrementaldecoder(
+            response.encoding or "utf-8"
+        )(errors="replace")
+        size = 0
+        truncated = False
+        with self.cache.open_raw(url) as raw:
+            try:
+                async for chunk in response.aiter_bytes():
+                    raw.write(chunk)
+                    extractor.feed(decoder.decode(chunk))
+                    size += len(chunk)
+                    if size >= self.max_page_bytes:
+                        truncated = True
+                        break
+                extractor.feed(decoder.decode(b"", final=True))
+                extractor.close()
+            except BaseException:
+                raw.close()
+                os.remove(raw.name)
+                raise
+        text = extractor.text()
+        title = " ".join(extractor.title.split())
+        self.cache.commit(
+            url,
+            raw,
+            text,
+            {
+                "url": url,
+                "final_url": str(response.url),
+                "title": title,
+                "content_type": content_type,
+                "etag": response.headers.get("etag"),
+                "last_modified": response.headers.get("last-modified"),
+                "fetched_at": time.time(),
+                "bytes": size,
+                "truncated": truncated,
+            },
+        )
+        self._prune()
+        return Page(
+            url,
+            str(response.url),
+            title,
+            text,
+            FETCHED,
+            None,
+            truncated,
+        )
+
+    def _prune(self):
+        # Every PRUNE_EVERY pages, in the background
+        self._fetched += 1
+        if self._fetched % PRUNE_EVERY != 1 or (
+            self._pruning is not None and not self._pruning.done()
+        ):
+            return
+        self._pruning = asyncio.ensure_future(
+            asyncio.to_thread(
+                self.cache.prune,
+                self.cache_ttl_seconds,
+                self.cache_max_bytes,
+            )
+        )
+
+
+_fetchers: (
+    "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Fetcher]"
+) = weakref.WeakKeyDictionary()
+
+
+def get_fetcher() -> Fetcher:
+    """Get the fetcher of the running event loop."""
+    loop = asyncio.get_running_loop()
+    fetcher = _fetchers.get(loop)
+    if fetcher is None:
+        fetcher = _fetchers[loop] = Fetcher.from_config()
+    return fetcher
+
+
+async def close_fetcher():
+    """Close the connection pool owned by the running event loop."""
+    fetcher = _fetchers.pop(asyncio.get_running_loop(), None)
+    if fetcher is not None:
+        await fetcher.close()
+
+
+async def fetch_handler(urls: Union[str, List[str]]) -> str:
+    """
+    Read web pages.
+
+    Args:
+        urls (Union[str, List[str]]): URLs to read.
+
+    Returns:
+        str: Title, source and text of each page, numbered for citing.
+    """
+    if isinstance(urls, str):
+        urls = [urls]
+    urls = list(dict.fromkeys(urls))[
+        : _fetch_config.get("max_urls", 10)
+    ]
+    pages = await get_fetcher().fetch_many(urls)
+    max_chars = _fetch_config.get("max_chars_per_page", 8000)
+    return "\n\n".join(
+        page.to_text(rank, max_chars)
+        for rank, page in enumerate(pages, start=1)
+    )
+
+
+register_tool(
+    name="fetch",
+    description="Read the main text of web pages, given their URLs",
+    handler=fetch_handler,
+    parameters={
+        "type": "object",
+        "properties": {
+            "urls": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "URLs of the pages to read",
+            }
+        },
+        "required": ["urls"],
+    },
+    timeout=60,
+    max_concurrency=8,
+)
@@ -0,0 +1,158 @@
+"""
+Benchmark the fetch tool against local page servers.
+
+Starts one PageServer per host and reads the same pages four ways:
+
+    sequential   one page at a time with an empty cache, the cost of a
+                 naive per-URL fetch inside a tool call
+    concurrent   all pages in one fetch_many with an empty cache
+    cached       again, served fresh from the page cache
+    revalidated  again with max_age_seconds 0, answered by 304s
+
+For each it prints the wall time, pages per second, the most requests
+one host saw at once and the peak Python memory, which stays well below
+the total page size because bodies are streamed to disk.
+
+Run from src/:
+    python -m api.tools.fetch_bench --hosts 4 --pages 40 --latency 0.1
+"""
+
+import argparse
+import asyncio
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from api.tools.fetch import Fetcher
+from api.tools.page_server import PageServer
+
+
+async def _read(fetcher: Fetcher, urls: list, sequential: bool) -> list:
+    if sequential:
+        return [await fetcher.fetch(url) for url in urls]
+    return await fetcher.fetch_many(urls)
+
+
+async def _scenario(
+    servers: list,
+    urls: list,
+    cache_dir: str,
+    per_host: int,
+    max_age: float,
+    sequential: bool = False,
+) -> dict:
+    for server in servers:
+        server.max_in_flight = 0
+    fetcher = Fetcher(
+        cache_dir=cache_dir,
+        max_connections_per_host=per_host,
+        max_age_seconds=max_age,
+        # The page servers listen on loopback
+        allow_private_addresses=True,
+    )
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        pages = await _read(fetcher, urls, sequential)
+    finally:
+        await fetcher.close()
+    wall = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    errors = [page.error for page in pages if page.error]
+    if errors:
+        raise RuntimeError(f"Fetch failed: {errors[0]}")
+    return {
+        "wall": wall,
+        "sources": {page.source for page in pages},
+        "max_per_host": max(server.max_in_flight for server in servers),
+        "peak_mb": peak / 2**20,
+    }
+
+
+async def _bench(args):
+    servers = [
+        PageServer(latency=args.latency, page_bytes=args.page_bytes)
+        for _ in range(args.hosts)
+    ]
+    for server in servers:
+        await server.start()
+    urls = [
+        f"{servers[page % args.hosts].base_url}/page/{page}"
+        for page in range(args.pages)
+    ]
+    cache_dir = tempfile.mkdtemp(prefix="fetch_bench_")
+    cold_dir = tempfile.mkdtemp(prefix="fetch_bench_cold_")
+    try:
+        scenarios = {
+            "sequential": _scenario(
+                servers,
+                urls,
+                cold_dir,
+                args.per_host,
+                3600,
+                sequential=True,
+            ),
+            "concurrent": _scenario(
+                servers, urls, cache_dir, args.per_host, 3600
+            ),
+            "cached": _scenario(
+                servers, urls, cache_dir, args.per_host, 3600
+            ),
+            "revalidated": _scenario(
+                servers, urls, cache_dir, args.per_host, 0
+            ),
+        }
+        print(
+            f"{args.pages} pages of {args.page_bytes // 1000} kB on "
+            f"{args.hosts} hosts, {args.latency * 1000:.0f} ms per "
+            f"response, {args.per_host} connections per host\n"
+        )
+        print(
+            f"{'scenario':>12} | {'seconds':>7} | {'pages/s':>7} | "
+            f"{'max/host':>8} | {'peak MB':>7} | source"
+        )
+        for name, scenario in scenarios.items():
+            result = await scenario
+            print(
+                f"{name:>12} | {result['wall']:>7.3f} | "
+                f"{args.pages / result['wall']:>7.0f} | "
+                f"{result['max_per_host']:>8} | "
+                f"{result['peak_mb']:>7.1f} | "
+                f"{','.join(sorted(result['sources']))}"
+            )
+        print(
+            f"\n304 responses: "
+            f"{sum(server.not_modified for server in servers)}"
+        )
+    finally:
+        for server in servers:
+            await server.stop()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        shutil.rmtree(cold_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch tool benchmark")
+    parser.add_argument("--hosts", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--per-host", type=int, default=4)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.1,
+        help="Seconds per response",
+    )
+    parser.add_argument(
+        "--page-bytes",
+        type=int,
+        default=500000,
+        help="Text size of each page",
+    )
+    args = parser.parse_args()
+    asyncio.run(_bench(args))
+
+
+if __name__ == "__main__":
+    main()
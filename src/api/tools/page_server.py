@@ -0,0 +1,239 @@
+"""
+Local web server of synthetic pages for testing and benchmarking the
+fetch tool.
+
+    /page/<n>      HTML article of page_bytes bytes, sent in chunks
+    /text/<n>      the same text as text/plain
+    /redirect/<n>  302 to /page/<n>
+    /status/<code> empty response with that status
+
+Pages carry an ETag and Last-Modified and are answered with 304 Not
+Modified when a request's validators match. Every response waits
+latency seconds first. The server counts requests, 304s and the most
+requests it handled at once. HTTP/1.1 keep-alive only, no external
+dependencies.
+
+Run from src/:
+    python -m api.tools.page_server --port 8901 --latency 0.1
+"""
+
+import argparse
+import asyncio
+from email.utils import formatdate
+
+_REASONS = {
+    200: "OK",
+    302: "Found",
+    304: "Not Modified",
+    404: "Not Found",
+    500: "Internal Server Error",
+}
+
+CHUNK_BYTES = 16384
+
+
+def _page_text(number: int, size: int) -> str:
+    sentence = (
+        f"Page {number} reports that revenue grew by {number % 97} "
+        "percent as data center demand kept rising. "
+    )
+    return (sentence * (size // len(sentence) + 1))[:size]
+
+
+def _page_html(number: int, size: int) -> bytes:
+    text = _page_text(number, size)
+    paragraphs = "".join(
+        f"<p>{text[start:start + 2000]}</p>\n"
+        for start in range(0, len(text), 2000)
+    )
+    return (
+        "<!DOCTYPE html><html><head>"
+        f"<title>Page {number}</title>"
+        "<script>var tracking = 'not content';</script>"
+        "<style>p { margin: 0 }</style></head><body>"
+        "<nav><a href='/'>Home</a> | <a href='/about'>About</a></nav>"
+        f"<article><h1>Page {number}</h1>\n{paragraphs}</article>"
+        "<footer>Copyright</footer></body></html>"
+    ).encode()
+
+
+class PageServer:
+    """
+    Server of synthetic pages.
+
+    Args:
+        host (str): Interface to bind.
+        port (int): Port to bind, 0 picks a free one.
+        latency (float): Seconds to wait before each response.
+        page_bytes (int): Size of the text of each page.
+        version (str): Part of every ETag; change it to make cached
+            pages stale.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.05,
+        page_bytes: int = 20000,
+        version: str = "1",
+    ):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.page_bytes = page_bytes
+        self.version = version
+        self.last_modified = formatdate(usegmt=True)
+        self.requests_served = 0
+        self.not_modified = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._server = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(
+            self._handle, self.host, self.port
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def serve_forever(self):
+        await self.start()
+        print(f"Page server listening on {self.base_url}")
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode().partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                _, path, _ = request_line.decode().split(" ", 2)
+
+                self.in_flight += 1
+                self.max_in_flight = max(
+                    self.max_in_flight, self.in_flight
+                )
+                try:
+                    if self.latency:
+                        await asyncio.sleep(self.latency)
+                    await self._respond(writer, path, headers)
+                finally:
+                    self.in_flight -= 1
+                self.requests_served += 1
+        except (
+            ConnectionError,
+            asyncio.IncompleteReadError,
+            asyncio.CancelledError,
+        ):
+            # Client went away or the server is shutting down
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, path: str, headers: dict):
+        kind, _, argument = path.strip("/").partition("/")
+        if kind == "status" and argument.isdigit():
+            writer.write(_head(int(argument), {"Content-Length": "0"}))
+            return await writer.drain()
+        if kind == "redirect" and argument.isdigit():
+            writer.write(
+                _head(
+                    302,
+                    {
+                        "Location": f"/page/{argument}",
+                        "Content-Length": "0",
+                    },
+                )
+            )
+            return await writer.drain()
+        if kind not in ("page", "text") or not argument.isdigit():
+            writer.write(_head(404, {"Content-Length": "0"}))
+            return await writer.drain()
+
+        number = int(argument)
+        etag = f'"{self.version}-{kind}-{number}"'
+        validators = {"ETag": etag, "Last-Modified": self.last_modified}
+        if headers.get("if-none-match") == etag:
+            self.not_modified += 1
+            writer.write(_head(304, validators))
+            return await writer.drain()
+        if kind == "page":
+            body = _page_html(number, self.page_bytes)
+            content_type = "text/html; charset=utf-8"
+        else:
+            body = _page_text(number, self.page_bytes).encode()
+            content_type = "text/plain; charset=utf-8"
+        writer.write(
+            _head(
+                200,
+                {
+                    **validators,
+                    "Content-Type": content_type,
+                    "Transfer-Encoding": "chunked",
+                },
+            )
+        )
+        for start in range(0, len(body), CHUNK_BYTES):
+            chunk = body[start : start + CHUNK_BYTES]
+            writer.write(
+                f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n"
+            )
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+def _head(status: int, headers: dict) -> bytes:
+    head = f"HTTP/1.1 {status} {_REASONS.get(status, 'Error')}\r\n"
+    for key, value in headers.items():
+        head += f"{key}: {value}\r\n"
+    return (head + "Connection: keep-alive\r\n\r\n").encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Local server of synthetic web pages"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.05,
+        help="Seconds per request",
+    )
+    parser.add_argument(
+        "--page-bytes",
+        type=int,
+        default=20000,
+        help="Text size of each page",
+    )
+    args = parser.parse_args()
+    server = PageServer(
+        args.host, args.port, args.latency, args.page_bytes
+    )
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@
 Tool registry - separate from the main tools module to avoid circular imports.
 """
 
+import inspect
 from typing import Dict, Callable, Optional, Any
 
 tool_registry: Dict[str, Dict] = {}
@@ -12,11 +13,21 @@ def register_tool(
     description: str,
     handler: Callable,
     parameters: Optional[Dict] = None,
+    timeout: Optional[float] = None,
+    max_concurrency: Optional[int] = None,
+    cacheable: bool = False,
+    cache_ttl: float = 300,
+    max_output_chars: Optional[int] = None,
 ):
     """
     Register a tool with a name, description, handler function, and
     optional parameters schema.
 
+    Handlers may be plain functions or coroutine functions. Plain
+    functions are run on the shared tool thread pool. Either may also
+    be a generator yielding the result in chunks, which are consumed
+    as they come (see api.tools.tool_output).
+
     Args:
         name (str): The name of the tool.
         description (str): A brief description of what the tool does.
@@ -24,6 +35,16 @@ def register_tool(
         functionality.
         parameters (Optional[Dict]): OpenAI-compatible parameters schema.
         If None, defaults to simple query parameter.
+        timeout (Optional[float]): Seconds before a call is abandoned.
+        If None, uses tool_executor.default_timeout from config.
+        max_concurrency (Optional[int]): Maximum number of calls of this
+        tool running at once. If None, only the thread pool bounds it.
+        cacheable (bool): Memoize results by arguments (see
+        api.tools.tool_cache); only for tools without side effects.
+        cache_ttl (float): Seconds a memoized result is reused.
+        max_output_chars (Optional[int]): Longest result given to the
+        model whole; longer ones are stored and previewed. If None, uses
+        tool_outputs.max_chars from config; 0 means no limit.
 
     Raises:
         ValueError: If a tool with the same name is already registered.
@@ -48,10 +69,11 @@ def register_tool(
         "description": description,
         "handler": handler,
         "parameters": parameters,
+        "is_async": inspect.iscoroutinefunction(handler)
+        or inspect.isasyncgenfunction(handler),
+        "timeout": timeout,
+        "max_concurrency": max_concurrency,
+        "cacheable": cacheable,
+        "cache_ttl": cache_ttl,
+        "max_output_chars": max_output_chars,
     }
-
-    # Debug output
-    print(
-        f"DEBUG: Registered tool '{name}' with description: {description}"
-    )
-    print(f"DEBUG: Total tools registered: {len(tool_registry)}")
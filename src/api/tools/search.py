@@ -1,23 +1,56 @@
+"""
+Search tool over the local document index (see api.tools.search_index).
+
+Queries are scored with BM25; when the search config names an
+embedding model and the index holds embeddings, the query is embedded
+too and both rankings are fused. Results are the top-k documents with
+a citation and a snippet each.
+"""
+
+import asyncio
+
+from api.config_loader import load_default_config
+from api.models.embeddings import embed_texts
 from api.tools.registry import register_tool
 
+_search_config = load_default_config().get("search", {})
 
-def search_handler(query: str) -> str:
+
+async def search_handler(query: str) -> str:
     """
-    Simulate a search tool that returns a fixed response.
+    Search the local index.
 
     Args:
         query (str): The search query.
 
     Returns:
-        str: A simulated search result.
+        str: Numbered results with title, source and snippet, citable
+            as [n].
     """
-    return f"Simulated search result for query: {query}"
+    # Imported here so the index module can run as a script after
+    # api.tools has loaded this one
+    from api.tools.search_index import get_search_index
+
+    index = get_search_index()
+    vector = None
+    embedding = _search_config.get("embedding")
+    if embedding and index.has_vectors:
+        vector = (await embed_texts([query], embedding))[0]
+    results = await asyncio.to_thread(
+        index.search, query, _search_config.get("top_k", 5), vector
+    )
+    if not results:
+        return f"No results for query: {query}"
+    return f"Results for query: {query}\n\n" + "\n\n".join(
+        result.to_text(rank)
+        for rank, result in enumerate(results, start=1)
+    )
 
 
 # Register with explicit parameters schema
 register_tool(
     name="search",
-    description="Search the web for information",
+    description="Search the document index for information",
     handler=search_handler,
     parameters={
         "type": "object",
@@ -29,4 +62,8 @@ register_tool(
         },
         "required": ["query"],
     },
+    timeout=30,
+    max_concurrency=8,
+    cacheable=True,
+    cache_ttl=3600,
 )
@@ -0,0 +1,1026 @@
+"""
+Local document index behind the search tool: BM25 over an inverted
+index, plus optional vector retrieval over document embeddings.
+
+An index is a directory of immutable segments and a manifest naming
+them. Ingestion is incremental: every batch of documents is written as
+new segments, a document whose id was ingested before replaces the old
+copy, and merge() folds all segments into one. Segment files are
+memory-mapped, so opening an index reads no postings, and uvicorn
+workers searching the same index share its pages through the OS page
+cache. Searches pick up a new manifest as soon as it is written.
+
+Documents are JSON objects with "text" and optional "id", "title",
+"url" and "embedding". Vector retrieval needs numpy and an index with
+embeddings; its results are fused with the BM25 ones by reciprocal
+rank. Without numpy, BM25 scoring runs in pure Python.
+
+Run from src/:
+    python -m api.tools.search_index ingest .cache/search_index docs.jsonl
+    python -m api.tools.search_index search .cache/search_index "query"
+    python -m api.tools.search_index merge .cache/search_index
+"""
+
+import argparse
+import bisect
+import fcntl
+import hashlib
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+from array import array
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from api.config_loader import load_default_config
+
+_search_config = load_default_config().get("search", {})
+
+# numpy, imported by _load_numpy() when an index is first opened
+np = None
+_numpy_probed = False
+
+MANIFEST = "manifest.json"
+# Candidates taken from each retriever before rank fusion
+FUSION_CANDIDATES = 50
+# Reciprocal rank fusion constant
+RRF_K = 60
+
+_TOKEN = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or "
+    "that the this to was were what when where which who will with".split()
+)
+
+
+def _load_numpy():
+    """numpy, imported on first call; None if it is not installed."""
+    global np, _numpy_probed
+    if not _numpy_probed:
+        _numpy_probed = True
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        np = numpy
+    return np
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens of a text, without stopwords."""
+    return [
+        token
+        for token in _TOKEN.findall(text.lower())
+        if token not in _STOPWORDS
+    ]
+
+
+def document_id(document: Dict) -> str:
+    """The document's id, else its URL, else a hash of its text."""
+    return str(
+        document.get("id")
+        or document.get("url")
+        or hashlib.sha256(document["text"].encode()).hexdigest()[:32]
+    )
+
+
+def make_snippet(
+    text: str, terms: Iterable[str], words: int = 40
+) -> str:
+    """
+    The window of a text with the most query terms in it.
+
+    Args:
+        text (str): Document text.
+        terms (Iterable[str]): Query tokens.
+        words (int): Length of the snippet in words.
+
+    Returns:
+        str: The snippet, with "..." where the text was cut.
+    """
+    tokens = text.split()
+    if len(tokens) <= words:
+        return " ".join(tokens)
+    terms = set(terms)
+    hits = [
+        index
+        for index, token in enumerate(tokens)
+        if terms.intersection(_TOKEN.findall(token.lower()))
+    ]
+    start = 0
+    if hits:
+        best = max(
+            range(len(hits)),
+            key=lambda i: bisect.bisect_left(hits, hits[i] + words) - i,
+        )
+        start = max(
+            0, min(hits[best] - words // 4, len(tokens) - words)
+        )
+    end = start + words
+    return (
+        ("... " if start else "")
+        + " ".join(tokens[start:end])
+        + (" ..." if end < len(tokens) else "")
+    )
+
+
+class SearchResult:
+    """
+    One search hit.
+
+    Args:
+        doc_id (str): Document id.
+        title (str): Document title, may be empty.
+        url (str): Source of the document, may be empty.
+        snippet (str): Passage of the text matching the query.
+        score (float): BM25 score, or fused score for hybrid searches.
+    """
+
+    def __init__(
+        self,
+        doc_id: str,
+        title: str,
+        url: str,
+        snippet: str,
+        score: float,
+    ):
+        self.doc_id = doc_id
+        self.title = title
+        self.url = url
+        self.snippet = snippet
+        self.score = score
+
+    def to_text(self, rank: int) -> str:
+        lines = [f"[{rank}] {self.title or self.doc_id}"]
+        if self.url:
+            lines.append(f"Source: {self.url}")
+        lines.append(f"Snippet: {self.snippet}")
+        return "\n".join(lines)
+
+
+def _map(path: str):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class _Segment:
+    """
+    Read side of one immutable segment. Postings of term i are
+    postings.bin[postings.idx[i]:postings.idx[i + 1]] (uint32 local doc
+    ids) with their term frequencies in tfs.bin (uint16); terms.bin
+    holds the sorted UTF-8 terms at the offsets of terms.idx.
+    """
+
+    def __init__(self, path: str, deleted: Iterable[int]):
+        self.name = os.path.basename(path)
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        self.docs = meta["docs"]
+        self.tokens = meta["tokens"]
+        self.terms = meta["terms"]
+        self.dim = meta["dim"]
+        self.deleted = frozenset(deleted)
+        _load_numpy()
+
+        def mapped(name: str, code: str):
+            return memoryview(_map(os.path.join(path, name))).cast(code)
+
+        self._term_bytes = _map(os.path.join(path, "terms.bin"))
+        self._term_offsets = mapped("terms.idx", "Q")
+        self._postings = mapped("postings.idx", "Q")
+        self._doc_ids = mapped("postings.bin", "I")
+        self._tfs = mapped("tfs.bin", "H")
+        self.lengths = mapped("lengths.bin", "I")
+        self._store = _map(os.path.join(path, "store.jsonl"))
+        self._store_offsets = mapped("store.idx", "Q")
+        self._vector_values = None
+        if self.dim:
+            self._vector_values = mapped("vectors.f32", "f")
+        self.vectors = None
+        if np is not None:
+            self._doc_ids_np = np.frombuffer(self._doc_ids, np.uint32)
+            self._tfs_np = np.frombuffer(self._tfs, np.uint16)
+            self._lengths_np = np.frombuffer(self.lengths, np.uint32)
+            self._deleted_np = np.fromiter(
+                self.deleted, np.int64, len(self.deleted)
+            )
+            if self.dim:
+                self.vectors = np.frombuffer(
+                    self._vector_values, np.float32
+                ).reshape(self.docs, self.dim)
+
+    @property
+    def live_docs(self) -> int:
+        return self.docs - len(self.deleted)
+
+    def term(self, index: int) -> bytes:
+        return self._term_bytes[
+            self._term_offsets[index] : self._term_offsets[index + 1]
+        ]
+
+    def postings_range(self, term: bytes) -> Optional[Tuple[int, int]]:
+        """Start and end of a term's postings, None if it is absent."""
+        low, high = 0, self.terms - 1
+        while low <= high:
+            middle = (low + high) // 2
+            candidate = self.term(middle)
+            if candidate < term:
+                low = middle + 1
+            elif candidate > term:
+                high = middle - 1
+            else:
+                return (
+                    self._postings[middle],
+                    self._postings[middle + 1],
+                )
+        return None
+
+    def postings(self, start: int, end: int):
+        return self._doc_ids[start:end], self._tfs[start:end]
+
+    def document(self, local: int) -> Dict:
+        return json.loads(
+            self._store[
+                self._store_offsets[local] : self._store_offsets[
+                    local + 1
+                ]
+            ]
+        )
+
+    def raw_document(self, local: int) -> bytes:
+        return self._store[
+            self._store_offsets[local] : self._store_offsets[local + 1]
+        ]
+
+    def vector(self, local: int) -> List[float]:
+        return self._vector_values[
+            local * self.dim : (local + 1) * self.dim
+        ].tolist()
+
+    def bm25(
+        self,
+        weighted: List[Tuple[Tuple[int, int], float]],
+        c1: float,
+        c2: float,
+        limit: int,
+    ) -> List[Tuple[float, int]]:
+        """
+        Top (score, local id) pairs for terms given as (postings range,
+        idf * (k1 + 1)); a document's length norm is c1 + c2 * length.
+        """
+        if np is not None:
+            ids, contributions = [], []
+            for (start, end), weight in weighted:
+                term_ids = self._doc_ids_np[start:end]
+                tfs = self._tfs_np[start:end].astype(np.float32)
+                ids.append(term_ids)
+                contributions.append(
+                    weight
+                    * tfs
+                    / (tfs + c1 + c2 * self._lengths_np[term_ids])
+                )
+            scores = np.bincount(
+                np.concatenate(ids),
+                np.concatenate(contributions),
+                minlength=self.docs,
+            )
+            scores[self._deleted_np] = 0
+            return _top(scores, limit)
+
+        scores = {}
+        get = scores.get
+        lengths = self.lengths
+        for (start, end), weight in weighted:
+            for doc, tf in zip(*self.postings(start, end)):
+                scores[doc] = get(doc, 0.0) + weight * tf / (
+                    tf + c1 + c2 * lengths[doc]
+                )
+        for doc in self.deleted:
+            scores.pop(doc, None)
+        return heapq.nlargest(
+            limit, ((score, doc) for doc, score in scores.items())
+        )
+
+    def nearest(self, vector, limit: int) -> List[Tuple[float, int]]:
+        """Top (cosine similarity, local id) pairs for a unit vector."""
+        scores = self.vectors @ vector
+        # Documents without an embedding have a zero vector
+        scores[self._deleted_np] = 0
+        return _top(scores, limit)
+
+
+def _top(scores, limit: int) -> list:
+    # Selecting among the non-zero scores only; argpartition is slow
+    # on long runs of ties
+    candidates = np.flatnonzero(scores > 0)
+    if limit < len(candidates):
+        candidates = candidates[
+            np.argpartition(scores[candidates], -limit)[-limit:]
+        ]
+    return sorted(
+        ((float(scores[doc]), int(doc)) for doc in candidates),
+        reverse=True,
+    )
+
+
+def _unit(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+class _SegmentWriter:
+    """Writes one segment into a temporary directory, see _Segment."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._tmp = f"{path}.tmp"
+        shutil.rmtree(self._tmp, ignore_errors=True)
+        os.makedirs(self._tmp)
+        self.ids: List[str] = []
+        self.lengths = array("I")
+        self.dim: Optional[int] = None
+        self._store = open(self._file("store.jsonl"), "wb")
+        self._store_offsets = array("Q", [0])
+        self._vectors = open(self._file("vectors.f32"), "wb")
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self._tmp, name)
+
+    def add(
+        self,
+        doc_id: str,
+        stored: bytes,
+        length: int,
+        vector: Optional[List[float]],
+    ):
+        """Add a document; stored is its JSON line."""
+        if vector is not None:
+            if self.dim is None:
+                self.dim = len(vector)
+                # Documents before the first one with an embedding
+                self._vectors.write(bytes(4 * self.dim * len(self.ids)))
+            elif len(vector) != self.dim:
+                raise ValueError(
+                    f"Embedding of {doc_id} has {len(vector)} dimensions,"
+                    f" expected {self.dim}"
+                )
+        if self.dim is not None:
+            self._vectors.write(
+                array("f", vector or bytes(4 * self.dim)).tobytes()
+            )
+        self.ids.append(doc_id)
+        self.lengths.append(length)
+        self._store.write(stored)
+        self._store_offsets.append(
+            self._store_offsets[-1] + len(stored)
+        )
+
+    def write_postings(
+        self, postings: Iterable[Tuple[bytes, list, list]]
+    ):
+        """Write (term, doc ids, tfs) triples in term byte order."""
+        term_offsets = array("Q", [0])
+        postings_offsets = array("Q", [0])
+        with (
+            open(self._file("terms.bin"), "wb") as terms,
+            open(self._file("postings.bin"), "wb") as doc_ids,
+            open(self._file("tfs.bin"), "wb") as tfs,
+        ):
+            for term, ids, frequencies in postings:
+                terms.write(term)
+                term_offsets.append(term_offsets[-1] + len(term))
+                doc_ids.write(_as_bytes(ids, "I"))
+                tfs.write(_as_bytes(frequencies, "H"))
+                postings_offsets.append(postings_offsets[-1] + len(ids))
+        with open(self._file("terms.idx"), "wb") as f:
+            term_offsets.tofile(f)
+        with open(self._file("postings.idx"), "wb") as f:
+            postings_offsets.tofile(f)
+        self.terms = len(term_offsets) - 1
+
+    def close(self):
+        """Finish the segment and move it into place."""
+        self._store.close()
+        self._vectors.close()
+        if self.dim is None:
+            os.remove(self._file("vectors.f32"))
+        with open(self._file("store.idx"), "wb") as f:
+            self._store_offsets.tofile(f)
+        with open(self._file("lengths.bin"), "wb") as f:
+            self.lengths.tofile(f)
+        with open(self._file("ids.json"), "w") as f:
+            json.dump(self.ids, f)
+        with open(self._file("meta.json"), "w") as f:
+            json.dump(
+                {
+                    "docs": len(self.ids),
+                    "tokens": sum(self.lengths),
+                    "terms": self.terms,
+                    "dim": self.dim,
+                },
+                f,
+            )
+        os.replace(self._tmp, self.path)
+
+
+def _as_bytes(values, code: str) -> bytes:
+    if np is not None and isinstance(values, np.ndarray):
+        return values.astype(
+            {"I": np.uint32, "H": np.uint16}[code]
+        ).tobytes()
+    return array(code, values).tobytes()
+
+
+class SearchIndex:
+    """
+    A segmented BM25 and vector index in a directory. Searches may run
+    from any number of threads; ingestion and merges are serialized
+    across processes by a lock file.
+
+    Args:
+        path (str): Index directory, created on first ingestion.
+        k1 (float): BM25 term frequency saturation.
+        b (float): BM25 document length normalization.
+        segment_docs (int): Documents per segment written by ingestion.
+        snippet_words (int): Length of result snippets in words.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        k1: float = 1.2,
+        b: float = 0.75,
+        segment_docs: int = 100000,
+        snippet_words: int = 40,
+    ):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        _load_numpy()
+        self.segment_docs = segment_docs
+        self.snippet_words = snippet_words
+        self._segments: List[_Segment] = []
+        self._manifest_stat = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, path: Optional[str] = None) -> "SearchIndex":
+        """
+        The index of the search section of default_config.yaml.
+
+        Args:
+            path (Optional[str]): Directory overriding index_path.
+        """
+        return cls(
+            path=path
+            or _search_config.get("index_path", ".cache/search_index"),
+            k1=_search_config.get("k1", 1.2),
+            b=_search_config.get("b", 0.75),
+            segment_docs=_search_config.get("segment_docs", 100000),
+            snippet_words=_search_config.get("snippet_words", 40),
+        )
+
+    # Reading
+
+    def _read_manifest(self) -> Dict:
+        try:
+            with open(os.path.join(self.path, MANIFEST)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"next_segment": 0, "segments": []}
+
+    def segments(self) -> List[_Segment]:
+        """The current segments, reopened if the manifest changed."""
+        try:
+            stat = os.stat(os.path.join(self.path, MANIFEST))
+            stat = (stat.st_ino, stat.st_mtime_ns)
+        except FileNotFoundError:
+            stat = None
+        if stat == self._manifest_stat:
+            return self._segments
+        with self._lock:
+            if stat != self._manifest_stat:
+                opened = {
+                    (segment.name, segment.deleted): segment
+                    for segment in self._segments
+                }
+                segments = []
+                for entry in self._read_manifest()["segments"]:
+                    key = (entry["name"], frozenset(entry["deleted"]))
+                    segments.append(
+                        opened.get(key)
+                        or _Segment(
+                            os.path.join(self.path, entry["name"]),
+                            entry["deleted"],
+                        )
+                    )
+                self._segments = segments
+                self._manifest_stat = stat
+        return self._segments
+
+    @property
+    def docs(self) -> int:
+        return sum(segment.live_docs for segment in self.segments())
+
+    @property
+    def has_vectors(self) -> bool:
+        return np is not None and any(
+            segment.vectors is not None for segment in self.segments()
+        )
+
+    def search(
+        self,
+        query: str,
+        k: int = 5,
+        vector: Optional[List[float]] = None,
+    ) -> List[SearchResult]:
+        """
+        Top-k documents for a query.
+
+        Args:
+            query (str): Query text, scored with BM25.
+            k (int): Number of results.
+            vector (Optional[List[float]]): Query embedding. When given
+                and the index has embeddings, BM25 and nearest neighbour
+                results are fused by reciprocal rank.
+
+        Returns:
+            List[SearchResult]: Results, best first.
+        """
+        segments = self.segments()
+        terms = list(dict.fromkeys(tokenize(query)))
+        hybrid = vector is not None and self.has_vectors
+        limit = max(k, FUSION_CANDIDATES) if hybrid else k
+        hits = self._bm25(segments, terms, limit)
+        if hybrid:
+            hits = _fuse(
+                [hits, self._nearest(segments, vector, limit)], k
+            )
+        return [
+            self._result(segments[index], local, score, terms)
+            for score, index, local in hits[:k]
+        ]
+
+    def _bm25(
+        self, segments: List[_Segment], terms: List[str], limit: int
+    ) -> List[Tuple[float, int, int]]:
+        ranges = [
+            [segment.postings_range(term.encode()) for term in terms]
+            for segment in segments
+        ]
+        docs = sum(segment.live_docs for segment in segments)
+        tokens = sum(segment.tokens for segment in segments)
+        if not docs or not terms:
+            return []
+        c1 = self.k1 * (1 - self.b)
+        # 1 when every document tokenized to nothing (no term can match)
+        average_length = tokens / sum(s.docs for s in segments) or 1.0
+        c2 = self.k1 * self.b / average_length
+        weights = []
+        for position in range(len(terms)):
+            df = sum(
+                end - start
+                for start, end in (
+                    segment_ranges[position]
+                    for segment_ranges in ranges
+                    if segment_ranges[position] is not None
+                )
+            )
+            idf = math.log(1 + (docs - df + 0.5) / (df + 0.5))
+            weights.append(idf * (self.k1 + 1))
+
+        hits = []
+        for index, (segment, segment_ranges) in enumerate(
+            zip(segments, ranges)
+        ):
+            weighted = [
+                (postings_range, weight)
+                for postings_range, weight in zip(
+                    segment_ranges, weights
+                )
+                if postings_range is not None
+            ]
+            if weighted:
+                hits.extend(
+                    (score, index, local)
+                    for score, local in segment.bm25(
+                        weighted, c1, c2, limit
+                    )
+                )
+        return heapq.nlargest(limit, hits)
+
+    def _nearest(
+        self, segments: List[_Segment], vector: List[float], limit: int
+    ) -> List[Tuple[float, int, int]]:
+        query = np.asarray(_unit(vector), np.float32)
+        hits = []
+        for index, segment in enumerate(segments):
+            if segment.vectors is not None and segment.dim == len(
+                query
+            ):
+                hits.extend(
+                    (score, index, local)
+                    for score, local in segment.nearest(query, limit)
+                )
+        return heapq.nlargest(limit, hits)
+
+    def _result(
+        self, segment: _Segment, local: int, score: float, terms: list
+    ) -> SearchResult:
+        document = segment.document(local)
+        return SearchResult(
+            doc_id=document["id"],
+            title=document.get("title", ""),
+            url=document.get("url", ""),
+            snippet=make_snippet(
+                document["text"], terms, self.snippet_words
+            ),
+            score=score,
+        )
+
+    # Writing
+
+    @contextmanager
+    def _write_lock(self):
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, "lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _write_manifest(self, manifest: Dict):
+        path = os.path.join(self.path, MANIFEST)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _new_segment(self, manifest: Dict) -> str:
+        # Skips names left on disk by a writer that died before saving
+        # the manifest
+        while True:
+            name = f"seg-{manifest['next_segment']:06d}"
+            manifest["next_segment"] += 1
+            if not os.path.exists(os.path.join(self.path, name)):
+                return name
+
+    def add_documents(
+        self,
+        documents: Iterable[Dict],
+        embed: Optional[
+            Callable[[List[str]], List[List[float]]]
+        ] = None,
+    ) -> int:
+        """
+        Ingest documents into new segments. A document with the id of
+        an indexed one replaces it. Searches see the documents once
+        the call returns.
+
+        Args:
+            documents (Iterable[Dict]): Documents with "text" and
+                optional "id", "title", "url" and "embedding".
+            embed (Optional[Callable[[List[str]], List[List[float]]]]):
+                Embeds the texts of documents without an embedding.
+
+        Returns:
+            int: Number of documents ingested.
+
+        Raises:
+            ValueError: If a document has no text, or embeddings of
+                one segment differ in size. The index is then left as
+                it was.
+        """
+        with self._write_lock():
+            manifest = self._read_manifest()
+            first = manifest["next_segment"]
+            try:
+                count = self._add_documents(manifest, documents, embed)
+            except BaseException:
+                # Drop the segments of this call, finished or not
+                for number in range(first, manifest["next_segment"]):
+                    path = os.path.join(self.path, f"seg-{number:06d}")
+                    shutil.rmtree(path, ignore_errors=True)
+                    shutil.rmtree(f"{path}.tmp", ignore_errors=True)
+                raise
+            self._write_manifest(manifest)
+        return count
+
+    def _add_documents(
+        self,
+        manifest: Dict,
+        documents: Iterable[Dict],
+        embed: Optional[Callable],
+    ) -> int:
+        count = 0
+        deleted = {
+            entry["name"]: set(entry["deleted"])
+            for entry in manifest["segments"]
+        }
+        locations = {}
+        for entry in manifest["segments"]:
+            with open(
+                os.path.join(self.path, entry["name"], "ids.json")
+            ) as f:
+                for local, doc_id in enumerate(json.load(f)):
+                    locations[doc_id] = (entry["name"], local)
+
+        batch = []
+        for document in documents:
+            if not document.get("text"):
+                raise ValueError(f"Document without text: {document}")
+            batch.append(document)
+            if len(batch) == self.segment_docs:
+                self._ingest(manifest, batch, embed, locations, deleted)
+                count += len(batch)
+                batch = []
+        if batch:
+            self._ingest(manifest, batch, embed, locations, deleted)
+            count += len(batch)
+        for entry in manifest["segments"]:
+            entry["deleted"] = sorted(deleted[entry["name"]])
+        return count
+
+    def _ingest(
+        self,
+        manifest: Dict,
+        documents: List[Dict],
+        embed: Optional[Callable],
+        locations: Dict,
+        deleted: Dict,
+    ):
+        if embed is not None:
+            missing = [d for d in documents if "embedding" not in d]
+            if missing:
+                vectors = embed([d["text"] for d in missing])
+                for document, vector in zip(missing, vectors):
+                    document["embedding"] = vector
+
+        name = self._new_segment(manifest)
+        writer = _SegmentWriter(os.path.join(self.path, name))
+        deleted[name] = set()
+        postings = defaultdict(list)
+        for local, document in enumerate(documents):
+            doc_id = document_id(document)
+            previous = locations.get(doc_id)
+            if previous is not None:
+                deleted[previous[0]].add(previous[1])
+            locations[doc_id] = (name, local)
+
+            counts = Counter(
+                tokenize(
+                    f"{document.get('title', '')} {document['text']}"
+                )
+            )
+            for term, tf in counts.items():
+                postings[term].append(local)
+                postings[term].append(min(tf, 65535))
+            stored = {
+                "id": doc_id,
+                "title": document.get("title", ""),
+                "url": document.get("url", ""),
+                "text": document["text"],
+            }
+            embedding = document.get("embedding")
+            writer.add(
+                doc_id,
+                (
+                    json.dumps(stored, ensure_ascii=False) + "\n"
+                ).encode(),
+                sum(counts.values()),
+                _unit(embedding) if embedding is not None else None,
+            )
+        writer.write_postings(
+            (term, entries[0::2], entries[1::2])
+            for term, entries in sorted(
+                (term.encode(), entries)
+                for term, entries in postings.items()
+            )
+        )
+        writer.close()
+        manifest["segments"].append({"name": name, "deleted": []})
+
+    def merge(self) -> int:
+        """
+        Fold all segments into one, dropping replaced documents.
+
+        Returns:
+            int: Number of segments merged.
+        """
+        with self._write_lock():
+            manifest = self._read_manifest()
+            entries = manifest["segments"]
+            if len(entries) < 2 and not any(
+                e["deleted"] for e in entries
+            ):
+                return 0
+            segments = [
+                _Segment(
+                    os.path.join(self.path, e["name"]), e["deleted"]
+                )
+                for e in entries
+            ]
+            dims = {s.dim for s in segments if s.dim is not None}
+            if len(dims) > 1:
+                raise ValueError(
+                    f"Segments have embedding sizes {dims}"
+                )
+
+            name = self._new_segment(manifest)
+            writer = _SegmentWriter(os.path.join(self.path, name))
+            remaps = []
+            for entry, segment in zip(entries, segments):
+                with open(
+                    os.path.join(self.path, entry["name"], "ids.json")
+                ) as f:
+                    ids = json.load(f)
+                remap = []
+                for local in range(segment.docs):
+                    if local in segment.deleted:
+                        remap.append(-1)
+                        continue
+                    remap.append(len(writer.ids))
+                    vector = None
+                    if dims:
+                        vector = (
+                            segment.vector(local)
+                            if segment.dim
+                            else [0.0] * next(iter(dims))
+                        )
+                    writer.add(
+                        ids[local],
+                        segment.raw_document(local),
+                        segment.lengths[local],
+                        vector,
+                    )
+                remaps.append(remap)
+            writer.write_postings(_merged_postings(segments, remaps))
+            writer.close()
+            manifest["segments"] = [{"name": name, "deleted": []}]
+            self._write_manifest(manifest)
+        for entry in entries:
+            shutil.rmtree(
+                os.path.join(self.path, entry["name"]),
+                ignore_errors=True,
+            )
+        return len(entries)
+
+
+def _merged_postings(segments: List[_Segment], remaps: List[list]):
+    """(term, doc ids, tfs) of all segments, in term byte order."""
+    if np is not None:
+        remaps = [np.asarray(remap, np.int64) for remap in remaps]
+    cursors = [
+        _terms(segment, index) for index, segment in enumerate(segments)
+    ]
+    current, ids, tfs = None, [], []
+    for term, index, i in heapq.merge(*cursors):
+        if term != current:
+            if ids:
+                yield current, _concat(ids), _concat(tfs)
+            current, ids, tfs = term, [], []
+        segment = segments[index]
+        start, end = segment._postings[i], segment._postings[i + 1]
+        doc_ids, frequencies = segment.postings(start, end)
+        remap = remaps[index]
+        if np is not None:
+            new_ids = remap[np.frombuffer(doc_ids, np.uint32)]
+            alive = new_ids >= 0
+            ids.append(new_ids[alive])
+            tfs.append(np.frombuffer(frequencies, np.uint16)[alive])
+        else:
+            for doc, tf in zip(doc_ids, frequencies):
+                if remap[doc] >= 0:
+                    ids.append(remap[doc])
+                    tfs.append(tf)
+    if ids:
+        yield current, _concat(ids), _concat(tfs)
+
+
+def _terms(segment: _Segment, index: int):
+    for i in range(segment.terms):
+        yield segment.term(i), index, i
+
+
+def _concat(parts: list):
+    if np is not None:
+        return np.concatenate(parts)
+    return parts
+
+
+def _fuse(rankings: List[list], k: int) -> List[Tuple[float, int, int]]:
+    """Reciprocal rank fusion of (score, segment, local) rankings."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, (_, index, local) in enumerate(ranking):
+            scores[(index, local)] += 1 / (RRF_K + rank + 1)
+    return heapq.nlargest(
+        k,
+        (
+            (score, index, local)
+            for (index, local), score in scores.items()
+        ),
+    )
+
+
+_search_index: Optional[SearchIndex] = None
+
+
+def get_search_index() -> SearchIndex:
+    """Get the process-wide index from the search config."""
+    global _search_index
+    if _search_index is None:
+        _search_index = SearchIndex.from_config()
+    return _search_index
+
+
+def _read_documents(paths: List[str]) -> Iterable[Dict]:
+    """Documents of JSONL files; other files are one document each."""
+    for path in paths:
+        if path.endswith(".jsonl"):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+        else:
+            with open(path, encoding="utf-8") as f:
+                yield {
+                    "id": os.path.abspath(path),
+                    "title": os.path.basename(path),
+                    "url": os.path.abspath(path),
+                    "text": f.read(),
+                }
+
+
+def _embedder() -> Callable[[List[str]], List[List[float]]]:
+    import asyncio
+
+    from api.models.clients import close_clients
+    from api.models.embeddings import embed_texts
+
+    async def embed(texts: List[str]) -> List[List[float]]:
+        try:
+            return await embed_texts(texts, _search_config["embedding"])
+        finally:
+            await close_clients()
+
+    return lambda texts: asyncio.run(embed(texts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local search index")
+    parser.add_argument(
+        "command", choices=["ingest", "search", "merge"]
+    )
+    parser.add_argument("index", help="Index directory")
+    parser.add_argument(
+        "inputs",
+        nargs="*",
+        help="ingest: .jsonl files or text files; search: the query",
+    )
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument(
+        "--embed",
+        action="store_true",
+        help="Embed documents with search.embedding from the config",
+    )
+    args = parser.parse_args()
+    index = SearchIndex.from_config(args.index)
+    start = time.perf_counter()
+    if args.command == "ingest":
+        count = index.add_documents(
+            _read_documents(args.inputs),
+            _embedder() if args.embed else None,
+        )
+        print(
+            f"Ingested {count} documents in "
+            f"{time.perf_counter() - start:.1f}s; {index.docs} in "
+            f"{len(index.segments())} segments",
+            file=sys.stderr,
+        )
+    elif args.command == "merge":
+        merged = index.merge()
+        print(
+            f"Merged {merged} segments in "
+            f"{time.perf_counter() - start:.1f}s",
+            file=sys.stderr,
+        )
+    else:
+        results = index.search(" ".join(args.inputs), args.k)
+        print(
+            "\n\n".join(r.to_text(i + 1) for i, r in enumerate(results))
+        )
+
+
+if __name__ == "__main__":
+    main()
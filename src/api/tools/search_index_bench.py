@@ -0,0 +1,222 @@
+"""
+Benchmark the local search index on synthetic corpora.
+
+Builds an index per corpus size (words drawn from a Zipf distribution,
+random unit embeddings when numpy is installed), then times single
+queries of two to three mid-frequency terms and reports queries per
+second and p50/p99 latency for BM25, BM25 without numpy, and hybrid
+BM25 plus vector retrieval. Also checks that results come best first
+without duplicates, that some queries match, and that BM25 without
+numpy ranks the same documents with the same scores; the exit code is
+1 if a check fails. Built indexes are kept under --dir and reused by
+later runs.
+
+Run from src/:
+    python -m api.tools.search_index_bench --sizes 100000 1000000
+"""
+
+import argparse
+import os
+import random
+import math
+import shutil
+import sys
+import time
+
+from api.tools import search_index
+from api.tools.search_index import SearchIndex
+
+VOCABULARY = 50000
+DOC_WORDS = (20, 80)
+
+
+def _du(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def _documents(size: int, dim: int, seed: int):
+    rng = random.Random(seed)
+    words = [f"w{rank}" for rank in range(VOCABULARY)]
+    weights = [1 / (rank + 1) ** 1.1 for rank in range(VOCABULARY)]
+    cumulative = []
+    total = 0.0
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+    vectors = None
+    for doc in range(size):
+        if dim and doc % 10000 == 0:
+            np = search_index._load_numpy()
+            vectors = np.random.default_rng(seed + doc).standard_normal(
+                (10000, dim), dtype=np.float32
+            )
+        document = {
+            "id": f"doc{doc}",
+            "title": f"Document {doc}",
+            "url": f"https://example.com/{doc}",
+            "text": " ".join(
+                rng.choices(
+                    words,
+                    cum_weights=cumulative,
+                    k=rng.randint(*DOC_WORDS),
+                )
+            ),
+        }
+        if vectors is not None:
+            document["embedding"] = vectors[doc % 10000].tolist()
+        yield document
+
+
+def _build(path: str, size: int, dim: int, seed: int) -> dict:
+    index = SearchIndex(path)
+    if index.docs == size:
+        return {"ingest_seconds": None}
+    shutil.rmtree(path, ignore_errors=True)
+    index = SearchIndex(path)
+    start = time.perf_counter()
+    index.add_documents(_documents(size, dim, seed))
+    return {"ingest_seconds": time.perf_counter() - start}
+
+
+def _queries(count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    return [
+        " ".join(
+            f"w{rng.randint(50, 5000)}"
+            for _ in range(rng.randint(2, 3))
+        )
+        for _ in range(count)
+    ]
+
+
+def _time(index: SearchIndex, queries: list, vectors: list) -> dict:
+    latencies = []
+    results = []
+    for query, vector in zip(queries, vectors):
+        start = time.perf_counter()
+        results.append(index.search(query, 10, vector))
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "results": results,
+        "qps": len(latencies) / sum(latencies),
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+    }
+
+
+def _check(label: str, results: list, bm25: list) -> list:
+    """Problems of one mode's results; bm25 is the numpy BM25 ones."""
+    failures = []
+    if not any(results):
+        failures.append(f"{label}: no query matched")
+    for hits in results:
+        scores = [hit.score for hit in hits]
+        if len(hits) > 10 or scores != sorted(scores, reverse=True):
+            failures.append(f"{label}: results not best first")
+            break
+        if len({hit.doc_id for hit in hits}) < len(hits):
+            failures.append(f"{label}: duplicate documents")
+            break
+    if label.endswith("bm25 no numpy"):
+        for hits, expected in zip(results, bm25):
+            if not _same_ranking(hits, expected):
+                failures.append(f"{label}: differs from numpy BM25")
+                break
+    return failures
+
+
+def _same_ranking(hits: list, expected: list) -> bool:
+    # numpy sums in float32, and the two break ties differently
+    def close(a: float, b: float) -> bool:
+        return math.isclose(a, b, rel_tol=1e-5)
+
+    if len(hits) != len(expected) or not all(
+        close(hit.score, other.score)
+        for hit, other in zip(hits, expected)
+    ):
+        return False
+    if not hits:
+        return True
+
+    def above_cutoff(results: list) -> set:
+        return {
+            hit.doc_id
+            for hit in results
+            if not close(hit.score, expected[-1].score)
+        }
+
+    return above_cutoff(hits) == above_cutoff(expected)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Search index benchmark"
+    )
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[100000, 1000000]
+    )
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument(
+        "--dim",
+        type=int,
+        default=64,
+        help="Embedding size; 0 for BM25 only",
+    )
+    parser.add_argument("--dir", default="/tmp/search_index_bench")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    numpy = search_index._load_numpy()
+    dim = args.dim if numpy is not None else 0
+
+    print(
+        f"{'docs':>8} | {'ingest s':>8} | {'MB':>6} | {'open ms':>7} | "
+        f"{'mode':>12} | {'q/s':>7} | {'p50 ms':>6} | {'p99 ms':>6}"
+    )
+    failures = []
+    for size in args.sizes:
+        path = os.path.join(args.dir, f"{size}-{dim}")
+        built = _build(path, size, dim, args.seed)
+        start = time.perf_counter()
+        index = SearchIndex(path)
+        index.segments()
+        open_ms = (time.perf_counter() - start) * 1000
+
+        queries = _queries(args.queries, args.seed + 1)
+        modes = {"bm25": [None] * len(queries)}
+        if numpy is not None:
+            modes["bm25 no numpy"] = modes["bm25"]
+        if dim:
+            rng = numpy.random.default_rng(args.seed + 2)
+            modes["hybrid"] = list(
+                rng.standard_normal((len(queries), dim)).tolist()
+            )
+        index.search(queries[0], 10)  # warm
+        for mode, vectors in modes.items():
+            search_index.np = None if mode == "bm25 no numpy" else numpy
+            result = _time(index, queries, vectors)
+            search_index.np = numpy
+            if mode == "bm25":
+                bm25 = result["results"]
+            failures += _check(
+                f"{size} {mode}", result["results"], bm25
+            )
+            ingest = built["ingest_seconds"]
+            print(
+                f"{size:>8} | "
+                f"{'cached' if ingest is None else f'{ingest:.0f}':>8} | "
+                f"{_du(path) / 2**20:>6.0f} | {open_ms:>7.1f} | "
+                f"{mode:>12} | {result['qps']:>7.0f} | "
+                f"{result['p50_ms']:>6.2f} | {result['p99_ms']:>6.2f}"
+            )
+    if failures:
+        print("\nFailed checks:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Memoization of tool results for tools registered with cacheable=True.
+
+Keys combine the tool name with canonical JSON arguments (sorted keys,
+whitespace in string values collapsed) so trivially different calls,
+e.g. repeated searches for "NVIDIA revenue 2024", share one entry.
+Concurrent calls with the same key are coalesced: only the first runs
+the tool, the others await its result.
+"""
+
+import asyncio
+import json
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from api import metrics
+from api.config_loader import load_default_config
+
+_tool_cache_config = load_default_config().get("tool_cache", {})
+
+
+def _canonicalize(value):
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {key: _canonicalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonicalize(item) for item in value]
+    return value
+
+
+def make_tool_cache_key(
+    tool_name: str, tool_args: Dict[str, Any]
+) -> str:
+    """
+    Build the cache key of a tool call.
+
+    Args:
+        tool_name (str): The name of the tool.
+        tool_args (Dict[str, Any]): The arguments of the call.
+
+    Returns:
+        str: "<tool name>:<canonical JSON arguments>".
+    """
+    canonical_args = json.dumps(
+        _canonicalize(tool_args),
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return f"{tool_name}:{canonical_args}"
+
+
+class ToolResultCache:
+    """
+    In-process LRU of tool results with per-entry TTL and single-flight
+    execution of concurrent identical calls.
+
+    Args:
+        max_entries (int): Maximum number of cached results.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = (
+            OrderedDict()
+        )
+        # event loop -> {key: running task}
+        self._in_flight: (
+            "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict]"
+        ) = weakref.WeakKeyDictionary()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, result = entry
+        if time.time() > expires_at:
+            self._entries.pop(key, None)
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def set(self, key: str, result: str, ttl: float):
+        self._entries[key] = (time.time() + ttl, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_run(
+        self,
+        key: str,
+        ttl: float,
+        run: Callable[[], Awaitable[str]],
+    ) -> str:
+        """
+        Return the cached result for key, join an identical call that
+        is already running, or run the tool and cache its result.
+        Failures are not cached.
+
+        Args:
+            key (str): Cache key from make_tool_cache_key.
+            ttl (float): Seconds to keep a fresh result.
+            run (Callable[[], Awaitable[str]]): Executes the tool.
+
+        Returns:
+            str: The tool result.
+        """
+        result = self.get(key)
+        if result is not None:
+            self.hits += 1
+            metrics.CACHE_REQUESTS.labels("tool", "hit").inc()
+            return result
+
+        in_flight = self._in_flight.setdefault(
+            asyncio.get_running_loop(), {}
+        )
+        task = in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            metrics.CACHE_REQUESTS.labels("tool", "coalesced").inc()
+        else:
+            self.misses += 1
+            metrics.CACHE_REQUESTS.labels("tool", "miss").inc()
+            task = asyncio.ensure_future(run())
+            in_flight[key] = task
+
+            def _done(task):
+                in_flight.pop(key, None)
+                if not task.cancelled() and task.exception() is None:
+                    self.set(key, task.result(), ttl)
+
+            task.add_done_callback(_done)
+
+        # A cancelled caller must not cancel the call others wait on
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+        }
+
+
+_tool_cache: Optional[ToolResultCache] = None
+
+
+def get_tool_cache() -> ToolResultCache:
+    """
+    Get the process-wide tool result cache.
+
+    Returns:
+        ToolResultCache: The shared tool result cache.
+    """
+    global _tool_cache
+    if _tool_cache is None:
+        _tool_cache = ToolResultCache(
+            max_entries=_tool_cache_config.get("max_entries", 1024)
+        )
+    return _tool_cache
@@ -0,0 +1,383 @@
+"""
+Bounded tool results.
+
+A result longer than its tool's max_output_chars (see register_tool;
+tool_outputs.max_chars in default_config.yaml by default) does not go
+into the agent's history. It is written once to a blob store on disk,
+and the model gets its first preview_chars with the id of the stored
+output. The read_output tool pages through it, page_chars at a time.
+
+Handlers return a str, or yield their output in chunks from a
+generator or async generator. Chunks are consumed as they come: at
+most max_output_chars of a result is held in memory and the rest
+streams straight to the blob file, so the memory and prompt of a run
+stay bounded however large a tool's output gets. Stored outputs are
+removed ttl_seconds after they were written.
+"""
+
+import bisect
+import codecs
+import collections.abc
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Optional, Tuple
+
+from api.config_loader import load_default_config
+from api.tools.registry import register_tool
+
+_outputs_config = load_default_config().get("tool_outputs", {})
+
+# Characters between the entries of a blob's offset index
+INDEX_CHARS = 65536
+# Blobs created between two sweeps for expired ones
+PRUNE_EVERY = 256
+READ_BYTES = 65536
+
+_OUTPUT_ID = re.compile(r"[0-9a-f]{16}")
+
+
+class BlobWriter:
+    """
+    A stored output being written. The text goes to a temporary file
+    that becomes <id>.txt on close(); <id>.json with its length and
+    offset index is written last, so a blob is complete once that file
+    exists.
+    """
+
+    def __init__(self, store: "BlobStore", output_id: str, tool: str):
+        self.store = store
+        self.output_id = output_id
+        self.tool = tool
+        self.chars = 0
+        self.bytes = 0
+        # (chars, bytes) offsets at least INDEX_CHARS apart
+        self.index = [[0, 0]]
+        self._path = store.path_of(output_id)
+        self._file = open(f"{self._path}.txt.tmp", "wb")
+
+    def write(self, text: str):
+        for start in range(0, len(text), INDEX_CHARS):
+            data = text[start : start + INDEX_CHARS].encode(
+                "utf-8", "surrogatepass"
+            )
+            self._file.write(data)
+            self.chars += min(INDEX_CHARS, len(text) - start)
+            self.bytes += len(data)
+            if self.chars - self.index[-1][0] >= INDEX_CHARS:
+                self.index.append([self.chars, self.bytes])
+
+    def close(self) -> str:
+        """Complete the blob and return its id."""
+        self._file.close()
+        os.replace(f"{self._path}.txt.tmp", f"{self._path}.txt")
+        meta = {
+            "tool": self.tool,
+            "chars": self.chars,
+            "bytes": self.bytes,
+            "index": self.index,
+            "created_at": time.time(),
+        }
+        with open(f"{self._path}.json.tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(f"{self._path}.json.tmp", f"{self._path}.json")
+        return self.output_id
+
+    def discard(self):
+        self._file.close()
+        try:
+            os.remove(f"{self._path}.txt.tmp")
+        except FileNotFoundError:
+            pass
+
+
+class BlobStore:
+    """
+    Directory of stored tool outputs, shared by the workers on a host.
+
+    Args:
+        path (str): Directory of the blobs.
+        ttl_seconds (float): Age after which blobs are removed.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = 86400):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._created = 0
+
+    def path_of(self, output_id: str) -> str:
+        return os.path.join(self.path, output_id)
+
+    def create(self, tool: str) -> BlobWriter:
+        """Start a blob; every PRUNE_EVERY blobs, expired ones go."""
+        with self._lock:
+            prune = self._created % PRUNE_EVERY == 0
+            self._created += 1
+        if prune:
+            self.prune()
+        return BlobWriter(self, uuid.uuid4().hex[:16], tool)
+
+    def read(
+        self, output_id: str, offset: int, length: int
+    ) -> Optional[Tuple[str, int]]:
+        """
+        Read characters of a stored output.
+
+        Args:
+            output_id (str): The blob.
+            offset (int): First character.
+            length (int): Characters to read at most.
+
+        Returns:
+            Optional[Tuple[str, int]]: The text and the length of the
+                whole output, or None if there is no such blob.
+        """
+        if not _OUTPUT_ID.fullmatch(output_id):
+            return None
+        path = self.path_of(output_id)
+        try:
+            with open(f"{path}.json") as f:
+                meta = json.load(f)
+            text_file = open(f"{path}.txt", "rb")
+        except (FileNotFoundError, ValueError):
+            return None
+        offset = max(0, min(offset, meta["chars"]))
+        index = meta["index"]
+        chars, position = index[
+            bisect.bisect_right(index, [offset, float("inf")]) - 1
+        ]
+        decoder = codecs.getincrementaldecoder("utf-8")("surrogatepass")
+        parts = []
+        wanted = length
+        skip = offset - chars
+        with text_file:
+            text_file.seek(position)
+            while wanted > 0:
+                data = text_file.read(READ_BYTES)
+                text = decoder.decode(data, final=not data)
+                if skip:
+                    skipped = min(skip, len(text))
+                    text = text[skipped:]
+                    skip -= skipped
+                if text:
+                    parts.append(text[:wanted])
+                    wanted -= len(parts[-1])
+                if not data:
+                    break
+        return "".join(parts), meta["chars"]
+
+    def prune(self) -> int:
+        """Remove blobs older than ttl_seconds; return how many."""
+        cutoff = time.time() - self.ttl_seconds
+        removed = 0
+        try:
+            entries = list(os.scandir(self.path))
+        except FileNotFoundError:
+            return 0
+        for entry in entries:
+            try:
+                if entry.stat().st_mtime >= cutoff:
+                    continue
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            if entry.name.endswith(".json"):
+                removed += 1
+        return removed
+
+
+_blob_store: Optional[BlobStore] = None
+
+
+def get_blob_store() -> BlobStore:
+    """
+    Get the process-wide blob store, from the tool_outputs section of
+    default_config.yaml.
+
+    Returns:
+        BlobStore: The shared blob store.
+    """
+    global _blob_store
+    if _blob_store is None:
+        _blob_store = BlobStore(
+            _outputs_config.get("blob_dir", ".cache/tool_outputs"),
+            _outputs_config.get("ttl_seconds", 86400),
+        )
+    return _blob_store
+
+
+class BoundedOutput:
+    """
+    Collects the chunks of one tool result, holding at most max_chars
+    of it in memory: once the result outgrows that, everything so far
+    and every later chunk goes to a blob.
+
+    Args:
+        tool (str): Tool that produces the result.
+        max_chars (Optional[int]): Longest result kept whole; None for
+            tool_outputs.max_chars, 0 for no limit.
+    """
+
+    def __init__(self, tool: str, max_chars: Optional[int] = None):
+        self.tool = tool
+        self.max_chars = (
+            _outputs_config.get("max_chars", 16000)
+            if max_chars is None
+            else max_chars
+        )
+        self.preview_chars = min(
+            _outputs_config.get("preview_chars", 4000),
+            self.max_chars or 0,
+        )
+        self.chars = 0
+        self.output_id: Optional[str] = None
+        self._parts = []
+        self._writer: Optional[BlobWriter] = None
+        self._preview = ""
+
+    def add(self, chunk: str):
+        if not chunk:
+            return
+        if not isinstance(chunk, str):
+            chunk = str(chunk)
+        self.chars += len(chunk)
+        if self._writer is not None:
+            self._writer.write(chunk)
+            return
+        self._parts.append(chunk)
+        if self.max_chars and self.chars > self.max_chars:
+            text = "".join(self._parts)
+            self._parts = []
+            self._preview = _preview(text, self.preview_chars)
+            self._writer = get_blob_store().create(self.tool)
+            self._writer.write(text)
+
+    def text(self) -> str:
+        """The whole result, or its preview and the id to read on."""
+        if self._writer is None:
+            return "".join(self._parts)
+        self.output_id = self._writer.close()
+        return self._preview + (
+            f"\n[Output truncated: showing {len(self._preview)} of "
+            f"{self.chars} characters. Call read_output with output_id "
+            f'"{self.output_id}" and offset {len(self._preview)} for '
+            "the rest.]"
+        )
+
+    def discard(self):
+        if self._writer is not None:
+            self._writer.discard()
+
+
+def _preview(text: str, limit: int) -> str:
+    preview = text[:limit]
+    # End on a line break when one is near
+    cut = preview.rfind("\n", int(limit * 0.8))
+    return preview[:cut] if cut > 0 else preview
+
+
+def bound_output(
+    result: Any,
+    tool: str,
+    max_chars: Optional[int] = None,
+) -> BoundedOutput:
+    """
+    Consume a chunk iterator, such as a generator, or bound any other
+    result as its str(). Blocks on the iterator, so run it on the tool
+    thread pool for sync handlers.
+
+    Returns:
+        BoundedOutput: The collected result; call text() for it.
+    """
+    output = BoundedOutput(tool, max_chars)
+    if not isinstance(result, collections.abc.Iterator):
+        # A dict, list or number is one value, not chunks
+        output.add(None if result is None else str(result))
+        return output
+    try:
+        for chunk in result:
+            output.add(chunk)
+    except BaseException:
+        output.discard()
+        raise
+    return output
+
+
+async def bound_output_async(
+    result: AsyncIterator[str],
+    tool: str,
+    max_chars: Optional[int] = None,
+) -> BoundedOutput:
+    """Consume the chunks of an async generator like bound_output."""
+    output = BoundedOutput(tool, max_chars)
+    try:
+        async for chunk in result:
+            output.add(chunk)
+    except BaseException:
+        output.discard()
+        raise
+    return output
+
+
+def read_output_handler(output_id: str, offset: int = 0) -> str:
+    """
+    Read a page of a stored tool output.
+
+    Args:
+        output_id (str): Id given in a truncated tool result.
+        offset (int): First character to read.
+
+    Returns:
+        str: Up to page_chars characters and where the next page starts.
+    """
+    offset = max(0, int(offset))
+    found = get_blob_store().read(
+        str(output_id).strip().strip('"'),
+        offset,
+        _outputs_config.get("page_chars", 8000),
+    )
+    if found is None:
+        return (
+            f"Error: no stored output with id {output_id}; outputs are "
+            f"kept for {_outputs_config.get('ttl_seconds', 86400)}s"
+        )
+    text, total = found
+    offset = min(offset, total)
+    end = offset + len(text)
+    if end < total:
+        position = f"continue with offset {end}"
+    else:
+        position = "end of output"
+    return f"{text}\n[Characters {offset}-{end} of {total}; {position}]"
+
+
+register_tool(
+    name="read_output",
+    description=(
+        "Read more of a tool output that was truncated, a page at a time"
+    ),
+    handler=read_output_handler,
+    parameters={
+        "type": "object",
+        "properties": {
+            "output_id": {
+                "type": "string",
+                "description": "The output_id given in the truncated "
+                "output",
+            },
+            "offset": {
+                "type": "integer",
+                "description": "Character to start reading at",
+            },
+        },
+        "required": ["output_id"],
+    },
+    timeout=30,
+    # Pages are page_chars long, never stored again
+    max_output_chars=0,
+)
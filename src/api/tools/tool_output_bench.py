@@ -0,0 +1,233 @@
+"""
+Benchmark of bounded tool outputs.
+
+runs    Runs run_agent with a fake model that calls a tool streaming
+        --output-mb megabytes per call for --steps steps, once with
+        every result kept whole (max_output_chars 0, as before) and
+        once with the default limit, where results are stored and
+        previewed. Reports wall time, peak Python memory, the longest
+        prompt the model was sent and what was stored on disk.
+paging  Pages through one stored output with the read_output tool and
+        times a page at the start, middle and end of it.
+
+Both check their results: with the limit no prompt holds a whole tool
+result, and reading every page from offset 0 to the end marker gives
+back exactly the tool's output. The exit code is 1 if a check fails.
+Blobs go to a temporary directory.
+
+Run from src/:
+    python -m api.tools.tool_output_bench --runs 4 --steps 4 --output-mb 4
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from api.agent import run_agent
+from api.models import fake_provider
+from api.models.fake_provider import FakeModel, Latency
+from api.tools import execute_tool_async, tool_output
+from api.tools.fake_tools import register_fake_tool
+from api.tools.tool_output import BlobStore, read_output_handler
+
+
+class PromptSizeModel(FakeModel):
+    """Fake model that records the longest prompt it is sent."""
+
+    def __init__(self, name: str, steps: int):
+        script = [
+            {
+                "content": f"Thought: I need the full dump {step}.",
+                "tool_calls": [
+                    {
+                        "name": "bench_dump",
+                        "arguments": {"query": f"dump {step}"},
+                    }
+                ],
+            }
+            for step in range(steps)
+        ]
+        script.append("Thought: I have enough.\nFinal Answer: Done.")
+        super().__init__(name, script, Latency(0))
+        self.max_prompt_chars = 0
+
+    def completion_for(self, messages: list):
+        self.max_prompt_chars = max(
+            self.max_prompt_chars,
+            sum(
+                len(message.get("content") or "")
+                for message in messages
+            ),
+        )
+        return super().completion_for(messages)
+
+
+def _disk_mb(directory: str) -> float:
+    return (
+        sum(entry.stat().st_size for entry in os.scandir(directory))
+        / 2**20
+    )
+
+
+async def _runs(args, max_output_chars, directory: str) -> dict:
+    model = PromptSizeModel("bench-tool-output", args.steps)
+    fake_provider._models[model.name] = model
+    register_fake_tool(
+        "bench_dump",
+        output_chars=int(args.output_mb * 2**20),
+        chunk_chars=args.chunk_chars,
+        max_output_chars=max_output_chars,
+    )
+    config = {
+        "agent_type": "single_agent",
+        "provider": "fake",
+        "model": model.name,
+        "max_steps": args.steps + 1,
+        "knowledge": False,
+    }
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(
+            *(
+                run_agent(f"Summarize dump set {run}", config)
+                for run in range(args.runs)
+            )
+        )
+    finally:
+        wall = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {
+        "wall": wall,
+        "peak_mb": peak / 2**20,
+        "prompt_chars": model.max_prompt_chars,
+        "disk_mb": _disk_mb(directory),
+    }
+
+
+async def _bench_runs(args, directory: str, failures: list):
+    print(
+        f"{args.runs} runs at once, {args.steps} tool calls each of "
+        f"{args.output_mb:g} MB in {args.chunk_chars} character chunks\n"
+    )
+    print(
+        f"{'limit':>7} | {'seconds':>7} | {'peak MB':>7} | "
+        f"{'max prompt chars':>16} | {'stored MB':>9}"
+    )
+    for max_output_chars in (0, None):
+        path = os.path.join(directory, f"blobs-{max_output_chars}")
+        tool_output._blob_store = BlobStore(path)
+        result = await _runs(args, max_output_chars, path)
+        label = "off" if max_output_chars == 0 else "default"
+        if max_output_chars is None and result["prompt_chars"] >= int(
+            args.output_mb * 2**20
+        ):
+            failures.append(
+                f"a {result['prompt_chars']} character prompt with "
+                f"the default limit holds a whole tool result"
+            )
+        print(
+            f"{label:>7} | {result['wall']:>7.2f} | "
+            f"{result['peak_mb']:>7.1f} | "
+            f"{result['prompt_chars']:>16} | {result['disk_mb']:>9.1f}"
+        )
+
+
+def _read_all(output_id: str) -> tuple:
+    """Follow read_output pages from offset 0; return text and pages."""
+    parts = []
+    offset = 0
+    while True:
+        page = read_output_handler(output_id, offset)
+        text, _, footer = page.rpartition("\n[Characters ")
+        if not footer.startswith(f"{offset}-"):
+            raise RuntimeError(f"Bad page at offset {offset}: {page!r}")
+        parts.append(text)
+        if footer.endswith("; end of output]"):
+            return "".join(parts), len(parts)
+        offset = int(
+            re.search(r"continue with offset (\d+)", footer)[1]
+        )
+
+
+async def _bench_paging(args, directory: str, failures: list):
+    tool_output._blob_store = BlobStore(
+        os.path.join(directory, "paging")
+    )
+    tool = register_fake_tool(
+        "bench_dump",
+        output_chars=int(args.output_mb * 2**20),
+        chunk_chars=args.chunk_chars,
+    )
+    preview = await execute_tool_async(
+        "bench_dump", {"query": "paging"}
+    )
+    output_id = re.search(r'output_id "(\w+)"', preview).group(1)
+    total = int(args.output_mb * 2**20)
+    text, pages = _read_all(output_id)
+    if text != "".join(tool._chunks("paging")):
+        failures.append(
+            f"the {pages} pages of the stored output do not add up to "
+            f"the tool's output"
+        )
+    print(f"\nread_output over a {args.output_mb:g} MB output")
+    print(f"{'offset':>10} | {'ms per page':>11}")
+    for offset in (0, total // 2, total - 1000):
+        start = time.perf_counter()
+        for _ in range(args.pages):
+            read_output_handler(output_id, offset)
+        elapsed = (time.perf_counter() - start) / args.pages
+        print(f"{offset:>10} | {elapsed * 1000:>11.3f}")
+
+
+async def _bench(args):
+    directory = tempfile.mkdtemp(prefix="tool_output_bench_")
+    failures = []
+    try:
+        if args.scenario in ("runs", "all"):
+            await _bench_runs(args, directory, failures)
+        if args.scenario in ("paging", "all"):
+            await _bench_paging(args, directory, failures)
+    finally:
+        tool_output._blob_store = None
+        shutil.rmtree(directory, ignore_errors=True)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Bounded tool output benchmark"
+    )
+    parser.add_argument(
+        "--scenario",
+        choices=["runs", "paging", "all"],
+        default="all",
+    )
+    parser.add_argument("--runs", type=int, default=4)
+    parser.add_argument("--steps", type=int, default=4)
+    parser.add_argument(
+        "--output-mb",
+        type=float,
+        default=4,
+        help="Size of every tool result",
+    )
+    parser.add_argument("--chunk-chars", type=int, default=65536)
+    parser.add_argument(
+        "--pages", type=int, default=100, help="Pages read per offset"
+    )
+    args = parser.parse_args()
+    failures = asyncio.run(_bench(args))
+    if failures:
+        print("\nFailed checks:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
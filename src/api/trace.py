@@ -0,0 +1,434 @@
+"""
+Structured tracing for agent runs.
+
+Spans record what a run did and how long it took: agent.run,
+agent.step, model.call and tool.call, each with timings, token counts
+and sizes as attributes. Finished spans are handed to a background
+thread that writes them to disk, so tracing never does I/O on the
+event loop; if the exporter falls behind, spans are dropped rather
+than queued without bound.
+
+Settings come from the `tracing` section of default_config.yaml, or the
+TRACE_LEVEL environment variable:
+- level: "off", "info" (spans) or "debug" (spans plus debug events,
+  which replace the old print() debugging)
+- sample_rate: fraction of traces (root spans) that are recorded
+- format: "jsonl" (one span per line) or "otlp" (one OTLP/JSON
+  ExportTraceServiceRequest per line, for OpenTelemetry collectors)
+
+Usage:
+    with trace.span("tool.call", tool=name) as span:
+        ...
+        span.set(result_chars=len(result))
+    trace.debug("Raw response", response=response)
+"""
+
+import atexit
+import json
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Union
+
+from api.config_loader import load_default_config
+
+_trace_config = load_default_config().get("tracing", {})
+
+DEBUG = 10
+INFO = 20
+OFF = 100
+_LEVELS = {"debug": DEBUG, "info": INFO, "off": OFF}
+
+_level = _LEVELS.get(
+    os.getenv(
+        "TRACE_LEVEL", _trace_config.get("level", "info")
+    ).lower(),
+    INFO,
+)
+_sample_rate = _trace_config.get("sample_rate", 1.0)
+
+
+def set_level(level: str):
+    """Switch tracing to "off", "info" or "debug" at runtime."""
+    global _level
+    _level = _LEVELS[level.lower()]
+
+
+def set_sample_rate(sample_rate: float):
+    global _sample_rate
+    _sample_rate = sample_rate
+
+
+def debug_enabled() -> bool:
+    """Whether debug events are recorded; guard costly formatting."""
+    return _level <= DEBUG
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class Span:
+    """
+    A timed operation within a trace.
+
+    Args:
+        name (str): Operation name, e.g. "model.call".
+        trace_id (str): 32 hex digit ID shared by the whole trace.
+        parent_id (Optional[str]): Span ID of the parent span.
+        attributes (Dict): Initial attributes.
+    """
+
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "attributes",
+        "events",
+        "error",
+        "start_ns",
+        "_start_perf_ns",
+        "duration_ns",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str],
+        attributes: Dict,
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.events = []
+        self.error: Optional[str] = None
+        self.start_ns = time.time_ns()
+        self._start_perf_ns = time.perf_counter_ns()
+        self.duration_ns: Optional[int] = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def event(self, name: str, **attributes):
+        self.events.append(
+            (
+                time.time_ns(),
+                name,
+                {k: _attribute_value(v) for k, v in attributes.items()},
+            )
+        )
+
+    def set_error(self, error: BaseException):
+        self.error = f"{type(error).__name__}: {error}"
+
+    def end(self):
+        if self.duration_ns is not None:
+            return
+        self.duration_ns = time.perf_counter_ns() - self._start_perf_ns
+        _get_exporter().export(self)
+
+
+class _NoopSpan:
+    """Stand-in for spans that are not recorded; every call is free."""
+
+    __slots__ = ()
+
+    def set(self, **attributes):
+        pass
+
+    def event(self, name: str, **attributes):
+        pass
+
+    def set_error(self, error: BaseException):
+        pass
+
+    def end(self):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span: ContextVar[Union[Span, _NoopSpan, None]] = ContextVar(
+    "current_span", default=None
+)
+
+
+def current_span() -> Union[Span, _NoopSpan]:
+    """The innermost span of the running task, or NOOP_SPAN."""
+    return _current_span.get() or NOOP_SPAN
+
+
+def start_span(
+    name: str, level: int = INFO, **attributes
+) -> Union[Span, _NoopSpan]:
+    """
+    Start a span under the current one without making it current;
+    call end() when the operation finishes.
+
+    Args:
+        name (str): Operation name.
+        level (int): INFO or DEBUG.
+        **attributes: Initial attributes.
+
+    Returns:
+        Union[Span, _NoopSpan]: The span, or NOOP_SPAN when it is
+            filtered by level or sampling.
+    """
+    if level < _level:
+        return NOOP_SPAN
+    parent = _current_span.get()
+    if parent is NOOP_SPAN:
+        # Inside a trace that was sampled out
+        return NOOP_SPAN
+    if parent is None:
+        if _sample_rate < 1 and random.random() >= _sample_rate:
+            return NOOP_SPAN
+        return Span(name, _new_id(128), None, attributes)
+    return Span(name, parent.trace_id, parent.span_id, attributes)
+
+
+@contextmanager
+def span(name: str, level: int = INFO, **attributes):
+    """
+    Record a span around a block and make it the current span, so
+    spans and debug events inside the block (and in tasks it starts)
+    become its children. Exceptions are recorded and re-raised.
+    """
+    new_span = start_span(name, level, **attributes)
+    token = _current_span.set(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        new_span.set_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        new_span.end()
+
+
+@contextmanager
+def use_span(active_span: Union[Span, _NoopSpan]):
+    """Make a span from start_span current for a block, without ending it."""
+    token = _current_span.set(active_span)
+    try:
+        yield active_span
+    finally:
+        _current_span.reset(token)
+
+
+def debug(message: str, **attributes):
+    """
+    Record a debug event on the current span. A no-op unless the
+    level is debug.
+    """
+    if _level > DEBUG:
+        return
+    current_span().event(message, **attributes)
+
+
+def _attribute_value(value):
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    if isinstance(value, (list, tuple, dict)):
+        try:
+            return json.dumps(value, default=str)
+        except (TypeError, ValueError):
+            pass
+    return str(value)
+
+
+def _span_record(span: Span) -> Dict:
+    return {
+        "trace_id": span.trace_id,
+        "span_id": span.span_id,
+        "parent_id": span.parent_id,
+        "name": span.name,
+        "start_unix_ns": span.start_ns,
+        "duration_ms": round(span.duration_ns / 1e6, 3),
+        "attributes": {
+            k: _attribute_value(v) for k, v in span.attributes.items()
+        },
+        "events": [
+            {"time_unix_ns": t, "name": name, "attributes": attrs}
+            for t, name, attrs in span.events
+        ],
+        "error": span.error,
+    }
+
+
+def _otlp_value(value) -> Dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": "" if value is None else str(value)}
+
+
+def _otlp_attributes(attributes: Dict) -> list:
+    return [
+        {"key": key, "value": _otlp_value(_attribute_value(value))}
+        for key, value in attributes.items()
+    ]
+
+
+def _otlp_request(spans: list) -> Dict:
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": _otlp_attributes(
+                        {"service.name": "deep-research-agent"}
+                    )
+                },
+                "scopeSpans": [
+                    {
+                        "scope": {"name": "api.trace"},
+                        "spans": [
+                            {
+                                "traceId": span.trace_id,
+                                "spanId": span.span_id,
+                                "parentSpanId": span.parent_id or "",
+                                "name": span.name,
+                                "kind": 1,
+                                "startTimeUnixNano": str(span.start_ns),
+                                "endTimeUnixNano": str(
+                                    span.start_ns + span.duration_ns
+                                ),
+                                "attributes": _otlp_attributes(
+                                    span.attributes
+                                ),
+                                "events": [
+                                    {
+                                        "timeUnixNano": str(t),
+                                        "name": name,
+                                        "attributes": _otlp_attributes(
+                                            attrs
+                                        ),
+                                    }
+                                    for t, name, attrs in span.events
+                                ],
+                                "status": (
+                                    {"code": 2, "message": span.error}
+                                    if span.error
+                                    else {"code": 1}
+                                ),
+                            }
+                            for span in spans
+                        ],
+                    }
+                ],
+            }
+        ]
+    }
+
+
+class SpanExporter:
+    """
+    Writes finished spans from a daemon thread, in batches.
+
+    Args:
+        path (str): File spans are appended to.
+        format (str): "jsonl" or "otlp".
+        max_queue (int): Spans buffered before new ones are dropped.
+        batch_size (int): Most spans written per batch.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        format: str = "jsonl",
+        max_queue: int = 10000,
+        batch_size: int = 512,
+    ):
+        self.path = path
+        self.format = format
+        self.batch_size = batch_size
+        self.dropped = 0
+        self.exported = 0
+        self._queue: queue.Queue = queue.Queue(max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._thread = threading.Thread(
+                target=self._run, name="trace-exporter", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        with open(self.path, "a", encoding="utf-8") as file:
+            while True:
+                batch = [self._queue.get()]
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                try:
+                    self._write(file, batch)
+                except (OSError, TypeError, ValueError):
+                    self.dropped += len(batch)
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, file, batch: list):
+        if self.format == "otlp":
+            file.write(json.dumps(_otlp_request(batch)) + "\n")
+        else:
+            for span in batch:
+                file.write(json.dumps(_span_record(span)) + "\n")
+        file.flush()
+        self.exported += len(batch)
+
+    def flush(self):
+        """Block until every queued span has been written."""
+        if self._thread is not None:
+            self._queue.join()
+
+
+_exporter: Optional[SpanExporter] = None
+
+
+def _get_exporter() -> SpanExporter:
+    global _exporter
+    if _exporter is None:
+        path = _trace_config.get("path", "log/traces.jsonl")
+        if not os.path.isabs(path):
+            path = os.path.join(os.path.dirname(__file__), path)
+        _exporter = SpanExporter(
+            path,
+            format=_trace_config.get("format", "jsonl"),
+            max_queue=_trace_config.get("max_queue", 10000),
+        )
+        atexit.register(_exporter.flush)
+    return _exporter
+
+
+def flush():
+    """Write out all finished spans."""
+    if _exporter is not None:
+        _exporter.flush()